@@ -10,6 +10,8 @@ import re
 import csv
 import pandas
 
+from src.processing import perfstat
+
 
 
 #Temporary files/directories for handling data
@@ -71,6 +73,19 @@ re_3_subrec_countfield = re.compile(r"""
 
 
 def Process_ProfFile(proffile:str, outcsvfile:str) -> None:
+    data = perfstat.parse_prof(proffile)
+    data.to_csv(outcsvfile)
+
+    print ('Start time: '+ str(data.start_time))
+    print ('Columns: '+ str(data.columns))
+    print ('runs type: '+ data.runtype)
+    print ('runs count: '+ str(data.runcount) )
+    print ('Total Records: '+ str(len(data)) )
+
+
+## Earlier regex based implementation, retained as the reference for
+## benchmarking the streaming parser (see src/processing/benchmark.py)
+def Process_ProfFile_legacy(proffile:str, outcsvfile:str) -> None:
     with io.open(proffile, 'rt') as  proffile_entry:
         
         stats_gatherer = {}
@@ -195,16 +210,13 @@ def Process_ProfFile(proffile:str, outcsvfile:str) -> None:
         print ('Total Records: '+ str(record_counter) )
 
 
-data_dir='/home/vaisakh/developer/modeling/tmp/extract/'
-
-# outdir = extract_data(prof)
-in_data_prof=os.path.join(data_dir,'IdleSleep-perf-1.prof')
-in_data_power=os.path.join(data_dir,'IdleSleep-perf-1.powdata')
-in_data_polldata=os.path.join(data_dir,'IdleSleep-perf-1.polldata')
-
-out_prof_csv = os.path.join(data_dir,'IdleSleep-perf-1.prof.csv')
-Process_ProfFile(in_data_prof,out_prof_csv)
-
-
+if __name__ == '__main__':
+    data_dir='/home/vaisakh/developer/modeling/tmp/extract/'
 
+    # outdir = extract_data(prof)
+    in_data_prof=os.path.join(data_dir,'IdleSleep-perf-1.prof')
+    in_data_power=os.path.join(data_dir,'IdleSleep-perf-1.powdata')
+    in_data_polldata=os.path.join(data_dir,'IdleSleep-perf-1.polldata')
 
+    out_prof_csv = os.path.join(data_dir,'IdleSleep-perf-1.prof.csv')
+    Process_ProfFile(in_data_prof,out_prof_csv)
@@ -19,7 +19,6 @@ TODO:
 """
 
 import fabric
-import tarfile
 import sys
 import os
 import shutil
@@ -38,10 +37,6 @@ workload_data_dir = os.path.join(src_root,'data')
 workload_result_dir = os.path.join(src_root,'results')
 conn = fabric.Connection( '192.168.0.101', port=22, user='root', connect_kwargs={'password':'odroid'})
 
-def make_tarfile(output_filename, source_dir):
-    with tarfile.open(output_filename, "w:bz2") as tar:
-        tar.add(source_dir, arcname=os.path.basename(source_dir))
-
 def execute_workload (test_desc_prefix:str,freq_list:[int], on_bigcluster:bool=True):
     for freq in freq_list:
         test_desc_composed=test_desc_prefix+'-CPUFreq-'+str(freq/1000000)+'GHz'
@@ -51,13 +46,13 @@ def execute_workload (test_desc_prefix:str,freq_list:[int], on_bigcluster:bool=T
                                 iteration_count=2,
                                 enable_stress_workloads= True,
                                 enable_compress_workloads = True,
-                                enable_encode_workloads = True 
+                                enable_encode_workloads = True,
+                                stream_archive = True
                           )
         cpuload_wkld.setup_persistant(workload_data=workload_data_dir, resultsdir_prefix=workload_result_dir, testname_suffix=test_desc_composed)
         # Run the workload
         results = cpuload_wkld.run(cpu_freq=freq )
-        # Tar the results folder and move the directory to backup rather than deleting it
-        make_tarfile(os.path.join(workload_result_dir, os.path.basename(results)+'.tar.bz2'),results)
+        # Iterations were archived into <results>.pack as they completed, move the directory to backup rather than deleting it
         shutil.move(results, workload_result_dir+'/backup/')
         del cpuload_wkld
 
@@ -75,13 +70,13 @@ def execute_idle_scenario (test_desc_prefix:str,
                                 run_on_bigcore=on_bigcluster,
                                 idle_duration=60,
                                 run_perf_sleep=perf_sleep ,
-                                iteration_count=2 # applicable only for perf-sleep case
+                                iteration_count=2, # applicable only for perf-sleep case
+                                stream_archive = True
                           )
         idle_wkld.setup_persistant(resultsdir_prefix=workload_result_dir, testname_suffix=test_desc_composed)
         # Run the workload
         results = idle_wkld.run(cpu_freq=freq,max_fan=max_fan )
-        # Tar the results folder and move the directory to backup rather than deleting it
-        make_tarfile(os.path.join(workload_result_dir, os.path.basename(results)+'.tar.bz2'),results)
+        # Iterations were archived into <results>.pack as they completed, move the directory to backup rather than deleting it
         shutil.move(results, workload_result_dir+'/backup/')
         del idle_wkld
 
@@ -1,8 +1,12 @@
 import argparse
+import atexit
+import json
 import os
 
 import m5
 from m5.objects import MathExprPowerModel, PowerModel
+from m5.util import warn
+from m5.util.convert import toFrequency, toLatency
 
 import fs_bigLITTLE as bL
 
@@ -19,22 +23,50 @@ class CpuPowerOn(MathExprPowerModel):
         )
 
 
+class CpuPowerExpr(MathExprPowerModel):
+    def __init__(self, cpu_path, dyn, st, **kwargs):
+        super(CpuPowerExpr, self).__init__(**kwargs)
+        # Expressions of a fitted model (src/processing/powermodel.py --gem5), in Watt
+        self.dyn = dyn.format(cpu=cpu_path)
+        self.st = st.format(cpu=cpu_path)
+
+
 class CpuPowerOff(MathExprPowerModel):
     dyn = "0"
     st = "0"
 
 
 class CpuPowerModel(PowerModel):
-    def __init__(self, cpu_path, big_dyncoeff, big_statcoeff, **kwargs):
+    def __init__(self, cpu_path, big_dyncoeff, big_statcoeff, on=None, **kwargs):
         super(CpuPowerModel, self).__init__(**kwargs)
         self.pm = [
-            CpuPowerOn(cpu_path, big_dyncoeff, big_statcoeff),  # ON
+            on or CpuPowerOn(cpu_path, big_dyncoeff, big_statcoeff),  # ON
             CpuPowerOff(),  # CLK_GATED
             CpuPowerOff(),  # SRAM_RETENTION
             CpuPowerOff(),  # OFF
         ]
 
+def load_power_model(filename, cluster, clock):
+    """Per-core expressions of the model of a cluster fitted closest to its clock"""
+    with open(filename) as f:
+        models = [m for m in json.load(f)["models"] if m["cluster"] == cluster]
+    if not models:
+        warn(f"No {cluster} cluster model in {filename}, no power modelled")
+        return {}
+    freq_ghz = toFrequency(clock) / 1e9
+    model = min(models, key=lambda m: abs(m["freq_ghz"] - freq_ghz))
+    print(f"Power model of the {cluster} cluster at {clock}: {model['freq_ghz']}GHz fit")
+    return model["cores"]
+
+
 def addOptions(parser):
+    parser.add_argument(
+        "--power-model",
+        type=str,
+        default=None,
+        help="JSON power model of src/processing/powermodel.py --gem5, "
+        "overrides the power coefficients",
+    )
     parser.add_argument(
         "--bigcore-dyn-pow-coeff",
         type=str,
@@ -59,6 +91,53 @@ def addOptions(parser):
         default="1.0",
         help="Coefficient to be used in power model for Little Core's static power",
     )
+    parser.add_argument(
+        "--stat-dump-period",
+        type=str,
+        default=None,
+        help="Dump the stats periodically (e.g. 0.1ms)",
+    )
+    parser.add_argument(
+        "--stats-timeseries",
+        type=str,
+        default="tsjson://power.jsonl?include='ipc$|numCycles$|power_model'",
+        help="Stat visitor URL the periodic dumps are appended to, "
+        "besides --stats-file (e.g. npz://power.npz?chunk=1000)",
+    )
+    parser.add_argument(
+        "--stats-periodic-text",
+        type=str,
+        default="on",
+        help="Periodic dumps to --stats-file ('on'), not in text at all "
+        "('off', --stats-file only gets the final dump) or to another stat "
+        "visitor URL instead (e.g. text://periodic.txt)",
+    )
+
+
+def divert_periodic_text_stats(url):
+    """Keeps the --stats-file output out of the periodic dumps, which go to
+    url instead unless it is 'off'; it gets the final dump only"""
+    final = [
+        output
+        for output in m5.stats.outputList
+        if not isinstance(
+            output,
+            (m5.stats.JsonOutputVistor, m5.stats.TimeSeriesOutputVisitor),
+        )
+    ]
+    m5.stats.outputList[:] = [
+        output for output in m5.stats.outputList if output not in final
+    ]
+    if url != "off":
+        m5.stats.addStatVisitor(url)
+
+    def final_dump():
+        # Registered before m5.simulate() registers its final dump, hence
+        # run after it (in reverse order), the stats being prepared
+        for output in final:
+            m5.stats.dumpOutput(output)
+
+    atexit.register(final_dump)
 
 
 def main():
@@ -83,21 +162,42 @@ def main():
     print ('ExBig type '+str(type(bL.Ex5BigCluster))+' .')
     print ('ExLittle type '+str(type(bL.Ex5LittleCluster))+' .')
 
-    # Wire up power models to the CPUs
-    for cpu in root.system.descendants():
-        if not isinstance(cpu, m5.objects.BaseCPU):
-            continue
-        cpu.power_state.default_state = "ON"
-        if ('ex5_big' in str(type(cpu))) :
-            cpu.power_model = CpuPowerModel(cpu.path(), big_dynamic_powcoeff, big_static_powcoeff)
-
-        if ('ex5_LITTLE' in str(type(cpu))) :
-            cpu.power_model = CpuPowerModel(cpu.path(), little_dynamic_powcoeff, little_static_powcoeff)
+    if options.power_model:
+        # Wire up the fitted per-core expressions, cores named as in the perf data
+        for cluster, socket, cpus, clock in (
+            ("big", "S1", root.system.bigCluster.cpus, options.big_cpu_clock),
+            ("little", "S0", root.system.littleCluster.cpus, options.little_cpu_clock),
+        ):
+            exprs = load_power_model(options.power_model, cluster, clock)
+            for idx, cpu in enumerate(cpus):
+                core = exprs.get(f"{socket}-D0-C{idx}", {"dyn": "0", "st": "0"})
+                cpu.power_state.default_state = "ON"
+                cpu.power_model = CpuPowerModel(
+                    cpu.path(), None, None, on=CpuPowerExpr(cpu.path(), core["dyn"], core["st"])
+                )
+    else:
+        # Wire up power models to the CPUs
+        for cpu in root.system.descendants():
+            if not isinstance(cpu, m5.objects.BaseCPU):
+                continue
+            cpu.power_state.default_state = "ON"
+            if ('ex5_big' in str(type(cpu))) :
+                cpu.power_model = CpuPowerModel(cpu.path(), big_dynamic_powcoeff, big_static_powcoeff)
+
+            if ('ex5_LITTLE' in str(type(cpu))) :
+                cpu.power_model = CpuPowerModel(cpu.path(), little_dynamic_powcoeff, little_static_powcoeff)
 
     bL.instantiate(options)
 
-    # Dumping stats periodically
-    # m5.stats.periodicStatDump(m5.ticks.fromSeconds(0.1e-3))
+    # Dumping stats periodically, appended to a compact time series
+    if options.stat_dump_period:
+        if options.stats_timeseries:
+            m5.stats.addStatVisitor(options.stats_timeseries)
+        if options.stats_periodic_text != "on":
+            divert_periodic_text_stats(options.stats_periodic_text)
+        m5.stats.periodicStatDump(
+            m5.ticks.fromSeconds(toLatency(options.stat_dump_period))
+        )
     bL.run()
 
 
@@ -26,9 +26,9 @@
 
 from .jsonclient import JSONClient
 from .atlasclient import AtlasClient
+from .resource_index import version_key, is_compatible
 from _m5 import core
 from typing import Optional, Dict, List, Tuple
-import itertools
 from m5.util import warn
 
 
@@ -116,12 +116,14 @@ class ClientWrapper:
             except Exception as e:
                 warn(f"Error getting resources from client {client}: {str(e)}")
         # check if no 2 resources have the same id and version
-        for res1, res2 in itertools.combinations(resources, 2):
-            if res1["resource_version"] == res2["resource_version"]:
+        versions = set()
+        for resource in resources:
+            if resource["resource_version"] in versions:
                 raise Exception(
                     f"Resource {resource_id} has multiple resources with "
-                    f"the same version: {res1['resource_version']}"
+                    f"the same version: {resource['resource_version']}"
                 )
+            versions.add(resource["resource_version"])
         return resources
 
     def get_resource_json_obj_from_client(
@@ -232,12 +234,11 @@ class ClientWrapper:
         to avoid this duplication.
         """
 
-        compatible_resources = []
-        for resource in resources:
-            for version in resource["gem5_versions"]:
-                if gem5_version.startswith(version):
-                    compatible_resources.append(resource)
-        return compatible_resources
+        return [
+            resource
+            for resource in resources
+            if is_compatible(resource["gem5_versions"], gem5_version)
+        ]
 
     def _sort_resources(self, resources: List) -> List:
         """
@@ -256,13 +257,9 @@ class ClientWrapper:
             those less significant. If the value is a digit it is cast as an
             int, otherwise, it is cast as a string, to lower-case.
             """
-            to_return = (resource["id"].lower(),)
-            for val in resource["resource_version"].split("."):
-                if val.isdigit():
-                    to_return += (int(val),)
-                else:
-                    to_return += (str(val).lower(),)
-            return to_return
+            return (resource["id"].lower(),) + version_key(
+                resource["resource_version"]
+            )
 
         return sorted(
             resources,
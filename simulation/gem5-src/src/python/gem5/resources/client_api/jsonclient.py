@@ -29,6 +29,7 @@ from pathlib import Path
 from urllib import request
 from typing import Optional, Dict, Union, Type, Tuple, List, Any
 from .abstract_client import AbstractClient
+from .resource_index import ResourceIndex, load_index
 from urllib.error import URLError
 from m5.util import warn
 
@@ -40,10 +41,18 @@ class JSONClient(AbstractClient):
         :param path: The path to the Resource, either URL or local.
         """
         self.path = path
-        self.resources = []
+
+        try:
+            from _m5 import core
+
+            gem5_versions = [core.gem5Version]
+        except ImportError:
+            gem5_versions = []
 
         if Path(self.path).is_file():
-            self.resources = json.load(open(self.path))
+            # Local catalogs are indexed once, the index being cached across
+            # runs until the catalog changes.
+            self.index = load_index(self.path, gem5_versions)
         elif not self._url_validator(self.path):
             raise Exception(
                 f"Resources location '{self.path}' is not a valid path or URL."
@@ -56,11 +65,17 @@ class JSONClient(AbstractClient):
                 raise Exception(
                     f"Unable to open Resources location '{self.path}': {e}"
                 )
-            self.resources = json.loads(response.read().decode("utf-8"))
+            self.index = ResourceIndex.build(
+                json.loads(response.read().decode("utf-8")), gem5_versions
+            )
+
+    @property
+    def resources(self) -> List[Dict[str, Any]]:
+        return self.index.get()
 
     def get_resources_json(self) -> List[Dict[str, Any]]:
         """Returns a JSON representation of the resources."""
-        return self.resources
+        return self.index.get()
 
     def get_resources(
         self,
@@ -68,21 +83,10 @@ class JSONClient(AbstractClient):
         resource_version: Optional[str] = None,
         gem5_version: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        filter = self.resources  # Unfiltered.
-        if resource_id:
-            filter = [  # Filter by resource_id.
-                resource
-                for resource in filter
-                if resource["id"] == resource_id
-            ]
-            if resource_version:
-                filter = [  # Filter by resource_version.
-                    resource
-                    for resource in filter
-                    if resource["resource_version"] == resource_version
-                ]
-
-        # Filter by gem5_version.
-        return self.filter_incompatible_resources(
-            resources_to_filter=filter, gem5_version=gem5_version
+        # Looked up in the index by ID and version, the resources compatible
+        # with the gem5 version being listed once per gem5 version.
+        return self.index.get(
+            resource_id=resource_id,
+            resource_version=resource_version,
+            gem5_version=gem5_version,
         )
@@ -0,0 +1,321 @@
+# Copyright (c) 2023 The Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met: redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer;
+# redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution;
+# neither the name of the copyright holders nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+An index of a resources catalog (a JSON list of resources), for the
+`JSONClient`. Resources are indexed by ID and then version, the versions of
+each ID being sorted newest first, and the resources compatible with a gem5
+version are listed once per gem5 version.
+
+The index of a local catalog is persisted to a cache file (in
+`~/.cache/gem5/resource-index`, or `$GEM5_RESOURCE_INDEX_DIR`), validated
+by the path, size and modification time of the catalog. The cache file holds
+a compact JSON header, the index, followed by each resource as compact JSON:
+a resource is only decoded once it is looked up, so a fresh cache is loaded
+without parsing the catalog.
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+_INDEX_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def version_key(version: str) -> Tuple:
+    """
+    The sort key of a resource version. In cases where the version contains
+    periods, it's assumed this is to separate a "major.minor.hotfix" style
+    versioning system. In which case, the value separated in the
+    most-significant position is sorted before those less significant. If
+    the value is a digit it is cast as an int, otherwise, it is cast as a
+    string, to lower-case.
+    """
+    to_return = ()
+    for val in version.split("."):
+        if val.isdigit():
+            to_return += (int(val),)
+        else:
+            to_return += (str(val).lower(),)
+    return to_return
+
+
+def is_compatible(gem5_versions: Iterable[str], gem5_version: str) -> bool:
+    """
+    Whether a resource supporting `gem5_versions` is compatible with a gem5
+    version. A resource's gem5 version without minor (or hot-fix) component
+    is compatible with all the minor (or hot-fix) versions, e.g., '20.1' is
+    compatible with gem5 '20.1.1.0' and '20.1.2.0'.
+    """
+    return any(gem5_version.startswith(version) for version in gem5_versions)
+
+
+def _index_dir() -> Path:
+    return Path(
+        os.getenv(
+            "GEM5_RESOURCE_INDEX_DIR",
+            os.path.join(Path.home(), ".cache", "gem5", "resource-index"),
+        )
+    )
+
+
+def _source_key(path: Path) -> List[Union[str, int]]:
+    st = os.stat(str(path))
+    return [str(path.resolve()), st.st_size, st.st_mtime_ns]
+
+
+class ResourceIndex:
+    """
+    The resources of a catalog, indexed by ID and version.
+    """
+
+    def __init__(
+        self,
+        ids: Dict[str, List[list]],
+        count: int,
+        compatible: Optional[Dict[str, Dict[str, List[int]]]] = None,
+        resources: Optional[List[Dict[str, Any]]] = None,
+        blob: Optional[bytes] = None,
+        spans: Optional[List[List[int]]] = None,
+    ):
+        """
+        :param ids: For each resource ID, the `[version, gem5_versions, n]`
+        of its resources, newest version first, `n` being the position of the
+        resource in the catalog.
+        :param count: The number of resources of the catalog.
+        :param compatible: For gem5 versions, the positions of the resources
+        of each ID compatible with it, newest version first.
+        :param resources: The resources, if decoded.
+        :param blob: The resources encoded as JSON, if not decoded.
+        :param spans: The offset and length of each resource in `blob`.
+        """
+        self._ids = ids
+        self._count = count
+        self._compatible = compatible if compatible is not None else {}
+        self._resources = resources if resources else [None] * count
+        self._blob = blob
+        self._spans = spans
+
+    @classmethod
+    def build(
+        cls,
+        resources: List[Dict[str, Any]],
+        gem5_versions: Iterable[str] = (),
+    ) -> "ResourceIndex":
+        """
+        Indexes a list of resources.
+
+        :param resources: The resources of the catalog.
+        :param gem5_versions: The gem5 versions for which the compatible
+        resources are listed upfront (and persisted).
+        """
+        ids = {}
+        for n, resource in enumerate(resources):
+            ids.setdefault(resource["id"], []).append(
+                [
+                    resource["resource_version"],
+                    list(resource.get("gem5_versions", [])),
+                    n,
+                ]
+            )
+        for entries in ids.values():
+            entries.sort(key=lambda entry: version_key(entry[0]), reverse=True)
+        index = cls(ids, len(resources), resources=list(resources))
+        for gem5_version in gem5_versions:
+            index.compatible(gem5_version)
+        return index
+
+    def compatible(self, gem5_version: str) -> Dict[str, List[int]]:
+        """
+        The positions of the resources compatible with a gem5 version, per
+        resource ID and newest version first. Computed once per gem5 version.
+        """
+        if gem5_version not in self._compatible:
+            self._compatible[gem5_version] = {
+                resource_id: [
+                    n
+                    for _, versions, n in entries
+                    if is_compatible(versions, gem5_version)
+                ]
+                for resource_id, entries in self._ids.items()
+            }
+        return self._compatible[gem5_version]
+
+    def resource(self, n: int) -> Dict[str, Any]:
+        """The resource at position `n` of the catalog, decoded once."""
+        resource = self._resources[n]
+        if resource is None:
+            offset, length = self._spans[n]
+            resource = json.loads(bytes(self._blob[offset : offset + length]))
+            self._resources[n] = resource
+        return resource
+
+    def __len__(self) -> int:
+        return self._count
+
+    def ids(self) -> List[str]:
+        """The resource IDs of the catalog."""
+        return list(self._ids)
+
+    def get(
+        self,
+        resource_id: Optional[str] = None,
+        resource_version: Optional[str] = None,
+        gem5_version: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        The resources with the given ID (newest version first) and version,
+        compatible with the given gem5 version. All the resources of the
+        catalog, in order, if no ID is given (the version is then ignored).
+        """
+        if resource_id is None:
+            if gem5_version:
+                selected = sorted(
+                    n
+                    for positions in self.compatible(gem5_version).values()
+                    for n in positions
+                )
+            else:
+                selected = range(self._count)
+            return [self.resource(n) for n in selected]
+
+        entries = self._ids.get(resource_id, [])
+        if gem5_version:
+            positions = self.compatible(gem5_version).get(resource_id, [])
+        else:
+            positions = [n for _, _, n in entries]
+        if resource_version:
+            versions = {n: version for version, _, n in entries}
+            positions = [
+                n for n in positions if versions[n] == resource_version
+            ]
+        return [self.resource(n) for n in positions]
+
+    def save(self, path: Path, source: List[Union[str, int]]) -> None:
+        """
+        Writes the index to a cache file, atomically.
+
+        :param source: The key of the catalog the index is valid for.
+        """
+        parts = []
+        spans = []
+        offset = 0
+        for n in range(self._count):
+            part = json.dumps(
+                self.resource(n), separators=(",", ":")
+            ).encode()
+            parts.append(part)
+            spans.append([offset, len(part)])
+            offset += len(part)
+        header = {
+            "version": _INDEX_VERSION,
+            "source": source,
+            "count": self._count,
+            "ids": self._ids,
+            "compatible": self._compatible,
+            "spans": spans,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{path}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header, separators=(",", ":")).encode())
+            f.write(b"\n")
+            f.writelines(parts)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(
+        cls, path: Path, source: List[Union[str, int]]
+    ) -> Optional["ResourceIndex"]:
+        """
+        Reads an index from a cache file, if it is valid for the catalog.
+
+        :param source: The key of the catalog.
+        :return: The index, or None if the cache file is missing or stale.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            end = data.index(b"\n")
+            header = json.loads(data[:end])
+        except (OSError, ValueError):
+            return None
+        if (
+            header.get("version") != _INDEX_VERSION
+            or header.get("source") != source
+        ):
+            return None
+        return cls(
+            header["ids"],
+            header["count"],
+            compatible=header["compatible"],
+            blob=memoryview(data)[end + 1 :],
+            spans=header["spans"],
+        )
+
+
+# The indices of the catalogs loaded by this process, with their source key.
+_loaded = {}
+
+
+def load_index(
+    path: Union[str, Path], gem5_versions: Iterable[str] = ()
+) -> ResourceIndex:
+    """
+    The index of a local catalog: from this process, from the cache file if
+    the catalog did not change since it was written, else built from the
+    catalog (and the cache file written).
+
+    :param path: The path of the catalog (a JSON list of resources).
+    :param gem5_versions: The gem5 versions for which the compatible
+    resources are listed when building the index.
+    """
+    path = Path(path)
+    source = _source_key(path)
+    loaded = _loaded.get(source[0])
+    if loaded is not None and loaded[0] == source:
+        return loaded[1]
+
+    cache = _index_dir() / (
+        hashlib.md5(source[0].encode()).hexdigest() + ".index"
+    )
+    index = ResourceIndex.load(cache, source)
+    if index is None:
+        with open(path) as f:
+            index = ResourceIndex.build(json.load(f), gem5_versions)
+        try:
+            # Not persisted if the catalog changed while being read.
+            if _source_key(path) == source:
+                index.save(cache, source)
+        except OSError:
+            # The index is built again by every process.
+            pass
+    _loaded[source[0]] = (source, index)
+    return index
@@ -42,7 +42,7 @@ from .client import (
     get_resource_json_obj,
     list_resources as client_list_resources,
 )
-from .md5_utils import md5_file, md5_dir
+from .md5_utils import md5_cached, clear_cache
 from ..utils.progress_bar import tqdm, progress_hook
 
 from ..utils.filelock import FileLock
@@ -254,10 +254,11 @@ def get_resource(
         )
 
         if os.path.exists(to_path):
-            if os.path.isfile(to_path):
-                md5 = md5_file(Path(to_path))
-            else:
-                md5 = md5_dir(Path(to_path))
+            # The md5 is cached next to the resource (`<to_path>.md5cache`)
+            # and only recomputed once the resource changes, so resources
+            # already present, such as multi-GB disk images, are not hashed
+            # again on every request.
+            md5 = md5_cached(Path(to_path))
 
             if md5 == resource_json["md5sum"]:
                 # In this case, the file has already been download, no need to
@@ -268,6 +269,7 @@ def get_resource(
                     os.remove(to_path)
                 else:
                     shutil.rmtree(to_path)
+                clear_cache(Path(to_path))
             else:
                 raise Exception(
                     "There already a file present at '{}' but "
@@ -24,42 +24,136 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 import hashlib
+import json
+import mmap
+import os
 from _hashlib import HASH as Hash
 
+# Files are hashed in slices of this size (mapped, or read into a buffer).
+_CHUNK_SIZE = 8 * 1024 * 1024
 
-def _md5_update_from_file(filename: Path, hash: Hash) -> Hash:
-    assert filename.is_file()
+# Files below this size are hashed without a progress bar.
+_PROGRESS_MIN_SIZE = 1024 * 1024 * 100
 
-    if filename.stat().st_size < 1024 * 1024 * 100:
-        from ..utils.progress_bar import FakeTQDM
+# Suffix of the sidecar file caching the md5 of a resource, and the version
+# of its format.
+CACHE_SUFFIX = ".md5cache"
+_CACHE_VERSION = 1
 
-        # if the file is less than 100MB, no need to show a progress bar.
-        tqdm = FakeTQDM()
-    else:
-        from ..utils.progress_bar import tqdm
 
-    with tqdm.wrapattr(
-        open(str(filename), "rb"),
-        "read",
+def _progress(filename: Path, size: int):
+    from ..utils.progress_bar import tqdm, _have_tqdm
+
+    if size < _PROGRESS_MIN_SIZE or not _have_tqdm:
+        # if the file is less than 100MB, no need to show a progress bar.
+        return None
+    return tqdm(
+        total=size,
+        unit="B",
+        unit_scale=True,
         miniters=1,
         desc=f"Computing md5sum on {filename}",
-        total=filename.stat().st_size,
-    ) as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash.update(chunk)
+    )
+
+
+def _md5_update_from_file(filename: Path, hash: Hash) -> Hash:
+    assert filename.is_file()
+
+    size = filename.stat().st_size
+    progress = _progress(filename, size)
+    with open(str(filename), "rb") as f:
+        try:
+            # Mapping the file avoids copying it through read buffers.
+            # hashlib releases the GIL while hashing large slices.
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty or unmappable files (e.g., pipes, some network file
+            # systems) are read instead.
+            mapped = None
+
+        if mapped is not None:
+            with mapped, memoryview(mapped) as view:
+                for offset in range(0, len(view), _CHUNK_SIZE):
+                    with view[offset : offset + _CHUNK_SIZE] as chunk:
+                        hash.update(chunk)
+                    if progress is not None:
+                        progress.update(min(_CHUNK_SIZE, size - offset))
+        else:
+            buffer = bytearray(_CHUNK_SIZE)
+            for n in iter(lambda: f.readinto(buffer), 0):
+                hash.update(memoryview(buffer)[:n])
+                if progress is not None:
+                    progress.update(n)
+    if progress is not None:
+        progress.close()
     return hash
 
 
-def _md5_update_from_dir(directory: Path, hash: Hash) -> Hash:
-    assert directory.is_dir()
+def _dir_entries(directory: Path) -> List[Tuple[bytes, Optional[Path]]]:
+    """
+    The entries of a directory, recursively, in the order they are hashed:
+    (name, path) for files and (name, None) for any other entry, each
+    directory being followed by its own entries.
+    """
+    entries = []
     for path in sorted(directory.iterdir(), key=lambda p: str(p).lower()):
-        hash.update(path.name.encode())
         if path.is_file():
-            hash = _md5_update_from_file(path, hash)
-        elif path.is_dir():
-            hash = _md5_update_from_dir(path, hash)
+            entries.append((path.name.encode(), path))
+        else:
+            entries.append((path.name.encode(), None))
+            if path.is_dir():
+                entries += _dir_entries(path)
+    return entries
+
+
+def _read_small(path: Path) -> Optional[bytes]:
+    if path.stat().st_size > _CHUNK_SIZE:
+        return None
+    with open(str(path), "rb") as f:
+        return f.read()
+
+
+def _md5_update_from_dir(
+    directory: Path, hash: Hash, workers: Optional[int] = None
+) -> Hash:
+    assert directory.is_dir()
+
+    # The md5 of a directory is one digest over all of its names and
+    # contents, so the hashing itself is sequential. Files are read ahead
+    # by a pool of workers instead, overlapping the reads (the bulk of the
+    # time on cold caches and network file systems) with the hashing. Large
+    # files are hashed in place, mapped.
+    entries = _dir_entries(directory)
+    workers = workers or min(8, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        ahead = iter(entries)
+
+        def fill():
+            while len(pending) < 2 * workers:
+                entry = next(ahead, None)
+                if entry is None:
+                    return
+                name, path = entry
+                future = pool.submit(_read_small, path) if path else None
+                pending.append((name, path, future))
+
+        fill()
+        while pending:
+            name, path, future = pending.popleft()
+            hash.update(name)
+            if future is not None:
+                data = future.result()
+                if data is None:
+                    hash = _md5_update_from_file(path, hash)
+                else:
+                    hash.update(data)
+            fill()
     return hash
 
 
@@ -88,7 +182,7 @@ def md5_file(filename: Path) -> str:
     return str(_md5_update_from_file(filename, hashlib.md5()).hexdigest())
 
 
-def md5_dir(directory: Path) -> str:
+def md5_dir(directory: Path, workers: Optional[int] = None) -> str:
     """
     Gives the md5 value of a directory.
 
@@ -96,5 +190,101 @@ def md5_dir(directory: Path) -> str:
 
     Note: The path of files are also hashed so the md5 of the directory changes
     if empty files are included or filenames are changed.
+
+    :param workers: The number of threads reading files ahead of the hashing.
+    By default, a few more than the number of CPUs (at most 8).
+    """
+    return str(
+        _md5_update_from_dir(directory, hashlib.md5(), workers).hexdigest()
+    )
+
+
+def _stat_fingerprint(path: Path) -> List[int]:
+    st = os.stat(str(path))
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def fingerprint(path: Path) -> Dict[str, Union[str, List[int]]]:
+    """
+    Gives the fingerprint of a file or directory: the size, modification
+    time (ns) and inode number of the file, or of the directory and, hashed,
+    of every entry beneath it. Any change to the contents of a file is
+    expected to change its fingerprint, which takes a `stat` per entry
+    instead of reading the contents.
+
+    :param path: The path to get the fingerprint of.
+    """
+    path = Path(path)
+    result = {"path": str(path.resolve()), "stat": _stat_fingerprint(path)}
+    if path.is_dir():
+        tree = hashlib.md5()
+        for root, dirs, files in os.walk(str(path)):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                entry = os.path.join(root, name)
+                tree.update(os.path.relpath(entry, str(path)).encode())
+                tree.update(str(_stat_fingerprint(Path(entry))).encode())
+        result["tree"] = tree.hexdigest()
+    return result
+
+
+def cache_path(path: Path) -> Path:
+    """
+    The sidecar file caching the md5 of a file or directory, next to it.
+    """
+    return Path(f"{path}{CACHE_SUFFIX}")
+
+
+def md5_cached(path: Path) -> str:
+    """
+    Gets the md5 value of a file or directory, as `md5`, through a sidecar
+    cache: the md5 is stored next to the path, with the fingerprint of the
+    path, and only computed again once the fingerprint changes (e.g., the
+    file is modified or replaced). Verifying a multi-GB disk image that has
+    not changed then takes a few `stat` calls.
+
+    Note: A change preserving the size, modification time and inode of a
+    file (e.g., an in-place rewrite followed by `touch -r`) is not detected.
+    Use `md5` to always hash the contents.
+
+    :param path: The path to get the md5 of.
+    """
+    path = Path(path)
+    sidecar = cache_path(path)
+    key = fingerprint(path)
+    try:
+        with open(str(sidecar)) as f:
+            cached = json.load(f)
+        if (
+            cached.get("version") == _CACHE_VERSION
+            and cached.get("fingerprint") == key
+        ):
+            return cached["md5"]
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+
+    value = md5(path)
+    # The fingerprint is taken again, in case the path changed while being
+    # hashed, in which case the md5 is not cached.
+    if fingerprint(path) == key:
+        tmp = Path(f"{sidecar}.{os.getpid()}.tmp")
+        try:
+            with open(str(tmp), "w") as f:
+                entry = {"version": _CACHE_VERSION, "fingerprint": key}
+                entry["md5"] = value
+                json.dump(entry, f)
+            os.replace(str(tmp), str(sidecar))
+        except OSError:
+            # A read-only location is hashed every time.
+            if tmp.exists():
+                tmp.unlink()
+    return value
+
+
+def clear_cache(path: Path) -> None:
+    """
+    Removes the sidecar md5 cache of a file or directory, if any.
     """
-    return str(_md5_update_from_dir(directory, hashlib.md5()).hexdigest())
+    sidecar = cache_path(path)
+    if sidecar.exists():
+        sidecar.unlink()
@@ -42,7 +42,7 @@ import m5
 import _m5.stats
 from m5.objects import Root
 from m5.params import isNullPointer
-from .gem5stats import JsonOutputVistor
+from .gem5stats import JsonOutputVistor, TimeSeriesOutputVisitor
 from m5.util import attrdict, fatal
 
 # Stat exports
@@ -198,6 +198,94 @@ def _jsonFactory(fn):
     return JsonOutputVistor(fn)
 
 
+def _has_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return False
+    return True
+
+
+@_url_factory(["tsjson"])
+def _timeSeriesJsonFactory(
+    fn, include=None, exclude=None, queue_size=64, rescan=100
+):
+    """Append stats to a time series in JSON lines format.
+
+    Every stat dump (e.g. periodic dumps) is appended to the file as one
+    compact line, after a header line with the stat names, units and
+    descriptions (again when the recorded stats change, e.g. stats
+    appearing after the first dump). Unlike json://, the file is not
+    rewritten on every dump and formulas (e.g. ipc) are included. Records
+    are written by a background thread.
+
+    Parameters:
+      * include (str): Regular expression of the stats to record
+      * exclude (str): Regular expression of the stats not to record
+      * queue_size (unsigned): Dumps buffered for the writer (default: 64)
+      * rescan (unsigned): Dumps between looking for new stats, 0 for
+        never (default: 100)
+
+    Example:
+      tsjson://power.jsonl?include='ipc$|numCycles$|power_model'
+
+    """
+
+    return TimeSeriesOutputVisitor(
+        fn,
+        format="tsjson",
+        include=include,
+        exclude=exclude,
+        queue_size=queue_size,
+        rescan=rescan,
+    )
+
+
+@_url_factory(["npz"], enable=_has_numpy())
+def _npzFactory(
+    fn,
+    include=None,
+    exclude=None,
+    chunk=256,
+    queue_size=64,
+    compress=False,
+    rescan=100,
+):
+    """Append stats to a time series in NumPy NPZ format.
+
+    Stat dumps are stored as columnar blocks of chunk dumps: a tick
+    vector and a float64 matrix with one row per dump, the columns
+    (stats, vector elements and distribution fields) being stored once,
+    and again from the block where the recorded stats change. The archive
+    can be loaded with numpy.load while the simulation runs. Requires
+    numpy.
+
+    Parameters:
+      * include (str): Regular expression of the stats to record
+      * exclude (str): Regular expression of the stats not to record
+      * chunk (unsigned): Dumps per block (default: 256)
+      * queue_size (unsigned): Blocks buffered for the writer (default: 64)
+      * compress (bool): Deflate the blocks (default: False)
+      * rescan (unsigned): Dumps between looking for new stats, 0 for
+        never (default: 100)
+
+    Example:
+      npz://power.npz?include='power_model'&chunk=1000
+
+    """
+
+    return TimeSeriesOutputVisitor(
+        fn,
+        format="npz",
+        include=include,
+        exclude=exclude,
+        chunk=chunk,
+        queue_size=queue_size,
+        compress=compress,
+        rescan=rescan,
+    )
+
+
 def addStatVisitor(url):
     """Add a stat visitor specified using a URL string
 
@@ -414,16 +502,24 @@ def dump(roots=None):
         prepare()
 
     for output in outputList:
-        if isinstance(output, JsonOutputVistor):
-            if not all_roots:
-                output.dump(Root.getInstance())
-            else:
-                output.dump(all_roots)
+        dumpOutput(output, all_roots)
+
+
+def dumpOutput(output, roots=None):
+    """Dump the statistics, as prepared by the last dump, to one output.
+    Outputs kept out of outputList (e.g. out of periodic dumps) are dumped
+    this way."""
+
+    if isinstance(output, (JsonOutputVistor, TimeSeriesOutputVisitor)):
+        if not roots:
+            output.dump(Root.getInstance())
         else:
-            if output.valid():
-                output.begin()
-                _dump_to_visitor(output, roots=all_roots)
-                output.end()
+            output.dump(roots)
+    else:
+        if output.valid():
+            output.begin()
+            _dump_to_visitor(output, roots=roots)
+            output.end()
 
 
 def reset():
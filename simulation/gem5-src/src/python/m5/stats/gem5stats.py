@@ -29,9 +29,17 @@ This serves as the bridge between the gem5 statistics exposed via PyBind11 and
 the Python Stats model.
 """
 
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import zipfile
 from datetime import datetime
-from typing import IO, List, Union
+from typing import IO, List, Optional, Tuple, Union
 
+import _m5.core
 import _m5.stats
 from m5.objects import *
 from m5.ext.pystats.group import *
@@ -84,6 +92,346 @@ class JsonOutputVistor:
             simstat.dump(fp=fp, **self.json_args)
 
 
+# Fields of a distribution in a time series, before its buckets
+TIME_SERIES_DIST_FIELDS = [
+    "samples",
+    "mean",
+    "stdev",
+    "underflows",
+    "overflows",
+    "min_value",
+    "max_value",
+]
+
+
+class TimeSeriesOutputVisitor:
+    """
+    A stat visitor appending every dump to a time series, for periodic stat
+    dumps (`m5.stats.periodicStatDump`). Unlike `JsonOutputVistor`, which
+    rewrites its file on every dump, the file is truncated once and each
+    dump is appended as a compact record:
+
+    * "tsjson": JSON lines, a header line with the columns (the stat names,
+      vector elements and distribution fields as `name::subname`), units
+      and descriptions, then one `{"tick": ..., "values": [...]}` line per
+      dump.
+    * "npz": an NPZ archive of columnar blocks, `columns.npy` then
+      `tick_<n>.npy` and `data_<n>.npy` (float64, one row per dump) per
+      block of `chunk` dumps. The archive is valid after every block.
+
+    Only the stats whose dotted name matches `include` and not `exclude`
+    (regular expressions, `re.search`) are recorded, e.g. the `ipc`,
+    `numCycles` and power model stats of a 0.1 ms power dump. Formulas are
+    recorded, unlike in `JsonOutputVistor`. The stats are resolved on the
+    first dump and again every `rescan` dumps: when the columns change
+    (stats appearing after the first dump, or dumps of other roots), the
+    following records come after a new header line ("tsjson"), or a new
+    block starts with its `columns_<n>.npy` ("npz"). Records are encoded
+    and written by a background thread so that the simulation does not
+    wait on the file system; the thread is drained at exit.
+    """
+
+    def __init__(
+        self,
+        file: str,
+        format: str = "tsjson",
+        include: Optional[str] = None,
+        exclude: Optional[str] = None,
+        chunk: int = 256,
+        queue_size: int = 64,
+        compress: bool = False,
+        rescan: int = 100,
+    ):
+        """
+        Parameters
+        ----------
+
+        file: str
+            The output file location (relative to the gem5 output directory).
+
+        format: str
+            "tsjson" (JSON lines) or "npz" (columnar blocks).
+
+        include: Optional[str]
+            Regular expression of the stat names to record (default: all).
+
+        exclude: Optional[str]
+            Regular expression of the stat names not to record.
+
+        chunk: int
+            Dumps per block of the "npz" format.
+
+        queue_size: int
+            Records (or blocks) waiting for the writer thread before a dump
+            blocks.
+
+        compress: bool
+            Deflate the blocks of the "npz" format.
+
+        rescan: int
+            Dumps between two resolutions of the stats (0: resolved once).
+        """
+
+        if format not in ("tsjson", "npz"):
+            raise ValueError(f"Unknown time series format '{format}'")
+        if format == "npz":
+            # Fail when the visitor is added rather than at the first dump
+            import numpy
+
+        from m5 import options
+
+        self.file = os.path.join(options.outdir, file)
+        self.format = format
+        self.include = re.compile(include) if include else None
+        self.exclude = re.compile(exclude) if exclude else None
+        self.chunk = max(1, int(chunk))
+        self.compress = compress
+        self.rescan = max(0, int(rescan))
+
+        # roots key -> [entries, columns, dumps since resolved]
+        self._entries = {}
+        self._columns = None
+        self._block = []
+        self._error = None
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._closed = False
+
+        # Truncated once, appended to on each dump
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        self._thread = threading.Thread(
+            target=self._write_loop, name=f"stats-{file}", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _selected(self, name: str) -> bool:
+        if self.include and not self.include.search(name):
+            return False
+        return not (self.exclude and self.exclude.search(name))
+
+    def _resolve(
+        self, roots: Union[List[SimObject], Root]
+    ) -> List[Tuple[str, _m5.stats.Info]]:
+        """The (name, Info) of the selected stats under the roots"""
+
+        entries = []
+
+        def visit(prefix, group):
+            for stat in group.getStats():
+                name = prefix + stat.name
+                if self._selected(name):
+                    entries.append((name, stat))
+            for key, child in group.getStatGroups().items():
+                visit(prefix + key + ".", child)
+
+        if isinstance(roots, Root):
+            visit("", roots)
+        else:
+            for root in roots:
+                visit(".".join(root.path_list()) + ".", root)
+        return entries
+
+    @staticmethod
+    def _value(stat: _m5.stats.Info):
+        """The value of a stat: a number, a list (vectors) or a dict
+        (distributions)"""
+        if isinstance(stat, _m5.stats.ScalarInfo):
+            return stat.value
+        if isinstance(stat, _m5.stats.VectorInfo):
+            values = list(stat.result)
+            if isinstance(stat, _m5.stats.FormulaInfo) and len(values) == 1:
+                return values[0]
+            return values
+        if isinstance(stat, _m5.stats.DistInfo):
+            buckets = list(stat.values)
+            samples = sum(buckets) + stat.underflow + stat.overflow
+            mean = stat.sum / samples if samples else 0.0
+            var = 0.0
+            if samples > 1:
+                var = (stat.squares - stat.sum * stat.sum / samples) / (
+                    samples - 1
+                )
+            return {
+                "samples": samples,
+                "mean": mean,
+                "stdev": max(var, 0.0) ** 0.5,
+                "underflows": stat.underflow,
+                "overflows": stat.overflow,
+                "min_value": stat.min_val,
+                "max_value": stat.max_val,
+                "buckets": buckets,
+            }
+        return None
+
+    @staticmethod
+    def _flatten(name: str, stat: _m5.stats.Info, value) -> List[str]:
+        """The columns of a stat value"""
+        if isinstance(value, dict):
+            return [f"{name}::{f}" for f in TIME_SERIES_DIST_FIELDS] + [
+                f"{name}::bucket{i}" for i in range(len(value["buckets"]))
+            ]
+        if isinstance(value, list):
+            subnames = list(getattr(stat, "subnames", []))
+            subnames += [""] * (len(value) - len(subnames))
+            return [f"{name}::{subnames[i] or i}" for i in range(len(value))]
+        return [name]
+
+    def dump(self, roots: Union[List[SimObject], Root]) -> None:
+        """
+        Appends the stats of a simulation root (or list of roots) to the
+        time series.
+
+        WARNING: This dump assumes the statistics have already been prepared
+        for the target root.
+        """
+
+        import m5
+
+        if self._error is not None:
+            raise self._error
+        key = id(roots) if isinstance(roots, Root) else tuple(map(id, roots))
+        resolved = self._entries.get(key)
+        if resolved is None or (self.rescan and resolved[2] >= self.rescan):
+            entries = self._resolve(roots)
+            values = [self._value(stat) for _, stat in entries]
+            columns = []
+            for (name, stat), value in zip(entries, values):
+                columns += self._flatten(name, stat, value)
+            if columns == self._columns:
+                columns = self._columns
+            resolved = self._entries[key] = [entries, columns, 0]
+        else:
+            entries, columns = resolved[0], resolved[1]
+            values = [self._value(stat) for _, stat in entries]
+        resolved[2] += 1
+        tick = m5.curTick()
+
+        if columns is not self._columns:
+            # The records of a block share its columns
+            if self._block:
+                self._queue.put(("block", self._block))
+                self._block = []
+            self._columns = columns
+            header = {
+                "columns": self._columns,
+                "names": [name for name, _ in entries],
+                "units": [stat.unit for _, stat in entries],
+                "descriptions": [stat.desc for _, stat in entries],
+                "sim_freq": _m5.core.getClockFrequency(),
+            }
+            self._queue.put(("header", header))
+
+        if self.format == "tsjson":
+            self._queue.put(("record", (tick, values)))
+        else:
+            self._block.append((tick, values))
+            if len(self._block) >= self.chunk:
+                self._queue.put(("block", self._block))
+                self._block = []
+
+    def close(self) -> None:
+        """Writes the pending records and stops the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._block:
+            self._queue.put(("block", self._block))
+            self._block = []
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            from m5.util import warn
+
+            warn(f"Stats time series {self.file}: {self._error}")
+
+    # Writer thread
+    def _write_loop(self) -> None:
+        blocks = 0
+        header = None
+        new_header = False
+        stream = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, data = item
+                if kind == "header":
+                    header = data
+                    new_header = True
+                    if self.format == "tsjson":
+                        if stream is None:
+                            stream = open(self.file, "a")
+                        stream.write(json.dumps({"header": header}) + "\n")
+                elif kind == "record":
+                    tick, values = data
+                    stream.write(
+                        json.dumps(
+                            {"tick": tick, "values": values},
+                            separators=(",", ":"),
+                        )
+                        + "\n"
+                    )
+                else:
+                    self._write_block(blocks, header, data, new_header)
+                    new_header = False
+                    blocks += 1
+                if stream is not None and self._queue.empty():
+                    stream.flush()
+        except Exception as e:
+            self._error = e
+            # Keep consuming, so that dumps never block on a dead writer
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def _write_block(
+        self, number: int, header: dict, block: list, new_header: bool
+    ) -> None:
+        import numpy
+
+        rows = []
+        for _, values in block:
+            row = []
+            for value in values:
+                if isinstance(value, dict):
+                    row += [value[f] for f in TIME_SERIES_DIST_FIELDS]
+                    row += value["buckets"]
+                elif isinstance(value, list):
+                    row += value
+                else:
+                    row.append(value)
+            rows.append(row)
+        compression = zipfile.ZIP_STORED
+        if self.compress:
+            compression = zipfile.ZIP_DEFLATED
+        members = {
+            f"tick_{number:06d}.npy": numpy.array(
+                [tick for tick, _ in block], dtype=numpy.uint64
+            ),
+            f"data_{number:06d}.npy": numpy.array(rows, dtype=numpy.float64),
+        }
+        if number == 0:
+            members = {
+                "columns.npy": numpy.array(header["columns"]),
+                "sim_freq.npy": numpy.array(header["sim_freq"]),
+                **members,
+            }
+        elif new_header:
+            members = {
+                f"columns_{number:06d}.npy": numpy.array(header["columns"]),
+                **members,
+            }
+        # Reopened per block, so that the archive is valid after each one
+        with zipfile.ZipFile(self.file, "a", compression=compression) as zf:
+            for member, array in members.items():
+                with zf.open(member, "w", force_zip64=True) as f:
+                    numpy.lib.format.write_array(f, array, allow_pickle=False)
+
+
 def get_stats_group(group: _m5.stats.Group) -> Group:
     """
     Translates a gem5 Group object into a Python stats Group object. A Python
@@ -27,9 +27,11 @@
 import unittest
 import tempfile
 import os
+import shutil
 from typing import Dict
 import json
 
+from gem5.resources.client_api import resource_index
 from gem5.resources.client_api.jsonclient import JSONClient
 
 
@@ -142,6 +144,21 @@ class JSONClientTestSuite(unittest.TestCase):
     def tearDownClass(cls) -> None:
         os.remove(cls.file_path)
 
+    def setUp(self) -> None:
+        # Catalog indices are cached in a temporary directory, not in the
+        # user's cache
+        self.index_dir = tempfile.mkdtemp()
+        self.saved_index_dir = os.environ.get("GEM5_RESOURCE_INDEX_DIR")
+        os.environ["GEM5_RESOURCE_INDEX_DIR"] = self.index_dir
+        resource_index._loaded.clear()
+
+    def tearDown(self) -> None:
+        if self.saved_index_dir is None:
+            del os.environ["GEM5_RESOURCE_INDEX_DIR"]
+        else:
+            os.environ["GEM5_RESOURCE_INDEX_DIR"] = self.saved_index_dir
+        shutil.rmtree(self.index_dir)
+
     def verify_json(self, json: Dict) -> None:
         """
         This verifies the JSON file created in created in
@@ -30,7 +30,13 @@ import os
 import shutil
 from pathlib import Path
 
-from gem5.resources.md5_utils import md5_file, md5_dir
+from gem5.resources.md5_utils import (
+    md5_file,
+    md5_dir,
+    md5_cached,
+    cache_path,
+    clear_cache,
+)
 
 
 class MD5FileTestSuite(unittest.TestCase):
@@ -114,3 +120,43 @@ class MD5DirTestSuite(unittest.TestCase):
         shutil.rmtree(dir2)
 
         self.assertEquals(first_md5, second_md5)
+
+
+class MD5CacheTestSuite(unittest.TestCase):
+    """Test cases for gem5.resources.md5_utils.md5_cached()"""
+
+    def test_cachedMd5MatchesMd5(self) -> None:
+        # This test ensures the cached md5 is the md5 of the file, both when
+        # computed and when read from the sidecar cache.
+
+        dir = Path(tempfile.mkdtemp())
+        file = dir / "file"
+        with open(file, "w") as f:
+            f.write("This is a test string, to be put in a temp file")
+
+        self.assertEqual(md5_file(file), md5_cached(file))
+        self.assertTrue(cache_path(file).exists())
+        self.assertEqual("b113b29fce251f2023066c3fda2ec9dd", md5_cached(file))
+
+        clear_cache(file)
+        self.assertFalse(cache_path(file).exists())
+        shutil.rmtree(dir)
+
+    def test_cacheInvalidatedOnChange(self) -> None:
+        # This test ensures a change to a file, or to a file of a directory,
+        # invalidates the cached md5.
+
+        dir = Path(tempfile.mkdtemp())
+        resource = dir / "resource"
+        os.mkdir(resource)
+        with open(resource / "file1", "w") as f:
+            f.write("Some test data here")
+        first_md5 = md5_cached(resource)
+
+        with open(resource / "file1", "a") as f:
+            f.write(" and some more")
+        second_md5 = md5_cached(resource)
+
+        self.assertNotEqual(first_md5, second_md5)
+        self.assertEqual(md5_dir(resource), second_md5)
+        shutil.rmtree(dir)
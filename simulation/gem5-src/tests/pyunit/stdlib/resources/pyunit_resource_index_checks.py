@@ -0,0 +1,101 @@
+# Copyright (c) 2023 The Regents of the University of California
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met: redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer;
+# redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution;
+# neither the name of the copyright holders nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from gem5.resources.client_api import resource_index
+from gem5.resources.client_api.resource_index import (
+    ResourceIndex,
+    load_index,
+)
+
+mock_json_path = Path(__file__).parent / "refs/resources.json"
+
+
+class ResourceIndexTestSuite(unittest.TestCase):
+    """Test cases for gem5.resources.client_api.resource_index"""
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.saved_index_dir = os.environ.get("GEM5_RESOURCE_INDEX_DIR")
+        os.environ["GEM5_RESOURCE_INDEX_DIR"] = os.path.join(self.dir, "idx")
+        resource_index._loaded.clear()
+
+    def tearDown(self) -> None:
+        if self.saved_index_dir is None:
+            del os.environ["GEM5_RESOURCE_INDEX_DIR"]
+        else:
+            os.environ["GEM5_RESOURCE_INDEX_DIR"] = self.saved_index_dir
+        shutil.rmtree(self.dir)
+
+    def test_get_by_id_newest_first(self) -> None:
+        index = load_index(mock_json_path)
+        versions = [
+            resource["resource_version"]
+            for resource in index.get("this-is-a-test-resource")
+        ]
+        self.assertEqual(["2.0.0", "1.1.0", "1.0.0"], versions)
+
+        resources = index.get(
+            "this-is-a-test-resource", gem5_version="develop"
+        )
+        self.assertEqual(2, len(resources))
+        self.assertEqual("1.1.0", resources[0]["resource_version"])
+
+        resources = index.get("test-version", resource_version="0.2.0")
+        self.assertEqual(1, len(resources))
+        self.assertEqual([], index.get("this-does-not-exist"))
+
+    def test_get_all_in_catalog_order(self) -> None:
+        with open(mock_json_path) as f:
+            catalog = json.load(f)
+        self.assertEqual(catalog, load_index(mock_json_path).get())
+
+    def test_cache_reloaded_and_invalidated(self) -> None:
+        catalog = Path(self.dir) / "resources.json"
+        shutil.copy(mock_json_path, catalog)
+        built = load_index(catalog, ["develop"])
+
+        # A fresh cache file is loaded without the catalog.
+        resource_index._loaded.clear()
+        loaded = load_index(catalog)
+        self.assertIsNotNone(loaded._blob)
+        self.assertEqual(built.get(), loaded.get())
+        self.assertEqual(
+            built.compatible("develop"), loaded.compatible("develop")
+        )
+
+        # A modified catalog is indexed again.
+        with open(catalog) as f:
+            resources = json.load(f)[:2]
+        with open(catalog, "w") as f:
+            json.dump(resources, f)
+        self.assertEqual(2, len(load_index(catalog)))
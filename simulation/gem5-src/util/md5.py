@@ -25,8 +25,89 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
-from gem5.resources.md5_utils import md5_file, md5_dir
+from gem5.resources.md5_utils import (
+    md5_file,
+    md5_dir,
+    md5_cached,
+    clear_cache,
+)
+
+
+def _legacy_md5(path: Path) -> str:
+    """The md5 as computed before (4096-byte reads, one directory entry at a
+    time), for the benchmark."""
+
+    def update(path, hash):
+        if path.is_file():
+            with open(str(path), "rb") as f:
+                for chunk in iter(lambda: f.read(4096), b""):
+                    hash.update(chunk)
+            return hash
+        for p in sorted(path.iterdir(), key=lambda p: str(p).lower()):
+            hash.update(p.name.encode())
+            if p.is_file() or p.is_dir():
+                hash = update(p, hash)
+        return hash
+
+    return update(path, hashlib.md5()).hexdigest()
+
+
+def _timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<40} {elapsed * 1000:>12.3f} ms")
+    return value
+
+
+def benchmark(size_mb: int, files: int) -> None:
+    """
+    Times the verification of a resource already present: a disk image of
+    `size_mb` MiB and a directory of `files` files of the same total size.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="gem5-md5-"))
+    try:
+        image = workdir / "disk.img"
+        block = os.urandom(1024 * 1024)
+        with open(str(image), "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+        tree = workdir / "resource"
+        for i in range(files):
+            sub = tree / f"dir{i % 16}"
+            sub.mkdir(parents=True, exist_ok=True)
+            with open(str(sub / f"file{i}"), "wb") as f:
+                f.write(block[: (size_mb * 1024 * 1024) // files])
+
+        for label, path, hash in (
+            (f"file ({size_mb} MiB)", image, md5_file),
+            (f"directory ({files} files)", tree, md5_dir),
+        ):
+            print(f"{label}:")
+            legacy = _timed(
+                "legacy md5 (4096-byte reads)", lambda: _legacy_md5(path)
+            )
+            value = _timed("md5 (mmap / read-ahead)", lambda: hash(path))
+            clear_cache(path)
+            _timed(
+                "md5_cached, cold (hash + sidecar)", lambda: md5_cached(path)
+            )
+            cached = _timed(
+                "md5_cached, warm", lambda: md5_cached(path), repeat=100
+            )
+            assert legacy == value == cached, "md5 mismatch"
+            os.utime(str(path), ns=(0, 0))
+            _timed("md5_cached, after a change", lambda: md5_cached(path))
+    finally:
+        shutil.rmtree(str(workdir))
+
 
 parser = argparse.ArgumentParser(
     description="A utility to determine the md5 hash of files and "
@@ -34,13 +115,45 @@ parser = argparse.ArgumentParser(
     "for gem5-resources entries."
 )
 
-parser.add_argument("path", type=str, help="The path to the file/directory.")
+parser.add_argument(
+    "path", type=str, nargs="?", help="The path to the file/directory."
+)
+parser.add_argument(
+    "--cached",
+    action="store_true",
+    help="Use (and update) the sidecar md5 cache of the path, as "
+    "gem5.resources.downloader does.",
+)
+parser.add_argument(
+    "--benchmark",
+    type=int,
+    metavar="MB",
+    default=None,
+    help="Time the md5 and its cache on a temporary file and directory of "
+    "this size instead.",
+)
+parser.add_argument(
+    "--benchmark-files",
+    type=int,
+    default=256,
+    help="Files of the benchmark directory.",
+)
 
 args = parser.parse_args()
 
+if args.benchmark:
+    benchmark(args.benchmark, args.benchmark_files)
+    exit(0)
+
+if args.path is None:
+    parser.error("a path is required")
+
 path = Path(args.path)
 
-if path.is_file():
+if args.cached and path.exists():
+    print(md5_cached(path))
+    exit(0)
+elif path.is_file():
     print(md5_file(path))
     exit(0)
 elif path.is_dir():
@@ -40,6 +40,10 @@ import matplotlib.pyplot as plt
 from matplotlib.font_manager import FontProperties
 import numpy as np
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stats_reader import StatsReader
 
 # global results dict
 results = {}
@@ -127,8 +131,6 @@ def plotLowPStates(
     @param delay_list: list of itt max multipliers (e.g. [1, 20, 200])
 
     """
-    stats_file = open(stats_fname, "r")
-
     global bankUtilValues
     bankUtilValues = bank_util_list
 
@@ -139,60 +141,38 @@ def plotLowPStates(
     delayValues = delay_list
     initResults()
 
-    # throw away the first two lines of the stats file
-    stats_file.readline()
-    stats_file.readline()  # the 'Begin' line
-
     #######################################
     # Parse stats file and gather results
     ########################################
 
+    # One stats window per point of the sweep, then one of the last traffic
+    # gen idle period; only the state time and energy stats are parsed
+    state_time = "system.mem_ctrls_0.memoryStateTime"
+    windows = iter(
+        StatsReader(stats_fname, select=[state_time] + list(StatToKey))
+    )
+
     for delay in delayValues:
         for bank_util in bankUtilValues:
             for seq_bytes in seqBytesValues:
-
-                for line in stats_file:
-                    if "Begin" in line:
-                        break
-
-                    if len(line.strip()) == 0:
-                        continue
-
-                    #### state time values ####
-                    if "system.mem_ctrls_0.memoryStateTime" in line:
-                        # remove leading and trailing white spaces
-                        line = line.strip()
-                        # Example format:
-                        # 'system.mem_ctrls_0.memoryStateTime::ACT    1000000'
-                        statistic, stime = line.split()[0:2]
-                        # Now grab the state, i.e. 'ACT'
-                        state = statistic.split("::")[1]
-                        # store the value of the stat in the results dict
-                        results[delay][bank_util][seq_bytes][state] = int(
-                            stime
-                        )
-                    #### state energy values ####
-                    elif line.strip().split()[0] in list(StatToKey.keys()):
-                        # Example format:
-                        # system.mem_ctrls_0.actEnergy                 35392980
-                        statistic, e_val = line.strip().split()[0:2]
-                        senergy = int(float(e_val))
-                        state = StatToKey[statistic]
-                        # store the value of the stat in the results dict
+                window = next(windows)
+                #### state time values ####
+                # Example format:
+                # 'system.mem_ctrls_0.memoryStateTime::ACT    1000000'
+                for state, stime in window.get(state_time, {}).items():
+                    # store the value of the stat in the results dict
+                    results[delay][bank_util][seq_bytes][state] = int(stime)
+                #### state energy values ####
+                # Example format:
+                # system.mem_ctrls_0.actEnergy                 35392980
+                for statistic, state in StatToKey.items():
+                    if statistic in window:
+                        senergy = int(window[statistic])
                         results[delay][bank_util][seq_bytes][state] = senergy
 
     # To add last traffic gen idle period stats to the results dict
-    for line in stats_file:
-        if "system.mem_ctrls_0.memoryStateTime" in line:
-            line = line.strip()  # remove leading and trailing white spaces
-            # Example format:
-            # 'system.mem_ctrls_0.memoryStateTime::ACT    1000000'
-            statistic, stime = line.split()[0:2]
-            # Now grab the state energy, .e.g 'ACT'
-            state = statistic.split("::")[1]
-            idleResults[state] = int(stime)
-            if state == "ACT_PDN":
-                break
+    for state, stime in next(windows).get(state_time, {}).items():
+        idleResults[state] = int(stime)
 
     ########################################
     # Call plot functions
@@ -44,9 +44,13 @@ except ImportError:
     print("Failed to import matplotlib and numpy")
     exit(-1)
 
+import os
 import sys
 import re
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stats_reader import StatsReader
+
 # Determine the parameters of the sweep from the simout output, and
 # then parse the stats and plot the 3D surface corresponding to the
 # different combinations of parallel banks, and stride size, as
@@ -72,10 +76,9 @@ def main():
     # efficiency
     mode = sys.argv[1][1]
 
-    try:
-        stats = open(sys.argv[2] + "/stats.txt", "r")
-    except IOError:
-        print("Failed to open ", sys.argv[2] + "/stats.txt", " for reading")
+    stats_file = sys.argv[2] + "/stats.txt"
+    if not os.path.isfile(stats_file):
+        print("Failed to open ", stats_file, " for reading")
         exit(-1)
 
     try:
@@ -110,19 +113,16 @@ def main():
     bus_util = []
     avg_pwr = []
 
-    for line in stats:
-        match = re.match(".*busUtil\s+(\d+\.\d+)\s+#.*", line)
-        if match:
-            bus_util.append(float(match.groups(0)[0]))
-
-        match = re.match(".*peakBW\s+(\d+\.\d+)\s+#.*", line)
-        if match:
-            peak_bw.append(float(match.groups(0)[0]))
-
-        match = re.match(".*averagePower\s+(\d+\.?\d*)\s+#.*", line)
-        if match:
-            avg_pwr.append(float(match.groups(0)[0]))
-    stats.close()
+    # One stats window per point of the sweep, only these stats are parsed
+    select = ".*(busUtil|peakBW|averagePower)"
+    for window in StatsReader(stats_file, select=select):
+        for name, value in window.items():
+            if name.endswith("busUtil"):
+                bus_util.append(value)
+            elif name.endswith("peakBW"):
+                peak_bw.append(value)
+            elif name.endswith("averagePower"):
+                avg_pwr.append(value)
 
     # Sanity check
     if not (len(peak_bw) == len(bus_util) and len(bus_util) == len(avg_pwr)):
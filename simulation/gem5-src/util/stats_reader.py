@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+
+# Streaming reader of gem5 text statistics (stats.txt, stats.txt.gz)
+#
+# A stats.txt holds one window per statistics dump, between
+# "---------- Begin Simulation Statistics ----------" and the matching End
+# line; with periodic dumps (e.g. the power timelines of odroid_xu4_sim.py)
+# a run yields thousands of them. StatsReader yields the windows one at a
+# time as StatsWindow records:
+#
+#   tick, sim_freq    finalTick and simFreq of the window (final_tick and
+#                     sim_freq of older gem5 versions)
+#   scalars           {name id: value}
+#   vectors           {name id: {subname: value}}, from "name::subname" lines
+#   distributions     {name id: {subname: value}}, vectors holding ::samples
+#
+# Names are interned once into a NameTable shared by all windows (and by
+# readers given the same table). With a projection (select) only the
+# selected statistics are converted, the others are skipped on their name,
+# which is decided once per distinct name.
+#
+# Usage:
+#   for window in StatsReader("m5out/stats.txt.gz", select=[...]):
+#       window.tick, window["system.cpu.ipc"], window.get("a::b")
+#   ts = timeseries("m5out/stats.txt", ["system.cpu.ipc", "a::b"])
+#   ts["tick"], ts["seconds"], ts["data"]          # NumPy arrays
+#   ts = load_timeseries("m5out/power.jsonl")      # tsjson:// or npz://
+#
+#   stats_reader.py list m5out/stats.txt
+#   stats_reader.py export m5out/stats.txt -o power.npz \
+#       --select '.*power_model.*'
+#   stats_reader.py benchmark --size 2G [--gzip]
+#
+# On the 2 GiB benchmark dump (82502 windows, one core): 8 selected stats
+# in 5.2s (394 MiB/s, 7.9s gzipped), all stats in 28.3s (72 MiB/s, 29.4s
+# gzipped), against 7.8s (15.1s gzipped) for the legacy regex of 8 stats.
+
+import argparse
+import codecs
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BEGIN = "---------- Begin Simulation Statistics ----------"
+END = "---------- End Simulation Statistics   ----------"
+_UNSEEN = object()
+TICK_STATS = ("finalTick", "final_tick")
+FREQ_STATS = ("simFreq", "sim_freq")
+# Distribution fields of the tsjson:// records, before the buckets
+TIME_SERIES_DIST_FIELDS = ("samples", "mean", "stdev", "underflows",
+                           "overflows", "min_value", "max_value")
+
+
+class NameTable:
+    """Interned statistic names (without ::subname) and their descriptions"""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.descriptions = []
+
+    def intern(self, name, description=""):
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.descriptions.append(description)
+        return idx
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+
+class StatsWindow:
+    """The statistics of one dump"""
+
+    __slots__ = (
+        "index",
+        "tick",
+        "sim_freq",
+        "names",
+        "scalars",
+        "vectors",
+        "distributions",
+    )
+
+    def __init__(self, index, names):
+        self.index = index
+        self.tick = None
+        self.sim_freq = None
+        self.names = names
+        self.scalars = {}
+        self.vectors = {}
+        self.distributions = {}
+
+    @property
+    def seconds(self):
+        """Simulated time at the end of the window"""
+        if self.tick is None or not self.sim_freq:
+            return None
+        return self.tick / self.sim_freq
+
+    def _finish(self):
+        # Vectors & distributions share the name::subname format
+        for idx in [i for i, v in self.vectors.items() if "samples" in v]:
+            self.distributions[idx] = self.vectors.pop(idx)
+
+    def __getitem__(self, name):
+        """Value of "name" (scalar, or {subname: value}) or "name::subname" """
+        base, _, sub = name.partition("::")
+        idx = self.names.ids.get(base)
+        if idx is not None:
+            if not sub and idx in self.scalars:
+                return self.scalars[idx]
+            group = self.vectors.get(idx)
+            if group is None:
+                group = self.distributions.get(idx)
+            if group is not None:
+                if not sub:
+                    return group
+                if sub in group:
+                    return group[sub]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def items(self):
+        """(name, value) of every statistic, vector elements as name::subname,
+        in order of first appearance in the file"""
+        names = self.names.names
+        groups = dict(self.vectors)
+        groups.update(self.distributions)
+        for idx in sorted(set(self.scalars) | set(groups)):
+            if idx in self.scalars:
+                yield names[idx], self.scalars[idx]
+            else:
+                for sub, value in groups[idx].items():
+                    yield names[idx] + "::" + sub, value
+
+
+def open_stats(path, binary=False):
+    """Text (or binary) stream of a stats file, gzip-compressed or not"""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        stream = gzip.open(path, "rb")
+    else:
+        stream = open(path, "rb")
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+
+
+def _selector(select):
+    """Predicate on statistic names of a projection"""
+    if select is None:
+        return lambda name: True
+    if isinstance(select, re.Pattern):
+        return lambda name: select.fullmatch(name) is not None
+    if isinstance(select, str):
+        pattern = re.compile(select)
+        return lambda name: pattern.fullmatch(name) is not None
+    if callable(select):
+        return select
+    names = {name.partition("::")[0] for name in select}
+    return names.__contains__
+
+
+def _value(text):
+    try:
+        return float(text)
+    except ValueError:
+        return float("nan")
+
+
+# Statistic lines: name[::subname], whitespace, value, ... Matching on the
+# newline rather than on ^ lets the regex engine skip to line starts
+_LINE = r"\n({})[ \t]+([^ \t\n]+)"
+_ANY_NAME = r"[^ \t\n\-][^ \t\n]*"
+_BLOCK_SIZE = 1 << 22
+
+
+def _trie_regex(names):
+    """Alternation of names factored on their common prefixes (cheaper for
+    the regex engine than a flat alternation of similar names)"""
+    tree = {}
+    for name in names:
+        node = tree
+        for ch in name:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        if list(node) == [""]:
+            return ""
+        alts = [re.escape(ch) + build(node[ch]) for ch in sorted(node) if ch]
+        regex = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + regex + ")?" if "" in node else regex
+
+    return build(tree)
+
+
+def _line_pattern(select):
+    """Regex of the statistic lines of a projection: the names (and the
+    tick & frequency) for a list of names, any line otherwise"""
+    if select is None or isinstance(select, (str, re.Pattern)) or callable(
+        select
+    ):
+        return re.compile(_LINE.format(_ANY_NAME))
+    names = {name.partition("::")[0] for name in select}
+    names.update(TICK_STATS + FREQ_STATS)
+    return re.compile(
+        _LINE.format(_trie_regex(names) + r"(?:::[^ \t\n]+)?")
+    )
+
+
+def _windows_text(path):
+    """(text between the Begin and End lines, True) of each window, and
+    (text read, False) of a window cut short by a read error"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open_stats(path, binary=True) as stream:
+        buf = ""
+        done = False
+        error = None
+        while not done and error is None:
+            chunks = []
+            size = 0
+            while size < _BLOCK_SIZE:
+                try:
+                    # read1: a corrupt gzip tail only costs its last block
+                    data = stream.read1(_BLOCK_SIZE - size)
+                except (EOFError, OSError, zlib.error) as e:
+                    # e.g. a gzip stream of a run still going or killed
+                    print(f"WARNING: {path} ends early ({e})", file=sys.stderr)
+                    error = e
+                    break
+                if not data:
+                    done = True
+                    break
+                chunks.append(decoder.decode(data))
+                size += len(data)
+            buf += "".join(chunks)
+            start = 0
+            while True:
+                begin = buf.find(BEGIN, start)
+                if begin < 0:
+                    buf = buf[-len(BEGIN) :]
+                    break
+                end = buf.find(END, begin)
+                if end < 0:
+                    buf = buf[begin:]
+                    break
+                yield buf[begin + len(BEGIN) : end], True
+                start = end + len(END)
+        if error is not None and buf.startswith(BEGIN):
+            yield buf[len(BEGIN) :], False
+
+
+class StatsReader:
+    """Iterable of the windows of a stats file, read lazily on each iteration
+
+    select: names (of scalars, vectors or name::subname), a regular
+    expression (str or compiled, matching whole names without ::subname)
+    or a predicate; None parses every statistic. Lines of a list of names
+    are found by a single regular expression, without looking at the
+    others in Python.
+    """
+
+    def __init__(self, path, select=None, names=None):
+        self.path = path
+        self.names = names if names is not None else NameTable()
+        self._select = _selector(select)
+        self._pattern = _line_pattern(select)
+        # stat key (name or name::subname) -> (id, subname), None if skipped
+        self._keys = {}
+
+    def _decide(self, key, text, start):
+        """Decision of a statistic seen for the first time, and the offset
+        from which to look for the next one: the lines of the pattern are
+        found in order, so the line of the key is at or after start"""
+        base, _, sub = key.partition("::")
+        decision = None
+        if self._select(base):
+            line = "\n" + key
+            pos = text.find(line, start)
+            # "\nkey" followed by the separator, not a longer name
+            while pos >= 0 and text[pos + len(line)] not in " \t":
+                pos = text.find(line, pos + 1)
+            description = ""
+            if pos >= 0:
+                end = text.find("\n", pos + 1)
+                start = end if end >= 0 else len(text)
+                rest = text[pos + len(line) : start]
+                description = rest.partition("#")[2].strip()
+            decision = (self.names.intern(base, description), sub or None)
+        self._keys[key] = decision
+        return decision, start
+
+    def _window(self, index, text):
+        keys = self._keys
+        window = StatsWindow(index, self.names)
+        scalars = window.scalars
+        vectors = window.vectors
+        start = 0
+        for key, value in self._pattern.findall(text):
+            if key in TICK_STATS:
+                window.tick = int(_value(value))
+            elif key in FREQ_STATS:
+                window.sim_freq = int(_value(value))
+            decision = keys.get(key, _UNSEEN)
+            if decision is _UNSEEN:
+                decision, start = self._decide(key, text, start)
+            if decision is None:
+                continue
+            idx, sub = decision
+            try:
+                value = float(value)
+            except ValueError:
+                value = float("nan")
+            if sub is None:
+                scalars[idx] = value
+            else:
+                group = vectors.get(idx)
+                if group is None:
+                    group = vectors[idx] = {}
+                group[sub] = value
+        window._finish()
+        return window
+
+    def __iter__(self):
+        index = 0
+        for text, complete in _windows_text(self.path):
+            window = self._window(index, text)
+            if complete or window.tick is not None:
+                yield window
+            index += 1
+
+
+def read_windows(path, select=None):
+    """List of the windows of a stats file"""
+    return list(StatsReader(path, select))
+
+
+def timeseries(path, columns, windows=None):
+    """NumPy time series of statistics (scalars or name::subname), one row
+    per window: {"tick", "seconds", "columns", "data"}, missing values NaN"""
+    if np is None:
+        raise ImportError("timeseries needs NumPy")
+    if windows is None:
+        windows = StatsReader(path, select=columns)
+    nan = float("nan")
+    ticks = []
+    seconds = []
+    rows = []
+    for window in windows:
+        ticks.append(window.tick if window.tick is not None else -1)
+        s = window.seconds
+        seconds.append(s if s is not None else nan)
+        rows.append([window.get(c, nan) for c in columns])
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    return {
+        "tick": np.array(ticks, dtype=np.int64),
+        "seconds": np.array(seconds, dtype=np.float64),
+        "columns": list(columns),
+        "data": data,
+    }
+
+
+def _flat_values(values):
+    """Row of a tsjson:// record, as the columns of its header"""
+    row = []
+    for value in values:
+        if isinstance(value, dict):
+            row += [value[f] for f in TIME_SERIES_DIST_FIELDS]
+            row += value["buckets"]
+        elif isinstance(value, list):
+            row += value
+        else:
+            row.append(value)
+    return row
+
+
+def _merge_segments(segments):
+    """(columns, data) of (columns, rows) segments of a time series whose
+    columns changed, on the union of the columns (NaN where missing)"""
+    names = list(dict.fromkeys(c for cols, _ in segments for c in cols))
+    index = {c: i for i, c in enumerate(names)}
+    parts = []
+    for cols, rows in segments:
+        part = np.full((len(rows), len(names)), np.nan)
+        part[:, [index[c] for c in cols]] = np.asarray(
+            rows, dtype=np.float64).reshape(len(rows), len(cols))
+        parts.append(part)
+    data = np.concatenate(parts) if parts else np.zeros((0, len(names)))
+    return names, data
+
+
+def load_timeseries(path, columns=None):
+    """Time series appended by the tsjson:// or npz:// stat visitors, as
+    returned by timeseries() (all the recorded columns by default, the
+    columns of stats recorded from a later dump on being NaN before)"""
+    if np is None:
+        raise ImportError("load_timeseries needs NumPy")
+    if path.endswith(".npz"):
+        with np.load(path) as archive:
+            freq = float(archive["sim_freq"])
+            blocks = sorted(f for f in archive.files if f.startswith("data_"))
+            ticks = [archive["tick_" + f[5:]] for f in blocks]
+            # Columns of a block: columns.npy or its latest columns_<n>.npy
+            cols = list(archive["columns"])
+            segments = []
+            for f in blocks:
+                if "columns_" + f[5:] in archive.files:
+                    cols = list(archive["columns_" + f[5:]])
+                segments.append((cols, archive[f]))
+        ticks = np.concatenate(ticks) if ticks else np.zeros(0)
+    else:
+        freq, ticks, segments = None, [], []
+        with open_stats(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line of a time series being written
+                    break
+                if "header" in record:
+                    segments.append((record["header"]["columns"], []))
+                    freq = record["header"]["sim_freq"]
+                    continue
+                ticks.append(record["tick"])
+                segments[-1][1].append(_flat_values(record["values"]))
+    names, data = _merge_segments(segments)
+    ticks = np.asarray(ticks, dtype=np.int64)
+    if columns is not None:
+        data = data[:, [names.index(c) for c in columns]]
+        names = list(columns)
+    return {
+        "tick": ticks,
+        "seconds": ticks / freq if freq else np.full(len(ticks), np.nan),
+        "columns": [str(c) for c in names],
+        "data": data,
+    }
+
+
+def _scalar_columns(path, select):
+    """Names of the numeric statistics (vector elements as name::subname) of
+    the first window"""
+    for window in StatsReader(path, select):
+        return [name for name, _ in window.items()]
+    return []
+
+
+# ---------------------------------------------------------------------------
+# Benchmark on a synthetic periodic dump
+
+
+def _window_text(tick, seed, cpus=8):
+    lines = [
+        "",
+        BEGIN,
+        f"simSeconds {tick / 1e12:.6f} # Number of seconds simulated (Second)",
+        f"simTicks {tick} # Number of ticks simulated (Tick)",
+        f"finalTick {tick} # Number of ticks from beginning of simulation",
+        "simFreq 1000000000000 # The number of ticks per simulated second",
+    ]
+    for cpu in range(cpus):
+        cl = "bigCluster" if cpu >= cpus // 2 else "littleCluster"
+        p = f"system.{cl}.cpus{cpu % (cpus // 2)}"
+        v = seed + cpu
+        lines += [
+            f"{p}.numCycles {1000 + v} # Number of cpu cycles simulated",
+            f"{p}.ipc {0.5 + v / 100:.6f} # IPC: instructions per cycle",
+            f"{p}.commitStats0.numInsts {800 + v} # Number of instructions",
+            f"{p}.dcache.overallMisses::total {30 + v} # overall misses",
+            f"{p}.dcache.overallAccesses::total {900 + v} # overall accesses",
+            f"{p}.power_model.dynamicPower {0.1 + v / 1000:.6f} # (Watt)",
+            f"{p}.power_model.staticPower {0.01 + v / 1e4:.6f} # (Watt)",
+        ]
+        for i, op in enumerate(["No_OpClass", "IntAlu", "IntMult", "MemRead",
+                                "MemWrite", "FloatAdd", "SimdAlu", "total"]):
+            lines.append(
+                f"{p}.commitStats0.committedInstType::{op} {v * i} "
+                f"{i:.2f}% {i * 2:.2f}% # Class of committed instruction"
+            )
+        lines.append(f"{p}.icache.missLatency::samples {v} # latency")
+        lines.append(f"{p}.icache.missLatency::mean {v / 3:.6f} # latency")
+        for b in range(0, 400, 20):
+            lines.append(
+                f"{p}.icache.missLatency::{b}-{b + 19} {b + v} "
+                f"1.00% 50.00% # latency"
+            )
+        lines.append(f"{p}.icache.missLatency::total {v} # latency")
+    lines += [END, ""]
+    return "\n".join(lines) + "\n"
+
+
+def _legacy_read(path, names):
+    """Per-line union regex, then per-statistic regexes, as the tools did"""
+    union = re.compile("|".join("^" + n + r"\s+[\d\.]+" for n in names))
+    regexes = [
+        (n, re.compile("^" + n + r"\s+([\d\.e\-]+)\s+# (.*)$")) for n in names
+    ]
+    values = {n: [] for n in names}
+    with open_stats(path) as f:
+        for line in f:
+            if union.match(line):
+                for n, regex in regexes:
+                    m = regex.match(line)
+                    if m:
+                        values[n].append(float(m.group(1)))
+    return values
+
+
+def _parse_size(size):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    size = size.strip().upper()
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def benchmark(size, compress=False, keep=None):
+    path = keep or os.path.join(
+        tempfile.mkdtemp(), "stats.txt" + (".gz" if compress else "")
+    )
+    if not os.path.exists(path):
+        opener = gzip.open if compress else open
+        written = 0
+        window = 0
+        start = time.time()
+        with opener(path, "wt") as f:
+            while written < size:
+                text = _window_text((window + 1) * 10**9, window % 7)
+                f.write(text)
+                written += len(text)
+                window += 1
+        print(f"Wrote {window} windows ({written >> 20} MiB) to {path} "
+              f"in {time.time() - start:.1f}s")
+    raw = os.path.getsize(path)
+    selected = [
+        f"system.bigCluster.cpus{c}.{s}"
+        for c in range(4)
+        for s in ["ipc", "power_model.dynamicPower"]
+    ]
+
+    def timed(label, func):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        print(f"{label:<34} {elapsed:8.2f}s {raw / elapsed / (1 << 20):9.1f} "
+              "MiB/s (file)")
+        return result
+
+    legacy = timed(
+        "legacy regex, 8 stats", lambda: _legacy_read(path, selected)
+    )
+    ts = timed("StatsReader -> numpy, 8 stats",
+               lambda: timeseries(path, selected))
+    timed("StatsReader, all stats",
+          lambda: sum(1 for _ in StatsReader(path)))
+    for i, name in enumerate(selected):
+        if legacy[name] != list(ts["data"][:, i]):
+            raise Exception(f"Values of {name} differ from the legacy parse")
+    print(f"{len(ts['tick'])} windows, values equal to the legacy parse")
+    if not keep:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Streaming reader of gem5 stats.txt[.gz] files"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("list", help="Statistics of the first window")
+    p.add_argument("stats")
+    p.add_argument("--select", default=None, help="Regex of the names")
+    p = sub.add_parser("export", help="Time series to .npz or .csv")
+    p.add_argument("stats")
+    p.add_argument("-o", "--output", required=True, help=".npz or .csv")
+    p.add_argument("--select", default=None, help="Regex of the names")
+    p.add_argument("columns", nargs="*", help="Statistics (name[::sub])")
+    p = sub.add_parser("benchmark", help="Parse a synthetic periodic dump")
+    p.add_argument("--size", default="2G", help="Size of the dump, e.g. 2G")
+    p.add_argument("--gzip", action="store_true", help="Gzip the dump")
+    p.add_argument("--keep", default=None, help="Dump path to keep/reuse")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        reader = StatsReader(args.stats, args.select)
+        for window in reader:
+            for name, value in window.items():
+                idx = reader.names.ids[name.partition("::")[0]]
+                print(f"{name:<60} {value:<16g} # "
+                      f"{reader.names.descriptions[idx]}")
+            break
+    elif args.command == "export":
+        columns = args.columns or _scalar_columns(args.stats, args.select)
+        ts = timeseries(args.stats, columns)
+        if args.output.endswith(".csv"):
+            header = ",".join(["tick", "seconds"] + columns)
+            table = np.column_stack([ts["tick"], ts["seconds"], ts["data"]])
+            np.savetxt(args.output, table, delimiter=",", header=header,
+                       comments="", fmt="%.12g")
+        else:
+            np.savez(args.output, tick=ts["tick"], seconds=ts["seconds"],
+                     columns=np.array(columns), data=ts["data"])
+        print(f"{len(ts['tick'])} windows x {len(columns)} statistics "
+              f"written to {args.output}")
+    else:
+        benchmark(_parse_size(args.size), args.gzip, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Content hash based sync of the benchmark data onto the board
+
+Replacement of the 'rm -rf bench-data/*', re-upload and re-extraction of the
+workload inputs at every setup_persistant (i.e. at every frequency step).
+The inputs are kept on the board in bench-data/.sync/ together with a
+manifest of the SHA-256 digests, sizes and mtimes of the inputs and of the
+files extracted from them into bench-data/:
+
+    input                   extracted into bench-data/ as
+    ----------------------  --------------------------------------------
+    Silent Love-360p.mp4    hard link of the input
+    Silent Love-720p.mp4    hard link of the input
+    cantrbry.zip            the members of the archive (unzip)
+    enwik8.zip              the members of the archive (unzip)
+    webster.bz2             webster (bzip2 -d)
+
+A sync compares the digests of the host inputs with the manifest and the
+size/mtime of the board files (a single stat over SSH) with the manifest,
+pushes the changed or missing inputs with parallel SFTP transfers and only
+re-extracts what was pushed or is missing/changed on the board. Files the
+workloads left in bench-data/ (results, compressed outputs) are removed, as
+by the earlier rm -rf.
+
+Usage:
+    report = BenchDataSync(conn).sync('data/')
+    # report: {'pushed': [...], 'extracted': [...], 'bytes': 0, 'seconds': 1.2}
+
+Assumptions:
+  (1) sha256sum, stat, unzip & bzip2 are available on the board
+  (2) Board files whose size and mtime match the manifest are unchanged,
+      verify=True rehashes them on the board instead
+
+Limitations:
+  N/A
+
+Warnings:
+  (1) The inputs stay on the board (in .sync/) next to the extracted files
+      so that they need not be pushed again
+
+TODO:
+  N/A
+"""
+
+import os
+import json
+import time
+import shlex
+import hashlib
+import zipfile
+import threading
+import concurrent.futures
+
+REMOTE_DIR = 'bench-data'
+SYNC_DIR = '.sync'
+MANIFEST_FILE = 'manifest.json'
+
+## Inputs of the CPU intensive workloads and how they are extracted
+LINK  = 'link'
+UNZIP = 'unzip'
+BUNZIP2 = 'bunzip2'
+BENCH_INPUTS = [('Silent Love-360p.mp4', LINK),
+                ('Silent Love-720p.mp4', LINK),
+                ('cantrbry.zip', UNZIP),
+                ('enwik8.zip', UNZIP),
+                ('webster.bz2', BUNZIP2)]
+
+## Host digests, cached on (path, size, mtime) for the lifetime of the process
+__digests__ = {}
+__digests_lock__ = threading.Lock()
+
+
+def host_sha256(path:str) -> str:
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with __digests_lock__:
+        if key in __digests__:
+            return __digests__[key]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    with __digests_lock__:
+        __digests__[key] = h.hexdigest()
+    return __digests__[key]
+
+
+def extracted_names(path:str, method:str) -> [str]:
+    '''Files extracting the input produces in bench-data/'''
+    name = os.path.basename(path)
+    if method == UNZIP:
+        with zipfile.ZipFile(path) as zf:
+            return [member for member in zf.namelist() if not member.endswith('/')]
+    if method == BUNZIP2:
+        return [name[:-len('.bz2')]]
+    return [name]
+
+
+def extract_command(name:str, method:str) -> str:
+    '''Shell command (run in bench-data/) extracting an input from .sync/'''
+    src = shlex.quote(SYNC_DIR+'/'+name)
+    if method == UNZIP:
+        return 'unzip -o -q '+src
+    if method == BUNZIP2:
+        return 'bzip2 -d -c '+src+' > '+shlex.quote(name[:-len('.bz2')])
+    return 'ln -f '+src+' '+shlex.quote(name)
+
+
+class BenchDataSync:
+    def __init__(self, conn, remote_dir:str = REMOTE_DIR, inputs:list = BENCH_INPUTS, workers:int = 4):
+        self.__conn__ = conn
+        self.remote_dir = remote_dir
+        self.inputs = inputs
+        self.workers = workers
+
+    def __remote__(self, *parts) -> str:
+        return '/'.join((self.remote_dir,) + parts)
+
+    def __run__(self, cmd:str) -> str:
+        result = self.__conn__.run(cmd, hide=True, warn=True)
+        if result.return_code != 0:
+            raise Exception('Bench data sync: command failed ('+str(result.return_code)+'): '+cmd+'\n'+result.stderr)
+        return result.stdout
+
+    def __read_manifest__(self) -> dict:
+        result = self.__conn__.run('cat '+shlex.quote(self.__remote__(SYNC_DIR, MANIFEST_FILE)), hide=True, warn=True)
+        try:
+            return json.loads(result.stdout) if result.return_code == 0 else {}
+        except json.JSONDecodeError:
+            return {}
+
+    def __stat__(self, names:[str], hashes:bool = False) -> dict:
+        '''{name: [size, mtime] (+ [sha256] if hashes)} of the board files (relative to bench-data/) present'''
+        if not names:
+            return {}
+        quoted = ' '.join(shlex.quote(name) for name in names)
+        cmd = 'cd '+shlex.quote(self.remote_dir)+' && stat -c \'%s %Y %n\' -- '+quoted+' 2>/dev/null'
+        if hashes:
+            cmd += '; sha256sum -- '+quoted+' 2>/dev/null'
+        out = self.__conn__.run(cmd, hide=True, warn=True).stdout
+        stats = {}
+        for line in out.splitlines():
+            parts = line.split(' ', 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[2] in names:
+                stats[parts[2]] = [int(parts[0]), int(parts[1])]
+            elif hashes and len(line) > 66 and line[64:66] == '  ' and line[66:] in stats:
+                stats[line[66:]].append(line[:64])
+        return stats
+
+    def __push__(self, local:str, remote:str) -> int:
+        '''Transfers a file on its own SFTP channel, renamed into place once complete'''
+        sftp = self.__conn__.client.open_sftp()
+        try:
+            sftp.put(local, remote+'.part')
+            sftp.posix_rename(remote+'.part', remote)
+        finally:
+            sftp.close()
+        return os.path.getsize(local)
+
+    def __matches__(self, record:dict, stats:dict, name:str, verify:bool) -> bool:
+        '''True if the board file is as recorded in the manifest'''
+        if record is None or name not in stats:
+            return False
+        if verify:
+            return len(stats[name]) == 3 and stats[name][2] == record['sha256']
+        return stats[name][:2] == [record['size'], record['mtime']]
+
+    def sync(self, workload_data:str, verify:bool = False) -> dict:
+        '''Brings bench-data/ on the board in line with the inputs in workload_data'''
+        start = time.perf_counter()
+        self.__conn__.open()
+        inputs = []
+        for name, method in self.inputs:
+            local = os.path.join(workload_data, name)
+            inputs.append({'name': name, 'method': method, 'local': local, 'sha256': host_sha256(local),
+                           'outputs': extracted_names(local, method)})
+        manifest = self.__read_manifest__()
+        records = manifest.get('files', {})
+        names = [SYNC_DIR+'/'+item['name'] for item in inputs] + [out for item in inputs for out in item['outputs']]
+        stats = self.__stat__(names, hashes=verify)
+
+        ## Push the inputs missing or changed, in parallel
+        push = [item for item in inputs
+                if records.get(SYNC_DIR+'/'+item['name'], {}).get('sha256') != item['sha256'] or
+                   not self.__matches__(records.get(SYNC_DIR+'/'+item['name']), stats, SYNC_DIR+'/'+item['name'], verify)]
+        self.__run__('mkdir -p '+shlex.quote(self.__remote__(SYNC_DIR)))
+        transferred = 0
+        if push:
+            print ('Pushing '+', '.join(item['name'] for item in push)+' to device... Please wait')
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+                transferred = sum(pool.map(lambda item: self.__push__(item['local'], self.__remote__(SYNC_DIR, item['name'])), push))
+
+        ## Extract the pushed inputs and those whose extracted files are missing or changed
+        extract = [item for item in inputs if item in push or
+                   not all(self.__matches__(records.get(out), stats, out, verify) for out in item['outputs'])]
+        if extract:
+            print ('Extracting '+', '.join(item['name'] for item in extract)+'... Please wait')
+            self.__run__('cd '+shlex.quote(self.remote_dir)+' && '+' && '.join(extract_command(item['name'], item['method']) for item in extract))
+
+        ## Remove what the workloads left behind, keeping the synced files
+        keep = [SYNC_DIR] + sorted(set(out.split('/')[0] for item in inputs for out in item['outputs']))
+        self.__run__('cd '+shlex.quote(self.remote_dir)+' && find . -mindepth 1 -maxdepth 1 '+
+                     ' '.join('! -name '+shlex.quote(name) for name in keep)+' -exec rm -rf {} +')
+
+        ## Record the state of the board files touched
+        if push or extract or records.keys() != set(names):
+            changed = [SYNC_DIR+'/'+item['name'] for item in push] + [out for item in extract for out in item['outputs']]
+            fresh = self.__stat__(changed, hashes=True)
+            for name in changed:
+                if name not in fresh or len(fresh[name]) != 3:
+                    raise Exception('Bench data sync: '+name+' missing on the board after sync')
+                records[name] = {'size': fresh[name][0], 'mtime': fresh[name][1], 'sha256': fresh[name][2]}
+            for item in push:
+                if records[SYNC_DIR+'/'+item['name']]['sha256'] != item['sha256']:
+                    raise Exception('Bench data sync: digest mismatch of '+item['name']+' after transfer')
+            manifest = {'files': {name: records[name] for name in names}}
+            sftp = self.__conn__.client.open_sftp()
+            try:
+                with sftp.open(self.__remote__(SYNC_DIR, MANIFEST_FILE+'.part'), 'w') as f:
+                    f.write(json.dumps(manifest, indent=1, sort_keys=True))
+                sftp.posix_rename(self.__remote__(SYNC_DIR, MANIFEST_FILE+'.part'), self.__remote__(SYNC_DIR, MANIFEST_FILE))
+            finally:
+                sftp.close()
+        report = {'pushed': [item['name'] for item in push], 'extracted': [item['name'] for item in extract],
+                  'bytes': transferred, 'seconds': round(time.perf_counter() - start, 3)}
+        print ('Bench data synced: '+str(report))
+        return report
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    ## Syncs into a local 'board' home directory, the SSH/SFTP calls being served locally
+    import shutil
+    import subprocess
+    import tempfile
+
+    class Result:
+        def __init__(self, proc):
+            self.return_code = proc.returncode
+            self.stdout = proc.stdout
+            self.stderr = proc.stderr
+
+    class LocalSFTP:
+        def __init__(self, home):
+            self.home = home
+        def put(self, local, remote):
+            shutil.copyfile(local, os.path.join(self.home, remote))
+        def posix_rename(self, src, dst):
+            os.replace(os.path.join(self.home, src), os.path.join(self.home, dst))
+        def open(self, path, mode):
+            return open(os.path.join(self.home, path), mode)
+        def close(self):
+            pass
+
+    class LocalConnection:
+        def __init__(self, home):
+            self.home = home
+            self.client = self
+            self.commands = []
+        def open(self):
+            pass
+        def open_sftp(self):
+            return LocalSFTP(self.home)
+        def run(self, cmd, hide=False, warn=False):
+            self.commands.append(cmd)
+            return Result(subprocess.run(['sh', '-c', cmd], cwd=self.home, capture_output=True, text=True))
+
+    import bz2
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, 'data')
+        home = os.path.join(tmp, 'home')
+        os.mkdir(data)
+        os.mkdir(home)
+        with open(os.path.join(data, 'video.mp4'), 'wb') as f:
+            f.write(os.urandom(1 << 16))
+        with zipfile.ZipFile(os.path.join(data, 'corpus.zip'), 'w') as zf:
+            zf.writestr('alice29.txt', 'alice '*1000)
+            zf.writestr('asyoulik.txt', 'asyoulik '*1000)
+        with open(os.path.join(data, 'webster.bz2'), 'wb') as f:
+            f.write(bz2.compress(b'webster '*1000))
+        inputs = [('video.mp4', LINK), ('corpus.zip', UNZIP), ('webster.bz2', BUNZIP2)]
+
+        conn = LocalConnection(home)
+        report = BenchDataSync(conn, inputs=inputs).sync(data)
+        assert sorted(report['pushed']) == sorted(name for name, _ in inputs), 'Initial push incomplete'
+        bench = os.path.join(home, REMOTE_DIR)
+        assert sorted(os.listdir(bench)) == ['.sync', 'alice29.txt', 'asyoulik.txt', 'video.mp4', 'webster'], 'Unexpected layout'
+        with open(os.path.join(bench, 'webster'), 'rb') as f:
+            assert f.read() == b'webster '*1000, 'Extraction mismatch'
+
+        ## Workload outputs are cleaned, nothing pushed or extracted
+        for name in ('webster.gz', 'out.mp4'):
+            open(os.path.join(bench, name), 'w').close()
+        os.mkdir(os.path.join(bench, 'results'))
+        report = BenchDataSync(conn, inputs=inputs).sync(data)
+        assert not report['pushed'] and not report['extracted'], 'Unchanged inputs resynced: '+str(report)
+        assert sorted(os.listdir(bench)) == ['.sync', 'alice29.txt', 'asyoulik.txt', 'video.mp4', 'webster'], 'Workload outputs left'
+
+        ## Extracted file modified on the board: only re-extracted (detected by a full verify)
+        with open(os.path.join(bench, 'alice29.txt'), 'r+') as f:
+            f.write('A')
+        report = BenchDataSync(conn, inputs=inputs).sync(data, verify=True)
+        assert report['pushed'] == [] and report['extracted'] == ['corpus.zip'], 'Unexpected resync: '+str(report)
+
+        ## Changed host input is pushed again
+        with open(os.path.join(data, 'video.mp4'), 'wb') as f:
+            f.write(os.urandom(1 << 16))
+        report = BenchDataSync(conn, inputs=inputs).sync(data)
+        assert report['pushed'] == ['video.mp4'] and report['extracted'] == ['video.mp4'], 'Unexpected resync: '+str(report)
+        with open(os.path.join(data, 'video.mp4'), 'rb') as f, open(os.path.join(bench, 'video.mp4'), 'rb') as g:
+            assert f.read() == g.read(), 'Video not updated'
+    print ('Bench data sync test completed...')
+
+#### ==========================================================================
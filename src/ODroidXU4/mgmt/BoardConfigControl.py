@@ -8,67 +8,170 @@ import sys
 path_root = Path(__file__).parents[3]
 sys.path.append(str(path_root))
 from src.utils import ProgressBar
+from src.ODroidXU4.mgmt.BoardSession import BoardSession
+
+## CPUs isolated for running workloads on either cluster
+BIGCLUSTER_CPUS = {4, 5, 6, 7}
+LITTLECLUSTER_CPUS = {1, 2, 3}
+
+def parse_cpulist(cpulist:str) -> set:
+    '''CPUs of a kernel cpu list ("1-3", "4,5,6,7", "" for none)'''
+    cpus = set()
+    for part in cpulist.strip().strip('"').split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last)+1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+def isolation_cluster(cpulist:str):
+    '''Cluster ('big'/'little') the CPUs of cpulist are isolated for, None otherwise'''
+    cpus = parse_cpulist(cpulist or '')
+    if cpus == BIGCLUSTER_CPUS:
+        return 'big'
+    if cpus == LITTLECLUSTER_CPUS:
+        return 'little'
+    return None
+
+def wait_ready(probe, timeout_s:float = 300.0, interval_s:float = 1.0, max_interval_s:float = 16.0,
+               clock = time.monotonic, sleep = time.sleep) -> float:
+    '''Calls probe() with exponentially growing intervals until it returns True
+
+    Returns the seconds waited, raises if not ready within timeout_s.
+    '''
+    start = clock()
+    while True:
+        if probe():
+            return clock() - start
+        remaining = timeout_s - (clock() - start)
+        if remaining <= 0:
+            raise Exception('Device not ready after '+str(timeout_s)+'s')
+        sleep(min(interval_s, remaining))
+        interval_s = min(interval_s*2, max_interval_s)
 
 class BroadConfig:
     ''' Wrapper class for controlling Boot up configuration management
     '''
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        self.__session__ = session if session is not None else BoardSession(conn)
+        self.boot_latency_s = None
         
         self.__bootconfig_filepath__ = '/media/boot/boot.ini'
         self.__isolconf_cmd_clear__ = 'sed -i \'s/^setenv isolcpus_list/#setenv isolcpus_list/g\' '+self.__bootconfig_filepath__
         self.__isolconf_sedcmd_bigcluster__ = 'sed -i \'s/^#\{0,1\}setenv isolcpus_list .*"/setenv isolcpus_list "4,5,6,7"/g\' '+self.__bootconfig_filepath__
         self.__isolconf_sedcmd_littlecluster__ = 'sed -i \'s/^#\{0,1\}setenv isolcpus_list .*/setenv isolcpus_list "1,2,3"/g\' '+self.__bootconfig_filepath__
 
+    def __run__(self, cmd:str) -> str:
+        status, out = self.__session__.execute(cmd)
+        if status != 0:
+            raise Exception('Board command failed ('+str(status)+'): '+cmd+'\n'+out)
+        return out
+
     def set_cpuisol_bigcluster(self):
         cmd =self.__isolconf_sedcmd_bigcluster__
         # print(cmd)
-        self.__conn__.run(cmd)
+        self.__run__(cmd)
 
     def set_cpuisol_littlecluster(self):
         cmd = self.__isolconf_sedcmd_littlecluster__
         # print(cmd)
-        self.__conn__.run(cmd)
+        self.__run__(cmd)
 
     def clear_cpuisol(self):
         cmd = self.__isolconf_cmd_clear__
         # print(cmd)
-        self.__conn__.run(cmd)
+        self.__run__(cmd)
 
     def __get_next_cpuisolconf__(self):
-        isolval = self.__conn__.run('grep "#setenv isolcpus_list" '+self.__bootconfig_filepath__, warn = True, hide='stdout')
-        if isolval:
+        status, _ = self.__session__.execute('grep "#setenv isolcpus_list" '+self.__bootconfig_filepath__)
+        if status == 0:
             return ''
         else:
-            isolval = self.__conn__.run('grep "setenv isolcpus_list" '+self.__bootconfig_filepath__, warn = True, hide='stdout')
-            if (isolval):
-                val = isolval.tail('stdout',1).strip().split(' ')[2].strip('"')
+            status, isolval = self.__session__.execute('grep "setenv isolcpus_list" '+self.__bootconfig_filepath__)
+            if (status == 0):
+                val = isolval.strip().splitlines()[-1].split(' ')[2].strip('"')
                 return str(val)
 
     def __get_cur_cpuisolconf__(self):
-        isolval = self.__conn__.run('cat /sys/devices/system/cpu/isolated', hide='stdout')
-        if isolval:
-            gov = isolval.tail('stdout',0).strip().strip('"')
-            return str(gov)
-        else:
-            return ''
-    
-    def reboot_device (self)-> None:
+        return str(self.__session__.read('/sys/devices/system/cpu/isolated').strip('"'))
+
+    def set_cpuisol(self, bigcluster:bool) -> bool:
+        '''Isolates the CPUs of a cluster, rebooting only if they are not isolated already
+
+        The boot configuration is only rewritten if it isolates other CPUs.
+        Returns True if the device was rebooted.
+        '''
+        target = BIGCLUSTER_CPUS if bigcluster else LITTLECLUSTER_CPUS
+        if parse_cpulist(self.__get_next_cpuisolconf__() or '') != target:
+            if bigcluster:
+                self.set_cpuisol_bigcluster()
+            else:
+                self.set_cpuisol_littlecluster()
+        if parse_cpulist(self.__get_cur_cpuisolconf__()) == target:
+            print ('CPUs '+self.__get_cur_cpuisolconf__()+' isolated already, skipping reboot')
+            return False
+        self.reboot_device()
+        return True
+
+    def __boot_id__(self):
+        '''Boot id of the running kernel, None while the device is unreachable'''
+        try:
+            result = self.__conn__.run('cat /proc/sys/kernel/random/boot_id', hide=True, warn=True, timeout=10)
+            return result.stdout.strip() if result.return_code == 0 else None
+        except Exception:
+            self.__conn__.close()
+            return None
+
+    def reboot_device (self, timeout_s:float = 300.0)-> float:
+        '''Reboots the device and waits for it to come back, returns the boot latency in seconds
+
+        Readiness is probed with exponential backoff until a new boot id is
+        reported, so that the device still shutting down is not taken as up.
+        '''
+        boot_id = self.__boot_id__()
+        # Persistent channels die with the connection, reopened on next use
+        self.__session__.close()
+        start = time.monotonic()
         self.__conn__.run('reboot',warn=True)
         self.__conn__.close()
         print ('--- Waiting for device ---')
-        time.sleep(10)
-        while (True):
-            try:
-                result = self.__conn__.run('echo -n')
-                if result.return_code == 0:
-                    print('--Complete--')
-                    break
-            except:
-                print ('.', end ="")
+        def probe():
+            cur = self.__boot_id__()
+            return cur is not None and cur != boot_id
+        # Bounded connection attempts while the device is down
+        connect_timeout = self.__conn__.connect_timeout
+        self.__conn__.connect_timeout = 10
+        try:
+            wait_ready(probe, timeout_s=timeout_s)
+        finally:
+            self.__conn__.connect_timeout = connect_timeout
+        self.boot_latency_s = time.monotonic() - start
+        print ('--Complete-- (boot latency '+'{:.1f}'.format(self.boot_latency_s)+'s)')
+        return self.boot_latency_s
 
 #### ==========================================================================
 #### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] == 'offline':
+    assert parse_cpulist('1-3') == parse_cpulist('"1,2,3"') == LITTLECLUSTER_CPUS, 'cpu list parsing'
+    assert isolation_cluster('4-7') == 'big' and isolation_cluster('') is None, 'cluster of isolation'
+    ## Backoff on a simulated clock: ready after 40s
+    now = [0.0]
+    waits = []
+    def sleep(secs):
+        waits.append(secs)
+        now[0] += secs
+    assert wait_ready(lambda: now[0] >= 40, clock=lambda: now[0], sleep=sleep) == 47, 'Unexpected wait'
+    assert waits == [1, 2, 4, 8, 16, 16], 'Unexpected backoff '+str(waits)
+    try:
+        wait_ready(lambda: False, timeout_s=20, clock=lambda: now[0], sleep=sleep)
+        raise AssertionError('Timeout not raised')
+    except Exception as e:
+        assert 'not ready' in str(e), 'Unexpected error: '+str(e)
+    print ('Board boot configuration offline test completed...')
+    sys.exit(0)
+
 if __name__ == '__main__':
     conn = fabric.Connection( '192.168.0.101', port=22, user='root', connect_kwargs={'password':'odroid'})
     bc = BroadConfig(conn)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Persistent shell channels and batched sysfs access on the board
+
+Each conn.run of fabric opens a new SSH channel, requests a command and waits
+for its exit status, i.e. several round trips for every sysfs write; the
+board controllers issue one such command per setting. BoardSession instead
+keeps long-lived shell channels ('lanes') multiplexed on the single transport
+of the fabric.Connection:
+
+    control   board management (CPUFreqControl, MemCtrlrFreqControl,
+              FanControl, BroadConfig)
+    sampler   DataSampler traffic from its background thread, so that
+              sampling never queues behind control commands (and vice versa)
+
+Commands are written to the shell's stdin followed by a unique end marker
+carrying the exit status, so a command costs one round trip. SysfsBatch
+queues writes and reads and commits them as one script (one round trip),
+reading back the written files to verify the values were taken.
+
+Usage:
+    session = BoardSession(conn)
+    batch = session.batch()
+    batch.write('/sys/.../scaling_governor', 'performance')
+    batch.write('/sys/.../scaling_max_freq', 1400000)
+    batch.read('/sys/.../cpuinfo_cur_freq')
+    values = batch.commit()         # {path: value} of the reads
+
+Assumptions:
+  (1) The board's shell is POSIX sh
+  (2) Values written read back identically (after stripping whitespace),
+      else an explicit expect value or verify=False is to be given
+
+Limitations:
+  (1) Batched reads return single line values, newlines are folded into
+      spaces; multi-line files are read with execute()
+
+Warnings:
+  (1) Channels are reopened on first use after the connection dropped
+      (e.g. reboot), queued batches are not retried
+
+TODO:
+  N/A
+"""
+
+import fabric
+import re
+import uuid
+import shlex
+import threading
+
+CONTROL = 'control'
+SAMPLER = 'sampler'
+LANES = [CONTROL, SAMPLER]
+
+
+class ShellChannel:
+    '''Long-lived sh on one SSH channel, executing commands one at a time'''
+    def __init__(self, opener):
+        self.__opener__ = opener        # returns a new paramiko-like channel running sh
+        self.__chan__ = None
+        self.__lock__ = threading.Lock()
+
+    def __alive__(self) -> bool:
+        if self.__chan__ is None or self.__chan__.closed or self.__chan__.exit_status_ready():
+            return False
+        transport = self.__chan__.get_transport() if hasattr(self.__chan__, 'get_transport') else None
+        return transport is None or transport.is_active()
+
+    def execute(self, cmd:str) -> (int, str):
+        '''Runs cmd in the shell, returns (exit status of its last command, stdout without final newline)'''
+        with self.__lock__:
+            if not self.__alive__():
+                self.__chan__ = self.__opener__()
+            marker = 'XU4_END_'+uuid.uuid4().hex
+            self.__chan__.sendall((cmd+'\nprintf \'\\n'+marker+' %d\\n\' $?\n').encode())
+            pattern = re.compile(b'\n'+marker.encode()+b' (\\d+)\n')
+            buf = b''
+            while True:
+                data = self.__chan__.recv(1 << 16)
+                if not data:
+                    self.__chan__ = None
+                    raise Exception('Board channel closed while executing: '+cmd)
+                buf += data
+                match = pattern.search(buf)
+                if match:
+                    break
+            out = buf[:match.start()]
+            return int(match.group(1)), out[:-1].decode(errors='replace') if out.endswith(b'\n') else out.decode(errors='replace')
+
+    def close(self) -> None:
+        with self.__lock__:
+            if self.__chan__ is not None:
+                self.__chan__.close()
+                self.__chan__ = None
+
+
+class SysfsBatch:
+    '''Writes and reads of sysfs files committed in a single round trip'''
+    def __init__(self, channel:ShellChannel):
+        self.__channel__ = channel
+        self.__ops__ = []
+
+    def __len__(self):
+        return len(self.__ops__)
+
+    def write(self, path:str, value, verify:bool = True, expect = None) -> None:
+        '''Queues writing value to path, read back and compared to expect (default: value)'''
+        self.__ops__.append(('W', path, str(value), verify, str(value if expect is None else expect)))
+
+    def read(self, path:str) -> None:
+        self.__ops__.append(('R', path, None, False, None))
+
+    def script(self) -> str:
+        lines = []
+        def emit(tag, i, cmd):
+            lines.append('v=$( ('+cmd+') 2>&1 ); s=$?; '
+                         'printf \'%s %d %d %s\\n\' '+tag+' '+str(i)+' "$s" "$(printf \'%s\' "$v" | tr \'\\n\' \' \')"')
+        for i, (op, path, value, _, _) in enumerate(self.__ops__):
+            if op == 'W':
+                emit('W', i, 'printf \'%s\\n\' '+shlex.quote(value)+' > '+shlex.quote(path))
+            else:
+                emit('R', i, 'cat '+shlex.quote(path))
+        # Read back once all writes are done, as some settings constrain others
+        for i, (op, path, _, verify, _) in enumerate(self.__ops__):
+            if op == 'W' and verify:
+                emit('V', i, 'cat '+shlex.quote(path))
+        return '\n'.join(lines)
+
+    def parse(self, output:str) -> dict:
+        '''Checks the output of script(), returns {path: value} of the reads'''
+        reads = {}
+        errors = []
+        for line in output.splitlines():
+            parts = line.split(' ', 3)
+            if len(parts) < 3 or parts[0] not in ('W', 'R', 'V'):
+                continue
+            tag, i, status = parts[0], int(parts[1]), int(parts[2])
+            text = parts[3].strip() if len(parts) > 3 else ''
+            op, path, value, _, expect = self.__ops__[i]
+            if status != 0:
+                errors.append(('write' if tag == 'W' else 'read')+' '+path+' failed: '+text)
+            elif tag == 'R':
+                reads[path] = text
+            elif tag == 'V' and text != expect.strip():
+                errors.append(path+': wrote '+value+', read back '+text)
+        if errors:
+            raise Exception('Sysfs batch: '+'; '.join(errors))
+        return reads
+
+    def commit(self) -> dict:
+        '''Executes the queued operations, returns {path: value} of the reads
+
+        Raises on failed writes/reads and values not read back as expected.
+        '''
+        if not self.__ops__:
+            return {}
+        _, output = self.__channel__.execute(self.script())
+        try:
+            return self.parse(output)
+        finally:
+            self.__ops__ = []
+
+
+class BoardSession:
+    '''Pool of persistent shell channels (lanes) on the transport of a fabric.Connection'''
+    def __init__(self, conn: fabric.Connection):
+        self.__conn__ = conn
+        self.__lock__ = threading.Lock()
+        self.__channels__ = {}
+
+    def __open__(self):
+        with self.__lock__:
+            self.__conn__.open()    # no-op while connected, reconnects after a drop
+            chan = self.__conn__.client.get_transport().open_session()
+        # stderr is folded into stdout, so an unread stderr never stalls the channel window
+        chan.set_combine_stderr(True)
+        chan.exec_command('exec sh')
+        return chan
+
+    def channel(self, lane:str = CONTROL) -> ShellChannel:
+        with self.__lock__:
+            if lane not in self.__channels__:
+                self.__channels__[lane] = ShellChannel(self.__open__)
+            return self.__channels__[lane]
+
+    def execute(self, cmd:str, lane:str = CONTROL) -> (int, str):
+        return self.channel(lane).execute(cmd)
+
+    def batch(self, lane:str = CONTROL) -> SysfsBatch:
+        return SysfsBatch(self.channel(lane))
+
+    def write(self, path:str, value, batch:SysfsBatch = None, verify:bool = True, expect = None) -> None:
+        '''Writes value to path, queued in batch if given else committed right away'''
+        target = batch if batch is not None else self.batch()
+        target.write(path, value, verify, expect)
+        if batch is None:
+            target.commit()
+
+    def read(self, path:str, lane:str = CONTROL) -> str:
+        batch = self.batch(lane)
+        batch.read(path)
+        return batch.commit()[path]
+
+    def close(self) -> None:
+        with self.__lock__:
+            channels = list(self.__channels__.values())
+        for channel in channels:
+            channel.close()
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    ## Runs the shell protocol and batches against a local sh & fake sysfs files
+    import os
+    import subprocess
+    import tempfile
+
+    class LocalChannel:
+        '''Channel-like wrapper of a local sh process'''
+        def __init__(self):
+            self.proc = subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.closed = False
+        def exit_status_ready(self):
+            return self.proc.poll() is not None
+        def sendall(self, data):
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        def recv(self, n):
+            return self.proc.stdout.read1(n)
+        def close(self):
+            self.closed = True
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    channel = ShellChannel(LocalChannel)
+    status, out = channel.execute('echo hello; false')
+    assert (status, out) == (1, 'hello'), 'Unexpected execute result '+str((status, out))
+    with tempfile.TemporaryDirectory() as tmp:
+        gov = os.path.join(tmp, 'scaling_governor')
+        freq = os.path.join(tmp, 'scaling_max_freq')
+        ro = os.path.join(tmp, 'cpuinfo_cur_freq')
+        with open(ro, 'w') as f:
+            f.write('1400000\n')
+        batch = SysfsBatch(channel)
+        batch.write(gov, 'performance')
+        batch.write(freq, 1400000)
+        batch.read(ro)
+        assert batch.commit() == {ro: '1400000'}, 'Batch read mismatch'
+        with open(freq) as f:
+            assert f.read() == '1400000\n', 'Batch write mismatch'
+
+        ## Read back mismatch (e.g. value clamped by the driver) & failing write
+        batch.write(freq, 1500000, expect=1400000)
+        batch.write(os.path.join(tmp, 'missing', 'file'), 1)
+        try:
+            batch.commit()
+            raise AssertionError('Verification failure not detected')
+        except Exception as e:
+            assert 'read back 1500000' in str(e) and 'missing' in str(e), 'Unexpected error: '+str(e)
+
+        ## Channel reopened after it was closed
+        channel.close()
+        assert channel.execute('cat '+shlex.quote(freq)) == (0, '1500000'), 'Reopen failed'
+    channel.close()
+    print ('Board session test completed...')
+
+#### ==========================================================================
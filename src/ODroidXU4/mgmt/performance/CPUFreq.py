@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 import fabric
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[4]
+sys.path.append(str(path_root))
+from src.ODroidXU4.mgmt.BoardSession import BoardSession, SysfsBatch
+
 class CPUFreqControl:
     ''' Wrapper class for controlling CPU Frequency on ODroid-XU4
     '''
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        self.__session__ = session if session is not None else BoardSession(conn)
 
         self.__bigcorectrl_path__               = '/sys/devices/system/cpu/cpufreq/policy4'
         self.__bigcluster_governor_filename__   = self.__bigcorectrl_path__+'/scaling_governor'
@@ -15,36 +23,30 @@ class CPUFreqControl:
         self.__litcluster_governor_filename__   = self.__littlecorectrl_path__+'/scaling_governor'
         self.__litcluster_max_filename__        = self.__littlecorectrl_path__+'/scaling_max_freq'
 
-    def set_cluster_gov_perf(self, bigcluster: bool) -> None:
+    def set_cluster_gov_perf(self, bigcluster: bool, batch: SysfsBatch = None) -> None:
         file = self.__bigcluster_governor_filename__ if (bigcluster) else self.__litcluster_governor_filename__
-        self.__conn__.run('echo performance> '+ file)
+        self.__session__.write(file, 'performance', batch)
 
-    def set_cluster_gov_schedutil(self, bigcluster: bool) -> None:
+    def set_cluster_gov_schedutil(self, bigcluster: bool, batch: SysfsBatch = None) -> None:
         file = self.__bigcluster_governor_filename__ if (bigcluster) else self.__litcluster_governor_filename__
-        self.__conn__.run('echo schedutil> '+ file)
+        self.__session__.write(file, 'schedutil', batch)
 
-    def set_cluster_gov_ondemand(self, bigcluster: bool) -> None:
+    def set_cluster_gov_ondemand(self, bigcluster: bool, batch: SysfsBatch = None) -> None:
         file = self.__bigcluster_governor_filename__ if (bigcluster) else self.__litcluster_governor_filename__
-        self.__conn__.run('echo ondemand> '+ file)
+        self.__session__.write(file, 'ondemand', batch)
 
-    def set_cluster_frequency (self, bigcluster: bool, cpufreq:int)-> None:
+    def set_cluster_frequency (self, bigcluster: bool, cpufreq:int, batch: SysfsBatch = None)-> None:
         file = self.__bigcluster_max_filename__ if (bigcluster) else self.__litcluster_max_filename__
-        self.__conn__.run('echo \''+str(cpufreq)+'\'> '+ file)
+        self.__session__.write(file, cpufreq, batch)
 
     def __get_cluster_governor__(self, bigcluster: bool) -> str :
         file = self.__bigcluster_governor_filename__ if (bigcluster) else self.__litcluster_governor_filename__
-        govval = self.__conn__.run('cat '+ file, hide="stdout")
-        if (govval):
-            gov = govval.tail('stdout',1).strip()
-            return str(gov)
+        return str(self.__session__.read(file))
         
     def __get_cluster_maxfreq__(self, bigcluster: bool) -> int :
         file = self.__bigcorectrl_path__ if (bigcluster) else self.__littlecorectrl_path__
         file = file + '/cpuinfo_cur_freq'
-        govval = self.__conn__.run('cat '+ file, hide="stdout")
-        if (govval):
-            gov = govval.tail('stdout',1).strip()
-            return int(gov)
+        return int(self.__session__.read(file))
 
 #### ==========================================================================
 #### Test Code
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 import fabric
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[4]
+sys.path.append(str(path_root))
+from src.ODroidXU4.mgmt.BoardSession import BoardSession, SysfsBatch
+
 class FanControl:
     ''' Wrapper class for controlling CPU Fan on ODroid-XU4 hardware
     '''
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        self.__session__ = session if session is not None else BoardSession(conn)
         self.__fanctrl_path__ = '/sys/devices/platform/pwm-fan'
 
-        fanspeeds_ret = self.__conn__.run('cat '+self.__fanctrl_path__+'/fan_speed', hide="stdout")
+        fanspeeds_ret = self.__session__.read(self.__fanctrl_path__+'/fan_speed')
         if fanspeeds_ret:
-            self.__fanspeeds__ = fanspeeds_ret.tail('stdout',1).strip().split(' ')
+            self.__fanspeeds__ = fanspeeds_ret.split()
             #the fanspeeds will be like values : 0 120 180 240
             # implying higher indices for max speeds
             ## print (fanspeeds)
@@ -22,25 +30,26 @@ class FanControl:
             raise Exception('Fan speed parameters seemt to be not accessible')
         
         # Disable automatic fan control, will enable it back later
-        self.__conn__.run('echo 0 > '+self.__fanctrl_path__+'/automatic')
-        self.switch_off()
+        batch = self.__session__.batch()
+        batch.write(self.__fanctrl_path__+'/automatic', 0)
+        self.switch_off(batch)
+        batch.commit()
         
     
     def __del__(self):
-        self.switch_off()
-        self.__conn__.run('echo 1 > '+self.__fanctrl_path__+'/automatic')
+        batch = self.__session__.batch()
+        self.switch_off(batch)
+        batch.write(self.__fanctrl_path__+'/automatic', 1)
+        batch.commit()
 
-    def switch_off(self):
-        self.__conn__.run('echo '+self.__off_speed__+' > '+self.__fanctrl_path__+'/pwm1')
+    def switch_off(self, batch: SysfsBatch = None):
+        self.__session__.write(self.__fanctrl_path__+'/pwm1', self.__off_speed__, batch)
 
-    def switch_on(self):
-        self.__conn__.run('echo '+self.__max_speed__+' > '+self.__fanctrl_path__+'/pwm1')
+    def switch_on(self, batch: SysfsBatch = None):
+        self.__session__.write(self.__fanctrl_path__+'/pwm1', self.__max_speed__, batch)
 
     def __check_state__(self):
-        pwmval = self.__conn__.run('cat '+self.__fanctrl_path__+'/pwm1', hide="stdout")
-        if pwmval:
-            gov = pwmval.tail('stdout',1).strip()
-            return int(gov)
+        return int(self.__session__.read(self.__fanctrl_path__+'/pwm1'))
 
 
 #### ==========================================================================
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 import fabric
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[4]
+sys.path.append(str(path_root))
+from src.ODroidXU4.mgmt.BoardSession import BoardSession, SysfsBatch
+
 class MemCtrlrFreqControl:
     ''' Wrapper class for controlling Memory Controller Frequency on ODroid-XU4
     '''
 
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        self.__session__ = session if session is not None else BoardSession(conn)
         self.__memctrl_path__  = '/sys/class/devfreq/10c20000.memory-controller'
         self.__governor_file__ = self.__memctrl_path__+'/governor'
         self.__maxfreq_file__  = self.__memctrl_path__+'/max_freq'
@@ -14,29 +22,23 @@ class MemCtrlrFreqControl:
 
         ##TODO: back up the current ones for restoration on object deletion
 
-    def set_governor_perf(self):
-        fanspeeds_ret = self.__conn__.run('echo performance > '+self.__governor_file__)
+    def set_governor_perf(self, batch: SysfsBatch = None):
+        self.__session__.write(self.__governor_file__, 'performance', batch)
 
-    def set_governor_ondemand(self):
-        fanspeeds_ret = self.__conn__.run('echo simple_ondemand > '+self.__governor_file__)
+    def set_governor_ondemand(self, batch: SysfsBatch = None):
+        self.__session__.write(self.__governor_file__, 'simple_ondemand', batch)
 
-    def set_governor_powersave(self):
-        fanspeeds_ret = self.__conn__.run('echo powersave > '+self.__governor_file__)
+    def set_governor_powersave(self, batch: SysfsBatch = None):
+        self.__session__.write(self.__governor_file__, 'powersave', batch)
         
-    def set_boost_max_freq(self, val:int = 825000000):
-        fanspeeds_ret = self.__conn__.run('echo '+str(val)+' > '+self.__maxfreq_file__)
+    def set_boost_max_freq(self, val:int = 825000000, batch: SysfsBatch = None):
+        self.__session__.write(self.__maxfreq_file__, val, batch)
 
     def __check_governor__(self):
-        govval = self.__conn__.run('cat '+self.__governor_file__, hide="stdout")
-        if govval:
-            gov = govval.tail('stdout',1).strip()
-            return str(gov)
+        return str(self.__session__.read(self.__governor_file__))
         
     def __check_maxfreq__(self):
-        govval = self.__conn__.run('cat '+self.__maxfreq_file__, hide="stdout")
-        if govval:
-            gov = govval.tail('stdout',1).strip()
-            return int(gov)
+        return int(self.__session__.read(self.__maxfreq_file__))
 
 #### ==========================================================================
 #### Test Code
@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 import fabric
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[3]
+sys.path.append(str(path_root))
+from src.ODroidXU4.mgmt.BoardSession import BoardSession, SAMPLER
+
 class ProcStatSampler:
     '''Wrapper class for /proc/stat sampling
 
@@ -22,8 +29,10 @@ class ProcStatSampler:
         # ....
         #
     '''
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        # Sampling runs on its own channel, never queued behind board control commands
+        self.__session__ = session if session is not None else BoardSession(conn)
         self.__csv_header__ = ['stat_cpuid',
                               'stat_user','stat_nice','stat_system','stat_idle','stat_iowait',
                               'stat_irq','stat_softirq', 'stat_steal','stat_guest','stat_guest_nice']
@@ -38,10 +47,10 @@ class ProcStatSampler:
     def sample_data(self) -> [int]:
         '''Returns list of timestamp-ed(utc & local) csv strings to be recorded 
         '''
-        cpustat  = self.__conn__.run('cat /proc/stat', hide='stdout')
+        status, cpustat  = self.__session__.execute('cat /proc/stat', SAMPLER)
         
-        if cpustat:
-            cpustat_stdout = cpustat.tail('stdout',16).strip().splitlines()
+        if status == 0:
+            cpustat_stdout = cpustat.strip().splitlines()
             res = []
             ctr = 0
             for line in cpustat_stdout:
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""On-device telemetry agent streaming /proc/stat, thermal and DVFS state
+
+Pushed to the board by ODroidXU4.telemetry_sampler.TelemetrySampler and
+started over a single SSH channel. Every sample period it reads the CPU
+time lines of /proc/stat, the thermal zone temperatures, cpuinfo_cur_freq
+of the cpufreq policies and cur_freq of the devfreq devices, stamps the
+sample with the board's CLOCK_REALTIME/CLOCK_MONOTONIC and writes it as a
+fixed size little-endian binary record to stdout.
+
+Stream layout:
+    [1] MAGIC (8 bytes)
+    [2] Length of [3] (uint32)
+    [3] JSON header: rate, record struct format and field names, stat cpu
+        line names, thermal zones, cpufreq policies, devfreq devices
+    [4] Records back to back, each struct.calcsize(format) bytes
+
+The agent exits when its stdin is closed (i.e. the host closes the channel),
+on SIGTERM or after --duration seconds.
+
+Usage:
+    python3 telemetry_agent.py --rate 20 [--duration 100]
+
+Assumptions:
+  (1) Only the Python 3 standard library is available on the board
+  (2) The sysfs/procfs files are re-read with pread at offset 0, which
+      regenerates their contents, so files are opened once
+
+Limitations:
+  (1) Values which cannot be read (e.g. missing zone) are reported as -1
+
+Warnings:
+  (1) Runs on the CPUs not isolated for the workload (isolcpus), however it
+      still contributes a small load to the board
+
+TODO:
+  N/A
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import struct
+import select
+import signal
+import argparse
+
+MAGIC = b'XU4TEL1\n'
+STAT_FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice']
+
+__thermal_path__ = '/sys/devices/virtual/thermal/thermal_zone{}/temp'
+__cpufreq_path__ = '/sys/devices/system/cpu/cpufreq/policy{}/cpuinfo_cur_freq'
+__devfreq_glob__ = '/sys/class/devfreq/*/cur_freq'
+
+
+class SysFile:
+    '''File kept open and re-read from offset 0 on every sample'''
+    def __init__(self, path:str):
+        self.path = path
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            self.fd = None
+
+    def read(self) -> bytes:
+        if self.fd is None:
+            return b''
+        try:
+            return os.pread(self.fd, 65536, 0)
+        except OSError:
+            return b''
+
+    def read_int(self) -> int:
+        try:
+            return int(self.read())
+        except ValueError:
+            return -1
+
+
+class TelemetryAgent:
+    def __init__(self, rate:float, zones:[int], policies:[int], devfreq:[str]):
+        self.period_ns = int(1e9 / rate)
+        self.rate = rate
+        self.__stat__ = SysFile('/proc/stat')
+        self.stat_cpus = [line.split()[0].decode() for line in self.__stat__.read().splitlines()
+                          if line.startswith(b'cpu')]
+        self.zones = zones
+        self.policies = policies
+        self.__thermal__ = [SysFile(__thermal_path__.format(zone)) for zone in zones]
+        self.__cpufreq__ = [SysFile(__cpufreq_path__.format(policy)) for policy in policies]
+        self.devfreq = [os.path.basename(os.path.dirname(path)) for path in devfreq]
+        self.__devfreq__ = [SysFile(path) for path in devfreq]
+
+        self.fields = [('utc_ns', 'q'), ('monotonic_ns', 'q')]
+        for cpu in self.stat_cpus:
+            self.fields += [(cpu+'_'+name, 'Q') for name in STAT_FIELDS]
+        self.fields += [('thermal_zone'+str(zone), 'i') for zone in zones]
+        self.fields += [('cpufreq_policy'+str(policy), 'q') for policy in policies]
+        self.fields += [('devfreq_'+name, 'q') for name in self.devfreq]
+        self.format = '<' + ''.join(code for _, code in self.fields)
+        self.__record__ = struct.Struct(self.format)
+        self.__nstat__ = len(STAT_FIELDS)
+
+    def header(self) -> bytes:
+        meta = {'rate': self.rate, 'format': self.format, 'fields': self.fields,
+                'stat_cpus': self.stat_cpus, 'stat_fields': STAT_FIELDS,
+                'thermal_zones': self.zones, 'cpufreq_policies': self.policies,
+                'devfreq': self.devfreq, 'record_size': self.__record__.size}
+        body = json.dumps(meta).encode()
+        return MAGIC + struct.pack('<I', len(body)) + body
+
+    def sample(self) -> bytes:
+        utc_ns = time.time_ns()
+        mono_ns = time.monotonic_ns()
+        values = [utc_ns, mono_ns]
+        ncpus = len(self.stat_cpus)
+        for line in self.__stat__.read().splitlines()[:ncpus]:
+            counts = line.split()[1:self.__nstat__+1]
+            values += [int(count) for count in counts] + [0]*(self.__nstat__ - len(counts))
+        values += [0]*(2 + ncpus*self.__nstat__ - len(values))
+        values += [f.read_int() for f in self.__thermal__]
+        values += [f.read_int() for f in self.__cpufreq__]
+        values += [f.read_int() for f in self.__devfreq__]
+        return self.__record__.pack(*values)
+
+    def run(self, out, duration:float = None, batch:int = 1) -> int:
+        '''Samples until stdin is closed or duration elapsed, returns records written'''
+        out.write(self.header())
+        out.flush()
+        stdin = sys.stdin.buffer
+        count = 0
+        pending = []
+        next_ns = time.monotonic_ns()
+        end_ns = next_ns + int(duration*1e9) if duration else None
+        while end_ns is None or next_ns < end_ns:
+            pending.append(self.sample())
+            count += 1
+            if len(pending) >= batch:
+                out.write(b''.join(pending))
+                out.flush()
+                pending = []
+            # Absolute schedule, so that the rate does not drift with sampling cost
+            next_ns += self.period_ns
+            wait = max(next_ns - time.monotonic_ns(), 0) / 1e9
+            ready, _, _ = select.select([stdin], [], [], wait)
+            if ready and not os.read(stdin.fileno(), 4096):
+                break
+        if pending:
+            out.write(b''.join(pending))
+            out.flush()
+        return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Stream board telemetry as binary records to stdout')
+    parser.add_argument('--rate', type=float, default=20.0, help='Samples per second (10-100)')
+    parser.add_argument('--duration', type=float, default=None, help='Stop after seconds')
+    parser.add_argument('--batch', type=int, default=0, help='Records per write (default: ~100ms worth)')
+    parser.add_argument('--thermal-zones', default='0,1,2,3', help='Thermal zone numbers')
+    parser.add_argument('--cpufreq-policies', default='0,4', help='cpufreq policy numbers')
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    zones = [int(zone) for zone in args.thermal_zones.split(',') if zone]
+    policies = [int(policy) for policy in args.cpufreq_policies.split(',') if policy]
+    agent = TelemetryAgent(args.rate, zones, policies, sorted(glob.glob(__devfreq_glob__)))
+    batch = args.batch or max(int(args.rate / 10), 1)
+    agent.run(sys.stdout.buffer, args.duration, batch)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
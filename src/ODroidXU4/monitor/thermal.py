@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 import fabric
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[3]
+sys.path.append(str(path_root))
+from src.ODroidXU4.mgmt.BoardSession import BoardSession, SAMPLER
+
 class ThermalSampler:
     '''Wrapper class for thermal data sampling
 
     More information on thermal sysfs can be found in https://docs.kernel.org/driver-api/thermal/sysfs-api.html
     '''
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
+        # Sampling runs on its own channel, never queued behind board control commands
+        self.__session__ = session if session is not None else BoardSession(conn)
         self.__csv_header__ = ['therm_cpu0','therm_cpu1','therm_cpu2','therm_cpu4']
         self.__csv_fieldcnt__ = len(self.__csv_header__)
     
@@ -20,19 +29,19 @@ class ThermalSampler:
     def sample_data(self) -> [int]:
         '''Returns list of timestamp-ed(utc & local) csv strings to be recorded 
         '''
-        with self.__conn__.cd('/sys/devices/virtual/thermal/'):
-            thermstat  = self.__conn__.run(
-                                'echo $(cat'\
+        status, thermstat  = self.__session__.execute(
+                                # Subshell, as the working directory of the channel's shell persists
+                                '(cd /sys/devices/virtual/thermal/ && echo $(cat'\
                                 ' thermal_zone0/temp'\
                                 ' thermal_zone1/temp'\
                                 ' thermal_zone2/temp'\
-                                ' thermal_zone3/temp)',
-                             hide='stdout')
+                                ' thermal_zone3/temp))',
+                             SAMPLER)
         
         
-        if thermstat:
-            cpustat_stdout = thermstat.tail('stdout',1).strip()
-            csved = [eval(i) for i in cpustat_stdout.split(' ')] 
+        if status == 0:
+            cpustat_stdout = thermstat.strip().splitlines()[-1]
+            csved = [int(i) for i in cpustat_stdout.split(' ')] 
             test_len = len(csved)
             assert test_len == (self.__csv_fieldcnt__), \
                                 'Final length of CSV record seems to be wrong as '\
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Planning of perf-stat event groups within the PMU counter budget of the clusters
+
+Asking perf stat for more hardware events than the PMU has counters makes
+the kernel time-multiplex them: each event is counted for a fraction of the
+interval only (the '(3.64%)' of the perf-stat output) and its count scaled
+up, the events of a ratio (e.g. cache-misses / cache-references) being
+counted over different parts of the interval. The Cortex-A7 (LITTLE) PMU
+has 4 programmable counters, the Cortex-A15 (big) PMU 6, both besides the
+dedicated cycle counter. With '-a --per-core' perf counts on the cores of
+both clusters, so the smaller budget applies.
+
+The planner partitions the requested events into co-scheduled groups
+('{e1,e2,...}') that fit the budget:
+  - cpu-cycles uses the cycle counter, software events (cpu-clock, ...) no
+    counter at all, they are left out of the groups
+  - anchor events (instructions) are added to every group, with cpu-cycles,
+    so that every group yields IPC and per-instruction rates (running all
+    groups at once, they are counted in the first group only, perf-stat
+    reporting one count per event and core)
+  - related events (e.g. cache-misses & cache-references) are kept in one
+    group, the pairs being first-fit packed into the least number of groups
+and runs them in one of the modes
+    rotate      one group per iteration, round robin: unscaled counts
+    parallel    all groups at once as separate -e groups, multiplexed as
+                whole groups so that ratios within a group stay consistent
+    flat        all events in one -e list, as earlier (multiplexed per event)
+
+Usage:
+    plan = plan_events(['instructions', 'cpu-cycles', 'cache-misses', 'cache-references', ...], mode='rotate')
+    cmd = 'perf stat ... '+plan.event_options(iteration)
+    runmeta['perf_groups'] = plan.as_dict(iteration)     # groups & the ones active in the iteration
+
+Assumptions:
+  (1) No other user of the PMU (e.g. a watchdog) holds counters while
+      measuring
+
+Limitations:
+  (1) Event to counter constraints beyond the count of counters are not
+      modelled, the PMUs of both clusters have none for the generic events
+
+Warnings:
+  (1) Running all groups at once (parallel) still exceeds the budget, the
+      groups are multiplexed, and the anchors are counted in the first
+      group only: per-instruction rates of the other groups mix counts of
+      different parts of the interval. Rotation avoids it, at the cost of
+      one iteration per group.
+
+TODO:
+  N/A
+"""
+
+## Programmable counters of the PMU of each cluster, besides the cycle counter
+PMU_COUNTERS = {'little': 4, 'big': 6}
+## Events counted by the dedicated cycle counter
+CYCLE_EVENTS = ['cpu-cycles', 'cycles']
+## Events counted by the kernel, without PMU counter
+SOFTWARE_EVENTS = ['cpu-clock', 'task-clock', 'context-switches', 'cs', 'cpu-migrations', 'migrations',
+                   'page-faults', 'faults', 'minor-faults', 'major-faults', 'alignment-faults', 'emulation-faults']
+## Events added to every group
+ANCHOR_EVENTS = ['instructions']
+## Events to be counted together, e.g. numerator & denominator of a ratio
+RELATED_EVENTS = [
+    ('branch-misses', 'branch-instructions'),
+    ('branch-load-misses', 'branch-loads'),
+    ('cache-misses', 'cache-references'),
+    ('L1-dcache-load-misses', 'L1-dcache-loads'),
+    ('L1-dcache-store-misses', 'L1-dcache-stores'),
+    ('L1-icache-load-misses', 'L1-icache-loads'),
+    ('LLC-load-misses', 'LLC-loads'),
+    ('LLC-store-misses', 'LLC-stores'),
+]
+
+MODE_ROTATE   = 'rotate'
+MODE_PARALLEL = 'parallel'
+MODE_FLAT     = 'flat'
+MODES = [MODE_ROTATE, MODE_PARALLEL, MODE_FLAT]
+
+
+class PerfEventPlan:
+    '''Event groups of a perf-stat measurement and their schedule over iterations'''
+    def __init__(self, mode:str, groups:[[str]], software:[str], budget:int):
+        if mode not in MODES:
+            raise Exception('Unknown perf event mode: '+str(mode))
+        self.mode = mode
+        self.groups = groups
+        self.software = software
+        self.budget = budget
+
+    def __len__(self):
+        '''Iterations needed to count every event once'''
+        return len(self.groups) if self.mode == MODE_ROTATE else 1
+
+    def active(self, iteration:int) -> [int]:
+        '''Indices of the groups counted in an iteration (counted from 1)'''
+        if self.mode == MODE_ROTATE:
+            return [(iteration - 1) % len(self.groups)] if self.groups else []
+        return list(range(len(self.groups)))
+
+    def event_options(self, iteration:int) -> str:
+        '''-e options of perf stat for an iteration'''
+        active = [self.groups[idx] for idx in self.active(iteration)]
+        if self.mode == MODE_FLAT:
+            return '-e '+','.join(sum(active, []) + self.software)
+        # Quoted, braces being subject to brace expansion by the remote shell
+        options = ['-e \'{'+','.join(group)+'}\'' for group in active]
+        if self.software:
+            options.append('-e '+','.join(self.software))
+        return ' '.join(options)
+
+    def events(self, iteration:int = None) -> [str]:
+        '''Events counted in an iteration, or in any iteration'''
+        groups = self.groups if iteration is None else [self.groups[idx] for idx in self.active(iteration)]
+        return list(dict.fromkeys(sum(groups, []) + self.software))
+
+    def as_dict(self, iteration:int = None) -> dict:
+        '''Plan as stored in the run metadata, with the groups active in the iteration'''
+        plan = {'mode': self.mode, 'budget': self.budget, 'groups': self.groups, 'software': self.software}
+        if iteration is not None:
+            plan['active'] = self.active(iteration)
+        return plan
+
+
+def counter_budget(clusters:[str]) -> int:
+    '''Programmable counters available on every core of the clusters measured'''
+    return min(PMU_COUNTERS[cluster] for cluster in clusters)
+
+
+def __counted__(event:str) -> bool:
+    '''True if the event takes a programmable counter'''
+    return event not in CYCLE_EVENTS and event not in SOFTWARE_EVENTS
+
+
+def plan_events(events:[str], clusters:[str] = ('little', 'big'), mode:str = MODE_ROTATE,
+                anchors:[str] = ANCHOR_EVENTS, budget:int = None) -> PerfEventPlan:
+    '''Partitions the events into groups fitting the counter budget of the clusters'''
+    events = list(dict.fromkeys(events))
+    budget = counter_budget(clusters) if budget is None else budget
+    software = [event for event in events if event in SOFTWARE_EVENTS]
+    cycles = [event for event in events if event in CYCLE_EVENTS][:1]
+    hardware = [event for event in events if event not in software and event not in CYCLE_EVENTS]
+    if mode == MODE_FLAT:
+        return PerfEventPlan(mode, [[event for event in events if event not in software]], software, budget)
+
+    anchors = [event for event in anchors if event in hardware]
+    slots = budget - len(anchors)
+    if slots < 1:
+        raise Exception('Anchor events '+str(anchors)+' leave no counter of '+str(budget)+' for other events')
+
+    ## Bundles of related events, in order of the request
+    others = [event for event in hardware if event not in anchors]
+    bundles = []
+    for event in others:
+        if any(event in bundle for bundle in bundles):
+            continue
+        related = next((pair for pair in RELATED_EVENTS if event in pair), (event,))
+        bundle = [e for e in others if e in related]
+        if len(bundle) > slots:
+            bundle = [event]
+        bundles.append(bundle)
+
+    ## First fit of the bundles, larger first
+    packed = []
+    for bundle in sorted(bundles, key=len, reverse=True):
+        for group in packed:
+            if len(group) + len(bundle) <= slots:
+                group.extend(bundle)
+                break
+        else:
+            packed.append(list(bundle))
+    if not packed:
+        packed = [[]]
+
+    groups = []
+    for idx, group in enumerate(packed):
+        # Running all groups at once, cycles & anchors are counted once (in the first group)
+        shared = cycles + anchors if mode == MODE_ROTATE or idx == 0 else []
+        groups.append(shared + [e for e in others if e in group])
+    return PerfEventPlan(mode, groups, software, budget)
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    listing = ['branch-instructions', 'branch-misses', 'branch-load-misses', 'branch-loads',
+               'bus-cycles', 'cpu-cycles', 'instructions', 'cache-misses', 'cache-references', 'cpu-clock',
+               'L1-dcache-load-misses', 'L1-dcache-loads', 'L1-dcache-store-misses', 'L1-dcache-stores',
+               'L1-icache-load-misses', 'L1-icache-loads', 'LLC-load-misses', 'LLC-loads', 'LLC-store-misses', 'LLC-stores']
+
+    ## Rotation: every group fits the LITTLE PMU, carries the anchors and keeps related events together
+    plan = plan_events(listing)
+    assert plan.budget == 4, 'Budget of both clusters is the LITTLE one'
+    for group in plan.groups:
+        assert len([e for e in group if __counted__(e)]) <= 4, 'Group exceeds the budget: '+str(group)
+        assert group[:2] == ['cpu-cycles', 'instructions'], 'Anchors missing in '+str(group)
+    for pair in RELATED_EVENTS:
+        assert any(set(pair) <= set(group) for group in plan.groups), 'Pair split: '+str(pair)
+    assert set(plan.events()) == set(listing), 'Events lost'
+    assert len(plan) == 8 and plan.active(9) == [0], 'Unexpected rotation '+str(plan.groups)
+    options = plan.event_options(1)
+    assert options == "-e '{cpu-cycles,instructions,branch-instructions,branch-misses,bus-cycles}' -e cpu-clock", options
+
+    ## Parallel groups on the big cluster: anchors counted once
+    plan = plan_events(listing, clusters=['big'], mode=MODE_PARALLEL)
+    assert plan.budget == 6 and len(plan) == 1 and plan.active(3) == list(range(len(plan.groups))), 'Unexpected parallel plan'
+    assert sum(group.count('instructions') + group.count('cpu-cycles') for group in plan.groups) == 2, \
+           'Anchor counted more than once'
+    assert all(len([e for e in group if __counted__(e)]) <= 6 for group in plan.groups), 'Group exceeds the budget'
+
+    ## Flat: the earlier single event list
+    plan = plan_events(listing, mode=MODE_FLAT)
+    assert plan.event_options(1) == '-e '+','.join([e for e in listing if e != 'cpu-clock'] + ['cpu-clock']), 'Unexpected flat plan'
+    print ('Perf group planner test completed...')
+
+#### ==========================================================================
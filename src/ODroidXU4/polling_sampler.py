@@ -10,20 +10,22 @@ import csv
 ## Import the local packages
 from pathlib import Path
 import sys
-path_root = Path(__file__).parents[0]
+path_root = Path(__file__).parents[2]
 sys.path.append(str(path_root))
 print (str(path_root))
 
 # import data samplers
-import monitor.thermal as therm
-import monitor.proc_stat as pstat
+import src.ODroidXU4.monitor.thermal as therm
+import src.ODroidXU4.monitor.proc_stat as pstat
+from src.ODroidXU4.mgmt.BoardSession import BoardSession
 
 class DataSampler:
-    def __init__(self, conn: fabric.Connection):
+    def __init__(self, conn: fabric.Connection, session: BoardSession = None):
         self.__conn__ = conn
-        # initialize the sampler objects
-        self.__thermal__  = therm.ThermalSampler (self.__conn__)
-        self.__procstat__ = pstat.ProcStatSampler(self.__conn__)
+        self.__session__ = session if session is not None else BoardSession(conn)
+        # initialize the sampler objects, sharing the sampler channel of the session
+        self.__thermal__  = therm.ThermalSampler (self.__conn__, self.__session__)
+        self.__procstat__ = pstat.ProcStatSampler(self.__conn__, self.__session__)
 
         # Combined CSV Header 
         self.__combined_header__ = ['ts_utc','ts_local']
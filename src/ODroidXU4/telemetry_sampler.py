@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Host side of the on-device telemetry agent (monitor/telemetry_agent.py)
+
+Replacement of DataSampler, which costs two SSH round trips (thermal and
+/proc/stat) per sample and so polls only once every ~2s. The agent is pushed
+to the board once (deploy, at setup_persistant time) and started over a
+single SSH channel for each run; it samples /proc/stat, thermal zones,
+cpufreq and devfreq state on the board at a fixed rate and streams binary
+records back. The receiving thread demultiplexes each record into the rows
+of the poll dataset (.polldata), in the layout of DataSampler, i.e. one row
+per /proc/stat cpu line, followed by the frequency columns:
+
+    ts_utc, ts_local, therm_cpu0..4, stat_cpuid, stat_user..stat_guest_nice,
+    ts_monotonic_ns, cpufreq_policy0, cpufreq_policy4, devfreq_<device>...
+
+Usage:
+    sampler = TelemetrySampler(conn, rate_hz=20)
+    sampler.deploy()                        # once, prior to reboot
+    sampler.StartSampling('test.polldata')
+    ...
+    sampler.StopSampling()
+
+Assumptions:
+  (1) ts_utc/ts_local are taken from the board's clock at sampling time (as
+      are the perf-stat timestamps), not at arrival on the host. Offset of
+      the clocks (bounded above by the transfer latency) is reported on stop.
+
+Limitations:
+  (1) Rate is limited to RATE_MIN..RATE_MAX samples per second
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import fabric
+import os
+import csv
+import json
+import time
+import struct
+import datetime
+import threading
+
+AGENT_LOCAL_PATH  = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monitor', 'telemetry_agent.py')
+AGENT_REMOTE_DIR  = 'bench-tools'
+AGENT_REMOTE_PATH = AGENT_REMOTE_DIR+'/telemetry_agent.py'
+
+MAGIC = b'XU4TEL1\n'
+RATE_MIN = 10.0
+RATE_MAX = 100.0
+
+## Columns of the poll dataset, in the layout of DataSampler
+THERMAL_HEADER = ['therm_cpu0','therm_cpu1','therm_cpu2','therm_cpu4']
+STAT_HEADER = ['stat_cpuid',
+               'stat_user','stat_nice','stat_system','stat_idle','stat_iowait',
+               'stat_irq','stat_softirq', 'stat_steal','stat_guest','stat_guest_nice']
+
+
+class TelemetryStream:
+    '''Incremental decoder of the agent's byte stream into records'''
+    def __init__(self):
+        self.meta = None
+        self.record = None
+        self.__buf__ = bytearray()
+
+    def feed(self, data:bytes) -> list:
+        '''Consumes received bytes, returns the complete records (as tuples) among them'''
+        self.__buf__ += data
+        if self.meta is None:
+            if len(self.__buf__) < len(MAGIC)+4:
+                return []
+            if bytes(self.__buf__[:len(MAGIC)]) != MAGIC:
+                raise Exception('Telemetry: unexpected stream header '+repr(bytes(self.__buf__[:len(MAGIC)])))
+            size = struct.unpack_from('<I', self.__buf__, len(MAGIC))[0]
+            start = len(MAGIC)+4
+            if len(self.__buf__) < start+size:
+                return []
+            self.meta = json.loads(bytes(self.__buf__[start:start+size]))
+            self.record = struct.Struct(self.meta['format'])
+            del self.__buf__[:start+size]
+        usable = len(self.__buf__) - len(self.__buf__) % self.record.size
+        records = list(self.record.iter_unpack(self.__buf__[:usable]))
+        del self.__buf__[:usable]
+        return records
+
+    def pending(self) -> int:
+        '''Bytes of an incomplete record left in the buffer'''
+        return len(self.__buf__)
+
+
+def poll_header(meta:dict) -> [str]:
+    '''Header of the poll dataset for the agent's stream layout'''
+    return ['ts_utc','ts_local'] + THERMAL_HEADER + STAT_HEADER + ['ts_monotonic_ns'] + \
+           ['cpufreq_policy'+str(policy) for policy in meta['cpufreq_policies']] + \
+           ['devfreq_'+name for name in meta['devfreq']]
+
+
+def demux_record(meta:dict, record:tuple) -> [list]:
+    '''Rows of the poll dataset (one per /proc/stat cpu line) for one record'''
+    utc_ns, mono_ns = record[0], record[1]
+    nstat = len(meta['stat_fields'])
+    ncpus = len(meta['stat_cpus'])
+    therm_at = 2 + ncpus*nstat
+    freq_at = therm_at + len(meta['thermal_zones'])
+    utcts  = datetime.datetime.fromtimestamp(utc_ns/1e9, datetime.timezone.utc).replace(tzinfo=None)
+    locats = datetime.datetime.fromtimestamp(utc_ns/1e9)
+    common = [str(utcts), str(locats)] + list(record[therm_at:freq_at])
+    freqs = [mono_ns] + list(record[freq_at:])
+    rows = []
+    for i, cpu in enumerate(meta['stat_cpus']):
+        rows.append(common + [cpu] + list(record[2+i*nstat:2+(i+1)*nstat]) + freqs)
+    return rows
+
+
+class TelemetrySampler:
+    def __init__(self, conn: fabric.Connection, rate_hz:float = 20.0):
+        if not (RATE_MIN <= rate_hz <= RATE_MAX):
+            raise Exception('Telemetry: rate of '+str(rate_hz)+' Hz is out of range ['+
+                            str(RATE_MIN)+', '+str(RATE_MAX)+']')
+        self.__conn__ = conn
+        self.rate_hz = rate_hz
+        self.sampling_thread = None
+        self.f = None
+        self.writer = None
+        self.__chan__ = None
+        self.__stats__ = {}
+
+    def deploy(self) -> None:
+        '''Pushes the agent to the board, to be done once at setup time'''
+        self.__conn__.run('mkdir -p '+AGENT_REMOTE_DIR)
+        self.__conn__.put(AGENT_LOCAL_PATH, AGENT_REMOTE_PATH)
+        print ('Telemetry: agent pushed to '+AGENT_REMOTE_PATH)
+
+    def command(self) -> str:
+        return 'exec python3 -u '+AGENT_REMOTE_PATH+' --rate '+str(self.rate_hz)
+
+    def __receive__(self, recv) -> None:
+        '''Reads the stream until EOF with recv(nbytes), writing the poll dataset'''
+        stream = TelemetryStream()
+        period_ns = int(1e9/self.rate_hz)
+        last_mono = None
+        records = late = 0
+        offset_ns = None
+        while True:
+            data = recv(1 << 16)
+            if not data:
+                break
+            arrival_ns = time.time_ns()
+            batch = stream.feed(data)
+            if not batch:
+                continue
+            if 'meta' not in self.__stats__:
+                self.__stats__['meta'] = stream.meta
+                self.writer.writerow(poll_header(stream.meta))
+            for record in batch:
+                self.writer.writerows(demux_record(stream.meta, record))
+                if last_mono is not None and record[1] - last_mono > period_ns * 3 // 2:
+                    late += 1
+                last_mono = record[1]
+            records += len(batch)
+            # Arrival of the last record of the batch bounds the clock offset + latency
+            delta = arrival_ns - batch[-1][0]
+            offset_ns = delta if offset_ns is None else min(offset_ns, delta)
+        self.__stats__.update({'records': records, 'late': late, 'truncated_bytes': stream.pending(),
+                               'clock_offset_ms': None if offset_ns is None else offset_ns/1e6})
+
+    def stats(self) -> dict:
+        '''Records received, late samples (>1.5 periods apart) and clock offset of the last run'''
+        return {k: v for k, v in self.__stats__.items() if k != 'meta'}
+
+    def __start__(self, filename:str, recv) -> None:
+        self.__stats__ = {}
+        self.f = open(filename, "w", newline="")
+        self.writer = csv.writer(self.f)
+        self.sampling_thread = threading.Thread(target = self.__receive__, args = (recv,))
+        self.sampling_thread.start()
+
+    def StartSampling(self, filename:str)->None:
+        self.__conn__.open()
+        self.__chan__ = self.__conn__.client.get_transport().open_session()
+        self.__chan__.exec_command(self.command())
+        self.__start__(filename, self.__chan__.recv)
+        print ('Telemetry: agent started at '+str(self.rate_hz)+' Hz and logging in to '+filename)
+
+    def __stop__(self) -> None:
+        self.sampling_thread.join()
+        self.f.close()
+        self.f = None
+        self.writer = None
+
+    def StopSampling(self,)->None:
+        # Closing stdin of the agent makes it flush and exit, the stream then ends with EOF
+        self.__chan__.shutdown_write()
+        self.__stop__()
+        status = self.__chan__.recv_exit_status()
+        errors = b''
+        while self.__chan__.recv_stderr_ready():
+            errors += self.__chan__.recv_stderr(1 << 16)
+        self.__chan__.close()
+        self.__chan__ = None
+        if status != 0:
+            print ('Telemetry: agent exited with '+str(status)+': '+errors.decode(errors='replace'))
+        print ('Telemetry: thread stopped, '+str(self.stats()))
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    ## Runs the agent locally, reads the local /proc & sysfs (which may lack thermal zones)
+    import sys
+    import subprocess
+    import tempfile
+
+    sampler = TelemetrySampler(None, rate_hz=50)
+    agent = subprocess.Popen([sys.executable, '-u', AGENT_LOCAL_PATH, '--rate', '50'],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'test.polldata')
+        sampler.__start__(filename, agent.stdout.read1)
+        time.sleep(1)
+        agent.stdin.close()
+        sampler.__stop__()
+        assert agent.wait() == 0, 'Agent failed'
+        stats = sampler.stats()
+        print ('Stats: '+str(stats))
+
+        with open(filename) as f:
+            rows = list(csv.reader(f))
+        meta = sampler.__stats__['meta']
+        ncpus = len(meta['stat_cpus'])
+        assert rows[0] == poll_header(meta), 'Header mismatch'
+        assert len(rows) - 1 == stats['records'] * ncpus, 'Row count mismatch'
+        assert 40 <= stats['records'] <= 60, 'Unexpected record count '+str(stats['records'])
+        assert stats['truncated_bytes'] == 0, 'Truncated record'
+        assert all(len(row) == len(rows[0]) for row in rows), 'Row length mismatch'
+        assert rows[1][len(['ts_utc','ts_local'] + THERMAL_HEADER)] == 'cpu', 'First row is not the cpu total'
+    print ('Telemetry sampler test completed...')
+
+#### ==========================================================================
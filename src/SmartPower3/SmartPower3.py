@@ -1,9 +1,371 @@
 #!/usr/bin/env python3
-import socket
+"""Sampling of SmartPower3 power readings received via UDP
+
+NCSampler supports two capture modes:
+    CAPTURE_CSV   - each packet is stamped with datetime and written as a CSV
+                    row (.powdata) by the receiving thread, as earlier
+    CAPTURE_RING  - datagrams are received with socket.recv_into straight into
+                    slots of a preallocated ring buffer (PacketRing) and
+                    stamped with time_ns()/monotonic_ns(); a writer thread
+                    parses blocks of slots into a NumPy record array
+                    (POWBIN_DTYPE) and appends them to a binary .powbin file
+
+In ring mode the receiving thread does no parsing, formatting or file I/O,
+so higher SmartPower3 logging rates do not drop packets. A .powbin file is
+read back with load_powbin().
+
+Between captures, StartMonitoring keeps the board power (channel 1) of the
+last packets in memory without writing a file, read with recent_power(),
+e.g. to detect steady state prior to a run (utils/SettleControl.py).
+
+Assumptions:
+  (1) Packets follow the fixed layout of the logging protocol, fields which
+      do not are parsed by splitting on ',' instead
+
+Limitations:
+  (1) recvmmsg is not exposed by the Python socket module, queued datagrams
+      are drained with non-blocking recv_into calls after select instead
+  (2) Kernel receive timestamps (SO_TIMESTAMPNS) are used for utctime_ns
+      where available (Linux), else time_ns() at receive
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+import os
 import csv
+import json
+import time
+import socket
+import struct
 import datetime
 import threading
 import select
+import sys
+import collections
+
+import numpy as np
+
+## Capture modes of NCSampler
+CAPTURE_CSV  = 'csv'
+CAPTURE_RING = 'ring'
+
+POWBIN_SUFFIX = '.powbin'
+POWSTAT_SUFFIX = '.powstat'          # JSON summary of PacketStats, next to .powdata/.powbin
+POWBIN_MAGIC = b'SM3POWBIN\n'
+POWBIN_VERSION = 1
+__powbin_header_size__ = 1024        # magic + JSON header padded to this size
+
+## Kernel receive timestamps, not exported by the socket module on all versions
+__so_timestampns__ = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+__timespec__ = struct.Struct('ll')   # struct timespec (time_t, long)
+
+## Logging protocol: %010lu,%05d,%04d,%05d,%01d,%05d,%04d,%05d,%01d,%02d,
+##                   %05d,%04d,%05d,%01d,%02d,%02x,%02x\r\n
+## The checksums cover all bytes preceding them (including the ','):
+##   crc8-2sc: two's complement of the 8-bit sum, crc8-xor: 8-bit XOR
+PACKET_SIZE = 81
+__slot_size__ = 128                  # larger than PACKET_SIZE, to detect oversized datagrams
+__field_widths__ = [10, 5, 4, 5, 1, 5, 4, 5, 1, 2, 5, 4, 5, 1, 2, 2, 2]
+__hex_fields__ = 2                   # trailing CRC fields are hexadecimal
+__field_offsets__ = [sum(__field_widths__[:i]) + i for i in range(len(__field_widths__))]
+__fixed_length__ = __field_offsets__[-1] + __field_widths__[-1]
+__crc_offset__ = __field_offsets__[-__hex_fields__]
+
+## Record array layout, fields named as the NCSampler.pd_col_info CSV columns
+POWBIN_DTYPE = np.dtype([
+        ('utctime_ns', '<i8'), ('monotonic_ns', '<i8'), ('sm_mstime', '<i8'),
+        ('ps_ippwr-volts_mV', '<i4'), ('ps_ippwr-ampere_mA', '<i4'), ('ps_ippwr-watt_mW', '<i4'),
+        ('ps_ippwr-status_b', 'i1'),
+        ('dev_ippwr-ch0-volts_mV', '<i4'), ('dev_ippwr-ch0-ampere_mA', '<i4'), ('dev_ippwr-ch0-watt_mW', '<i4'),
+        ('dev_ippwr-ch0-status_b', 'i1'), ('dev_ippwr-ch0-interrupts', 'i1'),
+        ('dev_ippwr-ch1-volts_mV', '<i4'), ('dev_ippwr-ch1-ampere_mA', '<i4'), ('dev_ippwr-ch1-watt_mW', '<i4'),
+        ('dev_ippwr-ch1-status_b', 'i1'), ('dev_ippwr-ch1-interrupts', 'i1'),
+        ('crc8-2sc', 'u1'), ('crc8-xor', 'u1'),
+    ])
+__packet_fields__ = list(POWBIN_DTYPE.names[2:])
+__board_power_field__ = __packet_fields__.index('dev_ippwr-ch1-watt_mW')   # index among the ',' separated fields
+
+## ASCII digit value lookup, -1 for anything which is not a (hex) digit
+__digit_value__ = np.full(256, -1, dtype=np.int64)
+__digit_value__[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+__digit_value__[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+__digit_value__[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+
+def packet_checksums(payload:bytes) -> tuple:
+    '''(crc8-2sc, crc8-xor) of the bytes preceding the checksum fields'''
+    total = xor = 0
+    for byte in payload:
+        total += byte
+        xor ^= byte
+    return (-total) & 0xff, xor
+
+
+def packet_crc_ok(packet:bytes) -> bool:
+    '''Verifies both checksums of a raw packet'''
+    payload, sep, crcs = packet.strip().rpartition(b',')
+    payload, sep, crc2sc = payload.rpartition(b',')
+    try:
+        return bool(sep) and packet_checksums(payload+sep) == (int(crc2sc, 16), int(crcs, 16))
+    except ValueError:
+        return False
+
+
+def __parse_split__(packet:bytes):
+    '''Parses a packet not matching the fixed layout, None if malformed'''
+    fields = packet.strip().split(b',')
+    if len(fields) != len(__packet_fields__):
+        return None
+    try:
+        nint = len(fields) - __hex_fields__
+        return [int(f) for f in fields[:nint]] + [int(f, 16) for f in fields[nint:]]
+    except ValueError:
+        return None
+
+
+def parse_packets(slots:np.ndarray, lengths:np.ndarray, utc_ns:np.ndarray, mono_ns:np.ndarray) -> tuple:
+    '''Parses raw datagrams (rows of slots) into a POWBIN_DTYPE record array
+
+    Packets in the fixed layout are converted column wise, others are split
+    on ','. Returns (records, malformed packet count, checksum-ok flags of
+    the records).
+    '''
+    n = len(lengths)
+    digits = __digit_value__[slots[:, :__fixed_length__]]
+    fixed = lengths >= __fixed_length__
+    for off in __field_offsets__[1:]:
+        fixed &= slots[:, off-1] == ord(',')
+    if __fixed_length__ < slots.shape[1]:
+        fixed &= (lengths == __fixed_length__) | np.isin(slots[:, __fixed_length__], (ord('\r'), ord('\n')))
+
+    values = np.zeros((n, len(__field_widths__)), dtype=np.int64)
+    for i, (off, width) in enumerate(zip(__field_offsets__, __field_widths__)):
+        field = digits[:, off:off+width]
+        base = 16 if i >= len(__field_widths__) - __hex_fields__ else 10
+        fixed &= (field >= 0).all(axis=1) & (field < base).all(axis=1)
+        values[:, i] = field @ (base ** np.arange(width-1, -1, -1, dtype=np.int64))
+
+    payload = slots[:, :__crc_offset__]
+    crc_ok = (((-payload.sum(axis=1, dtype=np.int64)) & 0xff) == values[:, -2]) & \
+             (np.bitwise_xor.reduce(payload, axis=1) == values[:, -1])
+
+    valid = fixed.copy()
+    for row in np.flatnonzero(~fixed):
+        packet = slots[row, :lengths[row]].tobytes()
+        parsed = __parse_split__(packet)
+        if parsed is not None:
+            values[row] = parsed
+            valid[row] = True
+            crc_ok[row] = packet_crc_ok(packet)
+
+    records = np.zeros(int(valid.sum()), dtype=POWBIN_DTYPE)
+    records['utctime_ns'] = utc_ns[valid]
+    records['monotonic_ns'] = mono_ns[valid]
+    for i, name in enumerate(__packet_fields__):
+        records[name] = values[valid, i]
+    return records, n - len(records), crc_ok[valid]
+
+
+class PacketRing:
+    '''Single producer/single consumer ring buffer of raw datagrams
+
+    The receiving thread only advances head and the writer thread only
+    advances tail, hence no lock is required.
+    '''
+    def __init__(self, capacity:int = 16384, slot_size:int = __slot_size__):
+        self.capacity = capacity
+        self.slots = np.zeros((capacity, slot_size), dtype=np.uint8)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.utc_ns = np.zeros(capacity, dtype=np.int64)
+        self.mono_ns = np.zeros(capacity, dtype=np.int64)
+        self.__views__ = [memoryview(self.slots[i]) for i in range(capacity)]
+        self.__scratch__ = bytearray(slot_size)
+        self.head = 0                # slots written, by producer
+        self.tail = 0                # slots consumed, by consumer
+        self.dropped = 0             # datagrams discarded as ring was full
+
+    def free_view(self):
+        '''Buffer to receive the next datagram into, scratch space if the ring is full'''
+        if self.head - self.tail >= self.capacity:
+            return None
+        return self.__views__[self.head % self.capacity]
+
+    def scratch(self) -> bytearray:
+        return self.__scratch__
+
+    def commit(self, length:int, utc_ns:int, mono_ns:int) -> None:
+        i = self.head % self.capacity
+        self.lengths[i] = length
+        self.utc_ns[i] = utc_ns
+        self.mono_ns[i] = mono_ns
+        self.head += 1
+
+    def take(self) -> tuple:
+        '''Copies out all committed slots as (slots, lengths, utc_ns, mono_ns)'''
+        head = self.head
+        index = np.arange(self.tail, head) % self.capacity
+        out = (self.slots[index], self.lengths[index], self.utc_ns[index], self.mono_ns[index])
+        self.tail = head
+        return out
+
+
+class PacketStats:
+    '''Live packet counters and inter-arrival jitter of a SmartPower3 capture
+
+    Counters (readable while sampling through snapshot()):
+        received    - packets parsed
+        crc_failed  - packets whose crc8-2sc/crc8-xor do not match
+        malformed   - datagrams not in the logging protocol layout
+        dropped     - datagrams discarded by the sampler (ring buffer full)
+        gaps        - sm_mstime steps larger than 1.5x the nominal interval
+        missing     - packets estimated lost within those gaps
+        reordered   - sm_mstime steps <= 0 (duplicate or out of order)
+        late        - packets whose transit time (arrival - sm_mstime) exceeds
+                      the lowest seen so far by more than late_ms
+    Jitter is the change of transit time between consecutive packets, kept
+    as a histogram of its magnitude and as the RFC 3550 running estimate.
+    Timing analysis only uses packets with valid checksums, so a corrupted
+    packet also shows up as missing.
+    '''
+    jitter_edges_ms = [0, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+    __counters__ = ['received', 'crc_failed', 'malformed', 'dropped', 'gaps', 'missing', 'reordered', 'late']
+
+    def __init__(self, tick_ns:int = 1000000, nominal_ticks:float = None, late_ms:float = 50.0):
+        self.tick_ns = tick_ns
+        self.nominal_ticks = nominal_ticks       # estimated from the first packets if None
+        self.late_ms = late_ms
+        self.__lock__ = threading.Lock()
+        self.__counts__ = {name: 0 for name in self.__counters__}
+        self.__jitter_hist__ = np.zeros(len(self.jitter_edges_ms), dtype=np.int64)
+        self.__jitter_ms__ = 0.0
+        self.__first_deltas__ = []
+        self.__last_tick__ = None
+        self.__last_transit__ = None
+        self.__min_transit__ = None
+
+    def add_malformed(self, count:int) -> None:
+        with self.__lock__:
+            self.__counts__['malformed'] += int(count)
+
+    def set_dropped(self, count:int) -> None:
+        with self.__lock__:
+            self.__counts__['dropped'] = int(count)
+
+    def update(self, sm_mstime:np.ndarray, arrival_ns:np.ndarray, crc_ok:np.ndarray) -> None:
+        '''Accounts a block of received packets, in order of arrival'''
+        crc_ok = np.asarray(crc_ok, dtype=bool)
+        ticks = np.asarray(sm_mstime, dtype=np.int64)[crc_ok]
+        arrival_ns = np.asarray(arrival_ns, dtype=np.int64)[crc_ok]
+        with self.__lock__:
+            counts = self.__counts__
+            counts['received'] += len(crc_ok)
+            counts['crc_failed'] += int((~crc_ok).sum())
+            if len(ticks) == 0:
+                return
+            transit = arrival_ns - ticks*self.tick_ns
+            if self.__last_tick__ is not None:
+                deltas = np.diff(ticks, prepend=self.__last_tick__)
+                dtransit = np.diff(transit, prepend=self.__last_transit__)
+            else:
+                deltas = np.diff(ticks)
+                dtransit = np.diff(transit)
+            self.__last_tick__ = int(ticks[-1])
+            self.__last_transit__ = int(transit[-1])
+
+            counts['reordered'] += int((deltas <= 0).sum())
+            if self.nominal_ticks is None:
+                self.__first_deltas__ += [int(d) for d in deltas[deltas > 0]]
+                if len(self.__first_deltas__) >= 16:
+                    self.nominal_ticks = float(np.median(self.__first_deltas__))
+            if self.nominal_ticks:
+                gaps = deltas[deltas > 1.5*self.nominal_ticks]
+                counts['gaps'] += len(gaps)
+                counts['missing'] += int((np.rint(gaps / self.nominal_ticks) - 1).sum())
+
+            lowest = np.minimum.accumulate(transit)
+            if self.__min_transit__ is not None:
+                lowest = np.minimum(lowest, self.__min_transit__)
+            self.__min_transit__ = int(lowest[-1])
+            counts['late'] += int(((transit - lowest) > self.late_ms*1e6).sum())
+
+            jitter = np.abs(dtransit) / 1e6
+            self.__jitter_hist__ += np.histogram(jitter, bins=self.jitter_edges_ms+[np.inf])[0]
+            for value in jitter:
+                self.__jitter_ms__ += (value - self.__jitter_ms__) / 16
+
+    def snapshot(self) -> dict:
+        '''Current counters and derived ratios'''
+        with self.__lock__:
+            summary = dict(self.__counts__)
+            summary['nominal_interval_ticks'] = self.nominal_ticks
+            summary['tick_ns'] = self.tick_ns
+            summary['late_threshold_ms'] = self.late_ms
+            summary['jitter_ms'] = float(self.__jitter_ms__)
+            summary['jitter_hist_edges_ms'] = list(self.jitter_edges_ms)
+            summary['jitter_hist'] = self.__jitter_hist__.tolist()
+        expected = summary['received'] + summary['missing']
+        summary['loss_ratio'] = summary['missing'] / expected if expected else 0.0
+        summary['crc_failure_ratio'] = summary['crc_failed'] / summary['received'] if summary['received'] else 0.0
+        summary['late_ratio'] = summary['late'] / summary['received'] if summary['received'] else 0.0
+        return summary
+
+
+## Default bounds for accepting a capture, see check_capture_summary
+MAX_LOSS_RATIO = 0.01
+MAX_CRC_FAILURE_RATIO = 0.01
+MAX_LATE_RATIO = 0.05
+
+
+def check_capture_summary(summary:dict, max_loss_ratio:float = MAX_LOSS_RATIO,
+                          max_crc_failure_ratio:float = MAX_CRC_FAILURE_RATIO,
+                          max_late_ratio:float = MAX_LATE_RATIO) -> [str]:
+    '''Reasons for rejecting a capture given its PacketStats summary, empty if acceptable'''
+    reasons = []
+    if summary.get('received', 0) == 0:
+        reasons.append('no packets received')
+    for key, bound in (('loss_ratio', max_loss_ratio), ('crc_failure_ratio', max_crc_failure_ratio),
+                       ('late_ratio', max_late_ratio)):
+        if summary.get(key, 0.0) > bound:
+            reasons.append(key+' {:.4f} > {:.4f}'.format(summary[key], bound))
+    if summary.get('dropped', 0):
+        reasons.append(str(summary['dropped'])+' packets dropped by the sampler')
+    return reasons
+
+
+def summary_filename(filename:str) -> str:
+    '''Sidecar summary (.powstat) of a .powdata/.powbin file'''
+    return os.path.splitext(filename)[0] + POWSTAT_SUFFIX
+
+
+def __write_powbin_header__(f, meta:dict) -> None:
+    header = POWBIN_MAGIC + json.dumps(dict(meta, version=POWBIN_VERSION, dtype=POWBIN_DTYPE.descr)).encode()
+    if len(header) >= __powbin_header_size__:
+        raise Exception('SmartPower3 .powbin header too large')
+    f.write(header.ljust(__powbin_header_size__ - 1) + b'\n')
+
+
+def load_powbin(source) -> tuple:
+    '''Reads a .powbin file (path, file object or bytes), returns (records, header)
+
+    A partially written trailing record (capture interrupted) is ignored.
+    '''
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    if not data.startswith(POWBIN_MAGIC):
+        raise Exception('Not a SmartPower3 .powbin file')
+    header = json.loads(data[len(POWBIN_MAGIC):__powbin_header_size__].decode())
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    body = data[__powbin_header_size__:]
+    count = len(body) // dtype.itemsize
+    return np.frombuffer(body, dtype=dtype, count=count), header
 
 ###############################################################################
 # Utility class for processing UDP packet of power readings
@@ -28,14 +390,49 @@ class NCSampler:
         'crc8-2sc', 'crc8-xor'
     ]
     
-    def __init__(self) -> None:
+    def __init__(self, capture:str = CAPTURE_CSV, port:int = 6000,
+                 ring_capacity:int = 16384, flush_interval:float = 1.0, late_ms:float = 50.0,
+                 live_capacity:int = 4096) -> None:
+        if capture not in (CAPTURE_CSV, CAPTURE_RING):
+            raise Exception('Unknown SmartPower3 capture mode: '+str(capture))
+        self.capture = capture
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(('0.0.0.0',6000))
+        self.sock.bind(('0.0.0.0',port))
         self.sock.setblocking(0)
         self.bExit = False
         self.f = None
         self.sampling_thread = None
 
+        # Ring capture state
+        self.filename = None
+        self.writer_thread = None
+        self.ring_capacity = ring_capacity
+        self.flush_interval = flush_interval
+        self.__ring__ = None
+        self.__kernel_ts__ = False
+        if capture == CAPTURE_RING and __so_timestampns__ is not None:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, __so_timestampns__, 1)
+                self.__kernel_ts__ = True
+            except OSError:
+                pass
+        self.__ancbufsize__ = socket.CMSG_SPACE(__timespec__.size) if self.__kernel_ts__ else 0
+
+        # Packet counters, readable while sampling via the stats property
+        self.late_ms = late_ms
+        self.packet_stats = PacketStats(late_ms=late_ms)
+        self.__pending__ = ([], [], [])      # CSV mode: (sm_mstime, arrival_ns, crc_ok) not yet accounted
+        self.__start_utc__ = None
+
+        # Monitoring state: (monotonic_ns, board power mW) of the most recent packets
+        self.monitor_thread = None
+        self.__live__ = collections.deque(maxlen=live_capacity)
+
+    @property
+    def stats(self) -> dict:
+        '''Snapshot of the packet counters of the current/last capture'''
+        return self.packet_stats.snapshot()
+
     def __del__(self) -> None:
         print('Cleaning NC')
         self.sock.close()
@@ -49,7 +446,9 @@ class NCSampler:
                 ready = select.select([self.sock], [], [], 1)
                 if ready[0]:
                     data, _ = self.sock.recvfrom(81)
+                    arrival_ns = time.time_ns()
                     fields = data.strip().split(b',')
+                    self.__account_packet__(fields, data, arrival_ns)
                     # BUG:
                     # Data source: 1-14-2023_22-20-44_BigCore-100msPerf-CPUFreq-0.8GHz.tar.bz2   /ffmpeg-360p-2.pow
                     #    @SHA: commit/ab98cf19b24060207cd63b1ef274c8105a496c7c
@@ -69,8 +468,156 @@ class NCSampler:
         except socket.timeout:
             print("\nerror: socket timeout")
     
+    def __account_packet__(self, fields:[bytes], data:bytes, arrival_ns:int) -> None:
+        '''CSV mode: counts a packet, counters are updated in batches'''
+        try:
+            sm_mstime = int(fields[0])
+        except ValueError:
+            sm_mstime = None
+        if len(fields) != len(self.pd_col_info) - 2 or sm_mstime is None:
+            self.packet_stats.add_malformed(1)
+            return
+        pending = self.__pending__
+        pending[0].append(sm_mstime)
+        pending[1].append(arrival_ns)
+        pending[2].append(packet_crc_ok(data))
+        if len(pending[0]) >= 64:
+            self.__flush_pending__()
+
+    def __flush_pending__(self) -> None:
+        pending = self.__pending__
+        if pending[0]:
+            self.__pending__ = ([], [], [])
+            self.packet_stats.update(*pending)
+
+    def __write_summary__(self) -> None:
+        summary = self.stats
+        reasons = check_capture_summary(summary)
+        summary.update({'capture': self.capture, 'file': os.path.basename(self.filename),
+                        'start_utc': self.__start_utc__, 'stop_utc': str(datetime.datetime.utcnow()),
+                        'rejected_reasons': reasons})
+        with open(summary_filename(self.filename), 'w') as f:
+            json.dump(summary, f, indent=1)
+        print ('SM3-NCSampler: '+str(summary['received'])+' packets, '+str(summary['missing'])+' missing, '+
+               str(summary['crc_failed'])+' CRC failed, '+str(summary['late'])+' late, '+
+               str(summary['malformed'])+' malformed, '+str(summary['dropped'])+' dropped (ring full), '+
+               'jitter {:.2f}ms'.format(summary['jitter_ms']))
+        if reasons:
+            print ('SM3-NCSampler: WARNING: capture exceeds loss bounds: '+'; '.join(reasons))
+
+    def __receive_into__(self, view) -> int:
+        '''Receives one datagram into view, returns its length and receive times'''
+        if self.__kernel_ts__:
+            nbytes, ancdata, _, _ = self.sock.recvmsg_into([view], self.__ancbufsize__)
+            mono_ns = time.monotonic_ns()
+            for level, ctype, cdata in ancdata:
+                if level == socket.SOL_SOCKET and ctype == __so_timestampns__ and len(cdata) >= __timespec__.size:
+                    sec, nsec = __timespec__.unpack(cdata[:__timespec__.size])
+                    return nbytes, sec*1000000000 + nsec, mono_ns
+            return nbytes, time.time_ns(), mono_ns
+        nbytes = self.sock.recv_into(view)
+        return nbytes, time.time_ns(), time.monotonic_ns()
+
+    def __ReceiveRing(self)-> None:
+        """Receives packets into the ring buffer, draining the socket on every wakeup"""
+        ring = self.__ring__
+        while (self.bExit == False):
+            ready = select.select([self.sock], [], [], 1)
+            if not ready[0]:
+                continue
+            while True:
+                view = ring.free_view()
+                try:
+                    nbytes, utc_ns, mono_ns = self.__receive_into__(ring.scratch() if view is None else view)
+                except (BlockingIOError, InterruptedError):
+                    break
+                if view is None:
+                    ring.dropped += 1
+                else:
+                    ring.commit(nbytes, utc_ns, mono_ns)
+
+    def __flush_ring__(self) -> None:
+        slots, lengths, utc_ns, mono_ns = self.__ring__.take()
+        if len(lengths) == 0:
+            return
+        records, malformed, crc_ok = parse_packets(slots, lengths, utc_ns, mono_ns)
+        self.f.write(records.tobytes())
+        self.f.flush()
+        self.packet_stats.add_malformed(malformed)
+        self.packet_stats.update(records['sm_mstime'], records['utctime_ns'], crc_ok)
+        self.packet_stats.set_dropped(self.__ring__.dropped)
+
+    def __WriteRing(self)-> None:
+        """Parses and writes the ring buffer contents in blocks"""
+        while (self.bExit == False):
+            time.sleep(self.flush_interval)
+            self.__flush_ring__()
+
+    def __start_ring__(self, filename:str) -> None:
+        self.filename = os.path.splitext(filename)[0] + POWBIN_SUFFIX
+        self.__ring__ = PacketRing(self.ring_capacity)
+        self.f = open(self.filename, 'wb')
+        __write_powbin_header__(self.f, {'kernel_timestamps': self.__kernel_ts__,
+                                         'start_utc_ns': time.time_ns(),
+                                         'start_monotonic_ns': time.monotonic_ns()})
+        self.sampling_thread = threading.Thread(target = self.__ReceiveRing)
+        self.writer_thread = threading.Thread(target = self.__WriteRing)
+        self.sampling_thread.start()
+        self.writer_thread.start()
+        print ('SM3-NCSampler: ring capture started and logging in to '+self.filename)
+
+    def __stop_ring__(self) -> None:
+        self.writer_thread.join()
+        self.__flush_ring__()
+        self.packet_stats.set_dropped(self.__ring__.dropped)
+        self.writer_thread = None
+
+    def __Monitor(self)-> None:
+        """Keeps the board power of valid packets, without logging"""
+        while (self.bExit == False):
+            ready = select.select([self.sock], [], [], 1)
+            if not ready[0]:
+                continue
+            while True:
+                try:
+                    data = self.sock.recv(__slot_size__)
+                except (BlockingIOError, InterruptedError):
+                    break
+                fields = data.strip().split(b',')
+                if len(fields) != len(self.pd_col_info) - 2 or not packet_crc_ok(data):
+                    continue
+                try:
+                    self.__live__.append((time.monotonic_ns(), int(fields[__board_power_field__])))
+                except ValueError:
+                    continue
+
+    def StartMonitoring(self)->None:
+        '''Starts keeping the board power of received packets in memory, no file is written'''
+        self.bExit = False
+        self.__live__.clear()
+        self.monitor_thread = threading.Thread(target = self.__Monitor)
+        self.monitor_thread.start()
+
+    def StopMonitoring(self)->None:
+        self.bExit = True
+        self.monitor_thread.join()
+        self.monitor_thread = None
+
+    def recent_power(self, window_s:float) -> tuple:
+        '''(monotonic_ns, mW) arrays of the board power monitored within the last window_s seconds'''
+        live = np.array(list(self.__live__), dtype=np.int64).reshape(-1, 2)
+        keep = live[:, 0] > time.monotonic_ns() - int(window_s*1e9)
+        return live[keep, 0], live[keep, 1]
+
     def StartSampling(self, filename:str)->None:
             self.bExit = False
+            self.packet_stats = PacketStats(late_ms=self.late_ms)
+            self.__pending__ = ([], [], [])
+            self.__start_utc__ = str(datetime.datetime.utcnow())
+            if self.capture == CAPTURE_RING:
+                self.__start_ring__(filename)
+                return
+            self.filename = filename
             self.f = open(filename, "w", newline="")
             self.writer = csv.writer(self.f)
             self.writer.writerow(self.pd_col_info)
@@ -82,7 +629,71 @@ class NCSampler:
     def StopSampling(self,)->None:
         self.bExit = True
         self.sampling_thread.join()
+        if self.capture == CAPTURE_RING:
+            self.__stop_ring__()
+        self.__flush_pending__()
+        self.__write_summary__()
         self.f.close()
         self.f = None
         self.writer = None
         print ('SM3-NCSampler: thread stopped')
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    import tempfile
+
+    # Loopback test: send packets in the logging protocol layout to a ring capture
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    count = 5000
+    sampler = NCSampler(capture=CAPTURE_RING, port=port, flush_interval=0.2)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sampler.StartSampling(os.path.join(tmpdir, 'loopback.powdata'))
+        for i in range(count):
+            if i in (1000, 1001, 1002):
+                continue        # simulate packets lost on the way
+            payload = b'%010d,15297,0000,00000,0,05103,0000,00000,0,00,04991,%04d,%05d,1,00,' % (
+                        166542656 + i*50, 500 + i % 400, 2500 + i % 2000)
+            packet = payload + b'%02x,%02x\r\n' % packet_checksums(payload)
+            if i == 2000:
+                packet = packet.replace(b'15297', b'15298')     # corrupted in transit
+            tx.sendto(packet, ('127.0.0.1', port))
+            if i % 64 == 0:
+                time.sleep(0.001)
+        tx.sendto(b'garbage', ('127.0.0.1', port))
+        time.sleep(0.5)
+        sampler.StopSampling()
+        records, header = load_powbin(sampler.filename)
+        with open(summary_filename(sampler.filename), 'r') as f:
+            summary = json.load(f)
+    print('Header: '+str({k: v for k, v in header.items() if k != 'dtype'}))
+    print('Stats: '+str(sampler.stats))
+    span_ms = (records['utctime_ns'][-1] - records['utctime_ns'][0]) / 1e6
+    print('Capture span: {:.1f} ms'.format(span_ms))
+    assert abs(records['utctime_ns'][0] - header['start_utc_ns']) < 10**9, 'Receive timestamps off'
+    assert summary['malformed'] == 1, 'Malformed packet not detected'
+    assert summary['crc_failed'] == 1, 'Corrupted packet not detected'
+    assert len(records) + summary['dropped'] == count - 3, 'Packets lost outside the ring'
+    # The corrupted packet is excluded from timing analysis, hence a second gap
+    assert summary['dropped'] or (summary['gaps'] == 2 and summary['missing'] == 4), 'Gap not detected'
+    assert (np.diff(records['sm_mstime']) > 0).all(), 'Records out of order'
+    assert (records['dev_ippwr-ch1-watt_mW'] == 2500 + (records['sm_mstime'] - 166542656)//50 % 2000).all(), \
+            'Parsed values mismatch'
+    assert summary['dropped'] or not check_capture_summary(summary), 'Capture within bounds rejected'
+    assert check_capture_summary(summary, max_loss_ratio=0.0001), 'Lossy capture accepted'
+
+    # Monitoring between captures keeps the board power of valid packets only
+    sampler.StartMonitoring()
+    for i in range(20):
+        payload = b'%010d,15297,0000,00000,0,05103,0000,00000,0,00,04991,0500,%05d,1,00,' % (166542656 + i*50, 2500 + i)
+        tx.sendto(payload + b'%02x,%02x\r\n' % packet_checksums(payload), ('127.0.0.1', port))
+    tx.sendto(b'garbage', ('127.0.0.1', port))
+    time.sleep(0.5)
+    sampler.StopMonitoring()
+    live_ns, live_mW = sampler.recent_power(10)
+    assert list(live_mW) == [2500 + i for i in range(20)], 'Monitored power mismatch: '+str(live_mW)
+    assert len(sampler.recent_power(0)[0]) == 0, 'Window not applied'
+
+#### ==========================================================================
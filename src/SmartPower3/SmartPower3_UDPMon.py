@@ -39,6 +39,13 @@ import select
 
 from enum import IntEnum
 
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[0]
+sys.path.append(str(path_root))
+from SmartPower3 import PacketStats, packet_crc_ok
+
 ###############################################################################
 # Utility class for processing UDP packet of power readings
 ###############################################################################
@@ -67,6 +74,7 @@ class SmartPower3_NCSampler:
         self.f = None
         self.write = None
         self.sampling_thread = None
+        self.packet_stats = PacketStats()
     
 
     def __ProcessPacket(self)-> None:
@@ -77,15 +85,21 @@ class SmartPower3_NCSampler:
                 ready = select.select([self.sock], [], [], 1)
                 if ready[0]:
                     data, _ = self.sock.recvfrom(81)
+                    arrival_ns = time.time_ns()
                     fields = data.strip().split(b',')
                     row = [datetime.datetime.now()]+fields
                     self.writer.writerow(row)
-                    print("\ndebug: packet received: "+str(row))
+                    crc_ok = packet_crc_ok(data)
+                    try:
+                        self.packet_stats.update([int(fields[0])], [arrival_ns], [crc_ok])
+                    except ValueError:
+                        self.packet_stats.add_malformed(1)
         except socket.timeout:
             print("\nerror: socket timeout")
     
     def StartSampling(self, filename:str)->None:
             self.bExit = False
+            self.packet_stats = PacketStats()
             self.f = open(filename, "w", newline="")
             self.writer = csv.writer(self.f)
             self.writer.writerow(self.pd_col_info)
@@ -98,6 +112,7 @@ class SmartPower3_NCSampler:
         self.bExit = True
         self.sampling_thread.join()
         print ("Sampling stopped and data written")
+        print ("Packet statistics: "+str(self.packet_stats.snapshot()))
         self.f.close()
         self.f = None
         self.writer = None
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""Campaign scheduler running WorkloadExec-v2 sweeps on several boards in parallel
+
+WorkloadExec-v2.py drives a single board and walks the frequency lists
+serially. Here a campaign is described declaratively by a sweep file and a
+board inventory; every (kind, cluster, frequency, fan) of the sweep becomes
+a job, which is exactly one setup_persistant + run + results archive of
+WorkloadExec-v2 (all workloads and iterations of the job run on the same
+board). Each board is driven by its own thread with its own connection and
+SmartPower3 port; boards pull the next job from a shared queue, longest
+estimated job first, preferring jobs of the cluster they are isolated for.
+
+Sweep file (JSON), a single sweep or {"sweeps": [...]}:
+    {
+      "name": "100msPerf",                     # part of the archive names
+      "kind": "cpu",                           # cpu | idle | perf-sleep
+      "workloads": ["stress", "compress", "encode"],   # cpu only
+      "iterations": 2,
+      "perf_event_mode": "parallel",           # rotate | parallel | flat (see ODroidXU4/perf_groups.py)
+      "idle_duration": 60,                     # idle & perf-sleep only
+      "fans": ["MaxFan"],                      # MaxFan | NoFan (idle & perf-sleep)
+      "clusters": {"big": [2000000, 1900000], "little": [1400000]}
+    }
+
+Board inventory (JSON):
+    {"boards": [{"name": "xu4-01", "host": "192.168.0.101", "sm3_port": 6000},
+                {"name": "xu4-02", "host": "192.168.0.102", "sm3_port": 6001,
+                 "user": "root", "password": "odroid", "port": 22}]}
+
+Usage:
+    python3 src/campaign.py --sweep campaigns/dvfs-sweep.json --boards campaigns/boards.json
+    python3 src/campaign.py --sweep campaigns/dvfs-sweep.json --boards campaigns/boards.json --dry-run
+
+Progress is journaled to <results>/campaign.journal (utils/RunJournal.py),
+rerunning the same command after an interruption skips the completed jobs
+and iterations and resumes the interrupted ones.
+
+Results are written to <results>/<category>/ as by WorkloadExec-v2.py, the
+category following the kind and fan (03-Workloads, 01-Simple-Idling/<fan>,
+02-Idling-PerfSleep/<fan>). The files of every iteration are added to the
+run's .pack archive (src/processing/archive.py) as soon as it completes, and
+the results directories moved to backup/ at the end of the job.
+
+Assumptions:
+  (1) Every SmartPower3 unit is configured to log to this host on the UDP
+      port given for its board in the inventory, ports are unique
+  (2) Job runtime scales with the number of workloads and iterations and
+      inversely with the CPU frequency, used for ordering only
+
+Limitations:
+  (1) CPU intensive workloads always run with the fan at max speed
+      (CPUIntensiveWorkloads), a NoFan cpu sweep is rejected
+
+Warnings:
+  (1) perf_event_mode 'rotate' counts one event group per iteration after
+      the first, jobs with fewer iterations than the number of groups plus
+      one (9 with both clusters measured) are rejected when run
+
+TODO:
+  N/A
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+from src.utils.RunJournal import RunJournal
+from src.ODroidXU4.mgmt.BoardConfigControl import BroadConfig, isolation_cluster
+from src.ODroidXU4.perf_groups import MODES as PERF_EVENT_MODES, MODE_PARALLEL
+
+KINDS = ['cpu', 'idle', 'perf-sleep']
+CLUSTERS = ['big', 'little']
+FANS = ['MaxFan', 'NoFan']
+WORKLOAD_GROUPS = ['stress', 'compress', 'encode']
+
+## Results directory of each kind, as expected by src/processing/ingest.py
+__categories__ = {'cpu': '03-Workloads', 'idle': '01-Simple-Idling', 'perf-sleep': '02-Idling-PerfSleep'}
+
+
+class Board:
+    '''Board of the inventory with the UDP port of its SmartPower3 unit'''
+    def __init__(self, name:str, host:str, sm3_port:int = 6000, port:int = 22,
+                 user:str = 'root', password:str = 'odroid'):
+        self.name = name
+        self.host = host
+        self.sm3_port = sm3_port
+        self.port = port
+        self.user = user
+        self.password = password
+
+    def connect(self):
+        import fabric
+        return fabric.Connection(self.host, port=self.port, user=self.user,
+                                 connect_kwargs={'password': self.password})
+
+    def isolated_cluster(self):
+        '''Cluster the board currently isolates CPUs for, None if unknown or unreachable'''
+        try:
+            conn = self.connect()
+            try:
+                return isolation_cluster(BroadConfig(conn).__get_cur_cpuisolconf__())
+            finally:
+                conn.close()
+        except Exception as e:
+            print ('Campaign: isolation of '+self.name+' unknown: '+repr(e))
+            return None
+
+    def __str__(self) -> str:
+        return self.name+' ('+self.host+', SmartPower3 @'+str(self.sm3_port)+')'
+
+
+class Job:
+    '''One results archive: a workload kind on a cluster at a frequency'''
+    def __init__(self, name:str, kind:str, cluster:str, freq:int, fan:str = 'MaxFan',
+                 workloads:[str] = None, iterations:int = 2, idle_duration:int = 60,
+                 perf_event_mode:str = MODE_PARALLEL):
+        self.name = name
+        self.kind = kind
+        self.cluster = cluster
+        self.freq = freq
+        self.fan = fan
+        self.workloads = list(workloads or [])
+        self.iterations = iterations
+        self.idle_duration = idle_duration
+        self.perf_event_mode = perf_event_mode   # Scheduling of the perf event groups (ODroidXU4/perf_groups.py)
+        self.attempts = 0
+        self.failed_on = set()                  # Boards the job failed on, not retried there
+
+    @property
+    def bigcluster(self) -> bool:
+        return self.cluster == 'big'
+
+    @property
+    def test_desc(self) -> str:
+        '''Archive suffix, as composed by WorkloadExec-v2.py'''
+        prefix = ('BigCore-' if self.bigcluster else 'LittleCore-')+self.name
+        if self.kind != 'cpu' and self.fan == 'NoFan':
+            prefix += '-NoFan'
+        return prefix+'-CPUFreq-'+str(self.freq/1000000)+'GHz'
+
+    @property
+    def category(self) -> str:
+        if self.kind == 'cpu':
+            return __categories__[self.kind]
+        return os.path.join(__categories__[self.kind], self.fan)
+
+    @property
+    def key(self) -> str:
+        return self.kind+'/'+self.test_desc
+
+    def estimated_cost(self) -> float:
+        '''Relative runtime estimate used for longest-first ordering'''
+        if self.kind == 'idle':
+            return float(self.idle_duration)
+        count = max(len(self.workloads), 1) if self.kind == 'cpu' else 1
+        return count * max(self.iterations - 1, 1) * 100.0 / (self.freq / 1000000)
+
+    def as_dict(self) -> dict:
+        return {'name': self.name, 'kind': self.kind, 'cluster': self.cluster, 'freq': self.freq,
+                'fan': self.fan, 'workloads': self.workloads, 'iterations': self.iterations,
+                'idle_duration': self.idle_duration}
+
+    def __str__(self) -> str:
+        return self.category+'/'+self.test_desc
+
+
+def load_inventory(filename:str) -> [Board]:
+    with open(filename, 'r') as f:
+        boards = [Board(**entry) for entry in json.load(f)['boards']]
+    for attr in ('name', 'host', 'sm3_port'):
+        values = [getattr(board, attr) for board in boards]
+        if len(set(values)) != len(values):
+            raise Exception('Board inventory '+filename+': duplicate '+attr+' in '+str(values))
+    if not boards:
+        raise Exception('Board inventory '+filename+' lists no boards')
+    return boards
+
+
+def expand_sweep(sweep:dict) -> [Job]:
+    '''Jobs of a sweep description (or of each of {"sweeps": [...]})'''
+    if 'sweeps' in sweep:
+        jobs = [job for entry in sweep['sweeps'] for job in expand_sweep(entry)]
+    else:
+        kind = sweep.get('kind', 'cpu')
+        if kind not in KINDS:
+            raise Exception('Unknown sweep kind: '+str(kind))
+        workloads = sweep.get('workloads', ['stress'] if kind == 'cpu' else [])
+        unknown = set(workloads) - set(WORKLOAD_GROUPS)
+        if unknown:
+            raise Exception('Unknown workload groups: '+str(sorted(unknown)))
+        if sweep.get('perf_event_mode', MODE_PARALLEL) not in PERF_EVENT_MODES:
+            raise Exception('Unknown perf event mode: '+str(sweep['perf_event_mode']))
+        fans = sweep.get('fans', ['MaxFan'])
+        if set(fans) - set(FANS) or (kind == 'cpu' and fans != ['MaxFan']):
+            raise Exception('Unsupported fan settings '+str(fans)+' for '+kind+' sweeps')
+        jobs = []
+        for cluster, freqs in sweep['clusters'].items():
+            if cluster not in CLUSTERS:
+                raise Exception('Unknown cluster: '+str(cluster))
+            for freq in freqs:
+                for fan in fans:
+                    jobs.append(Job(sweep['name'], kind, cluster, int(freq), fan, workloads,
+                                    sweep.get('iterations', 2), sweep.get('idle_duration', 60),
+                                    sweep.get('perf_event_mode', MODE_PARALLEL)))
+    keys = [job.key for job in jobs]
+    if len(set(keys)) != len(keys):
+        raise Exception('Sweep holds duplicate jobs')
+    return jobs
+
+
+def plan_order(jobs:[Job], cluster:str = None) -> [Job]:
+    '''Order of the jobs on a single board isolating CPUs for cluster
+
+    Jobs of a cluster are contiguous, starting with the isolated cluster (else
+    the one with the longest job), longest job first within each cluster, so
+    that the board is rebooted at most once to change the isolation.
+    '''
+    jobs = sorted(jobs, key=lambda job: -job.estimated_cost())
+    if cluster is None and jobs:
+        cluster = jobs[0].cluster
+    return [job for job in jobs if job.cluster == cluster] + [job for job in jobs if job.cluster != cluster]
+
+
+def isolation_changes(order:[Job], cluster:str = None) -> int:
+    '''Reboots needed to run the jobs in order, starting with cluster isolated'''
+    changes = 0
+    for job in order:
+        if job.cluster != cluster:
+            changes += 1
+            cluster = job.cluster
+    return changes
+
+
+def run_job(board:Board, job:Job, workload_data:str, results_dir:str, journal:RunJournal = None) -> str:
+    '''Runs a job on a board as WorkloadExec-v2.py does, returns the archive path
+
+    With a journal, a job completed earlier is skipped and an interrupted one
+    resumed in its results directory, skipping the iterations it completed.
+    '''
+    from src import workloads as work
+    job_journal = journal.job(board.name, job.key) if journal is not None else None
+    if job_journal is not None and job_journal.completed():
+        print ('Campaign: '+str(job)+' completed earlier, '+job_journal.archive())
+        return job_journal.archive()
+    conn = board.connect()
+    outdir = os.path.join(results_dir, job.category)
+    os.makedirs(os.path.join(outdir, 'backup'), exist_ok=True)
+    try:
+        if job.kind == 'cpu':
+            wkld = work.CPUIntensiveWorkloads(conn,
+                                run_on_bigcore=job.bigcluster,
+                                iteration_count=job.iterations,
+                                enable_stress_workloads='stress' in job.workloads,
+                                enable_compress_workloads='compress' in job.workloads,
+                                enable_encode_workloads='encode' in job.workloads,
+                                power_port=board.sm3_port,
+                                journal=job_journal,
+                                stream_archive=True,
+                                perf_event_mode=job.perf_event_mode)
+            wkld.setup_persistant(workload_data=workload_data, resultsdir_prefix=outdir, testname_suffix=job.test_desc)
+            results = wkld.run(cpu_freq=job.freq)
+        else:
+            wkld = work.IdleWorkloads(conn,
+                                run_on_bigcore=job.bigcluster,
+                                idle_duration=job.idle_duration,
+                                run_perf_sleep=job.kind == 'perf-sleep',
+                                iteration_count=job.iterations,
+                                power_port=board.sm3_port,
+                                journal=job_journal,
+                                stream_archive=True,
+                                perf_event_mode=job.perf_event_mode)
+            wkld.setup_persistant(resultsdir_prefix=outdir, testname_suffix=job.test_desc)
+            results = wkld.run(cpu_freq=job.freq, max_fan=job.fan == 'MaxFan')
+        # Iterations were archived as they completed
+        archive = wkld.archive_path
+        # Release the SmartPower3 port prior to the next job of this board
+        del wkld
+        # Journaled before moving the results, so that an interruption in between only re-archives them
+        if job_journal is not None:
+            job_journal.complete(archive)
+        shutil.move(results, os.path.join(outdir, 'backup')+'/')
+        return archive
+    except Exception as e:
+        if job_journal is not None:
+            job_journal.fail(repr(e))
+        raise
+    finally:
+        conn.close()
+
+
+class CampaignScheduler:
+    '''Dispatches jobs to one worker thread per board'''
+    def __init__(self, boards:[Board], jobs:[Job], runner, max_attempts:int = 2, max_board_failures:int = 2,
+                 clusters:dict = None):
+        self.boards = boards
+        self.clusters = dict(clusters or {})    # board name -> cluster its CPUs are isolated for at start
+        self.runner = runner                    # runner(board, job) -> archive path
+        self.max_attempts = max_attempts
+        self.max_board_failures = max_board_failures
+        self.__lock__ = threading.Condition()
+        self.__pending__ = sorted(jobs, key=lambda job: -job.estimated_cost())
+        self.__running__ = 0
+        self.results = {}                       # job key -> {'board', 'archive' | 'error', 'seconds'}
+
+    def __next_job__(self, board:Board, cluster:str):
+        '''Longest pending job of the board's current cluster, else the longest (caller holds the lock)
+
+        Jobs which failed on the board are left to the other boards.
+        '''
+        eligible = [idx for idx, job in enumerate(self.__pending__) if board.name not in job.failed_on]
+        if not eligible:
+            return None
+        for idx in eligible:
+            if self.__pending__[idx].cluster == cluster:
+                return self.__pending__.pop(idx)
+        return self.__pending__.pop(eligible[0])
+
+    def __worker__(self, board:Board) -> None:
+        cluster = self.clusters.get(board.name)
+        failures = 0
+        while True:
+            with self.__lock__:
+                job = self.__next_job__(board, cluster)
+                # Jobs failing on the other boards may still be requeued for this one
+                while job is None and self.__running__ > 0:
+                    self.__lock__.wait()
+                    job = self.__next_job__(board, cluster)
+                if job is None:
+                    return
+                job.attempts += 1
+                self.__running__ += 1
+            print ('Campaign: '+board.name+' <- '+str(job)+' (attempt '+str(job.attempts)+')')
+            start = time.perf_counter()
+            isolation_change = job.cluster != cluster
+            try:
+                archive = self.runner(board, job)
+                result = {'board': board.name, 'archive': archive, 'isolation_change': isolation_change}
+                failures = 0
+                cluster = job.cluster
+            except Exception as e:
+                result = {'board': board.name, 'error': repr(e)}
+                failures += 1
+                cluster = None
+                print ('Campaign: '+board.name+' failed '+str(job)+': '+repr(e))
+            result['seconds'] = round(time.perf_counter() - start, 3)
+            with self.__lock__:
+                self.__running__ -= 1
+                self.results[job.key] = result
+                if 'error' in result:
+                    job.failed_on.add(board.name)
+                    if job.attempts < self.max_attempts:
+                        # Retried by whichever other board gets to it first
+                        self.__pending__.insert(0, job)
+                self.__lock__.notify_all()
+                if failures >= self.max_board_failures:
+                    print ('Campaign: retiring '+board.name+' after '+str(failures)+' consecutive failures')
+                    return
+
+    def run(self) -> dict:
+        '''Runs all jobs, returns {job key: result}'''
+        threads = [threading.Thread(target=self.__worker__, args=(board,), name=board.name) for board in self.boards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.results
+
+    def isolation_changes(self) -> int:
+        '''Jobs which required changing the isolated CPUs of their board (i.e. a reboot)'''
+        return sum(1 for result in self.results.values() if result.get('isolation_change'))
+
+    def failed(self) -> [str]:
+        return sorted(key for key, result in self.results.items() if 'error' in result)
+
+    def unscheduled(self) -> [Job]:
+        '''Jobs left pending, e.g. when all boards were retired'''
+        return list(self.__pending__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run a workload sweep on several boards in parallel')
+    parser.add_argument('--sweep', required=True, help='Sweep description (JSON)')
+    parser.add_argument('--boards', required=True, help='Board inventory (JSON)')
+    parser.add_argument('--data', default=os.path.join(str(path_root), 'data'), help='Workload data directory')
+    parser.add_argument('--results', default=os.path.join(str(path_root), 'results'), help='Results root directory')
+    parser.add_argument('--journal', default=None, help='Journal file (default: <results>/campaign.journal)')
+    parser.add_argument('--max-attempts', type=int, default=2, help='Attempts per job')
+    parser.add_argument('--dry-run', action='store_true', help='Print the jobs without running them')
+    args = parser.parse_args()
+
+    boards = load_inventory(args.boards)
+    with open(args.sweep, 'r') as f:
+        jobs = expand_sweep(json.load(f))
+    print ('Campaign: '+str(len(jobs))+' jobs on '+str(len(boards))+' boards: '+', '.join(map(str, boards)))
+    journal = RunJournal(args.journal or os.path.join(args.results, 'campaign.journal'))
+    states = journal.summary()
+    if args.dry_run:
+        order = plan_order(jobs)
+        for job in order:
+            print ('  '+str(job)+'  (cost {:.0f}'.format(job.estimated_cost())+
+                   (', '+states[job.key] if job.key in states else '')+')')
+        print ('Campaign: '+str(isolation_changes(order))+' isolation changes on a single board')
+        return 0
+
+    # Boards start with the jobs of the cluster they isolate already, avoiding a reboot
+    clusters = {board.name: board.isolated_cluster() for board in boards}
+    print ('Campaign: isolated clusters '+str(clusters))
+
+    runner = lambda board, job: run_job(board, job, args.data, args.results, journal)
+    scheduler = CampaignScheduler(boards, jobs, runner, max_attempts=args.max_attempts, clusters=clusters)
+    scheduler.run()
+    print ('Campaign: '+str(scheduler.isolation_changes())+' isolation changes')
+    for key in scheduler.failed():
+        print ('Campaign: FAILED '+key+': '+scheduler.results[key]['error'])
+    for job in scheduler.unscheduled():
+        print ('Campaign: NOT RUN '+str(job))
+    return 1 if scheduler.failed() or scheduler.unscheduled() else 0
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    sys.exit(main())
+
+if __name__ == '__main__':
+    ## Simulated runs: 10 boards should take about a tenth of the time of one
+    sweep = {'sweeps': [
+        {'name': '100msPerf', 'kind': 'cpu', 'workloads': ['stress'], 'iterations': 2,
+         'clusters': {'big': [2000000, 1800000, 1600000, 1400000, 1200000, 1000000, 800000, 600000, 400000, 200000],
+                      'little': [1400000, 1200000, 1000000, 800000, 600000, 400000, 200000]}},
+        {'name': 'Idle', 'kind': 'idle', 'iterations': 2, 'idle_duration': 60, 'fans': ['MaxFan', 'NoFan'],
+         'clusters': {'big': [2000000, 200000], 'little': [1400000, 200000]}},
+    ]}
+    jobs = expand_sweep(sweep)
+    assert len(jobs) == 17 + 8, 'Unexpected job count '+str(len(jobs))
+    assert len(set(job.key for job in jobs)) == len(jobs), 'Job keys not unique'
+
+    def simulated(board, job):
+        time.sleep(job.estimated_cost() * 0.0002)
+        return board.name+':'+job.key
+
+    def run(nboards, fail_board = None):
+        boards = [Board('xu4-%02d' % i, '192.168.0.%d' % (101+i), 6000+i) for i in range(nboards)]
+        def runner(board, job):
+            if board.name == fail_board:
+                raise Exception('unreachable')
+            return simulated(board, job)
+        start = time.perf_counter()
+        scheduler = CampaignScheduler(boards, expand_sweep(sweep), runner)
+        results = scheduler.run()
+        return time.perf_counter() - start, scheduler, results
+
+    ## Jobs of a cluster are contiguous, a single board changes isolation once
+    order = plan_order(jobs, 'little')
+    assert isolation_changes(order, 'little') == 1 and order[0].cluster == 'little', 'Clusters not contiguous'
+    assert isolation_changes(sorted(jobs, key=lambda job: -job.estimated_cost())) > 2, 'Interleaved order expected'
+
+    serial, scheduler, results = run(1)
+    assert scheduler.isolation_changes() == 2, 'Unexpected isolation changes '+str(scheduler.isolation_changes())
+    parallel, scheduler, results = run(10)
+    print ('1 board: {:.2f}s, 10 boards: {:.2f}s, speed-up {:.1f}x'.format(serial, parallel, serial/parallel))
+    assert len(results) == len(jobs) and not scheduler.failed(), 'Jobs missing or failed'
+    assert len(set(result['board'] for result in results.values())) == 10, 'Boards left idle'
+    assert serial / parallel > 5, 'Insufficient parallel speed-up'
+
+    ## A failing board is retired, its jobs are retried on the others
+    _, scheduler, results = run(3, fail_board='xu4-01')
+    assert not scheduler.failed() and not scheduler.unscheduled(), 'Jobs of the failing board lost'
+    assert all(result['board'] != 'xu4-01' for result in results.values()), 'Failed job not retried'
+    print ('Campaign scheduler test completed...')
+
+#### ==========================================================================
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""Catalog of post-boot gem5 checkpoints keyed by the simulated platform
+
+Booting Ubuntu in gem5 takes hours, SimulatedWorkloadExec-v1.py therefore
+restores a single hard-coded checkpoint, which is only valid for the
+platform it was taken on. The catalog keys checkpoints on a fingerprint of
+the options of fs_bigLITTLE.py/odroid_xu4_sim.py that shape the booted
+system:
+    CPU type & counts, caches (--caches, --last-cache-level), memory size,
+    machine type, kernel command line options (--root, --kernel-init,
+    --kernel-cmd), -P parameters, --vio-9p, and the SHA-256 of the kernel,
+    bootloaders, disk images, DTB and bootscript
+Clocks, voltages and power model options are left out, so that one
+checkpoint serves every point of a frequency sweep.
+
+A missing checkpoint is created once, through Gem5Farm: boot, 'm5 checkpoint',
+'m5 exit', the checkpoint being moved into the catalog. Concurrent users of
+a catalog directory are serialised with file locks, so that a fingerprint
+is booted once only.
+
+Layout of the catalog directory:
+    index.json              - entries (platform, checkpoint, size, created, last use, uses)
+                              & file digests cached on (size, mtime)
+    <fingerprint>/cpt.<tick> - checkpoints
+    build/                  - gem5 runs creating checkpoints
+
+Stale entries (inputs changed or gone, checkpoint directory missing) are
+dropped by prune(), evict() also drops entries unused for longer than a
+maximum age and then the least recently used ones until within a size bound.
+
+Usage:
+    python3 src/gem5checkpoints.py list
+    python3 src/gem5checkpoints.py add --cpt simulation/working-dir/m5out/cpt.328949930500
+    python3 src/gem5checkpoints.py ensure --platform-args '--big-cpus 2 --little-cpus 4 ...'
+    python3 src/gem5checkpoints.py evict --max-size 200G --max-age 60
+
+    catalog = CheckpointCatalog('simulation/checkpoints')
+    cpt = catalog.ensure(farm, args)        # path of the checkpoint, booting once if missing
+    fingerprint, cpt, unhashed = catalog.peek(args)   # read-only, e.g. for dry runs
+
+Assumptions:
+  (1) The gem5 binary restoring a checkpoint is compatible with the one that
+      created it (the binary is not part of the fingerprint)
+  (2) Platform files are given as paths on the host (not resolved through
+      M5_PATH)
+
+Limitations:
+  N/A
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import fcntl
+import shutil
+import hashlib
+import argparse
+import contextlib
+
+## Import the local packages
+from pathlib import Path
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+
+from src.processing.cache import make_key, parse_size, write_atomic_json
+from src.gem5farm import Gem5Farm, SimRun, PLATFORM_ARGS
+
+CATALOG_VERSION = 1
+INDEX_FILE = 'index.json'
+DEFAULT_CATALOG = os.path.join(str(path_root), 'simulation', 'checkpoints')
+## Files whose content is part of the fingerprint
+__file_options__ = ['kernel', 'bootloader', 'disk', 'dtb', 'bootscript']
+
+
+def __platform_parser__() -> argparse.ArgumentParser:
+    '''Options of fs_bigLITTLE.py shaping the booted system, with its defaults'''
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument('--kernel', type=str, default=None)
+    parser.add_argument('--bootloader', action='append', default=[])
+    parser.add_argument('--disk', action='append', default=[])
+    parser.add_argument('--dtb', type=str, default=None)
+    parser.add_argument('--bootscript', type=str, default='')
+    parser.add_argument('--root', type=str, default='/dev/vda1')
+    parser.add_argument('--machine-type', type=str, default='VExpress_GEM5')
+    parser.add_argument('--cpu-type', type=str, default='timing')
+    parser.add_argument('--kernel-init', type=str, default='/sbin/init')
+    parser.add_argument('--kernel-cmd', type=str, default=None)
+    parser.add_argument('--big-cpus', type=int, default=1)
+    parser.add_argument('--little-cpus', type=int, default=1)
+    parser.add_argument('--caches', action='store_true', default=False)
+    parser.add_argument('--last-cache-level', type=int, default=2)
+    parser.add_argument('--mem-size', type=str, default='2GB')
+    parser.add_argument('-P', '--param', action='append', default=[])
+    parser.add_argument('--vio-9p', action='store_true', default=False)
+    return parser
+
+
+def platform_config(args:[str]) -> dict:
+    '''Options of the config script arguments that shape the booted system, files as paths'''
+    options, _ = __platform_parser__().parse_known_args(args)
+    config = vars(options)
+    if not config['kernel']:
+        raise Exception('Platform arguments without --kernel')
+    return config
+
+
+def __file_sha256__(path:str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def __dir_size__(path:str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class CheckpointCatalog:
+    def __init__(self, root:str = DEFAULT_CATALOG):
+        self.root = os.path.abspath(root)
+        self.__index_file__ = os.path.join(self.root, INDEX_FILE)
+
+    ## ------------------------------------------------------------------------
+    ## Index, read & written under the lock of the catalog
+    @contextlib.contextmanager
+    def __locked__(self, name:str = '.lock'):
+        # Created with the first write, read-only users (peek) leave no trace
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, name), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __load__(self) -> dict:
+        if os.path.exists(self.__index_file__):
+            with open(self.__index_file__, 'r') as f:
+                return json.load(f)
+        return {'version': CATALOG_VERSION, 'entries': {}, 'files': {}}
+
+    def __save__(self, index:dict) -> None:
+        write_atomic_json(self.__index_file__, index)
+
+    @staticmethod
+    def __cached_digest__(index:dict, path:str) -> str:
+        '''SHA-256 of a file cached in the index, None if not cached for its (size, mtime)'''
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            raise Exception('Platform file not found: '+path)
+        st = os.stat(path)
+        rec = index['files'].get(path)
+        if rec and rec['size'] == st.st_size and rec['mtime_ns'] == st.st_mtime_ns:
+            return rec['sha256']
+        return None
+
+    @staticmethod
+    def __digest__(index:dict, path:str) -> str:
+        '''SHA-256 of a file, cached on (size, mtime) in the index'''
+        digest = CheckpointCatalog.__cached_digest__(index, path)
+        if digest:
+            return digest
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        print ('Catalog: hashing '+path)
+        digest = __file_sha256__(path)
+        index['files'][path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    @staticmethod
+    def __platform_files__(args:[str]) -> [str]:
+        '''Files whose content is part of the fingerprint'''
+        config = platform_config(args)
+        return [p for option in __file_options__
+                for p in (config[option] if isinstance(config[option], list) else [config[option]] if config[option] else [])]
+
+    def __platform__(self, index:dict, args:[str]) -> (str, dict):
+        '''Fingerprint and description of the platform of config script arguments'''
+        config = platform_config(args)
+        platform = dict(config)
+        for option in __file_options__:
+            paths = config[option] if isinstance(config[option], list) else [config[option]] if config[option] else []
+            platform[option] = [{'path': os.path.abspath(p), 'sha256': self.__digest__(index, p)} for p in paths]
+        key = {k: v for k, v in platform.items() if k not in __file_options__}
+        key.update({option: [f['sha256'] for f in platform[option]] for option in __file_options__})
+        return make_key('gem5-checkpoint', key, CATALOG_VERSION), platform
+
+    def fingerprint(self, args:[str]) -> str:
+        with self.__locked__():
+            index = self.__load__()
+            fingerprint, _ = self.__platform__(index, args)
+            self.__save__(index)
+        return fingerprint
+
+    ## ------------------------------------------------------------------------
+    ## Entries
+    def lookup(self, args:[str]):
+        '''Path of the checkpoint of the platform (marking it used), None if missing'''
+        with self.__locked__():
+            index = self.__load__()
+            fingerprint, _ = self.__platform__(index, args)
+            entry = index['entries'].get(fingerprint)
+            cpt = os.path.join(self.root, entry['cpt']) if entry else None
+            if entry and not os.path.isdir(cpt):
+                del index['entries'][fingerprint]
+                cpt = None
+            elif entry:
+                entry['last_used'] = time.time()
+                entry['uses'] += 1
+            self.__save__(index)
+        return cpt
+
+    def peek(self, args:[str]) -> (str, str, [str]):
+        '''Read-only lookup (e.g. dry runs), nothing is written and no file hashed:
+        (fingerprint, checkpoint path or None, platform files not hashed yet),
+        the fingerprint is None as long as some platform files are not hashed'''
+        index = self.__load__()
+        unhashed = [os.path.abspath(p) for p in self.__platform_files__(args) if not self.__cached_digest__(index, p)]
+        if unhashed:
+            return None, None, unhashed
+        fingerprint, _ = self.__platform__(index, args)
+        entry = index['entries'].get(fingerprint)
+        cpt = os.path.join(self.root, entry['cpt']) if entry else None
+        return fingerprint, cpt if cpt and os.path.isdir(cpt) else None, []
+
+    def add(self, args:[str], cpt:str, move:bool = False) -> str:
+        '''Adds a checkpoint directory (cpt.<tick>) of the platform, copied or moved, returns its path'''
+        cpt = os.path.abspath(cpt)
+        if not os.path.isfile(os.path.join(cpt, 'm5.cpt')):
+            raise Exception('Not a gem5 checkpoint: '+cpt)
+        with self.__locked__():
+            index = self.__load__()
+            fingerprint, platform = self.__platform__(index, args)
+            dst = os.path.join(self.root, fingerprint, os.path.basename(cpt))
+            if os.path.exists(os.path.join(self.root, fingerprint)):
+                shutil.rmtree(os.path.join(self.root, fingerprint))
+            os.makedirs(os.path.dirname(dst))
+            if move:
+                shutil.move(cpt, dst)
+            else:
+                shutil.copytree(cpt, dst)
+            now = time.time()
+            index['entries'][fingerprint] = {'platform': platform, 'cpt': os.path.relpath(dst, self.root),
+                                             'size': __dir_size__(dst), 'created': now, 'last_used': now, 'uses': 0}
+            self.__save__(index)
+        print ('Catalog: added '+fingerprint[:16]+' ('+os.path.relpath(dst, self.root)+')')
+        return dst
+
+    def ensure(self, farm:Gem5Farm, args:[str] = None) -> str:
+        '''Checkpoint of the platform of the farm (with further arguments), booting it once if missing'''
+        args = farm.platform_args + list(args or [])
+        cpt = self.lookup(args)
+        if cpt:
+            return cpt
+        fingerprint = self.fingerprint(args)
+        ## One boot per fingerprint: others wait for it and reuse its checkpoint
+        with self.__locked__('.build-'+fingerprint[:16]+'.lock'):
+            cpt = self.lookup(args)
+            if cpt:
+                return cpt
+            print ('Catalog: booting platform '+fingerprint[:16]+' to checkpoint it')
+            builder = Gem5Farm(os.path.join(self.root, 'build'), gem5=farm.gem5, script=farm.script,
+                               platform_args=farm.platform_args, max_parallel=1,
+                               start_timeout_s=farm.start_timeout_s, boot_timeout_s=farm.boot_timeout_s,
+                               run_timeout_s=farm.run_timeout_s, exit_timeout_s=farm.exit_timeout_s, prompt=farm.prompt)
+            run = CheckpointRun(fingerprint[:16], list(args or [])[len(farm.platform_args):])
+            result = builder.run([run])[0]
+            m5out = os.path.join(result['rundir'], 'm5out')
+            cpts = sorted(d for d in os.listdir(m5out) if d.startswith('cpt.')) if os.path.isdir(m5out) else []
+            if result['status'] != 'completed' or not cpts:
+                raise Exception('Checkpointing platform '+fingerprint[:16]+' failed: '+str(result['error'] or result['status']))
+            cpt = self.add(args, os.path.join(m5out, cpts[-1]), move=True)
+            shutil.rmtree(result['rundir'], ignore_errors=True)
+        return cpt
+
+    ## ------------------------------------------------------------------------
+    ## Size accounting & eviction
+    def __remove__(self, index:dict, fingerprint:str, reason:str) -> int:
+        entry = index['entries'].pop(fingerprint)
+        shutil.rmtree(os.path.join(self.root, fingerprint), ignore_errors=True)
+        print ('Catalog: evicted '+fingerprint[:16]+' ('+reason+', '+str(entry['size'] >> 20)+' MiB)')
+        return entry['size']
+
+    def __stale__(self, index:dict, fingerprint:str) -> str:
+        '''Reason why an entry is stale, None if valid'''
+        entry = index['entries'][fingerprint]
+        if not os.path.isdir(os.path.join(self.root, entry['cpt'])):
+            return 'checkpoint missing'
+        for option in __file_options__:
+            for f in entry['platform'][option]:
+                if not os.path.isfile(f['path']):
+                    return f['path']+' gone'
+                if self.__digest__(index, f['path']) != f['sha256']:
+                    return f['path']+' changed'
+        return None
+
+    def prune(self) -> int:
+        '''Drops stale entries, returns bytes freed'''
+        return self.evict()
+
+    def evict(self, max_bytes:int = None, max_age_days:float = None, keep:set = frozenset()) -> int:
+        '''Drops stale entries, entries unused for max_age_days, then least recently used ones
+           until within max_bytes; returns bytes freed'''
+        freed = 0
+        with self.__locked__():
+            index = self.__load__()
+            for fingerprint in list(index['entries']):
+                reason = self.__stale__(index, fingerprint)
+                if reason and fingerprint not in keep:
+                    freed += self.__remove__(index, fingerprint, reason)
+            entries = sorted(index['entries'].items(), key=lambda kv: kv[1]['last_used'])
+            total = sum(entry['size'] for _, entry in entries)
+            for fingerprint, entry in entries:
+                if fingerprint in keep:
+                    continue
+                if max_age_days is not None and time.time() - entry['last_used'] > max_age_days * 86400:
+                    reason = 'unused for '+str(int((time.time() - entry['last_used']) / 86400))+' days'
+                elif max_bytes is not None and total > max_bytes:
+                    reason = 'size bound'
+                else:
+                    continue
+                total -= entry['size']
+                freed += self.__remove__(index, fingerprint, reason)
+            self.__save__(index)
+        return freed
+
+    def entries(self) -> dict:
+        with self.__locked__():
+            return self.__load__()['entries']
+
+    def usage(self) -> dict:
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(entry['size'] for entry in entries.values())}
+
+
+class CheckpointRun(SimRun):
+    '''Boot of a platform that drops a checkpoint at the shell prompt'''
+    def __init__(self, name:str, args:[str] = None):
+        super().__init__('checkpoint', '', args=args, prefix=name)
+
+    def guest_command(self) -> bytes:
+        return b'm5 checkpoint; echo __gem5farm_exit=$?; m5 exit\n'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Catalog of post-boot gem5 checkpoints')
+    parser.add_argument('command', choices=['list', 'add', 'ensure', 'evict'])
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG, help='Catalog directory')
+    parser.add_argument('--platform-args', default=shlex.join(PLATFORM_ARGS), help='Arguments of the config script')
+    parser.add_argument('--cpt', help='Checkpoint directory to add (cpt.<tick>)')
+    parser.add_argument('--max-size', default=None, help='Size bound of evict, e.g. 200G')
+    parser.add_argument('--max-age', type=float, default=None, help='Days unused after which evict drops entries')
+    args = parser.parse_args()
+    catalog = CheckpointCatalog(args.catalog)
+    platform_args = shlex.split(args.platform_args)
+
+    if args.command == 'add':
+        if not args.cpt:
+            raise Exception('add needs --cpt')
+        catalog.add(platform_args, args.cpt)
+    elif args.command == 'ensure':
+        print (catalog.ensure(Gem5Farm(os.path.join(catalog.root, 'build'), platform_args=platform_args)))
+    elif args.command == 'evict':
+        freed = catalog.evict(parse_size(args.max_size) if args.max_size else None, args.max_age)
+        print ('Catalog: freed '+str(freed >> 20)+' MiB')
+    for fingerprint, entry in sorted(catalog.entries().items(), key=lambda kv: -kv[1]['last_used']):
+        platform = entry['platform']
+        print ('{} {:>8} MiB {:>4} uses  {} {}b/{}L {} caches={}  {}'.format(
+               fingerprint[:16], entry['size'] >> 20, entry['uses'], platform['cpu_type'], platform['big_cpus'],
+               platform['little_cpus'], platform['mem_size'], platform['caches'], entry['cpt']))
+    usage = catalog.usage()
+    print ('Catalog: '+str(usage['entries'])+' checkpoints, '+str(usage['bytes'] >> 20)+' MiB')
+    return 0
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    sys.exit(main())
+
+if __name__ == '__main__':
+    import tempfile
+
+    ## Stand-in for gem5: boots to the prompt, drops cpt.<tick> on 'm5 checkpoint'
+    fake_gem5 = r'''
+import os, sys, socket
+outdir = sys.argv[sys.argv.index('-d') + 1]
+s = socket.socket()
+s.bind(('localhost', 0)); s.listen(1)
+sys.stderr.write('system.terminal: Listening for connections on port %d\n' % s.getsockname()[1]); sys.stderr.flush()
+conn, _ = s.accept()
+conn.sendall(b'root@aarch64-gem5:/# ')
+cmd = b''
+while not cmd.endswith(b'\n'):
+    cmd += conn.recv(1024)
+if cmd.startswith(b'm5 checkpoint'):
+    os.makedirs(os.path.join(outdir, 'cpt.1000'))
+    with open(os.path.join(outdir, 'cpt.1000', 'm5.cpt'), 'w') as f:
+        f.write('[root]\n' + ' '.join(sys.argv) + '\n')
+conn.sendall(b'__gem5farm_exit=0\r\n')
+conn.close()
+'''
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = os.path.join(tmp, 'fake_gem5.py')
+        with open(fake, 'w') as f:
+            f.write(fake_gem5)
+        for name in ['vmlinux', 'boot', 'disk.img']:
+            with open(os.path.join(tmp, name), 'wb') as f:
+                f.write(name.encode() * 1000)
+        base = ['--kernel', os.path.join(tmp, 'vmlinux'), '--bootloader', os.path.join(tmp, 'boot'),
+                '--disk', os.path.join(tmp, 'disk.img'), '--cpu-type', 'exynos', '--big-cpus', '4', '--little-cpus', '4', '--caches']
+        catalog = CheckpointCatalog(os.path.join(tmp, 'catalog'))
+
+        ## Fingerprint ignores clocks & voltages, not the platform
+        fp = catalog.fingerprint(base)
+        assert fp == catalog.fingerprint(base + ['--big-cpu-clock', '1GHz', '--little-cpu-voltage', '1.0V']), 'Clock in fingerprint'
+        assert fp != catalog.fingerprint(base + ['--mem-size', '4GB']), 'Memory not in fingerprint'
+        assert fp != catalog.fingerprint(base[:-1] + ['--big-cpus', '2', '--caches']), 'CPU count not in fingerprint'
+
+        ## Booted once, then reused
+        farm = Gem5Farm(os.path.join(tmp, 'runs'), gem5=[sys.executable, fake], script='odroid_xu4_sim.py',
+                        platform_args=base, boot_timeout_s=10, run_timeout_s=10)
+        cpt = catalog.ensure(farm)
+        assert os.path.isfile(os.path.join(cpt, 'm5.cpt')) and cpt.startswith(os.path.join(catalog.root, fp)), 'Not checkpointed'
+        assert catalog.ensure(farm) == cpt and catalog.entries()[fp]['uses'] == 1, 'Checkpoint not reused'
+        assert os.listdir(os.path.join(catalog.root, 'build')) == ['farm.json'], 'Build run left behind'
+        cpt4 = catalog.ensure(farm, ['--mem-size', '4GB'])
+        assert cpt4 != cpt and catalog.usage()['entries'] == 2, 'Second platform not added'
+
+        ## Stale & LRU eviction
+        with open(os.path.join(tmp, 'disk.img'), 'ab') as f:
+            f.write(b'changed')
+        assert catalog.evict() > 0 and catalog.usage()['entries'] == 0 and not os.path.exists(cpt), 'Stale checkpoints kept'
+        fp, fp4 = catalog.fingerprint(base), catalog.fingerprint(base + ['--mem-size', '4GB'])
+        cpt = catalog.ensure(farm)
+        cpt4 = catalog.ensure(farm, ['--mem-size', '4GB'])
+        time.sleep(0.01)
+        catalog.lookup(base + ['--mem-size', '4GB'])
+        entries = catalog.entries()
+        freed = catalog.evict(max_bytes=entries[fp4]['size'])
+        assert freed == entries[fp]['size'] and catalog.lookup(base) is None and \
+               catalog.lookup(base + ['--mem-size', '4GB']) == cpt4, 'Least recently used not evicted'
+        assert catalog.evict(max_age_days=0) == entries[fp4]['size'], 'Unused entries not evicted'
+    print ('Checkpoint catalog test completed...')
+
+#### ==========================================================================
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""Concurrent gem5 simulations of a frequency/voltage/power coefficient/workload matrix (asyncio)
+
+Replacement of SimulatedWorkloadExec-v1.py, which runs a single gem5
+instance at a fixed clock with a blocking pexpect child, a fixed sleep and
+a telnetlib thread on the fixed terminal port 3456 (telnetlib is gone from
+Python 3.13). Here every run of the matrix gets its own directory and gem5
+process, started with asyncio subprocesses:
+  - gem5's output is streamed to <run>/gem5.log, the terminal port the
+    simulated system listens on is taken from it (gem5 moves to the next
+    free port when one is taken, so concurrent runs never collide)
+  - the guest shell is driven over an asyncio stream: wait for the prompt,
+    send the workload wrapped in 'm5 resetstats' / 'm5 dumpstats; m5 exit',
+    read until gem5 closes the terminal, each step with its own timeout;
+    the guest's exit code of the workload is echoed back
+  - at most min(host cores, available RAM / RAM per run) runs are active,
+    started longest first by their estimated runtime so that the last
+    runs to complete are short ones and the pool stays saturated
+    (estimates: earlier results of the run in <outdir>/farm.json, else of
+    the workload scaled by the big clock, else the "estimates" of the
+    matrix)
+  - with a checkpoint, every run restores it (the boot is shared by the
+    whole sweep), the config script being given the DVFS options and the
+    power coefficients of the run
+  - stats.txt is kept in <run>/m5out, the statistics of the power models
+    are collected into <run>/power.json, and the result of every run
+    (exit codes, terminal port, durations, files) into <outdir>/farm.json,
+    updated as runs complete
+
+Matrix (JSON):
+    {
+      "name": "dvfs",
+      "checkpoint": "simulation/working-dir/m5out/cpt.328949930500",   # optional, "catalog": see gem5checkpoints.py
+      "big":    [["2.0GHz", "1.25V"], ["1.0GHz", "1.0V"]],              # clock, voltage
+      "little": [["1.4GHz", "1.25V"]],
+      "workloads": {"ls": "ls", "stress-cpu4": "stress -c 4 -t 1s"},
+      "args": ["--power-model", "power_model.json"],                    # optional, to the config script
+      "coefficients": [{"bigcore-dyn-pow-coeff": "1.0"}, {"bigcore-dyn-pow-coeff": "1.2"}],  # optional
+      "sweep": "cross",                                                 # optional, or "each"
+      "estimates": {"stress-cpu4": 3600}                                # optional, seconds
+    }
+  "big"/"little" entries are [clock, voltage] or a clock (at the default
+  voltage). "cross" runs every big with every little entry, "each" sweeps
+  one cluster at a time, the other at its first entry (e.g. the 19 big and
+  13 LITTLE operating points of the board in 31 runs of
+  campaigns/gem5-powerfit.json, at the voltages of the OPP tables of the
+  XU4 device tree, exynos5422-odroid-core.dtsi). Every run is repeated
+  for each set of coefficients (options of odroid_xu4_sim.py).
+
+Usage:
+    python3 src/gem5farm.py --matrix campaigns/gem5-sweep.json --outdir simulation/runs
+    python3 src/gem5farm.py --matrix campaigns/gem5-sweep.json --outdir simulation/runs --dry-run
+    python3 src/gem5farm.py --matrix campaigns/gem5-powerfit.json --outdir simulation/runs/powerfit -j 8
+
+    farm = Gem5Farm('simulation/runs')
+    results = farm.run(expand_matrix(matrix))       # [{'name', 'status', 'returncode', 'guest_exit', ...}]
+
+Assumptions:
+  (1) The guest (ubuntu-18.04-docker.img) logs in as root on the terminal,
+      its prompt matching PROMPT, and has the m5 utility in its PATH
+  (2) A run needs about its simulated memory (--mem-size) plus
+      RUN_OVERHEAD_GB of host RAM
+  (3) Without earlier results, the runtime of a workload is taken to grow
+      as the inverse of the big clock (the simulated time does)
+
+Limitations:
+  (1) Available RAM is read once, at start, other users of the host are
+      not accounted for later on
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import signal
+import asyncio
+import argparse
+
+## Import the local packages
+from pathlib import Path
+path_root = Path(__file__).parents[1]
+sys.path.append(str(path_root))
+sys.path.append(str(path_root / 'simulation' / 'gem5-src' / 'util'))
+from stats_reader import StatsReader
+
+GEM5_DIST_DIR = os.path.join(str(path_root), 'simulation', 'gem5-dist')
+GEM5_SRC_DIR = os.path.join(str(path_root), 'simulation', 'gem5-src')
+PLATFORM_DIR = os.path.join(str(path_root), 'simulation', 'plat-resource')
+GEM5_EXECUTABLE = os.path.join(GEM5_DIST_DIR, 'gem5.opt')
+GEM5_SCRIPT = os.path.join(GEM5_SRC_DIR, 'configs', 'example', 'arm', 'odroid_xu4_sim.py')
+## Arguments of SimulatedWorkloadExec-v1.py, but for the frequencies
+PLATFORM_ARGS = ['--kernel', os.path.join(PLATFORM_DIR, 'vmlinux'),
+                 '--bootloader', os.path.join(PLATFORM_DIR, 'boot'),
+                 '--disk', os.path.join(PLATFORM_DIR, 'ubuntu-18.04-docker.img'),
+                 '--cpu-type', 'exynos', '--machine-type', 'VExpress_GEM5', '--big-cpus', '4', '--little-cpus', '4',
+                 '--caches', '--mem-size', '2GB']
+MEM_SIZE_GB = 2
+RUN_OVERHEAD_GB = 1.0
+
+PROMPT = re.compile(rb'root@aarch64-gem5:[^\n#]*# ?$')
+re_terminal_port = re.compile(rb'system\.terminal: Listening for connections on port (\d+)')
+re_guest_exit = re.compile(rb'__gem5farm_exit=(\d+)')
+re_power_stat = re.compile(r'.*power_model\..*')
+re_clock = re.compile(r'^\s*([0-9.]+)\s*([kMG]?)Hz\s*$')
+FARM_FILE = 'farm.json'
+REFERENCE_CLOCK_GHZ = 2.0
+DEFAULT_ESTIMATE_S = 1.0
+
+
+class SimRun:
+    '''One gem5 simulation: a workload at a big & LITTLE clock/voltage'''
+    def __init__(self, workload:str, cmd:str, big_clock:str = '2.0GHz', big_voltage:str = '1.25V',
+                 little_clock:str = '1.4GHz', little_voltage:str = '1.25V',
+                 checkpoint:str = None, args:[str] = None, prefix:str = '', coefficients:dict = None, label:str = ''):
+        self.workload = workload
+        self.cmd = cmd
+        self.big_clock = big_clock
+        self.big_voltage = big_voltage
+        self.little_clock = little_clock
+        self.little_voltage = little_voltage
+        self.checkpoint = checkpoint
+        self.args = list(args or [])
+        self.prefix = prefix
+        self.coefficients = dict(coefficients or {})
+        self.label = label
+
+    @property
+    def name(self) -> str:
+        '''Directory name of the run, e.g. dvfs-ls-big2.0GHz-1.25V-little1.4GHz-1.25V[-c1]'''
+        name = self.workload+'-big'+self.big_clock+'-'+self.big_voltage+'-little'+self.little_clock+'-'+self.little_voltage
+        name = name+'-'+self.label if self.label else name
+        return self.prefix+'-'+name if self.prefix else name
+
+    def script_args(self) -> [str]:
+        args = ['--big-cpu-clock', self.big_clock, '--big-cpu-voltage', self.big_voltage,
+                '--little-cpu-clock', self.little_clock, '--little-cpu-voltage', self.little_voltage]
+        if self.checkpoint:
+            args += ['--restore-from', os.path.abspath(self.checkpoint)]
+        for option, value in self.coefficients.items():
+            args += ['--'+option, str(value)]
+        return args + self.args
+
+    def guest_command(self) -> bytes:
+        '''Workload with statistics reset before & dumped after, exit code echoed'''
+        return ('m5 resetstats; '+self.cmd+'; echo __gem5farm_exit=$?; m5 dumpstats; m5 exit\n').encode()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+def __operating_points__(entries:list, voltage:str) -> [(str, str)]:
+    '''[clock, voltage] or clock entries of a matrix as (clock, voltage)'''
+    return [(entry, voltage) if isinstance(entry, str) else tuple(entry) for entry in entries]
+
+
+def expand_matrix(matrix:dict) -> [SimRun]:
+    '''Runs of a matrix description (see the module documentation)'''
+    bigs = __operating_points__(matrix.get('big', [['2.0GHz', '1.25V']]), '1.25V')
+    littles = __operating_points__(matrix.get('little', [['1.4GHz', '1.25V']]), '1.25V')
+    sweep = matrix.get('sweep', 'cross')
+    if sweep == 'cross':
+        points = [(big, little) for big in bigs for little in littles]
+    elif sweep == 'each':
+        points = [(big, littles[0]) for big in bigs] + [(bigs[0], little) for little in littles]
+        points = list(dict.fromkeys(points))
+    else:
+        raise Exception('Unknown sweep: '+str(sweep))
+    coefficients = matrix.get('coefficients') or [{}]
+    runs = []
+    for workload, cmd in matrix['workloads'].items():
+        for (big_clock, big_voltage), (little_clock, little_voltage) in points:
+            for idx, coeffs in enumerate(coefficients):
+                runs.append(SimRun(workload, cmd, big_clock, big_voltage, little_clock, little_voltage,
+                                   matrix.get('checkpoint'), matrix.get('args'), matrix.get('name', ''),
+                                   coefficients=coeffs, label='c'+str(idx) if len(coefficients) > 1 else ''))
+    names = [run.name for run in runs]
+    if len(set(names)) != len(names):
+        raise Exception('Matrix holds duplicate runs')
+    return runs
+
+
+def clock_ghz(clock:str) -> float:
+    '''GHz of a gem5 clock, e.g. 1.4GHz or 800MHz'''
+    m = re_clock.match(clock)
+    if not m:
+        raise Exception('Invalid clock: '+str(clock))
+    return float(m.group(1)) * {'': 1e-9, 'k': 1e-6, 'M': 1e-3, 'G': 1.0}[m.group(2)]
+
+
+def __clock_scale__(clock:str) -> float:
+    '''Runtime at clock relative to the one at REFERENCE_CLOCK_GHZ (1 for clocks not parsed)'''
+    try:
+        return REFERENCE_CLOCK_GHZ / clock_ghz(clock)
+    except Exception:
+        return 1.0
+
+
+def estimate_runtimes(runs:[SimRun], history:[dict] = (), estimates:dict = None) -> {str: float}:
+    '''Estimated seconds of each run: its earlier completed result, else the
+    earlier results of its workload (or the estimate given for it, or
+    DEFAULT_ESTIMATE_S at REFERENCE_CLOCK_GHZ) scaled by its big clock'''
+    done = {r['name']: r for r in history if r.get('status') == 'completed' and r.get('elapsed_s')}
+    per_workload = {}
+    for r in done.values():
+        # Brought to the reference clock
+        scaled = r['elapsed_s'] / __clock_scale__(r['big_clock'])
+        per_workload.setdefault(r['workload'], []).append(scaled)
+    estimates = estimates or {}
+    result = {}
+    for run in runs:
+        if run.name in done:
+            result[run.name] = done[run.name]['elapsed_s']
+            continue
+        if run.workload in per_workload:
+            base = sum(per_workload[run.workload]) / len(per_workload[run.workload])
+        else:
+            base = estimates.get(run.workload, DEFAULT_ESTIMATE_S)
+        result[run.name] = base * __clock_scale__(run.big_clock)
+    return result
+
+
+def available_ram_gb() -> float:
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / (1 << 20)
+    except OSError:
+        pass
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1 << 30)
+
+
+def parallel_slots(ram_per_run_gb:float = MEM_SIZE_GB + RUN_OVERHEAD_GB) -> int:
+    '''Runs the host can hold at once, bounded by its cores and available RAM'''
+    return max(1, min(os.cpu_count() or 1, int(available_ram_gb() // ram_per_run_gb)))
+
+
+def power_stats(stats_file:str) -> dict:
+    '''{statistic: [value of each dump]} of the power model statistics of a stats.txt'''
+    power = {}
+    for window in StatsReader(stats_file, select=re_power_stat):
+        for name, value in window.items():
+            values = power.setdefault(name, [])
+            values.extend([None] * (window.index - len(values)))
+            values.append(value)
+    return power
+
+
+class Gem5Farm:
+    '''Runs gem5 simulations concurrently, each in a directory of its own under outdir'''
+    def __init__(self, outdir:str, gem5:[str] = None, script:str = GEM5_SCRIPT, platform_args:[str] = None,
+                 max_parallel:int = None, ram_per_run_gb:float = MEM_SIZE_GB + RUN_OVERHEAD_GB,
+                 start_timeout_s:float = 600, boot_timeout_s:float = 3600, run_timeout_s:float = 24*3600,
+                 exit_timeout_s:float = 600, prompt = PROMPT):
+        self.outdir = os.path.abspath(outdir)
+        self.gem5 = list(gem5) if gem5 is not None else [GEM5_EXECUTABLE]
+        self.script = script
+        self.platform_args = list(platform_args) if platform_args is not None else list(PLATFORM_ARGS)
+        self.max_parallel = max_parallel or parallel_slots(ram_per_run_gb)
+        self.start_timeout_s = start_timeout_s      # until gem5 listens on the terminal
+        self.boot_timeout_s = boot_timeout_s        # until the guest's shell prompt
+        self.run_timeout_s = run_timeout_s          # until the workload completed & gem5 closed the terminal
+        self.exit_timeout_s = exit_timeout_s        # until gem5 exited
+        self.prompt = prompt
+        self.estimates = {}                          # {workload: seconds at REFERENCE_CLOCK_GHZ}
+
+    def cmdline(self, run:SimRun, rundir:str) -> [str]:
+        return self.gem5 + ['-d', os.path.join(rundir, 'm5out'), self.script] + self.platform_args + run.script_args()
+
+    ## ------------------------------------------------------------------------
+    @staticmethod
+    async def __pump__(stream, log, port:asyncio.Future) -> None:
+        '''Copies gem5's output to its log, resolving port once the terminal listens'''
+        async for line in stream:
+            log.write(line)
+            if not port.done():
+                m = re_terminal_port.search(line)
+                if m:
+                    port.set_result(int(m.group(1)))
+        if not port.done():
+            port.set_exception(Exception('gem5 exited before listening on the terminal'))
+
+    @staticmethod
+    async def __expect__(reader, log, pattern) -> bytes:
+        '''Reads the terminal until pattern matches the end of what was read (EOF if None)'''
+        buf = b''
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                if pattern is None:
+                    return buf
+                raise Exception('Terminal closed while waiting for '+str(pattern.pattern))
+            log.write(data)
+            buf = (buf + data)[-65536:]
+            if pattern is not None and pattern.search(buf.rstrip(b'\r\n ') + b' '):
+                return buf
+
+    @staticmethod
+    def __kill__(proc) -> None:
+        if proc.returncode is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def run_one(self, run:SimRun) -> dict:
+        '''Runs one simulation, returns its result (never raises for a failed run)'''
+        rundir = os.path.join(self.outdir, run.name)
+        os.makedirs(os.path.join(rundir, 'm5out'), exist_ok=True)
+        result = {'name': run.name, 'workload': run.workload, 'big_clock': run.big_clock, 'big_voltage': run.big_voltage,
+                  'little_clock': run.little_clock, 'little_voltage': run.little_voltage,
+                  'coefficients': run.coefficients, 'rundir': rundir,
+                  'status': 'failed', 'returncode': None, 'guest_exit': None, 'port': None, 'error': None}
+        t_start = time.time()
+        print ('Farm: starting '+run.name)
+        with open(os.path.join(rundir, 'gem5.log'), 'wb') as log, open(os.path.join(rundir, 'terminal.log'), 'wb') as term:
+            proc = await asyncio.create_subprocess_exec(*self.cmdline(run, rundir), cwd=rundir,
+                                                        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.STDOUT, start_new_session=True)
+            port = asyncio.get_running_loop().create_future()
+            pump = asyncio.create_task(self.__pump__(proc.stdout, log, port))
+            writer = None
+            step = 'start'
+            try:
+                result['port'] = await asyncio.wait_for(asyncio.shield(port), self.start_timeout_s)
+                reader, writer = await asyncio.open_connection('localhost', result['port'])
+                step = 'boot'
+                if run.checkpoint:
+                    # A restored guest sits at its prompt, have it printed again
+                    writer.write(b'\n')
+                await asyncio.wait_for(self.__expect__(reader, term, self.prompt), self.boot_timeout_s)
+                result['boot_s'] = round(time.time() - t_start, 3)
+                step = 'run'
+                writer.write(run.guest_command())
+                await writer.drain()
+                output = await asyncio.wait_for(self.__expect__(reader, term, None), self.run_timeout_s)
+                m = re_guest_exit.search(output)
+                result['guest_exit'] = int(m.group(1)) if m else None
+                step = 'exit'
+                result['returncode'] = await asyncio.wait_for(proc.wait(), self.exit_timeout_s)
+                ok = result['returncode'] == 0 and result['guest_exit'] == 0
+                result['status'] = 'completed' if ok else 'failed'
+            except asyncio.TimeoutError:
+                result['status'] = 'timeout'
+                result['error'] = 'Timed out in '+step
+            except Exception as e:
+                result['error'] = step+': '+repr(e)
+            finally:
+                if writer is not None:
+                    writer.close()
+                self.__kill__(proc)
+                result['returncode'] = await proc.wait()
+                await pump
+                if not port.done():
+                    port.cancel()
+                elif not port.cancelled():
+                    port.exception()     # retrieved, gem5 may have exited before listening
+        result['elapsed_s'] = round(time.time() - t_start, 3)
+
+        ## Gather the statistics & power model output
+        stats = os.path.join(rundir, 'm5out', 'stats.txt')
+        result['stats'] = stats if os.path.isfile(stats) else None
+        result['power'] = None
+        if result['stats']:
+            result['power'] = os.path.join(rundir, 'power.json')
+            with open(result['power'], 'w') as f:
+                json.dump(power_stats(stats), f, indent=1)
+        print ('Farm: '+run.name+' '+result['status']+' in '+str(result['elapsed_s'])+'s'+
+               (' ('+result['error']+')' if result['error'] else ''))
+        return result
+
+    def history(self) -> [dict]:
+        '''Results of the earlier runs in outdir (farm.json)'''
+        try:
+            with open(os.path.join(self.outdir, FARM_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def __save__(self, results:[dict]) -> None:
+        '''Saves the results to farm.json, with the earlier results of other runs'''
+        names = set(r['name'] for r in results)
+        results = [r for r in self.history() if r.get('name') not in names] + results
+        tmp = os.path.join(self.outdir, FARM_FILE+'.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(results, f, indent=1)
+        os.replace(tmp, os.path.join(self.outdir, FARM_FILE))
+
+    def schedule(self, runs:[SimRun]) -> ([SimRun], {str: float}):
+        '''Runs in start order, longest estimated first, and the estimates'''
+        estimates = estimate_runtimes(runs, self.history(), self.estimates)
+        return sorted(runs, key=lambda run: -estimates[run.name]), estimates
+
+    async def run_all(self, runs:[SimRun]) -> [dict]:
+        '''Runs the simulations in order of the schedule, max_parallel workers
+        taking the next one as one completes; results in the order of runs'''
+        order, estimates = self.schedule(runs)
+        pending = list(reversed(order))
+        results = {}
+        save = asyncio.Lock()
+
+        async def worker():
+            while pending:
+                run = pending.pop()
+                result = await self.run_one(run)
+                result['estimate_s'] = round(estimates[run.name], 3)
+                result['order'] = order.index(run)
+                results[run.name] = result
+                async with save:
+                    self.__save__(list(results.values()))
+
+        await asyncio.gather(*[worker() for _ in range(min(self.max_parallel, len(runs)))])
+        return [results[run.name] for run in runs]
+
+    def run(self, runs:[SimRun]) -> [dict]:
+        '''Runs the simulations, at most max_parallel at once; results are also saved to farm.json'''
+        os.makedirs(self.outdir, exist_ok=True)
+        print ('Farm: '+str(len(runs))+' runs, '+str(self.max_parallel)+' at once')
+        results = asyncio.run(self.run_all(runs))
+        self.__save__(results)
+        return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run a matrix of gem5 simulations concurrently')
+    parser.add_argument('--matrix', required=True, help='Matrix description (JSON)')
+    parser.add_argument('--outdir', default=os.path.join(str(path_root), 'simulation', 'runs'), help='Root of the run directories')
+    parser.add_argument('--gem5', default=GEM5_EXECUTABLE, help='gem5 executable')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Simulations at once (default: by cores & RAM)')
+    parser.add_argument('--ram-per-run', type=float, default=MEM_SIZE_GB + RUN_OVERHEAD_GB, help='Host RAM per simulation (GB)')
+    parser.add_argument('--boot-timeout', type=float, default=3600, help='Seconds until the guest shell prompt')
+    parser.add_argument('--run-timeout', type=float, default=24*3600, help='Seconds for the workload')
+    parser.add_argument('--catalog', default=None, help='Checkpoint catalog of "checkpoint": "catalog" (default: simulation/checkpoints)')
+    parser.add_argument('--dry-run', action='store_true', help='Print the gem5 command lines without running them (nothing is written, the checkpoint catalog included)')
+    args = parser.parse_args()
+
+    with open(args.matrix, 'r') as f:
+        matrix = json.load(f)
+    runs = expand_matrix(matrix)
+    farm = Gem5Farm(args.outdir, gem5=[args.gem5], max_parallel=args.jobs, ram_per_run_gb=args.ram_per_run,
+                    boot_timeout_s=args.boot_timeout, run_timeout_s=args.run_timeout)
+    farm.estimates = matrix.get('estimates', {})
+    if runs and runs[0].checkpoint == 'catalog':
+        from src.gem5checkpoints import CheckpointCatalog, DEFAULT_CATALOG
+        catalog = CheckpointCatalog(args.catalog or DEFAULT_CATALOG)
+        if args.dry_run:
+            # Read-only: neither the catalog nor the index are written, no platform file is hashed
+            fingerprint, checkpoint, unhashed = catalog.peek(farm.platform_args + runs[0].args)
+            if checkpoint is None:
+                if unhashed:
+                    print ('Farm: would hash '+', '.join(unhashed)+', then restore or boot/checkpoint the platform')
+                else:
+                    print ('Farm: would boot/checkpoint '+fingerprint)
+                checkpoint = os.path.join(catalog.root, fingerprint or '<fingerprint>', 'cpt.<tick>')
+        else:
+            checkpoint = catalog.ensure(farm, runs[0].args)
+        for run in runs:
+            run.checkpoint = checkpoint
+    if args.dry_run:
+        order, estimates = farm.schedule(runs)
+        for run in order:
+            print ('# ~{:.0f}s'.format(estimates[run.name]))
+            print (shlex.join(farm.cmdline(run, os.path.join(farm.outdir, run.name))))
+        print ('Farm: '+str(len(runs))+' runs, '+str(farm.max_parallel)+' at once')
+        return 0
+    results = farm.run(runs)
+    for result in results:
+        if result['status'] != 'completed':
+            print ('Farm: FAILED '+result['name']+': '+str(result['error'] or 'exit '+str(result['returncode'])+
+                   ', guest exit '+str(result['guest_exit'])))
+    return 1 if any(result['status'] != 'completed' for result in results) else 0
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    sys.exit(main())
+
+if __name__ == '__main__':
+    import tempfile
+
+    ## Stand-in for gem5: listens on the first free port from 3456, boots, runs the command & dumps stats
+    fake_gem5 = r'''
+import os, sys, socket, time, subprocess
+outdir = sys.argv[sys.argv.index('-d') + 1]
+clock = sys.argv[sys.argv.index('--big-cpu-clock') + 1]
+port = 3456
+while True:
+    s = socket.socket()
+    try:
+        s.bind(('localhost', port)); s.listen(1); break
+    except OSError:
+        s.close(); port += 1
+sys.stderr.write('system.terminal: Listening for connections on port %d\n' % port); sys.stderr.flush()
+conn, _ = s.accept()
+time.sleep(0.2)
+conn.sendall(b'Ubuntu 18.04 LTS\r\nroot@aarch64-gem5:/# ')
+if clock == 'hang':
+    time.sleep(60)
+cmd = b''
+while not cmd.endswith(b'\n'):
+    cmd += conn.recv(1024)
+workload = cmd.decode().split(';')[1].strip()
+code = 0 if workload != 'false' else 1
+conn.sendall(cmd + b'__gem5farm_exit=%d\r\n' % code)
+with open(os.path.join(outdir, 'stats.txt'), 'w') as f:
+    f.write('---------- Begin Simulation Statistics ----------\n')
+    f.write('system.bigCluster.cpus0.power_model.dynamicPower     0.%d   # Dynamic power (Watt)\n' % port)
+    f.write('system.bigCluster.cpus0.numCycles     1000   # Cycles\n')
+    f.write('---------- End Simulation Statistics   ----------\n')
+conn.close()
+sys.exit(0)
+'''
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = os.path.join(tmp, 'fake_gem5.py')
+        with open(fake, 'w') as f:
+            f.write(fake_gem5)
+        matrix = {'name': 'test', 'big': [['2.0GHz', '1.25V'], ['1.0GHz', '1.0V']], 'little': [['1.4GHz', '1.25V']],
+                  'workloads': {'ls': 'ls', 'true': 'true', 'false': 'false'}}
+        runs = expand_matrix(matrix)
+        assert len(runs) == 6 and len(set(run.name for run in runs)) == 6, 'Unexpected runs'
+
+        ## One cluster swept at a time, for each set of power coefficients
+        fit = expand_matrix({'big': ['2.0GHz', '1.8GHz', '1.6GHz'], 'little': ['1.4GHz', '1.2GHz'], 'sweep': 'each',
+                             'coefficients': [{'bigcore-dyn-pow-coeff': '1.0'}, {'bigcore-dyn-pow-coeff': '1.2'}],
+                             'workloads': {'ls': 'ls'}, 'checkpoint': 'cpt.1'})
+        assert len(fit) == 2 * (3 + 2 - 1), 'Unexpected sweep '+str([run.name for run in fit])
+        assert fit[1].name == 'ls-big2.0GHz-1.25V-little1.4GHz-1.25V-c1', 'Unexpected name '+fit[1].name
+        script_args = fit[1].script_args()
+        assert script_args[script_args.index('--bigcore-dyn-pow-coeff') + 1] == '1.2', 'Coefficient not passed'
+        assert '--restore-from' in script_args, 'Checkpoint not restored'
+
+        ## Estimates: earlier result of the run, else of the workload scaled by the clock
+        history = [{'name': fit[0].name, 'workload': 'ls', 'big_clock': '2.0GHz', 'status': 'completed', 'elapsed_s': 100}]
+        estimates = estimate_runtimes(fit, history)
+        assert estimates[fit[0].name] == 100 and abs(estimates[fit[4].name] - 125) < 1e-9, 'Unexpected estimates'
+        assert clock_ghz('800MHz') == 0.8, 'Clock not parsed'
+
+        runs.append(SimRun('ls', 'ls', big_clock='hang', prefix='test'))
+
+        farm = Gem5Farm(os.path.join(tmp, 'runs'), gem5=[sys.executable, fake], script='odroid_xu4_sim.py',
+                        platform_args=[], max_parallel=3, boot_timeout_s=10, run_timeout_s=2)
+        farm.estimates = {'false': 10}
+        order, _ = farm.schedule(runs[:-1])
+        assert [run.workload for run in order[:2]] == ['false']*2 and order[0].big_clock == '1.0GHz', \
+               'Not scheduled longest first: '+str([run.name for run in order])
+        t0 = time.time()
+        results = {r['name']: r for r in farm.run(runs)}
+        print ('Farm of '+str(len(runs))+' runs took {:.2f}s'.format(time.time() - t0))
+        statuses = sorted(r['status'] for r in results.values())
+        assert statuses == ['completed']*4 + ['failed']*2 + ['timeout'], 'Unexpected results '+str(statuses)
+        ports = [r['port'] for r in results.values()]
+        assert all(port and port >= 3456 for port in ports), 'Terminal port not taken from the output: '+str(ports)
+        done = results['test-ls-big2.0GHz-1.25V-little1.4GHz-1.25V']
+        assert done['guest_exit'] == 0 and done['returncode'] == 0 and os.path.isfile(done['stats']), 'Run not gathered'
+        with open(done['power']) as f:
+            power = json.load(f)
+        assert power == {'system.bigCluster.cpus0.power_model.dynamicPower': [float('0.'+str(done['port']))]}, \
+               'Unexpected power '+str(power)
+        failed = results['test-false-big1.0GHz-1.0V-little1.4GHz-1.25V']
+        assert failed['guest_exit'] == 1 and failed['status'] == 'failed', 'Guest exit code not captured'
+        assert results['test-ls-bighang-1.25V-little1.4GHz-1.25V']['error'] == 'Timed out in run', 'Timeout not detected'
+        assert os.path.isfile(os.path.join(tmp, 'runs', FARM_FILE)), 'Farm summary missing'
+        assert sorted(r['order'] for r in results.values()) == list(range(len(runs))), 'Start order not recorded'
+
+        ## Rescheduled by the runtimes measured
+        order, estimates = farm.schedule(runs[:-1])
+        assert estimates[done['name']] == done['elapsed_s'], 'Earlier runtime not used'
+    print ('gem5 farm test completed...')
+
+#### ==========================================================================
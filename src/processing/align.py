@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Alignment of timestamped streams on sorted int64 nanosecond arrays
+
+Replacement of the pandas.merge_asof based merging of ProcessTestResults
+(DataProcessor-v2.ipynb). All functions work on sorted int64 arrays of ns
+since epoch and use binary search (numpy.searchsorted), i.e. O(n log m)
+without building DataFrames or indexes:
+
+    match_indices   index of the right sample matched to every left timestamp
+                    (nearest/backward/forward, within a tolerance)
+    take            gathers values of matched samples, NaN where unmatched
+    interval_mean   time weighted mean of a sampled signal over intervals,
+                    e.g. SmartPower3 power integrated over each perf-stat
+                    interval instead of taking a single nearest sample
+    unique_last     one sample per timestamp, e.g. the poll stream which has
+                    a row per /proc/stat cpu line for every sample
+
+Matching follows merge_asof: backward takes the last sample at or before the
+timestamp, forward the first at or after it, nearest the closer of both
+preferring backward on ties; the tolerance is inclusive.
+
+Assumptions:
+  (1) Timestamp arrays are sorted ascending
+  (2) perf-stat interval timestamps mark the end of the interval
+
+Limitations:
+  (1) interval_mean interpolates linearly between samples (trapezoidal
+      integration), samples with non-finite values are skipped
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import numpy as np
+
+NEAREST  = 'nearest'
+BACKWARD = 'backward'
+FORWARD  = 'forward'
+MEAN     = 'mean'
+DIRECTIONS = [NEAREST, BACKWARD, FORWARD]
+
+UNMATCHED = -1
+NAT_NS = np.iinfo(np.int64).min     # int64 representation of NaT
+
+
+def match_indices(left_ns:np.ndarray, right_ns:np.ndarray, direction:str = NEAREST,
+                  tolerance_ns:int = None) -> np.ndarray:
+    '''Index into right_ns matched to each of left_ns, UNMATCHED (-1) where none'''
+    left_ns = np.asarray(left_ns, dtype=np.int64)
+    right_ns = np.asarray(right_ns, dtype=np.int64)
+    if direction not in DIRECTIONS:
+        raise Exception('Unknown direction: '+str(direction))
+    n = len(right_ns)
+    if n == 0:
+        return np.full(len(left_ns), UNMATCHED, dtype=np.int64)
+
+    # Last sample at or before / first sample at or after the timestamp
+    back = np.searchsorted(right_ns, left_ns, side='right') - 1
+    fwd = np.searchsorted(right_ns, left_ns, side='left')
+    back_ok = back >= 0
+    fwd_ok = fwd < n
+    back_dist = np.where(back_ok, left_ns - right_ns[np.clip(back, 0, n-1)], np.iinfo(np.int64).max)
+    fwd_dist = np.where(fwd_ok, right_ns[np.clip(fwd, 0, n-1)] - left_ns, np.iinfo(np.int64).max)
+
+    if direction == BACKWARD:
+        idx, dist, ok = back, back_dist, back_ok
+    elif direction == FORWARD:
+        idx, dist, ok = fwd, fwd_dist, fwd_ok
+    else:
+        use_fwd = fwd_dist < back_dist
+        idx = np.where(use_fwd, fwd, back)
+        dist = np.where(use_fwd, fwd_dist, back_dist)
+        ok = back_ok | fwd_ok
+    if tolerance_ns is not None:
+        ok = ok & (dist <= int(tolerance_ns))
+    return np.where(ok, idx, UNMATCHED).astype(np.int64)
+
+
+def take(values:np.ndarray, idx:np.ndarray, fill = np.nan) -> np.ndarray:
+    '''values[idx] with fill where idx is UNMATCHED'''
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and isinstance(fill, float):
+        values = values.astype(np.float64)
+    out = values[np.clip(idx, 0, max(len(values)-1, 0))] if len(values) else np.empty(len(idx), dtype=values.dtype)
+    out = np.array(out, copy=True)
+    out[idx == UNMATCHED] = fill
+    return out
+
+
+def unique_last(time_ns:np.ndarray) -> np.ndarray:
+    '''Indices of the last sample of each distinct timestamp (time_ns sorted)'''
+    time_ns = np.asarray(time_ns)
+    if len(time_ns) == 0:
+        return np.empty(0, dtype=np.int64)
+    last = np.empty(len(time_ns), dtype=bool)
+    last[-1] = True
+    np.not_equal(time_ns[1:], time_ns[:-1], out=last[:-1])
+    return np.flatnonzero(last)
+
+
+def interval_bounds(end_ns:np.ndarray, interval_ns:int = None) -> np.ndarray:
+    '''Start of each interval ending at end_ns
+
+    Intervals are contiguous, the first one spans interval_ns (default: the
+    median spacing of end_ns) before its end.
+    '''
+    end_ns = np.asarray(end_ns, dtype=np.int64)
+    if len(end_ns) == 0:
+        return end_ns.copy()
+    if interval_ns is None:
+        interval_ns = int(np.median(np.diff(end_ns))) if len(end_ns) > 1 else 0
+    start_ns = np.empty_like(end_ns)
+    start_ns[0] = end_ns[0] - interval_ns
+    start_ns[1:] = end_ns[:-1]
+    return start_ns
+
+
+def interval_mean(end_ns:np.ndarray, sample_ns:np.ndarray, values:np.ndarray,
+                  start_ns:np.ndarray = None, min_samples:int = 1) -> tuple:
+    '''Time weighted mean of the sampled signal over each interval (start_ns, end_ns]
+
+    The signal is linearly interpolated between samples and integrated with
+    the trapezoidal rule. Returns (means, samples) where samples is the number
+    of samples inside each interval; the mean is NaN for intervals not fully
+    covered by samples or holding fewer than min_samples samples.
+    '''
+    end_ns = np.asarray(end_ns, dtype=np.int64)
+    if start_ns is None:
+        start_ns = interval_bounds(end_ns)
+    start_ns = np.asarray(start_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.all():
+        sample_ns = np.asarray(sample_ns)[finite]
+        values = values[finite]
+    sample_ns = np.asarray(sample_ns, dtype=np.int64)
+
+    samples = (np.searchsorted(sample_ns, end_ns, side='right') -
+               np.searchsorted(sample_ns, start_ns, side='right')).astype(np.int64)
+    means = np.full(len(end_ns), np.nan)
+    if len(sample_ns) < 2:
+        return means, samples
+
+    # Relative times keep the float64 arithmetic exact at ns resolution
+    t0 = sample_ns[0]
+    t = (sample_ns - t0).astype(np.float64)
+    cumulative = np.zeros(len(t))
+    np.cumsum((t[1:] - t[:-1]) * (values[1:] + values[:-1]) * 0.5, out=cumulative[1:])
+
+    def integral(at_ns):
+        # Integral of the interpolated signal from the first sample up to at_ns
+        x = (at_ns - t0).astype(np.float64)
+        k = np.clip(np.searchsorted(t, x, side='right') - 1, 0, len(t)-1)
+        vx = np.interp(x, t, values)
+        return cumulative[k] + (x - t[k]) * (values[k] + vx) * 0.5
+
+    covered = (start_ns >= sample_ns[0]) & (end_ns <= sample_ns[-1]) & (end_ns > start_ns) & \
+              (samples >= min_samples)
+    if covered.any():
+        s = start_ns[covered]
+        e = end_ns[covered]
+        means[covered] = (integral(e) - integral(s)) / (e - s).astype(np.float64)
+    return means, samples
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    import pandas
+
+    rng = np.random.default_rng(1)
+    left = np.cumsum(rng.integers(90_000_000, 110_000_000, 2000))
+    right = np.sort(rng.integers(0, left[-1]+1_000_000_000, 4000))
+    vals = rng.random(len(right))
+    ldf = pandas.DataFrame({'l': np.arange(len(left))}, index=pandas.DatetimeIndex(left.view('datetime64[ns]')))
+    rdf = pandas.DataFrame({'r': vals}, index=pandas.DatetimeIndex(right.view('datetime64[ns]')))
+    for direction in DIRECTIONS:
+        for tol in (None, 20_000_000):
+            ref = pandas.merge_asof(ldf, rdf, left_index=True, right_index=True, direction=direction,
+                                    tolerance=None if tol is None else pandas.Timedelta(tol, unit='ns'))
+            got = take(vals, match_indices(left, right, direction, tol))
+            assert np.array_equal(ref['r'].to_numpy(), got, equal_nan=True), 'Mismatch: '+direction+' '+str(tol)
+
+    # Mean of a linear signal equals its value at the middle of the interval
+    sample_ns = np.arange(0, 10_000_000_000, 50_000_000, dtype=np.int64)
+    end_ns = np.arange(100_000_000, 9_000_000_000, 100_000_000, dtype=np.int64)
+    means, counts = interval_mean(end_ns, sample_ns, sample_ns*1e-9)
+    assert np.allclose(means, (end_ns - 50_000_000)*1e-9), 'Interval mean mismatch'
+    assert (counts == 2).all(), 'Interval sample count mismatch'
+    assert np.array_equal(unique_last(np.array([1, 1, 2, 3, 3, 3])), [1, 2, 5]), 'unique_last mismatch'
+    print('align: all checks passed')
+
+#### ==========================================================================
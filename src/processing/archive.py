@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""Streaming results archive with a parallel block codec and a member index
+
+Replacement of the tar/bz2 of a finished results directory (make_tarfile).
+Files are added to the archive as soon as they are complete, e.g. at the
+end of every workload iteration, so that the archive is ready when the run
+ends. Each member is cut into blocks which are compressed independently by a
+thread pool (zstd, from the zstandard package of requirements.txt, or bz2
+if asked for or if zstandard is missing; both release the GIL) and written
+in order. bz2 is hardly faster than tar.bz2, the speed-up comes from zstd.
+The index of the members (offsets and sizes of their blocks, SHA-256 of
+their content) is appended after every batch of members, so the archive is
+readable up to the last batch added even if the run is interrupted, and a
+single member is read (and its blocks decompressed in parallel) without
+decompressing the rest.
+
+File layout:
+    MAGIC (8 bytes)
+    blocks of the members, back to back
+    index (JSON) + trailer: index offset (uint64), index length (uint64), INDEX_MAGIC
+    ... further blocks & index + trailer per batch added, the last one is valid
+
+Usage:
+    with ArchiveWriter('results/03-Workloads/<run>.pack') as writer:
+        writer.add_files(['<run>/stress-cpu1-100s-1.prof', ...], root='results/03-Workloads')
+    reader = open_archive('results/03-Workloads/<run>.pack')        # or a .tar.bz2
+    data = reader.read('<run>/stress-cpu1-100s-1.prof')
+    for name, data in iter_members('<run>.tar.bz2'): ...
+
+    python3 src/processing/archive.py pack <results-dir> [<archive>]
+    python3 src/processing/archive.py list <archive>
+    python3 src/processing/archive.py convert <archive.tar.bz2> [<archive.pack>]
+
+Assumptions:
+  N/A
+
+Limitations:
+  (1) Members are not replaced, adding a name again adds another member
+      which shadows the earlier one
+
+Warnings:
+  (1) Archives compressed with zstd need the zstandard package to be read
+  (2) Without the zstandard package, archives are written with bz2 (a
+      warning is printed), about as slow as tar.bz2
+
+TODO:
+  N/A
+"""
+
+import os
+import sys
+import bz2
+import json
+import mmap
+import struct
+import hashlib
+import tarfile
+import argparse
+import threading
+import concurrent.futures
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_SUFFIX = '.pack'
+ARCHIVE_VERSION = 1
+MAGIC = b'XU4PACK1'
+INDEX_MAGIC = b'XU4PIDX1'
+__trailer__ = struct.Struct('<QQ8s')
+BLOCK_SIZE = 1 << 20
+CODEC_ZSTD = 'zstd'
+CODEC_BZ2 = 'bz2'
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_BZ2
+
+
+def __compressor__(codec:str, level:int = None):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise Exception('Archive codec zstd needs the zstandard package')
+        # Compressor objects are not thread safe, created per block
+        return lambda data: zstandard.ZstdCompressor(level=level or 10).compress(data)
+    if codec == CODEC_BZ2:
+        return lambda data: bz2.compress(data, level or 9)
+    raise Exception('Unknown archive codec: '+str(codec))
+
+
+def __decompressor__(codec:str):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise Exception('Archive is zstd compressed, reading it needs the zstandard package')
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_BZ2:
+        return bz2.decompress
+    raise Exception('Unknown archive codec: '+str(codec))
+
+
+def __read_index__(f) -> (dict, int):
+    '''(index, end of the valid content) of the archive open in f
+
+    Content after the last complete index (a batch interrupted while being
+    written) is ignored, the index being searched backwards for.
+    '''
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise Exception('Not a results archive: '+str(getattr(f, 'name', f)))
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < len(MAGIC) + __trailer__.size:
+        return None, len(MAGIC)
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        end = size
+        while end >= len(MAGIC) + __trailer__.size:
+            if m[end-len(INDEX_MAGIC):end] == INDEX_MAGIC:
+                offset, length, _ = __trailer__.unpack(m[end-__trailer__.size:end])
+                if offset + length + __trailer__.size == end:
+                    try:
+                        return json.loads(m[offset:offset+length]), end
+                    except ValueError:
+                        pass
+            end = m.rfind(INDEX_MAGIC, len(MAGIC), end-1)
+            if end < 0:
+                break
+            end += len(INDEX_MAGIC)
+    return None, len(MAGIC)
+
+
+class ArchiveWriter:
+    '''Appends members to an archive, compressing their blocks in parallel
+
+    Opening an existing archive appends to it (e.g. resuming a run).
+    '''
+    def __init__(self, path:str, codec:str = None, threads:int = None, block_size:int = BLOCK_SIZE, level:int = None):
+        self.path = path
+        self.__lock__ = threading.Lock()
+        self.__pool__ = concurrent.futures.ThreadPoolExecutor(max_workers=threads or os.cpu_count())
+        if os.path.exists(path):
+            self.__f__ = open(path, 'r+b')
+            index, end = __read_index__(self.__f__)
+            self.index = index or self.__new_index__(codec or DEFAULT_CODEC, block_size)
+            # Blocks are appended after the last index, which stays valid until the next one is written
+            self.__f__.truncate(end)
+            self.__f__.seek(end)
+        else:
+            self.__f__ = open(path, 'wb')
+            self.__f__.write(MAGIC)
+            self.index = self.__new_index__(codec or DEFAULT_CODEC, block_size)
+        if codec is None and self.index['codec'] == CODEC_BZ2 and zstandard is None:
+            print ('Archive: zstandard not installed, '+path+' is compressed with bz2 (see requirements.txt)')
+        self.__compress__ = __compressor__(self.index['codec'], level)
+
+    @staticmethod
+    def __new_index__(codec:str, block_size:int) -> dict:
+        return {'version': ARCHIVE_VERSION, 'codec': codec, 'block_size': block_size, 'members': []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def names(self) -> [str]:
+        return [member['name'] for member in self.index['members']]
+
+    def __chunks__(self, data:bytes) -> [bytes]:
+        bs = self.index['block_size']
+        return [data[i:i+bs] for i in range(0, len(data), bs)] or [b'']
+
+    def __write_index__(self) -> None:
+        body = json.dumps(self.index, separators=(',', ':')).encode()
+        offset = self.__f__.tell()
+        self.__f__.write(body)
+        self.__f__.write(__trailer__.pack(offset, len(body), INDEX_MAGIC))
+        self.__f__.flush()
+        os.fsync(self.__f__.fileno())
+
+    def add(self, members:[tuple]) -> None:
+        '''Adds [(name, data[, mtime])] and writes the index'''
+        with self.__lock__:
+            chunks = [self.__chunks__(member[1]) for member in members]
+            # Blocks of all members are compressed concurrently, written in order as they complete
+            compressed = self.__pool__.map(self.__compress__, [chunk for parts in chunks for chunk in parts])
+            for member, parts in zip(members, chunks):
+                blocks = []
+                for chunk in parts:
+                    block = next(compressed)
+                    blocks.append([self.__f__.tell(), len(block), len(chunk)])
+                    self.__f__.write(block)
+                self.index['members'].append({'name': member[0], 'size': len(member[1]),
+                                              'mtime': member[2] if len(member) > 2 else 0.0,
+                                              'sha256': hashlib.sha256(member[1]).hexdigest(), 'blocks': blocks})
+            self.__write_index__()
+
+    def add_files(self, paths:[str], root:str) -> None:
+        '''Adds files under the names of their paths relative to root (i.e. as tar arcnames)'''
+        members = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                members.append((os.path.relpath(path, root).replace(os.sep, '/'), f.read(), os.path.getmtime(path)))
+        self.add(members)
+
+    def close(self) -> None:
+        with self.__lock__:
+            if self.__f__ is not None:
+                self.__f__.close()
+                self.__f__ = None
+        self.__pool__.shutdown()
+
+
+class ArchiveReader:
+    '''Random access to the members of an archive'''
+    def __init__(self, path:str, threads:int = None):
+        self.path = path
+        self.threads = threads or os.cpu_count()
+        with open(path, 'rb') as f:
+            index, _ = __read_index__(f)
+        self.index = index or ArchiveWriter.__new_index__(DEFAULT_CODEC, BLOCK_SIZE)
+        # Later members shadow earlier ones of the same name
+        self.__members__ = {member['name']: member for member in self.index['members']}
+        self.__decompress__ = __decompressor__(self.index['codec'])
+
+    def names(self) -> [str]:
+        return list(self.__members__)
+
+    def member(self, name:str) -> dict:
+        if name not in self.__members__:
+            raise KeyError('No member '+name+' in '+self.path)
+        return self.__members__[name]
+
+    def __read_blocks__(self, f, member:dict) -> [bytes]:
+        compressed = []
+        for offset, csize, _ in member['blocks']:
+            f.seek(offset)
+            compressed.append(f.read(csize))
+        return compressed
+
+    def read(self, name:str, verify:bool = True) -> bytes:
+        '''Content of a member, its blocks decompressed in parallel'''
+        member = self.member(name)
+        with open(self.path, 'rb') as f:
+            compressed = self.__read_blocks__(f, member)
+        if len(compressed) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.threads, len(compressed))) as pool:
+                data = b''.join(pool.map(self.__decompress__, compressed))
+        else:
+            data = b''.join(map(self.__decompress__, compressed))
+        if verify and hashlib.sha256(data).hexdigest() != member['sha256']:
+            raise Exception('Checksum mismatch of '+name+' in '+self.path)
+        return data
+
+    def __iter__(self):
+        '''(name, data) of all members in archive order, decompressing ahead in parallel'''
+        names = self.names()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as pool:
+            # Bounded read-ahead, so that memory stays proportional to the number of threads
+            futures = [pool.submit(self.read, name) for name in names[:self.threads]]
+            for i, name in enumerate(names):
+                data = futures[i].result()
+                futures[i] = None
+                if i + self.threads < len(names):
+                    futures.append(pool.submit(self.read, names[i + self.threads]))
+                yield name, data
+
+
+def is_archive(path:str) -> bool:
+    '''True for archives of this module (else e.g. tar)'''
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_archive(path:str, threads:int = None) -> ArchiveReader:
+    return ArchiveReader(path, threads)
+
+
+def iter_members(path:str, threads:int = None):
+    '''(name, data) of the regular file members of an archive or of a (compressed) tar archive'''
+    if is_archive(path):
+        yield from ArchiveReader(path, threads)
+        return
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member).read()
+
+
+def strip_archive_suffix(name:str) -> str:
+    for suffix in (ARCHIVE_SUFFIX, '.tar.bz2', '.tar'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def pack_directory(source_dir:str, path:str = None, codec:str = None) -> str:
+    '''Archives a results directory (as make_tarfile, with the same member names)'''
+    source_dir = source_dir.rstrip(os.sep)
+    path = path or source_dir+ARCHIVE_SUFFIX
+    files = sorted(os.path.join(root, f) for root, _, names in os.walk(source_dir) for f in names)
+    with ArchiveWriter(path, codec) as writer:
+        writer.add_files(files, os.path.dirname(source_dir))
+    return path
+
+
+def convert_tar(tar_path:str, path:str = None, codec:str = None) -> str:
+    '''Converts a .tar.bz2 results archive'''
+    path = path or strip_archive_suffix(tar_path)+ARCHIVE_SUFFIX
+    with ArchiveWriter(path, codec) as writer:
+        batch = []
+        for name, data in iter_members(tar_path):
+            batch.append((name, data))
+            if sum(len(member[1]) for member in batch) >= 64 << 20:
+                writer.add(batch)
+                batch = []
+        if batch:
+            writer.add(batch)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Results archives with member index')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_pack = sub.add_parser('pack', help='Archive a results directory')
+    p_pack.add_argument('source')
+    p_pack.add_argument('archive', nargs='?')
+    p_list = sub.add_parser('list', help='List the members of an archive')
+    p_list.add_argument('archive')
+    p_conv = sub.add_parser('convert', help='Convert a .tar.bz2 results archive')
+    p_conv.add_argument('source')
+    p_conv.add_argument('archive', nargs='?')
+    for p in (p_pack, p_conv):
+        p.add_argument('--codec', choices=[CODEC_ZSTD, CODEC_BZ2], default=None)
+    args = parser.parse_args()
+
+    if args.cmd == 'pack':
+        print(pack_directory(args.source, args.archive, args.codec))
+    elif args.cmd == 'convert':
+        print(convert_tar(args.source, args.archive, args.codec))
+    else:
+        reader = open_archive(args.archive)
+        print('codec: '+reader.index['codec']+', '+str(len(reader.names()))+' members')
+        for name in reader.names():
+            member = reader.member(name)
+            csize = sum(block[1] for block in member['blocks'])
+            print('{:>12} {:>12}  {}'.format(member['size'], csize, name))
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    main()
+elif __name__ == '__main__':
+    import time
+    import shutil
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run = os.path.join(tmp, '11-14-2023_22-20-44_BigCore-Test-CPUFreq-2.0GHz')
+        os.mkdir(run)
+        contents = {}
+        for itr in (1, 2):
+            for ext, size in (('.prof', 3 << 20), ('.powdata', 9 << 20), ('.polldata', 1 << 20)):
+                name = 'stress-cpu1-100s-'+str(itr)+ext
+                lines = b''.join(b'%d,%d,0.%d\n' % (i, i*7 % 1013, i % 97) for i in range(size // 16))
+                contents[os.path.basename(run)+'/'+name] = lines
+                with open(os.path.join(run, name), 'wb') as f:
+                    f.write(lines)
+
+        ## Streamed per iteration, reopened in between (resumed run)
+        path = run+ARCHIVE_SUFFIX
+        for itr in (1, 2):
+            with ArchiveWriter(path) as writer:
+                writer.add_files(sorted(os.path.join(run, f) for f in os.listdir(run) if '-'+str(itr)+'.' in f), tmp)
+        reader = open_archive(path)
+        assert sorted(reader.names()) == sorted(contents), 'Members mismatch'
+        name = os.path.basename(run)+'/stress-cpu1-100s-2.powdata'
+        assert len(reader.member(name)['blocks']) == 9, 'Unexpected block count'
+        assert reader.read(name) == contents[name], 'Random access mismatch'
+        assert dict(iter_members(path)) == contents, 'Iteration mismatch'
+
+        ## Same members as make_tarfile, read back the same way
+        tar_path = run+'.tar.bz2'
+        t0 = time.perf_counter()
+        with tarfile.open(tar_path, 'w:bz2') as tar:
+            tar.add(run, arcname=os.path.basename(run))
+        t1 = time.perf_counter()
+        packed = pack_directory(run, os.path.join(tmp, 'packed'+ARCHIVE_SUFFIX))
+        t2 = time.perf_counter()
+        assert dict(iter_members(tar_path)) == contents and dict(iter_members(packed)) == contents, 'Read back mismatch'
+        print('tar.bz2: {:.2f}s, {:.1f} MiB; pack ({}): {:.2f}s, {:.1f} MiB'.format(
+              t1-t0, os.path.getsize(tar_path)/(1 << 20), DEFAULT_CODEC, t2-t1, os.path.getsize(packed)/(1 << 20)))
+        assert strip_archive_suffix(os.path.basename(packed)) == 'packed', 'Suffix not stripped'
+
+        ## Interrupted write leaves the last index valid, the next writer drops the partial batch
+        size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write(b'partial block'+INDEX_MAGIC+b'partial index')
+        assert sorted(open_archive(path).names()) == sorted(contents), 'Archive not readable after interrupted write'
+        ArchiveWriter(path).close()
+        assert os.path.getsize(path) == size, 'Partial batch not dropped'
+    print('Results archive test completed...')
+
+#### ==========================================================================
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Benchmarks of the processing modules against the earlier implementations
+
+Usage:
+    python3 src/processing/benchmark.py perfstat [archive.tar.bz2|archive.pack|file.prof ...]
+    python3 src/processing/benchmark.py align [archive.tar.bz2|archive.pack ...] [--repeat N]
+
+Without arguments, the archived runs in results/03-Workloads are used. The
+align benchmark runs on the largest workload iteration found in the archives.
+
+Assumptions:
+  (1) Archives under results/ are fetched from git-lfs (git lfs pull), LFS
+      pointer files are reported and skipped.
+
+Limitations:
+  N/A
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import sys
+import io
+import glob
+import time
+import tempfile
+import argparse
+import contextlib
+
+import numpy as np
+
+## Import the local packages
+from pathlib import Path
+path_root = Path(__file__).parents[2]
+sys.path.append(str(path_root))
+from src.processing import perfstat
+from src.processing import combine
+from src.processing.ingest import is_lfs_pointer, iter_archive_results
+from src.processing.archive import iter_members
+
+__default_archives__ = os.path.join(str(path_root), 'results', '03-Workloads', '*.tar.bz2')
+
+
+def __collect_prof_files__(sources:[str], tmpdir:str, limit:int) -> [str]:
+    '''Returns list of .prof files, extracting them from archives as needed'''
+    proffiles = []
+    for src in sources:
+        if src.endswith('.prof'):
+            proffiles.append(src)
+            continue
+        if is_lfs_pointer(src):
+            print('Skipping git-lfs pointer (not fetched): '+src)
+            continue
+        for name, data in iter_members(src):
+            if not name.endswith('.prof'):
+                continue
+            outfile = os.path.join(tmpdir, str(len(proffiles))+'_'+os.path.basename(name))
+            with open(outfile, 'wb') as f:
+                f.write(data)
+            proffiles.append(outfile)
+            if limit and len(proffiles) >= limit:
+                return proffiles
+    return proffiles
+
+
+def __timeit__(func, *args) -> float:
+    t0 = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t0
+
+
+def bench_perfstat(sources:[str], limit:int) -> None:
+    import DataProcessor as legacy
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        proffiles = __collect_prof_files__(sources, tmpdir, limit)
+        if not proffiles:
+            print('No .prof files to benchmark')
+            return
+        outcsv = os.path.join(tmpdir, 'out.csv')
+        total_lines = 0
+        total_legacy = total_new = total_new_csv = 0.0
+        print('{:<40} {:>10} {:>14} {:>14} {:>14}'.format(
+                'File', 'Lines', 'legacy l/s', 'parse l/s', 'parse+csv l/s'))
+        for proffile in proffiles:
+            with open(proffile, 'rb') as f:
+                lines = sum(1 for _ in f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                t_legacy = __timeit__(legacy.Process_ProfFile_legacy, proffile, outcsv)
+            t_new = __timeit__(perfstat.parse_prof, proffile)
+            t_new_csv = __timeit__(lambda p: perfstat.parse_prof(p).to_csv(outcsv), proffile)
+            print('{:<40} {:>10} {:>14.0f} {:>14.0f} {:>14.0f}'.format(
+                    os.path.basename(proffile)[-40:], lines,
+                    lines/t_legacy, lines/t_new, lines/t_new_csv))
+            total_lines += lines
+            total_legacy += t_legacy
+            total_new += t_new
+            total_new_csv += t_new_csv
+        print('{:<40} {:>10} {:>14.0f} {:>14.0f} {:>14.0f}'.format(
+                'Total', total_lines,
+                total_lines/total_legacy, total_lines/total_new, total_lines/total_new_csv))
+        print('Speed-up (parse only): {:.1f}x, (parse+csv): {:.1f}x'.format(
+                total_legacy/total_new, total_legacy/total_new_csv))
+
+
+def __largest_result__(sources:[str]) -> tuple:
+    '''(archive, result-name, files) of the workload iteration with the largest .prof'''
+    largest = None
+    for src in sources:
+        if is_lfs_pointer(src):
+            print('Skipping git-lfs pointer (not fetched): '+src)
+            continue
+        for name, files in iter_archive_results(src):
+            size = len(files.get('.prof', b''))
+            if '.prof' in files and (largest is None or size > largest[0]):
+                largest = (size, src, name, files)
+    return largest[1:] if largest else None
+
+
+def bench_align(sources:[str], repeat:int) -> None:
+    largest = __largest_result__(sources)
+    if largest is None:
+        print('No workload results to benchmark')
+        return
+    archive, name, files = largest
+    perf = combine.perf_stream(perfstat.parse_prof(io.BytesIO(files['.prof'])))
+    power = combine.read_powdata(files['.powdata'])
+    poll = combine.read_polldata(files['.polldata'])
+    print('Result: '+os.path.basename(archive)+' / '+name)
+    print('  perf intervals: '+str(len(perf))+' x '+str(len(perf.columns))+
+          ', power samples: '+str(len(power))+', poll samples: '+str(len(poll)))
+
+    # Results of both implementations must agree before comparing their speed
+    ref = combine.combine_legacy(perf, power, poll)
+    new = combine.combine(perf, power, poll)
+    assert list(ref.columns) == list(new.columns), 'Column mismatch between merge_asof and align'
+    for col in ref.columns:
+        assert np.array_equal(ref.columns[col], new.columns[col], equal_nan=True), 'Mismatch in column '+col
+
+    print('{:<28} {:>12} {:>14}'.format('Implementation', 'ms/merge', 'intervals/s'))
+    timings = {}
+    for label, func in [('merge_asof (legacy)', lambda: combine.combine_legacy(perf, power, poll)),
+                        ('align nearest', lambda: combine.combine(perf, power, poll)),
+                        ('align interval mean', lambda: combine.combine(perf, power, poll,
+                                                                        power_mode=combine.POWER_MEAN))]:
+        secs = min(__timeit__(func) for _ in range(repeat))
+        timings[label] = secs
+        print('{:<28} {:>12.2f} {:>14.0f}'.format(label, secs*1000, len(perf)/secs))
+    print('Speed-up (nearest): {:.1f}x'.format(timings['merge_asof (legacy)']/timings['align nearest']))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks for src/processing modules')
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    p_perfstat = subparsers.add_parser('perfstat', help='perf-stat parser vs DataProcessor.Process_ProfFile_legacy')
+    p_perfstat.add_argument('sources', nargs='*', help='.tar.bz2 result archives or .prof files')
+    p_perfstat.add_argument('--limit', type=int, default=0, help='Maximum number of .prof files to benchmark')
+
+    p_align = subparsers.add_parser('align', help='src/processing/align.py vs pandas.merge_asof merging')
+    p_align.add_argument('sources', nargs='*', help='.tar.bz2 result archives')
+    p_align.add_argument('--repeat', type=int, default=5, help='Repetitions, the fastest is reported')
+
+    args = parser.parse_args()
+    if args.bench == 'perfstat':
+        bench_perfstat(args.sources or sorted(glob.glob(__default_archives__)), args.limit)
+    elif args.bench == 'align':
+        bench_align(args.sources or sorted(glob.glob(__default_archives__)), max(args.repeat, 1))
+
+
+if __name__ == '__main__':
+    main()
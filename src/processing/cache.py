@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Content addressed cache of intermediate processing artifacts
+
+Artifacts are keyed on the SHA-256 of the results archive, the name of the
+member, the version of the code producing them and (for the merged stage)
+the merge parameters, so that a rerun only redoes the stages whose inputs
+changed:
+
+    stage     artifact                    key inputs
+    --------  --------------------------  ----------------------------------------------
+    manifest  results found in archive    archive digest, MANIFEST_VERSION
+          (their capture summaries & run metadata)
+    perf      parsed perf intervals       archive digest, member, perfstat.PARSER_VERSION
+    power     cleaned power samples       archive digest, member, combine.READER_VERSION
+    poll      polled data samples         archive digest, member, combine.READER_VERSION
+    merged    merged dataset (.npds)      keys of the above, merge tolerances, combine.MERGE_VERSION
+
+Layout of the cache directory:
+    index.json              - entries (stage, size, last access) & archive digests
+    objects/<kk>/<key>.*    - artifacts, written under a temporary name and renamed
+
+Only the process owning the ProcessingCache object updates index.json (its
+methods are thread safe); the ingestion workers write artifacts to paths
+handed to them and report back.
+Entries are evicted least recently used first once the size bound is hit.
+
+Assumptions:
+  (1) A single ingestion runs on a cache directory at a time.
+
+Limitations:
+  N/A
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+INDEX_FILE = 'index.json'
+MANIFEST_VERSION = 3
+STAGES = ['manifest', 'perf', 'power', 'poll', 'merged']
+__stage_suffix__ = {'manifest': '.json', 'perf': '.npz', 'power': '.npz', 'poll': '.npz', 'merged': '.npds'}
+
+
+def parse_size(size:str) -> int:
+    '''Parses sizes like 500M, 20G into bytes'''
+    size = str(size).strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def make_key(stage:str, *parts) -> str:
+    '''Content key of an artifact from its stage and inputs'''
+    h = hashlib.sha256(stage.encode())
+    for part in parts:
+        h.update(b'\0'+json.dumps(part, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def manifest_key(digest:str) -> str:
+    return make_key('manifest', digest, MANIFEST_VERSION)
+
+
+def __path_size__(path:str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+
+def link_tree(src:str, dst:str) -> None:
+    '''Copies a dataset directory using hard links where possible'''
+    def link_or_copy(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, copy_function=link_or_copy)
+
+
+class ProcessingCache:
+    def __init__(self, root:str, max_bytes:int = 20 << 30):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.__lock__ = threading.RLock()
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        self.__index_file__ = os.path.join(self.root, INDEX_FILE)
+        self.__index__ = {'entries': {}, 'archives': {}}
+        if os.path.exists(self.__index_file__):
+            with open(self.__index_file__, 'r') as f:
+                self.__index__ = json.load(f)
+        # Drop entries whose artifacts went missing
+        for key, entry in list(self.__index__['entries'].items()):
+            if not os.path.exists(self.path(entry['stage'], key)):
+                del self.__index__['entries'][key]
+
+    def path(self, stage:str, key:str) -> str:
+        return os.path.join(self.root, 'objects', key[:2], key+__stage_suffix__[stage])
+
+    def save(self) -> None:
+        with self.__lock__:
+            write_atomic_json(self.__index_file__, self.__index__)
+
+    ## ------------------------------------------------------------------------
+    ## Archive digests, cached on (size, mtime) to avoid rehashing
+    def known_digest(self, archive:str):
+        '''Digest of the archive if it is unchanged since last hashed, else None'''
+        st = os.stat(archive)
+        with self.__lock__:
+            rec = self.__index__['archives'].get(os.path.abspath(archive))
+        if rec and rec['size'] == st.st_size and rec['mtime_ns'] == st.st_mtime_ns:
+            return rec['sha256']
+        return None
+
+    def archive_digest(self, archive:str) -> str:
+        digest = self.known_digest(archive)
+        if digest:
+            return digest
+        st = os.stat(archive)
+        h = hashlib.sha256()
+        with open(archive, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        with self.__lock__:
+            self.__index__['archives'][os.path.abspath(archive)] = {
+                'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    ## ------------------------------------------------------------------------
+    ## Entries
+    def has(self, key:str) -> bool:
+        with self.__lock__:
+            return key in self.__index__['entries']
+
+    def get(self, key:str):
+        '''Path of a cached artifact (marking it recently used), None on miss'''
+        with self.__lock__:
+            entry = self.__index__['entries'].get(key)
+            if entry is None:
+                return None
+            entry['atime'] = time.time()
+            return self.path(entry['stage'], key)
+
+    def add(self, stage:str, key:str) -> None:
+        '''Records an artifact which was written to path(stage, key)'''
+        size = __path_size__(self.path(stage, key))
+        with self.__lock__:
+            self.__index__['entries'][key] = {'stage': stage, 'size': size, 'atime': time.time()}
+
+    def load_manifest(self, digest:str):
+        path = self.get(manifest_key(digest))
+        if path is None:
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def store_manifest(self, digest:str, manifest:dict) -> None:
+        key = manifest_key(digest)
+        write_atomic_json(self.path('manifest', key), manifest)
+        self.add('manifest', key)
+
+    def total_bytes(self) -> int:
+        with self.__lock__:
+            return sum(entry['size'] for entry in self.__index__['entries'].values())
+
+    def evict(self, keep:set = frozenset()) -> int:
+        '''Evicts least recently used entries until within size bound, returns bytes freed'''
+        with self.__lock__:
+            total = self.total_bytes()
+            freed = 0
+            entries = sorted(self.__index__['entries'].items(), key=lambda kv: kv[1]['atime'])
+            for key, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    continue
+                path = self.path(entry['stage'], key)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+                del self.__index__['entries'][key]
+                total -= entry['size']
+                freed += entry['size']
+            return freed
+
+    def stats(self) -> dict:
+        counts = {stage: 0 for stage in STAGES}
+        with self.__lock__:
+            for entry in self.__index__['entries'].values():
+                counts[entry['stage']] += 1
+        return {'entries': counts, 'bytes': self.total_bytes(), 'max_bytes': self.max_bytes}
+
+
+def write_atomic_json(path:str, obj) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path+'.tmp-'+str(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def tmp_path(path:str) -> str:
+    '''Temporary sibling of an artifact path, to be renamed with commit_path'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    base, ext = os.path.splitext(path)
+    return base+'.tmp-'+str(os.getpid())+ext
+
+
+def commit_path(tmp:str, path:str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
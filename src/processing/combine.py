@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Readers for SmartPower3/poll data and merging them with perf-stat intervals
+
+Port of ProcessTestResults from DataProcessor-v2.ipynb working on in-memory
+streams (e.g. members of a results archive) and producing the typed columns
+of src/processing/dataset.py instead of a merged CSV. Streams are aligned
+with src/processing/align.py; the earlier merge_asof implementation is
+retained as combine_legacy for the benchmark.
+
+Assumptions:
+  (1) .powdata files are CSV in the layout of SmartPower3.NCSampler.pd_col_info,
+      or binary .powbin files of its ring capture mode (detected by content)
+  (2) .polldata files are CSV in the layout of ODroidXU4.polling_sampler.DataSampler
+      (or ODroidXU4.telemetry_sampler.TelemetrySampler), i.e. one row per /proc/stat cpu line for every sample; the retained
+      columns are identical across those rows, so one row per sample is kept
+
+Limitations:
+  N/A
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas
+
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[2]
+sys.path.append(str(path_root))
+from src.processing import dataset
+from src.processing import align
+from src.processing import perfstat
+from src.SmartPower3 import SmartPower3 as sm3
+
+## Bump whenever the reader/merge output changes, used for keying cached results
+READER_VERSION = 2
+MERGE_VERSION = 3
+
+## Columns retained from the power monitor data, rest are not influencing current test scenarios
+POWER_COLUMNS = dataset.BYTES_COLUMNS
+## Columns retained from the polled data
+POLL_COLUMNS = ['therm_cpu0', 'therm_cpu1', 'therm_cpu2', 'therm_cpu4']
+
+DEFAULT_TOLERANCE_PERF_TO_POWER = pandas.Timedelta('50 milliseconds')   # Tolerance value in UTC-time to merge perf-stat and SmartPower3 data
+DEFAULT_TOLERANCE_PERF_TO_POLL  = pandas.Timedelta('5 seconds')
+
+## Alignment of power samples to perf-stat intervals
+POWER_NEAREST = align.NEAREST     # nearest sample within tolerance, as ProcessTestResults
+POWER_MEAN    = align.MEAN        # time weighted mean over the perf-stat interval
+POWER_MODES = [POWER_NEAREST, POWER_MEAN]
+
+
+class Stream:
+    '''Timestamped columns of one data source'''
+    def __init__(self, time_ns:np.ndarray, columns:dict):
+        self.time_ns = time_ns
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.time_ns)
+
+    def save_npz(self, filename:str) -> None:
+        names = list(self.columns)
+        arrays = {'c%d' % i: self.columns[name] for i, name in enumerate(names)}
+        with open(filename, 'wb') as f:
+            np.savez(f, names=np.array(json.dumps(names)), time_ns=self.time_ns, **arrays)
+
+    @classmethod
+    def load_npz(cls, filename:str):
+        with np.load(filename) as npz:
+            names = json.loads(str(npz['names']))
+            return cls(npz['time_ns'], {name: npz['c%d' % i] for i, name in enumerate(names)})
+
+
+def __as_text__(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def __to_ns__(series) -> np.ndarray:
+    # Timestamps falling on a full second are recorded without fractional part,
+    # hence ISO8601 rather than a fixed format
+    return pandas.to_datetime(series, format='ISO8601').values.astype('datetime64[ns]').view(np.int64)
+
+
+def read_powbin(source) -> Stream:
+    '''Reads a .powbin file of the SmartPower3 ring capture into a Stream'''
+    records, _ = sm3.load_powbin(source)
+    columns = {name: records[name].astype(np.float64) for name in POWER_COLUMNS}
+    return Stream(records['utctime_ns'].copy(), columns)
+
+
+def read_powdata(source) -> Stream:
+    '''Reads a .powdata (or .powbin) file (path, file object or bytes) into a Stream'''
+    if isinstance(source, (bytes, bytearray)) and source.startswith(sm3.POWBIN_MAGIC):
+        return read_powbin(source)
+    if isinstance(source, str) and source.endswith(sm3.POWBIN_SUFFIX):
+        return read_powbin(source)
+    df = pandas.read_csv(__as_text__(source), usecols=['utctime']+POWER_COLUMNS)
+    columns = {}
+    for name in POWER_COLUMNS:
+        columns[name] = dataset.clean_bytes_column(df[name]).to_numpy(dtype=np.float64)
+    return Stream(__to_ns__(df['utctime']), columns)
+
+
+def read_polldata(source) -> Stream:
+    '''Reads a .polldata file (path, file object or bytes) into a Stream'''
+    df = pandas.read_csv(__as_text__(source), usecols=['ts_utc']+POLL_COLUMNS)
+    time_ns = __to_ns__(df['ts_utc'])
+    keep = align.unique_last(time_ns)
+    columns = {name: df[name].to_numpy(dtype=np.float64)[keep] for name in POLL_COLUMNS}
+    return Stream(time_ns[keep], columns)
+
+
+def perf_stream(perf) -> Stream:
+    '''Stream of a perfstat.PerfStatData, with the least running percentage of each interval'''
+    columns = {name: perf.counts[:, i] for i, name in enumerate(perf.columns)}
+    columns[perfstat.RUNNING_PCT_COLUMN] = perf.running_pct()
+    return Stream(perf.time_ns, columns)
+
+
+def __frame__(stream:Stream, time_column:str) -> pandas.DataFrame:
+    df = pandas.DataFrame(stream.columns)
+    # As datetime64, unmatched rows become NaT in merge_asof rather than NaN
+    # (an int64 column would go through float64, losing the nanoseconds)
+    df.insert(0, time_column, stream.time_ns.view('datetime64[ns]'))
+    df.index = pandas.DatetimeIndex(stream.time_ns.view('datetime64[ns]'))
+    return df
+
+
+def __matched__(columns:dict, base_ns:np.ndarray, stream:Stream, time_column:str, tolerance) -> None:
+    idx = align.match_indices(base_ns, stream.time_ns, align.NEAREST, tolerance.value)
+    columns[time_column] = align.take(stream.time_ns, idx, fill=align.NAT_NS)
+    for name, values in stream.columns.items():
+        columns[name] = align.take(values, idx)
+
+
+def combine(perf:Stream, power:Stream, poll:Stream,
+            tolerance_perf_to_power = DEFAULT_TOLERANCE_PERF_TO_POWER,
+            tolerance_perf_to_poll  = DEFAULT_TOLERANCE_PERF_TO_POLL,
+            power_mode:str = POWER_NEAREST) -> Stream:
+    '''Merges the streams onto perf-stat intervals (or power samples, if perf is None)
+
+    Nearest sample within the tolerance is taken, same as ProcessTestResults.
+    Time of the matched power/poll samples is retained as power_time_ns and
+    poll_time_ns columns. With power_mode POWER_MEAN the power columns hold
+    the time weighted mean over each perf-stat interval instead, and the
+    number of power samples inside the interval is kept as power_samples.
+    '''
+    if power_mode not in POWER_MODES:
+        raise Exception('Unknown power alignment mode: '+str(power_mode))
+    columns = {}
+    if perf is not None:
+        base_ns = perf.time_ns
+        columns.update(perf.columns)
+        if power_mode == POWER_MEAN:
+            start_ns = align.interval_bounds(base_ns)
+            # Power samples inside each interval, also without power columns
+            samples = (np.searchsorted(power.time_ns, base_ns, side='right') -
+                       np.searchsorted(power.time_ns, start_ns, side='right')).astype(np.int64)
+            for name, values in power.columns.items():
+                columns[name], samples = align.interval_mean(base_ns, power.time_ns, values, start_ns)
+            columns['power_samples'] = samples
+        else:
+            __matched__(columns, base_ns, power, 'power_time_ns', tolerance_perf_to_power)
+    else:
+        base_ns = power.time_ns
+        columns.update(power.columns)
+    __matched__(columns, base_ns, poll, 'poll_time_ns', tolerance_perf_to_poll)
+    return Stream(np.asarray(base_ns, dtype=np.int64), columns)
+
+
+def combine_legacy(perf:Stream, power:Stream, poll:Stream,
+                   tolerance_perf_to_power = DEFAULT_TOLERANCE_PERF_TO_POWER,
+                   tolerance_perf_to_poll  = DEFAULT_TOLERANCE_PERF_TO_POLL) -> Stream:
+    '''merge_asof implementation of combine (nearest power), retained for the benchmark
+
+    Nearest sample within the tolerance is taken, same as ProcessTestResults.
+    Time of the matched power/poll samples is retained as power_time_ns and
+    poll_time_ns columns.
+    '''
+    power_df = __frame__(power, 'power_time_ns')
+    poll_df = __frame__(poll, 'poll_time_ns')
+    if perf is not None:
+        df = pandas.merge_asof(left=__frame__(perf, 'perf_time_ns'), right=power_df, right_index=True, left_index=True,
+                               direction='nearest', tolerance=tolerance_perf_to_power)
+        df = pandas.merge_asof(left=df, right=poll_df, right_index=True, left_index=True,
+                               direction='nearest', tolerance=tolerance_perf_to_poll)
+        df.drop(columns=['perf_time_ns'], inplace=True)
+    else:
+        df = pandas.merge_asof(left=power_df, right=poll_df, right_index=True, left_index=True,
+                               direction='nearest', tolerance=tolerance_perf_to_poll)
+        df.drop(columns=['power_time_ns'], inplace=True)
+
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if name.endswith('_time_ns'):
+            # Unmatched rows are NaT after merge, int64 min as NAT_NS
+            columns[name] = col.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            columns[name] = col.to_numpy(dtype=np.float64)
+    return Stream(df.index.values.view(np.int64), columns)
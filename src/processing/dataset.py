@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Typed columnar on-disk format for the combined perf/power/poll dataset
+
+Each run (one workload iteration of one results archive) is stored as a
+directory with suffix '.npds' holding:
+    schema.json     - schema version, row count, column dtypes/files and the
+                      per-run metadata (cluster, frequency, fan, workload, ...)
+    time_ns.npy     - int64 index, UTC timestamps as ns since epoch
+    <column>.npy    - one NumPy array per column
+
+Columns are opened with np.load(mmap_mode='r'), so an analysis only pages
+in the columns it actually uses instead of decompressing and re-parsing the
+merged CSV files.
+
+Usage:
+    python3 src/processing/dataset.py convert combined_dataset/ combined_npds/
+    python3 src/processing/dataset.py info combined_npds/03-Workloads/<run>/<result>.npds
+
+Assumptions:
+  N/A
+
+Limitations:
+  (1) Datasets are write-once, appending rows needs re-writing the run.
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import re
+import json
+import glob
+import shutil
+import argparse
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+SCHEMA_FILE = 'schema.json'
+INDEX_COLUMN = 'time_ns'
+DATASET_SUFFIX = '.npds'
+## JSON sidecar of a result written by WorkloadBase (settle time & criterion, ...),
+## merged into the metadata of its dataset
+RUNMETA_SUFFIX = '.runmeta'
+
+## Power columns which were recorded as b'...' literals by NCSampler
+BYTES_COLUMNS = [
+    'dev_ippwr-ch1-volts_mV', 'dev_ippwr-ch1-ampere_mA', 'dev_ippwr-ch1-watt_mW'
+]
+## Columns holding timestamps in the merged CSV files
+TIME_COLUMNS = ['utctime', 'utctime_x', 'utctime_y', 'utctime.1', 'ts_utc', 'localtime', 'ts_local']
+
+re_unsafe_filename = re.compile(r'[^A-Za-z0-9_.-]')
+# e.g.: 11-14-2023_22-20-44_BigCore-100msPerf-CPUFreq-0.8GHz
+re_archive_name = re.compile(r'(?:([\d-]+)_([\d-]+)_)?(.*CPUFreq-([.\d]+)GHz)')
+# e.g.: stress-cpu1-100s-1.prof, Idling.powdata
+re_result_name = re.compile(r'(.*?)(?:-(\d+))?(?:\.prof|\.powdata|\.powbin|\.polldata)?(?:\.csv)?$')
+
+
+class RunMetadata:
+    '''Per-run metadata stored along with the dataset'''
+    fields = ['category', 'run', 'cluster', 'freq_ghz', 'fan', 'workload', 'iteration', 'archive']
+
+    def __init__(self, category:str = '', run:str = '', cluster:str = '',
+                 freq_ghz:float = 0.0, fan:str = '', workload:str = '',
+                 iteration:int = 0, archive:str = '', **extra):
+        self.category = category
+        self.run = run
+        self.cluster = cluster
+        self.freq_ghz = freq_ghz
+        self.fan = fan
+        self.workload = workload
+        self.iteration = iteration
+        self.archive = archive
+        self.extra = extra
+
+    @classmethod
+    def from_names(cls, archive_name:str, result_name:str, category:str = ''):
+        '''Derives metadata from results archive/directory and result file names'''
+        run = os.path.basename(archive_name)
+        for suffix in ('.pack', '.tar.bz2', '.tar'):
+            if run.endswith(suffix):
+                run = run[:-len(suffix)]
+        m = re_archive_name.match(run)
+        freq_ghz = float(m.group(4)) if m else 0.0
+        if 'BigCore' in run:
+            cluster = 'big'
+        elif 'LittleCore' in run:
+            cluster = 'little'
+        else:
+            cluster = ''
+        if 'NoFan' in run or 'NoFan' in category:
+            fan = 'NoFan'
+        else:
+            # Workload runs are executed with fan at max speed (WorkloadBase.__pre_run__ default)
+            fan = 'MaxFan'
+        r = re_result_name.match(os.path.basename(result_name))
+        workload = r.group(1)
+        iteration = int(r.group(2)) if r.group(2) else 0
+        return cls(category=category, run=m.group(3) if m else run, cluster=cluster,
+                   freq_ghz=freq_ghz, fan=fan, workload=workload, iteration=iteration,
+                   archive=os.path.basename(archive_name))
+
+    def as_dict(self) -> dict:
+        d = {name: getattr(self, name) for name in self.fields}
+        d.update(self.extra)
+        return d
+
+    def __str__(self) -> str:
+        return f'{self.category} {self.cluster} {self.freq_ghz}GHz {self.fan} {self.workload}#{self.iteration}'
+
+
+def __column_filename__(name:str, idx:int) -> str:
+    safe = re_unsafe_filename.sub('_', name)
+    return '%04d_%s.npy' % (idx, safe)
+
+
+def write_dataset(path:str, time_ns:np.ndarray, columns:dict, metadata = None) -> str:
+    '''Writes a run as columnar dataset directory
+
+    columns maps column name to 1-D arrays of the same length as time_ns,
+    metadata can be RunMetadata or a plain dict. Returns the dataset path.
+    '''
+    if not path.endswith(DATASET_SUFFIX):
+        path += DATASET_SUFFIX
+    time_ns = np.asarray(time_ns, dtype=np.int64)
+    nrows = len(time_ns)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    schema_columns = []
+    np.save(os.path.join(path, INDEX_COLUMN+'.npy'), time_ns)
+    for idx, (name, values) in enumerate(columns.items()):
+        values = np.asarray(values)
+        assert len(values) == nrows, 'Column '+name+' length '+str(len(values))+\
+                                     ' mismatching with index length '+str(nrows)
+        filename = __column_filename__(name, idx)
+        np.save(os.path.join(path, filename), values)
+        schema_columns.append({'name': name, 'dtype': values.dtype.str, 'file': filename})
+
+    if isinstance(metadata, RunMetadata):
+        metadata = metadata.as_dict()
+    schema = {
+        'version': SCHEMA_VERSION,
+        'nrows': nrows,
+        'index': {'name': INDEX_COLUMN, 'dtype': time_ns.dtype.str, 'file': INDEX_COLUMN+'.npy',
+                  'unit': 'ns'},
+        'columns': schema_columns,
+        'metadata': metadata or {},
+    }
+    with open(os.path.join(path, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=1)
+    return path
+
+
+def update_metadata(path:str, extra:dict) -> None:
+    '''Adds entries to the metadata of a written dataset
+
+    schema.json is replaced rather than modified in place, as dataset files
+    may be hard links into the processing cache.
+    '''
+    schema_file = os.path.join(path, SCHEMA_FILE)
+    with open(schema_file, 'r') as f:
+        schema = json.load(f)
+    schema['metadata'].update(extra)
+    tmp = schema_file+'.tmp-'+str(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(tmp, schema_file)
+
+
+class Dataset:
+    '''Read access to a columnar dataset, columns are memory mapped on demand'''
+    def __init__(self, path:str):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE), 'r') as f:
+            self.schema = json.load(f)
+        if self.schema['version'] > SCHEMA_VERSION:
+            raise Exception('Unsupported dataset schema version '+str(self.schema['version'])+' in '+path)
+        self.__files__ = {c['name']: c['file'] for c in self.schema['columns']}
+
+    def __len__(self):
+        return self.schema['nrows']
+
+    def __contains__(self, name:str) -> bool:
+        return name in self.__files__
+
+    def __getitem__(self, name:str) -> np.ndarray:
+        return np.load(os.path.join(self.path, self.__files__[name]), mmap_mode='r')
+
+    @property
+    def columns(self) -> [str]:
+        return [c['name'] for c in self.schema['columns']]
+
+    @property
+    def metadata(self) -> dict:
+        return self.schema['metadata']
+
+    @property
+    def time_ns(self) -> np.ndarray:
+        return np.load(os.path.join(self.path, self.schema['index']['file']), mmap_mode='r')
+
+    def to_dataframe(self, columns:[str] = None):
+        '''Returns pandas DataFrame with the selected columns and a datetime index'''
+        import pandas
+        columns = self.columns if columns is None else columns
+        index = pandas.DatetimeIndex(np.asarray(self.time_ns).view('datetime64[ns]'), name='utctime')
+        return pandas.DataFrame({name: self[name] for name in columns}, index=index)
+
+
+def open_dataset(path:str) -> Dataset:
+    return Dataset(path)
+
+
+def iter_datasets(root:str, **filters):
+    '''Yields datasets under root whose metadata matches all of the filters
+
+    e.g. iter_datasets('combined_npds', cluster='big', freq_ghz=1.2)
+    '''
+    for schema_file in sorted(glob.glob(os.path.join(root, '**', '*'+DATASET_SUFFIX, SCHEMA_FILE), recursive=True)):
+        ds = Dataset(os.path.dirname(schema_file))
+        meta = ds.metadata
+        if all(meta.get(k) == v for k, v in filters.items()):
+            yield ds
+
+
+def clean_bytes_column(series):
+    '''Vectorized conversion of b'0166542656' literals into numbers'''
+    import pandas
+    if pandas.api.types.is_numeric_dtype(series):
+        return series
+    return pandas.to_numeric(series.astype(str).str.removeprefix("b'").str.removesuffix("'"), errors='coerce')
+
+
+def convert_merged_csv(csvfile:str, outpath:str, metadata = None) -> str:
+    '''Converts one of the merged CSV files in combined_dataset/ to a dataset'''
+    import pandas
+    df = pandas.read_csv(csvfile, low_memory=False)
+    # ISO8601 as in combine.py: full seconds are recorded without fractional part
+    time_ns = pandas.to_datetime(df['utctime'], format='ISO8601').values.astype('datetime64[ns]').view(np.int64)
+
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if name == 'utctime':
+            continue
+        if name in TIME_COLUMNS:
+            # NaT is kept as the int64 minimum, same as numpy datetime64
+            columns[name] = pandas.to_datetime(col, format='ISO8601').values.astype('datetime64[ns]').view(np.int64)
+            continue
+        col = clean_bytes_column(col)
+        if not pandas.api.types.is_numeric_dtype(col):
+            print('Skipping non-numeric column '+name+' in '+csvfile)
+            continue
+        columns[name] = col.to_numpy()
+    return write_dataset(outpath, time_ns, columns, metadata)
+
+
+def convert_combined_dataset(srcdir:str, outdir:str) -> int:
+    '''Converts a combined_dataset/ tree produced by DataProcessor-v2.ipynb
+
+    Layout: <srcdir>/<category...>/<run>/<result>.csv
+    '''
+    count = 0
+    csvfiles = sorted(glob.glob(os.path.join(srcdir, '**', '*.csv'), recursive=True))
+    for csvfile in csvfiles:
+        rel = os.path.relpath(csvfile, srcdir)
+        parts = rel.split(os.sep)
+        category = '/'.join(parts[:-2])
+        run = parts[-2] if len(parts) > 1 else ''
+        metadata = RunMetadata.from_names(run, parts[-1], category)
+        outpath = os.path.join(outdir, os.path.splitext(rel)[0])
+        print('Converting ('+str(count+1)+'/'+str(len(csvfiles))+'): '+rel)
+        convert_merged_csv(csvfile, outpath, metadata)
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Columnar dataset utilities')
+    subparsers = parser.add_subparsers(dest='cmd', required=True)
+    p_convert = subparsers.add_parser('convert', help='Convert merged CSV tree (combined_dataset/) to datasets')
+    p_convert.add_argument('srcdir')
+    p_convert.add_argument('outdir')
+    p_info = subparsers.add_parser('info', help='Print schema of datasets')
+    p_info.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    if args.cmd == 'convert':
+        count = convert_combined_dataset(args.srcdir, args.outdir)
+        print('Converted '+str(count)+' files')
+    elif args.cmd == 'info':
+        for path in args.paths:
+            ds = Dataset(path)
+            print(path+': '+str(len(ds))+' rows, '+str(len(ds.columns))+' columns')
+            print('  metadata: '+json.dumps(ds.metadata))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Registry of derived perf-stat features, computed on (time x core x event) blocks
+
+Replacement of the per-core column arithmetic of DataAnalysis-v1.ipynb
+(prepare_dataframes_from_csv, cols_corespecific_fields_litc/_bigc), which
+adds one IPC column per core and sums them with DataFrame lambdas on a
+freshly parsed CSV. Here the perf-stat counters of a dataset (see
+dataset.py) are read, a block of rows at a time, from the memory-mapped
+columns into a single float64 array of shape (rows, cores, events), and
+every derived feature is a vectorized reduction of that block. Only the
+counters needed by the requested features are read, and only the 1-D
+feature arrays are kept, so datasets of tens of millions of intervals are
+processed in bounded memory.
+
+Features are registered by name in FEATURES:
+    <metric>_<scope>        metric of a core (e.g. ipc_S1-D0-C2), of a cluster
+                            (ipc_big, mpki_little) or of all cores (ipc_all)
+    sum_<event>_<scope>     sum of an event over the cores of the scope
+    delta_<feature>         difference of a feature to the previous interval
+with the metrics
+    ipc                 instructions / cpu-cycles           (summed over cores)
+    mpki                1000 * cache-misses / instructions  (pooled over cores)
+    branch_miss_rate    branch-misses / branch-instructions (pooled over cores)
+    cache_miss_ratio    cache-misses / cache-references     (pooled over cores)
+A metric summed over cores is the sum of the per-core values (the notebook's
+Aggregate_IPC), a pooled metric the ratio of the event sums. The names used
+by earlier versions of powermodel.py (aggregate_ipc, ...) are kept as ALIASES.
+
+Every feature also knows its counterpart in gem5's statistics, so that a
+linear model fitted on these features (powermodel.py) is exported as the
+MathExprPowerModel expressions of each simulated core (gem5_expressions,
+read by simulation/gem5-src/configs/example/arm/odroid_xu4_sim.py).
+
+Usage:
+    python3 src/processing/features.py list
+    python3 src/processing/features.py compute combined_npds/03-Workloads/<run>/<result>.npds ipc_big mpki_big
+
+    values = compute(ds, ['ipc_big', 'mpki_big', 'delta_ipc_big'])    # {name: np.ndarray of len(ds)}
+    for rows, block in iter_blocks(ds, ['ipc_big']):                    # bounded memory
+        ...
+
+Assumptions:
+  (1) Perf-stat columns are named <core>_<event> (e.g. S1-D0-C0_instructions),
+      S0 being the LITTLE (A7) and S1 the big (A15) cluster
+  (2) A missing counter column reads as NaN, as does any ratio with a zero
+      denominator, such samples being left out of the regression
+
+Limitations:
+  (1) gem5 has no per-core statistic for pooled ratios, a pooled cluster
+      metric is exported as the sum of its per-core ratios
+  (2) gem5's counterparts of the ARM PMU events are approximations:
+      cache-references/-misses are the L1 D-cache accesses/misses and
+      branch-instructions/-misses the branch predictor lookups/mispredictions
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import argparse
+
+import numpy as np
+
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[2]
+sys.path.append(str(path_root))
+from src.processing import dataset
+
+LITTLE_CORES = ['S0-D0-C0', 'S0-D0-C1', 'S0-D0-C2', 'S0-D0-C3']
+BIG_CORES = ['S1-D0-C0', 'S1-D0-C1', 'S1-D0-C2', 'S1-D0-C3']
+CORES = LITTLE_CORES + BIG_CORES
+SCOPES = dict([(core, [core]) for core in CORES] + [('little', LITTLE_CORES), ('big', BIG_CORES), ('all', CORES)])
+EVENTS = ['cpu-cycles', 'instructions', 'cache-misses', 'cache-references', 'branch-instructions', 'branch-misses']
+## Rows per block, i.e. 16 MiB per block of 8 cores and 4 events
+BLOCK_ROWS = 1 << 16
+
+## gem5 statistics of a CPU ({cpu} being its path) counting the perf-stat events
+GEM5_EVENTS = {
+    'cpu-cycles':           '{cpu}.numCycles',
+    'instructions':         '{cpu}.commitStats0.numInsts',
+    'cache-misses':         '{cpu}.dcache.overallMisses',
+    'cache-references':     '{cpu}.dcache.overallAccesses',
+    'branch-instructions':  '{cpu}.branchPred.lookups',
+    'branch-misses':        '{cpu}.branchPred.condIncorrect',
+}
+
+## Feature names of earlier versions of powermodel.py
+ALIASES = {
+    'aggregate_ipc':            'ipc_all',
+    'aggregate_ipc_little':     'ipc_little',
+    'aggregate_ipc_big':        'ipc_big',
+    'cache_miss_rate_little':   'cache_miss_ratio_little',
+    'cache_miss_rate_big':      'cache_miss_ratio_big',
+}
+for __core__ in CORES:
+    ALIASES['cache_miss_rate_'+__core__] = 'cache_miss_ratio_'+__core__
+
+
+class Block:
+    '''Counters of a block of rows as a (rows, cores, events) array'''
+    def __init__(self, values:np.ndarray, cores:[str], events:[str]):
+        self.values = values
+        self.cores = {core: idx for idx, core in enumerate(cores)}
+        self.events = {event: idx for idx, event in enumerate(events)}
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def event(self, event:str, cores:[str]) -> np.ndarray:
+        '''(rows, len(cores)) counts of an event'''
+        idx = [self.cores[core] for core in cores]
+        if idx == list(range(idx[0], idx[0] + len(idx))):
+            return self.values[:, idx[0]:idx[0] + len(idx), self.events[event]]    # view, no copy
+        return self.values[:, idx, self.events[event]]
+
+
+def __ratio__(num:np.ndarray, den:np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = num / den
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+class Metric:
+    '''scale * num / den of each core, summed or pooled over the cores of a scope'''
+    def __init__(self, name:str, num:str, den:str, scale:float = 1.0, pooled:bool = True, gem5:str = None):
+        self.name = name
+        self.num = num
+        self.den = den
+        self.scale = scale
+        self.pooled = pooled
+        self.gem5 = gem5        # per-core statistic, if gem5 has one
+
+    def compute(self, block:Block, cores:[str]) -> np.ndarray:
+        num, den = block.event(self.num, cores), block.event(self.den, cores)
+        if self.pooled or len(cores) == 1:
+            return self.scale * __ratio__(num.sum(axis=1), den.sum(axis=1))
+        return self.scale * __ratio__(num, den).sum(axis=1)
+
+    def gem5_expression(self) -> str:
+        if self.gem5 is not None:
+            return self.gem5
+        expr = GEM5_EVENTS[self.num]+' / '+GEM5_EVENTS[self.den]
+        return expr if self.scale == 1.0 else repr(self.scale)+' * '+expr
+
+
+METRICS = [
+    Metric('ipc', 'instructions', 'cpu-cycles', pooled=False, gem5='{cpu}.ipc'),
+    Metric('mpki', 'cache-misses', 'instructions', scale=1000.0),
+    Metric('branch_miss_rate', 'branch-misses', 'branch-instructions'),
+    Metric('cache_miss_ratio', 'cache-misses', 'cache-references'),
+]
+
+
+class Feature:
+    '''Derived feature: its events, per-block computation and gem5 counterpart
+
+    compute(block) maps a Block to the (rows,) feature values, gem5 is the
+    expression of the feature's share of one core ({cpu} being the core's
+    path in the simulated system), cores the cores the feature sums over.
+    '''
+    def __init__(self, name:str, events:[str], cores:[str], compute, gem5:str = None, delta_of:str = None):
+        self.name = name
+        self.events = events
+        self.cores = cores
+        self.compute = compute
+        self.gem5 = gem5
+        self.delta_of = delta_of
+
+    def __repr__(self) -> str:
+        return 'Feature('+self.name+')'
+
+
+FEATURES = {}
+
+def register(feature:Feature) -> Feature:
+    if feature.name in FEATURES:
+        raise Exception('Feature '+feature.name+' registered twice')
+    FEATURES[feature.name] = feature
+    return feature
+
+for __scope__, __cores__ in SCOPES.items():
+    for __metric__ in METRICS:
+        register(Feature(__metric__.name+'_'+__scope__, [__metric__.num, __metric__.den], __cores__,
+                         lambda block, metric=__metric__, cores=__cores__: metric.compute(block, cores),
+                         gem5=__metric__.gem5_expression()))
+    for __event__ in EVENTS:
+        register(Feature('sum_'+__event__+'_'+__scope__, [__event__], __cores__,
+                         lambda block, event=__event__, cores=__cores__: block.event(event, cores).sum(axis=1),
+                         gem5=GEM5_EVENTS[__event__]))
+for __base__ in list(FEATURES.values()):
+    register(Feature('delta_'+__base__.name, __base__.events, __base__.cores, None, delta_of=__base__.name))
+
+
+def resolve(name:str) -> Feature:
+    feature = FEATURES.get(ALIASES.get(name, name))
+    if feature is None:
+        raise Exception('Unknown feature '+name)
+    return feature
+
+
+def is_feature(name:str) -> bool:
+    return ALIASES.get(name, name) in FEATURES
+
+
+## ----------------------------------------------------------------------------
+## Computation on datasets
+def counters(ds, events:[str], cores:[str] = CORES, start:int = 0, stop:int = None) -> np.ndarray:
+    '''(rows, cores, events) float64 array of the counters of rows [start, stop) of a dataset'''
+    stop = len(ds) if stop is None else min(stop, len(ds))
+    values = np.empty((max(stop - start, 0), len(cores), len(events)), dtype=np.float64)
+    for c, core in enumerate(cores):
+        for e, event in enumerate(events):
+            column = core+'_'+event
+            if column in ds:
+                values[:, c, e] = ds[column][start:stop]
+            else:
+                values[:, c, e] = np.nan
+    return values
+
+
+def iter_blocks(ds, names:[str], block_rows:int = BLOCK_ROWS):
+    '''Yields (slice of rows, {name: values}) of the features over blocks of a dataset'''
+    features = [resolve(name) for name in names]
+    bases = [FEATURES[f.delta_of] if f.delta_of else f for f in features]
+    events = sorted({event for f in bases for event in f.events}, key=EVENTS.index)
+    cores = [core for core in CORES if any(core in f.cores for f in bases)]
+    last = {}                                   # delta features: base value of the previous row
+    for start in range(0, len(ds), block_rows):
+        block = Block(counters(ds, events, cores, start, start + block_rows), cores, events)
+        computed = {}
+        for f in bases:
+            if f.name not in computed:
+                computed[f.name] = f.compute(block)
+        values = {}
+        for name, f in zip(names, features):
+            if f.delta_of is None:
+                values[name] = computed[f.name]
+                continue
+            base = computed[f.delta_of]
+            values[name] = np.diff(base, prepend=last.get(f.delta_of, np.nan))
+            last[f.delta_of] = base[-1]
+        yield slice(start, start + len(block)), values
+
+
+def compute(ds, names:[str], block_rows:int = BLOCK_ROWS) -> dict:
+    '''{name: (len(ds),) values} of the features of a dataset'''
+    out = {name: np.empty(len(ds), dtype=np.float64) for name in names}
+    for rows, values in iter_blocks(ds, names, block_rows):
+        for name in names:
+            out[name][rows] = values[name]
+    return out
+
+
+## ----------------------------------------------------------------------------
+## gem5 power expressions
+def gem5_expressions(coefficients:dict, intercept:float = 0.0, cores:[str] = CORES, scale:float = 1.0) -> dict:
+    '''{core: {'dyn': expr, 'st': expr}} of a linear model of the features
+
+    Each term coefficient * feature is attributed to the cores the feature
+    sums over (its gem5 expression evaluated on each of them), the intercept
+    is split evenly over the given cores as static power. scale converts the
+    model's unit to Watts (e.g. 0.001 * supply voltage for a current in mA).
+    Expressions use {cpu} for the path of the core's CPU.
+    '''
+    terms = {core: [] for core in CORES}
+    for name, coefficient in coefficients.items():
+        feature = resolve(name)
+        if feature.gem5 is None:
+            raise Exception('Feature '+name+' has no gem5 counterpart')
+        for core in feature.cores:
+            terms[core].append(repr(float(coefficient))+' * '+feature.gem5)
+    exprs = {}
+    for core in CORES:
+        st = float(intercept) / len(cores) if core in cores else 0.0
+        exprs[core] = {'dyn': repr(scale)+' * ('+(' + '.join(terms[core]) or '0')+')',
+                       'st': repr(scale * st)}
+    return exprs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Derived perf-stat features')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List the registered features')
+    p_compute = subparsers.add_parser('compute', help='Summarize features of a dataset')
+    p_compute.add_argument('dataset', help='Dataset directory (.npds)')
+    p_compute.add_argument('features', nargs='+', help='Feature names')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, feature in FEATURES.items():
+            print(name.ljust(40)+' '+','.join(feature.events).ljust(40)+' '+str(feature.gem5))
+        for alias, name in ALIASES.items():
+            print(alias.ljust(40)+' = '+name)
+    else:
+        ds = dataset.open_dataset(args.dataset)
+        for name, values in compute(ds, args.features).items():
+            print(name.ljust(40)+' mean '+str(np.nanmean(values))+', valid '+str(np.isfinite(values).sum())+'/'+str(len(values)))
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    main()
+elif __name__ == '__main__':
+    import os
+    import tempfile
+    import pandas
+
+    ## Features match the notebook's DataFrame arithmetic, also across block boundaries
+    rng = np.random.default_rng(3)
+    rows = 1000
+    cols = {}
+    for core in CORES:
+        cols[core+'_cpu-cycles'] = rng.uniform(1e6, 1e7, rows)
+        cols[core+'_instructions'] = cols[core+'_cpu-cycles'] * rng.uniform(0.2, 1.5, rows)
+        cols[core+'_cache-references'] = rng.uniform(1e4, 1e5, rows)
+        cols[core+'_cache-misses'] = cols[core+'_cache-references'] * rng.uniform(0, 0.2, rows)
+        cols[core+'_branch-instructions'] = rng.uniform(1e4, 1e5, rows)
+        cols[core+'_branch-misses'] = cols[core+'_branch-instructions'] * rng.uniform(0, 0.1, rows)
+    cols['S1-D0-C3_cpu-cycles'][5] = 0          # idle core: no valid IPC
+    df = pandas.DataFrame(cols)
+    for core in CORES:
+        df[core+'_IPC'] = df[core+'_instructions'] / df[core+'_cpu-cycles']
+    expected = {
+        'ipc_S0-D0-C1':      df['S0-D0-C1_IPC'],
+        'aggregate_ipc_big': df[[core+'_IPC' for core in BIG_CORES]].sum(axis=1, skipna=False),
+        'ipc_all':           df[[core+'_IPC' for core in CORES]].sum(axis=1, skipna=False),
+        'mpki_little':       1000 * df[[c+'_cache-misses' for c in LITTLE_CORES]].sum(axis=1) / df[[c+'_instructions' for c in LITTLE_CORES]].sum(axis=1),
+        'branch_miss_rate_big': df[[c+'_branch-misses' for c in BIG_CORES]].sum(axis=1) / df[[c+'_branch-instructions' for c in BIG_CORES]].sum(axis=1),
+        'cache_miss_ratio_S1-D0-C0': df['S1-D0-C0_cache-misses'] / df['S1-D0-C0_cache-references'],
+        'sum_instructions_big': df[[c+'_instructions' for c in BIG_CORES]].sum(axis=1),
+        'delta_mpki_little': (1000 * df[[c+'_cache-misses' for c in LITTLE_CORES]].sum(axis=1) / df[[c+'_instructions' for c in LITTLE_CORES]].sum(axis=1)).diff(),
+    }
+    expected['ipc_all'][5] = np.nan
+    expected['aggregate_ipc_big'][5] = np.nan
+    with tempfile.TemporaryDirectory() as tmp:
+        ds = dataset.open_dataset(dataset.write_dataset(os.path.join(tmp, 'run.npds'), np.arange(rows), cols))
+        for block_rows in (BLOCK_ROWS, 64, 1):
+            values = compute(ds, list(expected), block_rows=block_rows)
+            for name, series in expected.items():
+                assert np.allclose(values[name], series.to_numpy(), equal_nan=True), \
+                       'Feature '+name+' mismatch with blocks of '+str(block_rows)+' rows'
+        assert np.isnan(compute(ds, ['ipc_big'])['ipc_big'][5]), 'Zero cycles not a NaN sample'
+        del cols['S0-D0-C0_branch-misses']
+        ds = dataset.open_dataset(dataset.write_dataset(os.path.join(tmp, 'partial.npds'), np.arange(rows), cols))
+        assert np.isnan(compute(ds, ['branch_miss_rate_little'])['branch_miss_rate_little']).all(), 'Missing counter not NaN'
+
+        ## Only the events of the requested features are read
+        block = Block(counters(ds, ['instructions', 'cpu-cycles'], BIG_CORES, 0, 10), BIG_CORES, ['instructions', 'cpu-cycles'])
+        assert block.values.shape == (10, 4, 2) and np.shares_memory(block.event('instructions', BIG_CORES), block.values), \
+               'Unexpected block layout'
+
+    ## gem5 expressions: cluster terms spread over its cores, intercept as static power
+    exprs = gem5_expressions({'aggregate_ipc_big': 60.0, 'mpki_S1-D0-C0': 2.0}, intercept=400.0, cores=BIG_CORES, scale=0.005)
+    assert exprs['S1-D0-C0']['dyn'] == '0.005 * (60.0 * {cpu}.ipc + 2.0 * 1000.0 * {cpu}.dcache.overallMisses / {cpu}.commitStats0.numInsts)', \
+           'Unexpected expression '+exprs['S1-D0-C0']['dyn']
+    assert exprs['S1-D0-C3']['dyn'] == '0.005 * (60.0 * {cpu}.ipc)' and exprs['S1-D0-C3']['st'] == '0.5', 'Unexpected big core'
+    assert exprs['S0-D0-C0'] == {'dyn': '0.005 * (0)', 'st': '0.0'}, 'Unexpected LITTLE core'
+    print('Features test completed...')
+
+#### ==========================================================================
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""Parallel ingestion of results/*.tar.bz2 & *.pack archives into columnar datasets
+
+Command line replacement of the archive processing loop of
+DataProcessor-v2.ipynb. Archives are decompressed by reader threads (bz2
+releases the GIL while decompressing; .pack archives of
+src/processing/archive.py are also decompressed ahead block-parallel) and
+their members are streamed straight into memory, without extracting to disk. As soon as all files of
+a workload iteration (.prof/.powdata/.polldata) are read, they are handed
+over to a process pool for parsing, merging and writing the dataset.
+
+Outputs of an archive are written into a staging directory and moved in
+place only after every workload of the archive succeeded, so an output
+directory is either complete or absent.
+
+Results whose SmartPower3 capture summary (.powstat sidecar) exceeds the
+packet loss/CRC/late bounds are rejected: their datasets are left out and
+listed with the reasons in rejected.json of the output directory. Entries
+of the run metadata sidecar (.runmeta, e.g. the settle time prior to the
+run) are added to the metadata of the dataset. The running/enabled
+percentage of the perf counts is kept per interval (perf_running_pct
+column, the least of the interval) and per column (metadata), along with
+the event group which produced each column (perf_column_group) if the run
+recorded its event groups.
+
+Intermediate results are kept in a content addressed cache (see
+src/processing/cache.py), so a rerun only redoes the stages whose inputs
+changed: unchanged archives are linked from the cache without being
+decompressed, and a change of the merge tolerances re-merges the cached
+parse results. --status reports what a run would recompute.
+
+Usage:
+    python3 src/processing/ingest.py                       # everything under results/
+    python3 src/processing/ingest.py -j 8 results/03-Workloads/*.tar.bz2
+    python3 src/processing/ingest.py --output combined_npds --results results
+    python3 src/processing/ingest.py --status
+    python3 src/processing/ingest.py --tolerance-power-ms 20 --cache-size 50G
+    python3 src/processing/ingest.py --power-align mean
+    python3 src/processing/ingest.py --max-power-loss 0.05 --keep-rejected
+
+Assumptions:
+  (1) Archives are created by WorkloadExec-v2.py, i.e. one top level directory
+      holding <result>.prof, <result>.powdata and <result>.polldata files
+
+Limitations:
+  N/A
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import io
+import json
+import glob
+import time
+import shutil
+import argparse
+import threading
+import concurrent.futures
+
+import pandas
+
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[2]
+sys.path.append(str(path_root))
+from src.processing import perfstat
+from src.processing import combine
+from src.processing import dataset
+from src.processing import cache
+from src.processing import archive as results_archive
+from src.SmartPower3 import SmartPower3 as sm3
+
+__results_archive_dirs__ = [
+        '01-Simple-Idling/MaxFan',
+        '01-Simple-Idling/NoFan',
+        '02-Idling-PerfSleep/MaxFan',
+        '02-Idling-PerfSleep/NoFan',
+        '03-Workloads'
+    ]
+__result_exts__ = ('.prof', '.powdata', '.polldata')
+## Alternative member extensions, e.g. SmartPower3 ring capture in place of .powdata
+__result_ext_aliases__ = {'.powbin': '.powdata'}
+## Optional members describing a result
+__sidecar_exts__ = (sm3.POWSTAT_SUFFIX, dataset.RUNMETA_SUFFIX)
+REJECTED_FILE = 'rejected.json'
+## Cached parse stages: (stage, member extension, version of the producing code)
+__parse_stages__ = [('perf', '.prof', perfstat.PARSER_VERSION),
+                    ('power', '.powdata', combine.READER_VERSION),
+                    ('poll', '.polldata', combine.READER_VERSION)]
+__default_cache_dir__ = os.path.join(str(path_root), '.cache', 'processing')
+
+
+def is_lfs_pointer(filename:str) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(24) == b'version https://git-lfs.'
+
+
+class StageTimer:
+    '''Thread safe accumulator of per-stage wall clock time'''
+    stages = ['hash', 'read', 'cache', 'parse', 'merge', 'write']
+
+    def __init__(self):
+        self.__lock__ = threading.Lock()
+        self.seconds = {stage: 0.0 for stage in self.stages}
+
+    def add(self, timings:dict) -> None:
+        with self.__lock__:
+            for stage, secs in timings.items():
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + secs
+
+    def __str__(self) -> str:
+        return ', '.join(stage+': {:.2f}s'.format(secs) for stage, secs in self.seconds.items())
+
+
+def __cached_stage__(artifacts:dict, stage:str, stored:list, load, compute, save):
+    '''Loads the artifact of a stage from the cache, or computes and stores it'''
+    artifact = artifacts.get(stage)
+    if artifact and artifact[2]:
+        return load(artifact[1])
+    value = compute()
+    if artifact:
+        tmp = cache.tmp_path(artifact[1])
+        save(value, tmp)
+        cache.commit_path(tmp, artifact[1])
+        stored.append(stage)
+    return value
+
+
+def process_result(files:dict, outpath:str, metadata:dict, tolerances:tuple, artifacts:dict = None,
+                   power_mode:str = combine.POWER_NEAREST) -> dict:
+    '''Worker: parse, merge & write dataset of one workload iteration
+
+    files maps extension ('.prof', '.powdata', '.polldata') to file content.
+    artifacts optionally maps stage to (key, path, cached) of its artifact in
+    the ProcessingCache: cached ones are loaded instead of being recomputed
+    (files of those may be omitted), the others are stored at the path.
+    Returns stage timings, number of rows written and the stages stored.
+    '''
+    artifacts = artifacts or {}
+    timings = {}
+    stored = []
+    t0 = time.perf_counter()
+    merged_artifact = artifacts.get('merged')
+    if merged_artifact and merged_artifact[2]:
+        cache.link_tree(merged_artifact[1], outpath)
+        timings['cache'] = time.perf_counter() - t0
+        return {'timings': timings, 'rows': len(dataset.open_dataset(outpath)), 'stored': stored}
+
+    perf = None
+    if '.prof' in files or 'perf' in artifacts:
+        perfdata = __cached_stage__(
+                artifacts, 'perf', stored, perfstat.PerfStatData.load_npz,
+                lambda: perfstat.parse_prof(io.BytesIO(files['.prof'])), lambda v, p: v.save_npz(p))
+        perf = combine.perf_stream(perfdata)
+        metadata = dict(metadata, perf_running_pct=perfdata.column_running_pct())
+    power = __cached_stage__(artifacts, 'power', stored, combine.Stream.load_npz,
+                             lambda: combine.read_powdata(files['.powdata']), lambda v, p: v.save_npz(p))
+    poll = __cached_stage__(artifacts, 'poll', stored, combine.Stream.load_npz,
+                            lambda: combine.read_polldata(files['.polldata']), lambda v, p: v.save_npz(p))
+    t1 = time.perf_counter()
+    merged = combine.combine(perf, power, poll, *tolerances, power_mode=power_mode)
+    t2 = time.perf_counter()
+    if merged_artifact:
+        tmp = cache.tmp_path(merged_artifact[1])
+        dataset.write_dataset(tmp, merged.time_ns, merged.columns, metadata)
+        cache.commit_path(tmp, merged_artifact[1])
+        stored.append('merged')
+        cache.link_tree(merged_artifact[1], outpath)
+    else:
+        dataset.write_dataset(outpath, merged.time_ns, merged.columns, metadata)
+    t3 = time.perf_counter()
+    timings['parse'] = t1 - t0
+    timings['merge'] = t2 - t1
+    timings['write'] = t3 - t2
+    return {'timings': timings, 'rows': len(merged), 'stored': stored}
+
+
+def iter_archive_results(archive_path:str, sidecars:dict = None):
+    '''Streams an archive and yields (result-name, files) per workload iteration
+
+    A result is yielded as soon as its .prof, .powdata and .polldata members
+    were read; results without .prof (idle runs) are yielded at the end.
+    A .powbin member is returned as the .powdata of its result. Sidecar
+    members (.powstat, .runmeta) are collected into sidecars as {name: {ext: content}}.
+    '''
+    pending = {}
+    for member, data in results_archive.iter_members(archive_path):
+        name, ext = os.path.splitext(os.path.basename(member))
+        ext = __result_ext_aliases__.get(ext, ext)
+        if ext in __sidecar_exts__:
+            if sidecars is not None:
+                sidecars.setdefault(name, {})[ext] = data
+            continue
+        if ext not in __result_exts__:
+            continue
+        files = pending.setdefault(name, {})
+        files[ext] = data
+        if len(files) == len(__result_exts__):
+            yield name, pending.pop(name)
+    for name, files in pending.items():
+        if '.powdata' in files and '.polldata' in files:
+            yield name, files
+        else:
+            print('Incomplete result '+name+' in '+archive_path+', found only: '+str(sorted(files)))
+
+
+class ArchiveIngestor:
+    '''Fans archives out to reader threads and their results to a process pool'''
+    def __init__(self, results_root:str, output_root:str, jobs:int,
+                 tolerances:tuple = (combine.DEFAULT_TOLERANCE_PERF_TO_POWER,
+                                     combine.DEFAULT_TOLERANCE_PERF_TO_POLL),
+                 processing_cache:cache.ProcessingCache = None,
+                 power_mode:str = combine.POWER_NEAREST,
+                 capture_bounds:dict = None):
+        self.results_root = os.path.abspath(results_root)
+        self.output_root = os.path.abspath(output_root)
+        self.jobs = jobs
+        self.tolerances = tolerances
+        self.cache = processing_cache
+        self.power_mode = power_mode
+        # Keyword arguments of SmartPower3.check_capture_summary, None to keep all results
+        self.capture_bounds = capture_bounds
+        self.timer = StageTimer()
+        self.__pool__ = None
+        self.__used_keys__ = set()
+
+    def output_dir(self, archive_path:str) -> str:
+        '''Final output directory of an archive, <output>/<category>/<run>'''
+        archive_path = os.path.abspath(archive_path)
+        category = os.path.relpath(os.path.dirname(archive_path), self.results_root)
+        if category.startswith('..'):
+            category = os.path.basename(os.path.dirname(archive_path))
+        meta = dataset.RunMetadata.from_names(archive_path, '', category)
+        return os.path.join(self.output_root, category, meta.run)
+
+    def __artifacts__(self, digest:str, name:str, exts:[str], metadata:dict) -> dict:
+        '''Cache artifacts of one result as {stage: (key, path, cached)}, None without cache'''
+        if self.cache is None:
+            return None
+        keys = {}
+        for stage, ext, version in __parse_stages__:
+            if ext in exts:
+                keys[stage] = cache.make_key(stage, digest, name+ext, version)
+        keys['merged'] = cache.make_key('merged', keys, [tol.value for tol in self.tolerances], self.power_mode,
+                                        combine.MERGE_VERSION, metadata)
+        return {stage: (key, self.cache.path(stage, key), self.cache.has(key)) for stage, key in keys.items()}
+
+    @staticmethod
+    def __needs_input__(artifacts:dict) -> bool:
+        '''Whether the archive members are needed to produce the result'''
+        if artifacts is None:
+            return True
+        if artifacts['merged'][2]:
+            return False
+        return not all(cached for stage, (_, _, cached) in artifacts.items() if stage != 'merged')
+
+    def __plan__(self, archive_path:str, category:str, name:str, exts:[str], digest:str) -> tuple:
+        '''Returns (result file name, metadata, artifacts) of one result'''
+        ext = '.prof' if '.prof' in exts else '.powdata'
+        metadata = dataset.RunMetadata.from_names(archive_path, name+ext, category).as_dict()
+        return name+ext, metadata, self.__artifacts__(digest, name, exts, metadata)
+
+    def __rejected__(self, captures:dict) -> dict:
+        '''{name: reasons} of results whose capture summary exceeds the bounds'''
+        if self.capture_bounds is None:
+            return {}
+        rejected = {}
+        for name, summary in captures.items():
+            reasons = sm3.check_capture_summary(summary, **self.capture_bounds)
+            if reasons:
+                rejected[name] = reasons
+        return rejected
+
+    def __submit__(self, staging:str, plan:tuple, files:dict):
+        filename, metadata, artifacts = plan
+        if artifacts is not None:
+            # Members of cached stages need not be shipped to the worker
+            cached_exts = [ext for stage, ext, _ in __parse_stages__
+                           if artifacts['merged'][2] or (stage in artifacts and artifacts[stage][2])]
+            files = {ext: data for ext, data in files.items() if ext not in cached_exts}
+        outpath = os.path.join(staging, filename+dataset.DATASET_SUFFIX)
+        future = self.__pool__.submit(process_result, files, outpath, metadata, self.tolerances, artifacts,
+                                      self.power_mode)
+        return future, artifacts
+
+    def __collect__(self, result:dict, artifacts:dict) -> None:
+        self.timer.add(result['timings'])
+        if artifacts is None:
+            return
+        for stage, (key, _, cached) in artifacts.items():
+            if stage in result['stored']:
+                self.cache.add(stage, key)
+            elif cached:
+                self.cache.get(key)      # mark as recently used
+            self.__used_keys__.add(key)
+
+    def ingest_archive(self, archive_path:str) -> int:
+        '''Processes one archive, returns number of results written'''
+        outdir = self.output_dir(archive_path)
+        category = os.path.relpath(os.path.dirname(outdir), self.output_root)
+        staging = os.path.join(os.path.dirname(outdir), '.'+os.path.basename(outdir)+'.tmp-'+str(os.getpid()))
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+
+        digest = manifest = None
+        if self.cache is not None:
+            t_hash = time.perf_counter()
+            digest = self.cache.archive_digest(archive_path)
+            manifest = self.cache.load_manifest(digest)
+            self.timer.add({'hash': time.perf_counter() - t_hash})
+            self.__used_keys__.add(cache.manifest_key(digest))
+
+        futures = []
+        try:
+            plans = None
+            if manifest is not None:
+                plans = [(name, self.__plan__(archive_path, category, name, exts, digest))
+                         for name, exts in manifest['results'].items()]
+                if any(self.__needs_input__(plan[2]) for _, plan in plans):
+                    plans = None
+            if plans is not None:
+                # Everything is derivable from the cache, skip decompressing the archive
+                for name, plan in plans:
+                    futures.append((name, plan[0]) + self.__submit__(staging, plan, {}))
+            else:
+                t_read = time.perf_counter()
+                manifest = {'results': {}, 'captures': {}, 'runmeta': {}}
+                sidecars = {}
+                for name, files in iter_archive_results(archive_path, sidecars):
+                    manifest['results'][name] = sorted(files)
+                    plan = self.__plan__(archive_path, category, name, files, digest)
+                    futures.append((name, plan[0]) + self.__submit__(staging, plan, files))
+                for name, members in sidecars.items():
+                    if sm3.POWSTAT_SUFFIX in members:
+                        manifest['captures'][name] = json.loads(members[sm3.POWSTAT_SUFFIX])
+                    if dataset.RUNMETA_SUFFIX in members:
+                        manifest['runmeta'][name] = json.loads(members[dataset.RUNMETA_SUFFIX])
+                self.timer.add({'read': time.perf_counter() - t_read})
+                if self.cache is not None:
+                    self.cache.store_manifest(digest, manifest)
+            for _, _, future, artifacts in futures:
+                self.__collect__(future.result(), artifacts)
+        except BaseException:
+            for _, _, future, _ in futures:
+                future.cancel()
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # Sidecars may follow their results in the archive, hence added once all are written
+        for name, filename, _, _ in futures:
+            if name in manifest['runmeta']:
+                path = os.path.join(staging, filename+dataset.DATASET_SUFFIX)
+                extra = dict(manifest['runmeta'][name])
+                if extra.get('perf_groups'):
+                    # Event group which produced each perf column
+                    columns = dataset.open_dataset(path).metadata.get('perf_running_pct', {})
+                    extra['perf_column_group'] = perfstat.column_groups(columns, extra['perf_groups'])
+                dataset.update_metadata(path, extra)
+
+        # Leave out results whose power capture lost too many packets
+        rejected = self.__rejected__(manifest['captures'])
+        if rejected:
+            for name, filename, _, _ in futures:
+                if name in rejected:
+                    shutil.rmtree(os.path.join(staging, filename+dataset.DATASET_SUFFIX))
+                    print('Rejected '+name+' of '+os.path.basename(archive_path)+': '+'; '.join(rejected[name]))
+            cache.write_atomic_json(os.path.join(staging, REJECTED_FILE), rejected)
+
+        # Atomically replace the earlier output of this archive, if any
+        if os.path.exists(outdir):
+            old = staging+'.old'
+            os.rename(outdir, old)
+            os.rename(staging, outdir)
+            shutil.rmtree(old)
+        else:
+            os.rename(staging, outdir)
+        return len(futures) - len(rejected)
+
+    def run(self, archives:[str]) -> int:
+        '''Ingests the archives, returns number of archives failed'''
+        failures = 0
+        total = len(archives)
+        t_start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=min(self.jobs, max(total, 1))) as readers:
+            self.__pool__ = pool
+            futures = {readers.submit(self.ingest_archive, archive): archive for archive in archives}
+            done = 0
+            for future in concurrent.futures.as_completed(futures):
+                done += 1
+                archive = futures[future]
+                try:
+                    count = future.result()
+                    print('Processed ('+str(done)+'/'+str(total)+'): '+os.path.basename(archive)+
+                          ' - '+str(count)+' results')
+                except Exception as e:
+                    failures += 1
+                    print('Failed ('+str(done)+'/'+str(total)+'): '+os.path.basename(archive)+' - '+repr(e))
+                if self.cache is not None:
+                    self.cache.save()
+            self.__pool__ = None
+        if self.cache is not None:
+            freed = self.cache.evict(keep=self.__used_keys__)
+            self.cache.save()
+            if freed:
+                print('Evicted {:.1f} MiB from the processing cache'.format(freed/(1 << 20)))
+        print('Stage timings (summed over workers): '+str(self.timer))
+        print('Wall clock: {:.2f}s'.format(time.perf_counter() - t_start))
+        return failures
+
+    def status(self, archives:[str]) -> None:
+        '''Prints per archive what a run would recompute, without processing anything'''
+        for archive in archives:
+            outdir = self.output_dir(archive)
+            category = os.path.relpath(os.path.dirname(outdir), self.output_root)
+            digest = self.cache.known_digest(archive) if self.cache is not None else None
+            manifest = self.cache.load_manifest(digest) if digest else None
+            if digest is None:
+                state = 'new or changed, full processing'
+            elif manifest is None:
+                state = 'not processed, full processing'
+            else:
+                stale = {stage: 0 for stage in cache.STAGES[1:]}
+                for name, exts in manifest['results'].items():
+                    _, _, artifacts = self.__plan__(archive, category, name, exts, digest)
+                    for stage, (_, _, cached) in artifacts.items():
+                        stale[stage] += 0 if cached else 1
+                results = len(manifest['results'])
+                if not any(stale.values()):
+                    state = 'up to date ('+str(results)+' results)'
+                else:
+                    state = 'stale of '+str(results)+' results: '+ \
+                            ', '.join(stage+' '+str(count) for stage, count in stale.items() if count)
+                rejected = self.__rejected__(manifest['captures'])
+                if rejected:
+                    state += ', '+str(len(rejected))+' rejected (power capture)'
+            if not os.path.isdir(outdir):
+                state += ', output missing'
+            print(os.path.basename(archive)+': '+state)
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print('Cache '+self.cache.root+': '+
+                  ', '.join(stage+' '+str(count) for stage, count in stats['entries'].items())+
+                  ' - {:.1f} of {:.1f} MiB'.format(stats['bytes']/(1 << 20), stats['max_bytes']/(1 << 20)))
+
+
+def collect_archives(results_root:str, archives:[str]) -> [str]:
+    if not archives:
+        for subdir in __results_archive_dirs__:
+            archives += sorted(glob.glob(os.path.join(results_root, subdir, '*.tar.bz2')) +
+                               glob.glob(os.path.join(results_root, subdir, '*'+results_archive.ARCHIVE_SUFFIX)))
+    valid = []
+    for archive in archives:
+        if is_lfs_pointer(archive):
+            print('Skipping git-lfs pointer (not fetched): '+archive)
+        else:
+            valid.append(archive)
+    return valid
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Ingest results archives into columnar datasets')
+    parser.add_argument('archives', nargs='*', help='Archives to process (default: all under --results)')
+    parser.add_argument('--results', default=os.path.join(str(path_root), 'results'),
+                        help='Root of the results archives')
+    parser.add_argument('--output', default=os.path.join(str(path_root), 'combined_npds'),
+                        help='Root of the output datasets')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--tolerance-power-ms', type=float,
+                        default=combine.DEFAULT_TOLERANCE_PERF_TO_POWER / pandas.Timedelta('1 millisecond'),
+                        help='Merge tolerance of perf-stat to SmartPower3 samples')
+    parser.add_argument('--tolerance-poll-ms', type=float,
+                        default=combine.DEFAULT_TOLERANCE_PERF_TO_POLL / pandas.Timedelta('1 millisecond'),
+                        help='Merge tolerance of perf-stat to polled samples')
+    parser.add_argument('--power-align', choices=combine.POWER_MODES, default=combine.POWER_NEAREST,
+                        help='Nearest power sample, or mean power over each perf-stat interval')
+    parser.add_argument('--max-power-loss', type=float, default=sm3.MAX_LOSS_RATIO,
+                        help='Reject results whose SmartPower3 capture lost a larger share of packets')
+    parser.add_argument('--max-power-crc-failures', type=float, default=sm3.MAX_CRC_FAILURE_RATIO,
+                        help='Reject results with a larger share of SmartPower3 packets failing CRC')
+    parser.add_argument('--max-power-late', type=float, default=sm3.MAX_LATE_RATIO,
+                        help='Reject results with a larger share of late SmartPower3 packets')
+    parser.add_argument('--keep-rejected', action='store_true',
+                        help='Do not reject results based on their SmartPower3 capture summary')
+    parser.add_argument('--cache-dir', default=__default_cache_dir__,
+                        help='Directory of the processing cache')
+    parser.add_argument('--cache-size', default='20G',
+                        help='Size bound of the processing cache, e.g. 500M, 20G')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Process everything without the processing cache')
+    parser.add_argument('--status', action='store_true',
+                        help='Only report which archives/stages would be recomputed')
+    args = parser.parse_args()
+
+    archives = collect_archives(args.results, list(args.archives))
+    if not archives:
+        print('No archives to process')
+        return 0
+    tolerances = (pandas.Timedelta(milliseconds=args.tolerance_power_ms),
+                  pandas.Timedelta(milliseconds=args.tolerance_poll_ms))
+    processing_cache = None
+    if not args.no_cache:
+        processing_cache = cache.ProcessingCache(args.cache_dir, cache.parse_size(args.cache_size))
+    capture_bounds = None
+    if not args.keep_rejected:
+        capture_bounds = {'max_loss_ratio': args.max_power_loss,
+                          'max_crc_failure_ratio': args.max_power_crc_failures,
+                          'max_late_ratio': args.max_power_late}
+    ingestor = ArchiveIngestor(args.results, args.output, max(args.jobs, 1), tolerances, processing_cache,
+                               args.power_align, capture_bounds)
+    if args.status:
+        ingestor.status(archives)
+        return 0
+    return 1 if ingestor.run(archives) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
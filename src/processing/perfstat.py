@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""Streaming parser for interval mode perf-stat output (.prof files)
+
+The .prof files are generated by PerfStat_WorkloadCompiler (src/workloads.py)
+using 'perf stat -I 100 -a --per-core -e <events>', which emits one line per
+(core, event) for every 100ms interval. This module reads such a file in a
+single lazy pass and fills the counts straight into preallocated NumPy
+columns, one row per interval, instead of building a dictionary per interval.
+
+Layout of the perf-stat output being handled:
+    [1] # started on Sun Nov 12 22:12:33 2023
+    [2] #           time core         cpus             counts unit events
+    [3]      0.100174912 S0-D0-C0           1            1946044      branch-instructions  #  19.418 M/sec  (48.30%)
+             0.100174912 S0-D0-C0           1             100.22 msec cpu-clock            #  1.002 CPUs utilized
+             0.100174912 S0-D0-C0           1      <not counted>      branch-loads                          (0.00%)
+             0.100174912 S0-D0-C0           1    <not supported>      LLC-store-misses
+    [4]  Performance counter stats for 'system wide' (1 runs):
+
+The running/enabled percentage of each count (e.g. '(48.30%)', the share
+of the interval the event was counted and its count scaled up from) is
+kept along with the counts. Events of a run in groups (see
+src/ODroidXU4/perf_groups.py) are mapped to the group which produced them
+by column_groups, from the plan recorded in the run metadata.
+
+Assumptions:
+  (1) Records of one interval are contiguous and share the same timestamp
+      string, as perf prints them.
+
+Limitations:
+  (1) Only the interval records are parsed, the summary section [4] is
+      skipped after reading its header.
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import io
+import re
+import json
+import datetime
+import calendar
+
+import numpy as np
+
+## Bump whenever parsing output changes, used for keying cached results
+PARSER_VERSION = 1
+
+## Per cell status codes held in PerfStatData.status
+STATUS_COUNTED       = 0
+STATUS_NOT_COUNTED   = 1
+STATUS_NOT_SUPPORTED = 2
+STATUS_MISSING       = 3   # no record seen for the column in the interval
+
+## Only the meta lines need a regex, records are split on whitespace
+re_timestamp_info = re.compile(r"""
+                                ^[#]+                 # Line Start with # character
+                                \s+started\s+on\s+    # This string will be present before timestamp
+                                (.*\S)                # Time of perf start
+                                """, re.X)
+re_summary_header = re.compile(r"""^\s+
+                                Performance\scounter\sstats\sfor\s
+                                \'(.*)\'\s+              # Type of monitoring in perf
+                                \((\d+)\sruns\):
+                                """, re.X)
+
+__summary_prefix__ = 'Performance counter stats'
+## Column of the least running/enabled percentage of the counts of an interval
+RUNNING_PCT_COLUMN = 'perf_running_pct'
+__nan__ = float('nan')
+
+
+class PerfStatData:
+    '''Columnar result of parsing one perf-stat file
+
+    Column 'i' corresponds to (cores[i], events[i]) and is named as
+    '<core>_<event>', e.g. 'S0-D0-C0_instructions', same as the CSV columns
+    generated by the earlier DataProcessor implementation.
+    '''
+    def __init__(self):
+        self.start_time = None       # datetime of '# started on' line
+        self.start_ns = 0            # start_time as ns since epoch
+        self.runtype = ''
+        self.runcount = 0
+        self.lines = 0               # number of lines consumed
+        self.columns = []
+        self.cores = []
+        self.events = []
+        self.col_index = {}          # (core, event) -> column index
+        self.offset_ns = np.empty(0, dtype=np.int64)
+        self.counts = np.empty((0, 0), dtype=np.float64)
+        self.enabled_pct = np.empty((0, 0), dtype=np.float32)
+        self.status = np.empty((0, 0), dtype=np.int8)
+
+    def __len__(self):
+        return len(self.offset_ns)
+
+    @property
+    def time_ns(self) -> np.ndarray:
+        '''Absolute timestamps of the intervals as ns since epoch'''
+        return self.offset_ns + self.start_ns
+
+    def column(self, core:str, event:str) -> np.ndarray:
+        return self.counts[:, self.col_index[(core, event)]]
+
+    def running_pct(self) -> np.ndarray:
+        '''Least running/enabled percentage of the counted cells of each interval, 100 if none was scaled'''
+        pct = np.where(self.status == STATUS_COUNTED, self.enabled_pct, np.nan)
+        if pct.shape[1] == 0:
+            return np.full(len(self), np.nan, dtype=np.float32)
+        return np.fmin.reduce(pct, axis=1)
+
+    def column_running_pct(self) -> dict:
+        '''{column: mean running/enabled percentage over its counted intervals}, None if never counted'''
+        counted = self.status == STATUS_COUNTED
+        summary = {}
+        for idx, name in enumerate(self.columns):
+            pct = self.enabled_pct[counted[:, idx], idx]
+            summary[name] = round(float(pct.mean()), 2) if len(pct) else None
+        return summary
+
+    def to_dataframe(self):
+        '''Returns a pandas DataFrame in the layout of the earlier CSV output'''
+        import pandas
+        df = pandas.DataFrame(self.counts, columns=self.columns)
+        df.insert(0, 'utctime', pandas.to_datetime(self.time_ns, unit='ns'))
+        return df
+
+    def to_csv(self, outcsvfile:str) -> None:
+        self.to_dataframe().to_csv(outcsvfile, index=False, na_rep='NaN')
+
+    def save_npz(self, filename:str) -> None:
+        '''Saves the parsed data, to be restored by PerfStatData.load_npz'''
+        meta = {'start_time': self.start_time.isoformat() if self.start_time else None,
+                'start_ns': self.start_ns, 'runtype': self.runtype, 'runcount': self.runcount,
+                'lines': self.lines, 'cores': self.cores, 'events': self.events}
+        with open(filename, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), offset_ns=self.offset_ns, counts=self.counts,
+                     enabled_pct=self.enabled_pct, status=self.status)
+
+    @classmethod
+    def load_npz(cls, filename:str):
+        data = cls()
+        with np.load(filename) as npz:
+            meta = json.loads(str(npz['meta']))
+            data.offset_ns = npz['offset_ns']
+            data.counts = npz['counts']
+            data.enabled_pct = npz['enabled_pct']
+            data.status = npz['status']
+        if meta['start_time']:
+            data.start_time = datetime.datetime.fromisoformat(meta['start_time'])
+        data.start_ns = meta['start_ns']
+        data.runtype = meta['runtype']
+        data.runcount = meta['runcount']
+        data.lines = meta['lines']
+        for core, event in zip(meta['cores'], meta['events']):
+            PerfStatParser.__add_column__(data, core, event)
+        return data
+
+
+class PerfStatParser:
+    '''Single pass parser filling perf-stat intervals into NumPy columns
+
+    The column order is stable: columns for the cores/events given to the
+    constructor come first in that order, anything else encountered in the
+    file is appended in order of first appearance.
+    '''
+    def __init__(self, events:[str] = None, cores:[str] = None, capacity:int = 1024):
+        self.__capacity__ = max(int(capacity), 1)
+        self.__events__ = list(events) if events else []
+        self.__cores__ = list(cores) if cores else []
+
+    def __new_data__(self) -> PerfStatData:
+        data = PerfStatData()
+        for core in self.__cores__:
+            for event in self.__events__:
+                self.__add_column__(data, core, event)
+        return data
+
+    @staticmethod
+    def __add_column__(data:PerfStatData, core:str, event:str) -> int:
+        idx = len(data.columns)
+        data.col_index[(core, event)] = idx
+        data.cores.append(core)
+        data.events.append(event)
+        data.columns.append(core+'_'+event if core else event)
+        return idx
+
+    @staticmethod
+    def __offset_ns__(ts:str) -> int:
+        # Avoid float rounding of the 9 digit fractional part
+        sec, _, frac = ts.partition('.')
+        return int(sec)*1000000000 + int((frac+'000000000')[:9])
+
+    def parse(self, source) -> PerfStatData:
+        '''Parse a perf-stat file
+
+        source can be a path, or a text/binary file object such as a member
+        streamed out of a results archive.
+        '''
+        if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+            with io.open(source, 'rt') as f:
+                return self.parse(f)
+        if not isinstance(source, io.TextIOBase):
+            source = io.TextIOWrapper(source, encoding='utf-8', errors='replace')
+
+        data = self.__new_data__()
+        ncols = len(data.columns)
+        rows = self.__capacity__
+        offsets = np.empty(rows, dtype=np.int64)
+        counts = np.full((rows, ncols), np.nan, dtype=np.float64)
+        pct = np.full((rows, ncols), np.nan, dtype=np.float32)
+        status = np.full((rows, ncols), STATUS_MISSING, dtype=np.int8)
+
+        col_index = data.col_index
+        has_core = has_cpus = True
+        nrow = 0
+        lines = 0
+        prev_ts = None
+        row_counts = row_pct = row_status = None
+
+        for line in source:
+            lines += 1
+            first = line[:1]
+            ## [1] & [2]: meta information lines
+            if first == '#':
+                m = re_timestamp_info.match(line)
+                if m:
+                    data.start_time = datetime.datetime.strptime(m.group(1), '%a %b %d %H:%M:%S %Y')
+                    data.start_ns = calendar.timegm(data.start_time.timetuple())*1000000000
+                else:
+                    header = line[1:].split()
+                    if 'time' in header:
+                        has_core = ('core' in header) or ('CPU' in header)
+                        has_cpus = 'cpus' in header
+                continue
+
+            rec = line.lstrip()
+            if not rec:
+                continue
+            if not rec[0].isdigit():
+                ## [4]: summary section, only the header is of interest
+                if rec.startswith(__summary_prefix__):
+                    m = re_summary_header.match(line)
+                    if m:
+                        data.runtype = m.group(1)
+                        data.runcount = int(m.group(2))
+                    break
+                continue
+
+            ## [3]: interval record
+            tok = rec.split()
+            ts = tok[0]
+            if ts != prev_ts:
+                if prev_ts is not None:
+                    counts[nrow] = row_counts
+                    pct[nrow] = row_pct
+                    status[nrow] = row_status
+                    nrow += 1
+                if nrow == rows:
+                    rows *= 2
+                    offsets = np.resize(offsets, rows)
+                    counts = np.concatenate((counts, np.full_like(counts, np.nan)))
+                    pct = np.concatenate((pct, np.full_like(pct, np.nan)))
+                    status = np.concatenate((status, np.full_like(status, STATUS_MISSING)))
+                offsets[nrow] = self.__offset_ns__(ts)
+                row_counts = [__nan__]*ncols
+                row_pct = [__nan__]*ncols
+                row_status = [STATUS_MISSING]*ncols
+                prev_ts = ts
+
+            if has_core:
+                core = tok[1]
+                pos = 3 if has_cpus else 2
+            else:
+                core = ''
+                pos = 1
+            count = tok[pos]
+            if count[0] == '<':
+                # <not counted> / <not supported>
+                cell_status = STATUS_NOT_SUPPORTED if tok[pos+1] == 'supported>' else STATUS_NOT_COUNTED
+                event = tok[pos+2]
+                value = __nan__
+            else:
+                cell_status = STATUS_COUNTED
+                event = tok[pos+1]
+                # Optional unit field, e.g. '100.22 msec cpu-clock'
+                if len(tok) > pos+2 and tok[pos+2][0] not in '#(':
+                    event = tok[pos+2]
+                value = float(count.replace(',', ''))
+
+            last = tok[-1]
+            if last[-2:] == '%)':
+                enabled = float(last[1:-2])
+            else:
+                enabled = 100.0 if cell_status == STATUS_COUNTED else __nan__
+
+            idx = col_index.get((core, event))
+            if idx is None:
+                idx = self.__add_column__(data, core, event)
+                ncols += 1
+                row_counts.append(__nan__)
+                row_pct.append(__nan__)
+                row_status.append(STATUS_MISSING)
+                counts = np.pad(counts, ((0, 0), (0, 1)), constant_values=np.nan)
+                pct = np.pad(pct, ((0, 0), (0, 1)), constant_values=np.nan)
+                status = np.pad(status, ((0, 0), (0, 1)), constant_values=STATUS_MISSING)
+            row_counts[idx] = value
+            row_pct[idx] = enabled
+            row_status[idx] = cell_status
+
+        if prev_ts is not None:
+            counts[nrow] = row_counts
+            pct[nrow] = row_pct
+            status[nrow] = row_status
+            nrow += 1
+
+        data.lines = lines
+        data.offset_ns = offsets[:nrow].copy()
+        data.counts = counts[:nrow].copy()
+        data.enabled_pct = pct[:nrow].copy()
+        data.status = status[:nrow].copy()
+        return data
+
+
+def parse_prof(source, events:[str] = None, cores:[str] = None) -> PerfStatData:
+    '''Convenience wrapper around PerfStatParser.parse'''
+    return PerfStatParser(events=events, cores=cores).parse(source)
+
+
+def column_groups(columns:[str], perf_groups:dict) -> dict:
+    '''{column: index of the event group which produced it} of a run's plan (PerfEventPlan.as_dict)
+
+    Events outside of the groups (software events) and columns of events
+    not counted in the run map to None.
+    '''
+    active = perf_groups.get('active', range(len(perf_groups['groups'])))
+    group_of = {}
+    for idx in active:
+        for event in perf_groups['groups'][idx]:
+            group_of.setdefault(event, idx)
+    return {column: group_of.get(column.split('_', 1)[-1]) for column in columns}
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    import sys
+    import time
+
+    for proffile in sys.argv[1:]:
+        t0 = time.perf_counter()
+        data = parse_prof(proffile)
+        elapsed = time.perf_counter() - t0
+        print(proffile)
+        print('  Start time: '+str(data.start_time)+', runs: '+str(data.runcount)+' ('+data.runtype+')')
+        print('  Intervals: '+str(len(data))+', columns: '+str(len(data.columns)))
+        print('  Lines: '+str(data.lines)+' in '+'{:.3f}'.format(elapsed)+'s')
+        assert data.counts.shape == (len(data), len(data.columns)), 'Parsed counts shape mismatch'
+        print('  Least running: '+str(np.nanmin(data.running_pct()) if len(data) else None)+'%')
+
+    ## Running percentages & groups of a rotated run
+    prof = '\n'.join(['# started on Sun Nov 12 22:12:33 2023', '',
+        '#           time core         cpus             counts unit events',
+        '     0.100174912 S0-D0-C0           1            1946044      cpu-cycles',
+        '     0.100174912 S0-D0-C0           1            1846044      instructions',
+        '     0.100174912 S0-D0-C0           1              10000      cache-misses              (50.00%)',
+        '     0.100174912 S0-D0-C0           1             100.22 msec cpu-clock            #  1.002 CPUs utilized',
+        '     0.200174912 S0-D0-C0           1            1946044      cpu-cycles',
+        '     0.200174912 S0-D0-C0           1            1846044      instructions',
+        '     0.200174912 S0-D0-C0           1      <not counted>      cache-misses              (0.00%)',
+        '     0.200174912 S0-D0-C0           1             100.22 msec cpu-clock            #  1.002 CPUs utilized', ''])
+    data = parse_prof(io.StringIO(prof))
+    assert list(data.running_pct()) == [50.0, 100.0], 'Unexpected running percentages '+str(data.running_pct())
+    assert data.column_running_pct()['S0-D0-C0_cache-misses'] == 50.0, 'Unexpected column running percentage'
+    plan = {'mode': 'rotate', 'groups': [['cpu-cycles', 'instructions', 'branch-misses'], ['cpu-cycles', 'instructions', 'cache-misses']],
+            'software': ['cpu-clock'], 'active': [1]}
+    assert column_groups(data.columns, plan) == {'S0-D0-C0_cpu-cycles': 1, 'S0-D0-C0_instructions': 1,
+                                                 'S0-D0-C0_cache-misses': 1, 'S0-D0-C0_cpu-clock': None}, 'Unexpected groups'
+    print('Perf-stat parser test completed...')
+
+#### ==========================================================================
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""Per-frequency linear power models from sufficient statistics
+
+Replacement of the model fitting loop of DataAnalysis-v1.ipynb, which
+reloads and re-cleans every merged CSV file of a frequency for each of the
+frequencies and fits statsmodels' OLS of the current (dev_ippwr-ch1-ampere_mA)
+on the aggregate IPC. Here a single pass over the datasets (see dataset.py)
+accumulates, per (cluster, frequency, feature set), the sufficient statistics
+of the least squares problem: the sample count, the means and the cross
+product matrix of the features and the target (X^T X, X^T y, y^T y, kept
+centred on the means for numerical stability, merged with Chan's update).
+Coefficients, R^2, adjusted R^2 and the F-statistic of every model are
+solved from these, several feature sets (e.g. per-core IPC, cache-miss
+rates) being fitted in the same pass.
+
+The features are the derived features of features.py (or plain dataset
+columns), computed and accumulated a block of rows at a time. A model
+fitted on them is exported (--gem5) as per-core MathExprPowerModel
+expressions for simulation/gem5-src/configs/example/arm/odroid_xu4_sim.py.
+
+The accumulators are saved to a state file, runs added later are
+accumulated into it without re-reading the datasets already counted.
+
+Usage:
+    python3 src/processing/powermodel.py combined_npds                        # aggregate IPC model
+    python3 src/processing/powermodel.py combined_npds --state model.json \\
+        --feature-set ipc=aggregate_ipc --feature-set percore=ipc_S1-D0-C0,ipc_S1-D0-C1,ipc_S1-D0-C2,ipc_S1-D0-C3 \\
+        --feature-set cache=ipc_big,mpki_big,branch_miss_rate_big --category 03-Workloads --cluster big
+    python3 src/processing/powermodel.py combined_npds --feature-set ipc=ipc_big --gem5 power_model.json
+
+    fitter = PowerModelFitter({'ipc': ['aggregate_ipc']})
+    fitter.add_datasets(dataset.iter_datasets('combined_npds', category='03-Workloads'))
+    fitter.results('ipc')       # DataFrame: cluster, freq_ghz, n, coefficients, r2, adj_r2, f_statistic
+
+Assumptions:
+  (1) Samples with a missing or non-finite feature or target are left out,
+      as by dropna() in the notebook
+
+Limitations:
+  (1) Row normalization (--normalize, sklearn's Normalizer as used by the
+      notebook) is applied per sample prior to accumulating; other scalers
+      depending on the whole data are not supported
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+## Import the local packages
+from pathlib import Path
+import sys
+path_root = Path(__file__).parents[2]
+sys.path.append(str(path_root))
+from src.processing import dataset
+from src.processing import features
+from src.processing.features import LITTLE_CORES, BIG_CORES
+
+STATE_VERSION = 1
+DEFAULT_TARGET = 'dev_ippwr-ch1-ampere_mA'
+## Supply voltage of the board, converting a modelled current (mA) to power for gem5
+SUPPLY_VOLTS = 5.0
+
+
+class OLSAccumulator:
+    '''Sufficient statistics of the OLS of y on k features plus intercept'''
+    def __init__(self, k:int):
+        self.k = k
+        self.n = 0
+        self.mean = np.zeros(k + 1)             # means of [x_1..x_k, y]
+        self.comoment = np.zeros((k + 1, k + 1))  # centred cross products of [x_1..x_k, y]
+
+    def add(self, X:np.ndarray, y:np.ndarray) -> int:
+        '''Accumulates samples (rows of X), returns the number of samples kept'''
+        Z = np.column_stack([np.asarray(X, dtype=np.float64).reshape(len(y), self.k), np.asarray(y, dtype=np.float64)])
+        Z = Z[np.isfinite(Z).all(axis=1)]
+        if len(Z) == 0:
+            return 0
+        other = OLSAccumulator(self.k)
+        other.n = len(Z)
+        other.mean = Z.mean(axis=0)
+        D = Z - other.mean
+        other.comoment = D.T @ D
+        self.merge(other)
+        return len(Z)
+
+    def merge(self, other:'OLSAccumulator') -> None:
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean = self.mean + delta * (other.n / n)
+        self.n = n
+
+    def solve(self) -> dict:
+        '''Coefficients (intercept first), R^2, adjusted R^2 and F-statistic'''
+        k, n = self.k, self.n
+        result = {'n': n, 'coefficients': [np.nan]*(k + 1), 'r2': np.nan, 'adj_r2': np.nan, 'f_statistic': np.nan}
+        if n <= k + 1:
+            return result
+        Sxx = self.comoment[:k, :k]
+        Sxy = self.comoment[:k, k]
+        Syy = self.comoment[k, k]
+        beta = np.linalg.lstsq(Sxx, Sxy, rcond=None)[0]
+        intercept = self.mean[k] - beta @ self.mean[:k]
+        sse = max(Syy - beta @ Sxy, 0.0)
+        r2 = 1.0 - sse / Syy if Syy > 0 else np.nan
+        dof = n - k - 1
+        result.update({'coefficients': [float(intercept)] + [float(b) for b in beta], 'r2': float(r2),
+                       'adj_r2': float(1.0 - (1.0 - r2) * (n - 1) / dof),
+                       'f_statistic': float((r2 / k) / ((1.0 - r2) / dof)) if r2 < 1 else np.inf,
+                       'sse': float(sse)})
+        return result
+
+    def as_dict(self) -> dict:
+        return {'k': self.k, 'n': self.n, 'mean': self.mean.tolist(), 'comoment': self.comoment.tolist()}
+
+    @classmethod
+    def from_dict(cls, d:dict) -> 'OLSAccumulator':
+        acc = cls(d['k'])
+        acc.n = d['n']
+        acc.mean = np.array(d['mean'], dtype=np.float64)
+        acc.comoment = np.array(d['comoment'], dtype=np.float64)
+        return acc
+
+
+def __column__(ds, name:str, rows:slice = slice(None)) -> np.ndarray:
+    return np.asarray(ds[name][rows], dtype=np.float64) if name in ds else np.full(len(range(len(ds))[rows]), np.nan)
+
+
+## ----------------------------------------------------------------------------
+class PowerModelFitter:
+    '''Accumulates the OLS statistics of each feature set per (cluster, frequency)'''
+    def __init__(self, feature_sets:dict, target:str = DEFAULT_TARGET, normalize:bool = False):
+        self.feature_sets = {name: list(names) for name, names in feature_sets.items()}
+        self.target = target
+        self.normalize = normalize
+        self.accumulators = {}                  # (cluster, freq_ghz, feature set) -> OLSAccumulator
+        self.runs = set()                       # datasets accumulated, by run identity
+
+    @staticmethod
+    def run_id(ds) -> str:
+        meta = ds.metadata
+        return '/'.join(str(meta.get(key, '')) for key in ('category', 'run', 'workload', 'iteration')) or ds.path
+
+    def add_dataset(self, ds) -> bool:
+        '''Accumulates a dataset, False if it was accumulated already'''
+        rid = self.run_id(ds)
+        if rid in self.runs:
+            return False
+        meta = ds.metadata
+        derived = sorted({f for fs in self.feature_sets.values() for f in fs if features.is_feature(f)})
+        for rows, values in features.iter_blocks(ds, derived):
+            y = __column__(ds, self.target, rows)
+            for name, feature_set in self.feature_sets.items():
+                X = np.column_stack([values[f] if f in values else __column__(ds, f, rows) for f in feature_set])
+                Y = y
+                if self.normalize:
+                    # Row-wise L2 normalization of [y, X], as sklearn's Normalizer on the notebook's frame
+                    norm = np.sqrt(y*y + (X*X).sum(axis=1))
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        X, Y = X / norm[:, None], y / norm
+                key = (meta.get('cluster', ''), round(float(meta.get('freq_ghz', 0.0)), 3), name)
+                if key not in self.accumulators:
+                    self.accumulators[key] = OLSAccumulator(len(feature_set))
+                self.accumulators[key].add(X, Y)
+        self.runs.add(rid)
+        return True
+
+    def add_datasets(self, datasets) -> int:
+        return sum(1 for ds in datasets if self.add_dataset(ds))
+
+    def results(self, feature_set:str):
+        '''DataFrame of the models of a feature set, one row per (cluster, frequency)'''
+        import pandas
+        rows = []
+        names = ['const'] + self.feature_sets[feature_set]
+        for (cluster, freq, fs), acc in sorted(self.accumulators.items()):
+            if fs != feature_set:
+                continue
+            fit = acc.solve()
+            row = {'cluster': cluster, 'freq_ghz': freq, 'n': fit['n']}
+            row.update(zip(names, fit['coefficients']))
+            row.update({'r2': fit['r2'], 'adj_r2': fit['adj_r2'], 'f_statistic': fit['f_statistic']})
+            rows.append(row)
+        return pandas.DataFrame(rows, columns=['cluster', 'freq_ghz', 'n'] + names + ['r2', 'adj_r2', 'f_statistic'])
+
+    def gem5_models(self, feature_set:str, supply_volts:float = SUPPLY_VOLTS) -> dict:
+        '''MathExprPowerModel expressions (in Watts) of each core, per (cluster, frequency) model
+
+        Read by simulation/gem5-src/configs/example/arm/odroid_xu4_sim.py (--power-model).
+        '''
+        if self.target.endswith('_mA'):
+            scale = 0.001 * supply_volts
+        elif self.target.endswith('_mW'):
+            scale = 0.001
+        else:
+            raise Exception('No conversion of '+self.target+' to Watts')
+        models = []
+        names = self.feature_sets[feature_set]
+        for (cluster, freq, fs), acc in sorted(self.accumulators.items()):
+            fit = acc.solve()
+            if fs != feature_set or not np.isfinite(fit['coefficients']).all():
+                continue
+            cores = {'little': LITTLE_CORES, 'big': BIG_CORES}.get(cluster, features.CORES)
+            models.append({'cluster': cluster, 'freq_ghz': freq, 'r2': fit['r2'],
+                           'cores': features.gem5_expressions(dict(zip(names, fit['coefficients'][1:])),
+                                                              fit['coefficients'][0], cores, scale)})
+        return {'feature_set': feature_set, 'features': names, 'target': self.target, 'models': models}
+
+    ## ------------------------------------------------------------------------
+    ## State file
+    def save(self, path:str) -> None:
+        state = {'version': STATE_VERSION, 'target': self.target, 'normalize': self.normalize,
+                 'feature_sets': self.feature_sets, 'runs': sorted(self.runs),
+                 'accumulators': [{'cluster': c, 'freq_ghz': f, 'feature_set': fs, 'stats': acc.as_dict()}
+                                  for (c, f, fs), acc in sorted(self.accumulators.items())]}
+        tmp = path+'.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path:str) -> 'PowerModelFitter':
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if state['version'] > STATE_VERSION:
+            raise Exception('Unsupported power model state version '+str(state['version'])+' in '+path)
+        fitter = cls(state['feature_sets'], state['target'], state['normalize'])
+        fitter.runs = set(state['runs'])
+        for entry in state['accumulators']:
+            fitter.accumulators[(entry['cluster'], entry['freq_ghz'], entry['feature_set'])] = \
+                OLSAccumulator.from_dict(entry['stats'])
+        return fitter
+
+
+def parse_feature_sets(specs:[str]) -> dict:
+    '''{name: [features]} of name=feature,feature,... specifications
+
+    Features are names of features.FEATURES (or its ALIASES) or dataset columns.
+    '''
+    sets = {}
+    for spec in specs:
+        name, _, names = spec.partition('=')
+        if not names:
+            name, names = spec, spec
+        sets[name] = names.split(',')
+    return sets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fit per-frequency linear power models')
+    parser.add_argument('root', help='Root of the datasets (output of ingest.py)')
+    parser.add_argument('--state', default=None, help='Accumulator state file, updated with new runs')
+    parser.add_argument('--feature-set', action='append', default=[], help='name=feature,... (default: ipc=aggregate_ipc)')
+    parser.add_argument('--target', default=DEFAULT_TARGET, help='Column to model')
+    parser.add_argument('--normalize', action='store_true', help='Row-wise L2 normalization, as in DataAnalysis-v1')
+    parser.add_argument('--category', default=None, help='Only datasets of a category, e.g. 03-Workloads')
+    parser.add_argument('--cluster', default=None, choices=['big', 'little'], help='Only datasets of a cluster')
+    parser.add_argument('--gem5', default=None, help='Write the gem5 power expressions of the first feature set to this JSON file')
+    parser.add_argument('--supply-volts', type=float, default=SUPPLY_VOLTS, help='Board supply voltage, for --gem5 of a current model')
+    args = parser.parse_args()
+
+    feature_sets = parse_feature_sets(args.feature_set or ['ipc=aggregate_ipc'])
+    if args.state and os.path.exists(args.state):
+        fitter = PowerModelFitter.load(args.state)
+        if fitter.target != args.target or fitter.normalize != args.normalize:
+            raise Exception('State '+args.state+' was accumulated with another target/normalization')
+        missing = {name: fs for name, fs in feature_sets.items() if fitter.feature_sets.get(name) != fs}
+        if missing and fitter.runs:
+            raise Exception('Feature sets '+str(sorted(missing))+' not in state '+args.state+', use a new state file')
+        fitter.feature_sets.update(feature_sets)
+    else:
+        fitter = PowerModelFitter(feature_sets, args.target, args.normalize)
+    filters = {key: value for key, value in (('category', args.category), ('cluster', args.cluster)) if value}
+    added = fitter.add_datasets(dataset.iter_datasets(args.root, **filters))
+    print('Accumulated '+str(added)+' new runs ('+str(len(fitter.runs))+' in total)')
+    if args.state:
+        fitter.save(args.state)
+    import pandas
+    with pandas.option_context('display.max_rows', None, 'display.width', 200):
+        for name in feature_sets:
+            print('--- '+name+': '+args.target+' ~ '+' + '.join(fitter.feature_sets[name]))
+            print(fitter.results(name).to_string(index=False))
+    if args.gem5:
+        with open(args.gem5, 'w') as f:
+            json.dump(fitter.gem5_models(list(feature_sets)[0], args.supply_volts), f, indent=2)
+        print('gem5 power expressions written to '+args.gem5)
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__' and len(sys.argv) > 1:
+    main()
+elif __name__ == '__main__':
+    import tempfile
+
+    ## Accumulated (in chunks, merged) fit matches a direct least squares fit
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(5000, 3)) * [1.0, 10.0, 0.01] + [2.0, -5.0, 100.0]
+    y = 300 + X @ [40.0, -2.0, 500.0] + rng.normal(scale=20.0, size=len(X))
+    y[7] = np.nan
+    acc = OLSAccumulator(3)
+    for chunk in np.array_split(np.arange(len(X)), 7):
+        part = OLSAccumulator(3)
+        part.add(X[chunk], y[chunk])
+        acc.merge(part)
+    fit = acc.solve()
+    keep = np.isfinite(y)
+    A = np.column_stack([np.ones(keep.sum()), X[keep]])
+    beta, res, _, _ = np.linalg.lstsq(A, y[keep], rcond=None)
+    r2 = 1 - res[0] / ((y[keep] - y[keep].mean())**2).sum()
+    n, k = keep.sum(), 3
+    assert fit['n'] == n, 'NaN sample not dropped'
+    assert np.allclose(fit['coefficients'], beta), 'Coefficient mismatch '+str(fit['coefficients'])+' vs '+str(beta)
+    assert np.isclose(fit['r2'], r2) and np.isclose(fit['adj_r2'], 1 - (1 - r2)*(n - 1)/(n - k - 1)), 'R^2 mismatch'
+    assert np.isclose(fit['f_statistic'], (r2/k)/((1 - r2)/(n - k - 1))), 'F-statistic mismatch'
+
+    ## Datasets: two frequencies, two feature sets, incremental through the state file
+    def make_run(root, freq, iteration):
+        cols = {}
+        for core in LITTLE_CORES + BIG_CORES:
+            cols[core+'_cpu-cycles'] = rng.uniform(1e6, 1e7, 400) * freq
+            cols[core+'_instructions'] = cols[core+'_cpu-cycles'] * rng.uniform(0.2, 1.5, 400)
+            cols[core+'_cache-references'] = rng.uniform(1e4, 1e5, 400)
+            cols[core+'_cache-misses'] = cols[core+'_cache-references'] * rng.uniform(0, 0.2, 400)
+        agg = sum(cols[c+'_instructions'] / cols[c+'_cpu-cycles'] for c in LITTLE_CORES + BIG_CORES)
+        cols[DEFAULT_TARGET] = 200 + 100*freq + 60*freq*agg + rng.normal(scale=5, size=400)
+        meta = {'category': '03-Workloads', 'run': 'BigCore-T-CPUFreq-'+str(freq)+'GHz', 'cluster': 'big',
+                'freq_ghz': freq, 'workload': 'stress', 'iteration': iteration}
+        return dataset.write_dataset(os.path.join(root, meta['run'], 'stress-'+str(iteration)+'.prof'),
+                                     np.arange(400), cols, meta)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for freq in (1.0, 2.0):
+            make_run(tmp, freq, 1)
+        sets = {'ipc': ['aggregate_ipc'], 'cache': ['aggregate_ipc_big', 'cache_miss_rate_big']}
+        fitter = PowerModelFitter(sets)
+        assert fitter.add_datasets(dataset.iter_datasets(tmp)) == 2, 'Runs not accumulated'
+        state = os.path.join(tmp, 'model.json')
+        fitter.save(state)
+
+        make_run(tmp, 2.0, 2)
+        fitter = PowerModelFitter.load(state)
+        assert fitter.add_datasets(dataset.iter_datasets(tmp)) == 1, 'Only the new run is to be accumulated'
+        full = PowerModelFitter(sets)
+        full.add_datasets(dataset.iter_datasets(tmp))
+        incremental, direct = fitter.results('ipc'), full.results('ipc')
+        print(incremental.to_string(index=False))
+        assert list(incremental['n']) == [400, 800], 'Unexpected sample counts'
+        assert np.allclose(incremental[['const', 'aggregate_ipc', 'r2']], direct[['const', 'aggregate_ipc', 'r2']]), \
+               'Incremental fit differs'
+        row = incremental[incremental['freq_ghz'] == 2.0].iloc[0]
+        assert abs(row['aggregate_ipc'] - 120) < 1 and row['r2'] > 0.99, 'Unexpected model '+str(row.to_dict())
+        assert len(fitter.results('cache')) == 2, 'Second feature set missing'
+
+        ## gem5 export: the fitted aggregate IPC slope on every core, the intercept on the big cores
+        model = fitter.gem5_models('ipc')['models'][1]
+        assert model['freq_ghz'] == 2.0 and model['cores']['S0-D0-C0']['dyn'].startswith('0.005 * (') and \
+               model['cores']['S0-D0-C0']['dyn'].endswith(' * {cpu}.ipc)'), 'Unexpected gem5 model '+str(model)
+        assert np.isclose(float(model['cores']['S1-D0-C0']['st']), 0.005 * row['const'] / 4), 'Unexpected static power'
+    print('Power model test completed...')
+
+#### ==========================================================================
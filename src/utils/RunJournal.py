@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Append-only journal of campaign runs, for resuming at iteration granularity
+
+Every state transition of a run is appended as one JSON line to the journal
+file and flushed to disk (fsync) before the run proceeds, so that a crash of
+the host, a reboot or a dropped SSH session leaves a journal describing all
+the work completed up to that point:
+
+    state               fields (besides ts, board, job)
+    ------------------  --------------------------------------------------------
+    job-started         results_path (the results directory of the job)
+    iteration-started   cluster, freq, workload, iteration
+    iteration-completed cluster, freq, workload, iteration, artifacts {path: sha256}
+    job-completed       archive, artifacts {archive: sha256}
+    job-failed          error
+
+Jobs are identified by a key chosen by the runner (e.g. the campaign job's
+key), iterations by (workload, iteration). Artifact paths are stored as
+given, relative paths are resolved against the journal's directory.
+
+On restart a JobJournal of a job started earlier hands back its results
+directory; iterations whose completion was journaled and whose artifacts
+still match their checksums are skipped, iterations started but not
+completed (or whose artifacts went missing/changed) are run again, their
+stale artifacts being removed first.
+
+Usage:
+    journal = RunJournal('results/campaign.journal')
+    job = journal.job('xu4-01', 'cpu/BigCore-100msPerf-CPUFreq-2.0GHz')
+    if not job.completed():
+        results_path = job.results_path or job.start(new_results_path)
+        ...
+        if not job.iteration_completed('stress-cpu1-100s', 1):
+            job.begin_iteration('big', 2000000, 'stress-cpu1-100s', 1)
+            ...
+            job.complete_iteration('big', 2000000, 'stress-cpu1-100s', 1, [artifact paths])
+        job.complete(archive)
+
+Assumptions:
+  (1) A single process appends to a journal file at a time (the campaign
+      scheduler's threads share one RunJournal object)
+
+Limitations:
+  (1) A line torn by a crash while being written is ignored on load
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+JOB_STARTED         = 'job-started'
+ITERATION_STARTED   = 'iteration-started'
+ITERATION_COMPLETED = 'iteration-completed'
+JOB_COMPLETED       = 'job-completed'
+JOB_FAILED          = 'job-failed'
+
+
+def file_sha256(path:str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class RunJournal:
+    def __init__(self, filename:str):
+        self.filename = os.path.abspath(filename)
+        self.root = os.path.dirname(self.filename)
+        self.__lock__ = threading.Lock()
+        self.__entries__ = []
+        self.torn = 0
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                for line in f:
+                    try:
+                        self.__entries__.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        self.torn += 1
+        os.makedirs(self.root, exist_ok=True)
+        self.__f__ = open(self.filename, 'a')
+        # Terminate a torn last line, so that the next entry starts on its own line
+        if self.torn:
+            self.__f__.write('\n')
+
+    def close(self) -> None:
+        with self.__lock__:
+            self.__f__.close()
+
+    def resolve(self, path:str) -> str:
+        return os.path.join(self.root, path)
+
+    def append(self, entry:dict) -> dict:
+        '''Appends an entry (stamped with the time), durable once returned'''
+        entry = dict(entry, ts=time.time())
+        with self.__lock__:
+            self.__f__.write(json.dumps(entry, sort_keys=True)+'\n')
+            self.__f__.flush()
+            os.fsync(self.__f__.fileno())
+            self.__entries__.append(entry)
+        return entry
+
+    def entries(self, job:str = None) -> [dict]:
+        with self.__lock__:
+            return [entry for entry in self.__entries__ if job is None or entry.get('job') == job]
+
+    def checksums(self, paths:[str]) -> dict:
+        return {path: file_sha256(self.resolve(path)) for path in paths}
+
+    def verify(self, artifacts:dict) -> bool:
+        '''True if all artifacts exist and match their checksums'''
+        for path, digest in artifacts.items():
+            if not os.path.isfile(self.resolve(path)) or file_sha256(self.resolve(path)) != digest:
+                return False
+        return True
+
+    def job(self, board:str, job:str) -> 'JobJournal':
+        return JobJournal(self, board, job)
+
+    def summary(self) -> dict:
+        '''Last state of every job: {job: state}'''
+        states = {}
+        for entry in self.entries():
+            if entry['state'] in (JOB_STARTED, JOB_COMPLETED, JOB_FAILED):
+                states[entry['job']] = entry['state']
+        return states
+
+
+class JobJournal:
+    '''Journal entries of one job, as seen by the board running it'''
+    def __init__(self, journal:RunJournal, board:str, job:str):
+        self.journal = journal
+        self.board = board
+        self.job = job
+
+    def __last__(self, *states) -> dict:
+        for entry in reversed(self.journal.entries(self.job)):
+            if entry['state'] in states:
+                return entry
+        return None
+
+    def __append__(self, state:str, **fields) -> dict:
+        return self.journal.append(dict(fields, board=self.board, job=self.job, state=state))
+
+    @property
+    def results_path(self) -> str:
+        '''Results directory of an earlier attempt of the job, if it still exists'''
+        entry = self.__last__(JOB_STARTED)
+        if entry is None or not os.path.isdir(self.journal.resolve(entry['results_path'])):
+            return None
+        return self.journal.resolve(entry['results_path'])
+
+    def start(self, results_path:str) -> str:
+        self.__append__(JOB_STARTED, results_path=results_path)
+        return results_path
+
+    def completed(self) -> bool:
+        '''True if the job completed and its archive is intact'''
+        entry = self.__last__(JOB_COMPLETED, JOB_STARTED)
+        return entry is not None and entry['state'] == JOB_COMPLETED and self.journal.verify(entry['artifacts'])
+
+    def archive(self) -> str:
+        entry = self.__last__(JOB_COMPLETED)
+        return None if entry is None else entry['archive']
+
+    def complete(self, archive:str) -> None:
+        self.__append__(JOB_COMPLETED, archive=archive, artifacts=self.journal.checksums([archive]))
+
+    def fail(self, error:str) -> None:
+        self.__append__(JOB_FAILED, error=error)
+
+    ## ------------------------------------------------------------------------
+    ## Iterations
+    def __iteration__(self, workload:str, iteration:int) -> dict:
+        '''Last entry of the iteration since the job was (re)started, None if not run'''
+        for entry in reversed(self.journal.entries(self.job)):
+            if entry['state'] == JOB_STARTED:
+                return None
+            if entry['state'] in (ITERATION_STARTED, ITERATION_COMPLETED) and \
+               entry['workload'] == workload and entry['iteration'] == iteration:
+                return entry
+        return None
+
+    def iteration_completed(self, workload:str, iteration:int) -> bool:
+        '''True if the iteration completed earlier and its artifacts are intact'''
+        entry = self.__iteration__(workload, iteration)
+        return entry is not None and entry['state'] == ITERATION_COMPLETED and self.journal.verify(entry['artifacts'])
+
+    def begin_iteration(self, cluster:str, freq:int, workload:str, iteration:int, stale:[str] = []) -> None:
+        '''Records the start of an iteration, removing artifacts left by a partial earlier run (stale)'''
+        entry = self.__iteration__(workload, iteration)
+        if entry is not None:
+            print ('Journal: re-running partial iteration '+workload+'-'+str(iteration)+' of '+self.job)
+            for path in stale:
+                if os.path.isfile(self.journal.resolve(path)):
+                    os.remove(self.journal.resolve(path))
+        self.__append__(ITERATION_STARTED, cluster=cluster, freq=freq, workload=workload, iteration=iteration)
+
+    def complete_iteration(self, cluster:str, freq:int, workload:str, iteration:int, artifacts:[str]) -> None:
+        self.__append__(ITERATION_COMPLETED, cluster=cluster, freq=freq, workload=workload, iteration=iteration,
+                        artifacts=self.journal.checksums(artifacts))
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'campaign.journal')
+        results = os.path.join(tmp, 'run-1')
+        os.mkdir(results)
+        def artifact(name, content):
+            path = os.path.join(results, name)
+            with open(path, 'w') as f:
+                f.write(content)
+            return path
+
+        ## First attempt: iteration 1 completes, iteration 2 is cut short
+        journal = RunJournal(filename)
+        job = journal.job('xu4-01', 'cpu/BigCore-Test-CPUFreq-2.0GHz')
+        assert job.results_path is None and not job.completed(), 'Fresh job not pending'
+        job.start(results)
+        job.begin_iteration('big', 2000000, 'stress', 1)
+        job.complete_iteration('big', 2000000, 'stress', 1, [artifact('stress-1.prof', 'a'), artifact('stress-1.powdata', 'b')])
+        job.begin_iteration('big', 2000000, 'stress', 2)
+        partial = artifact('stress-2.powdata', 'partial')
+        journal.close()
+        with open(filename, 'a') as f:
+            f.write('{"state": "iteration-compl')    # torn by the crash
+
+        ## Restart: results directory reused, iteration 1 skipped, iteration 2 re-run
+        journal = RunJournal(filename)
+        assert journal.torn == 1, 'Torn line not detected'
+        job = journal.job('xu4-01', 'cpu/BigCore-Test-CPUFreq-2.0GHz')
+        assert job.results_path == results, 'Results directory not recovered'
+        assert job.iteration_completed('stress', 1), 'Completed iteration not recognized'
+        assert not job.iteration_completed('stress', 2), 'Partial iteration taken as completed'
+        job.begin_iteration('big', 2000000, 'stress', 2, stale=[partial])
+        assert not os.path.exists(partial), 'Stale artifact not removed'
+        job.complete_iteration('big', 2000000, 'stress', 2, [artifact('stress-2.prof', 'c'), artifact('stress-2.powdata', 'd')])
+
+        ## Changed artifact invalidates its iteration
+        artifact('stress-1.prof', 'corrupted')
+        assert not job.iteration_completed('stress', 1), 'Changed artifact not detected'
+
+        archive = os.path.join(tmp, 'run-1.tar.bz2')
+        with open(archive, 'w') as f:
+            f.write('archive')
+        job.complete(archive)
+        journal.close()
+
+        journal = RunJournal(filename)
+        job = journal.job('xu4-02', 'cpu/BigCore-Test-CPUFreq-2.0GHz')
+        assert job.completed() and job.archive() == archive, 'Completed job not recognized'
+        assert journal.summary() == {'cpu/BigCore-Test-CPUFreq-2.0GHz': JOB_COMPLETED}, 'Unexpected summary'
+        os.remove(archive)
+        assert not job.completed(), 'Missing archive not detected'
+        journal.close()
+    print ('Run journal test completed...')
+
+#### ==========================================================================
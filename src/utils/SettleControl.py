@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Detection of thermal/power steady state prior to starting a workload
+
+Replacement of the fixed 2 minute wait of WorkloadBase.__pre_run__. The
+SettleController samples the board temperature and reads the live
+SmartPower3 power stream once per poll interval, and fits a line over a
+rolling window of each signal. The board is considered settled once the
+slopes and standard deviations of both signals stayed below the thresholds
+of the SettleCriterion for hold_s seconds, though not earlier than min_s
+and at most max_s after starting.
+
+Usage:
+    result = SettleController(power_source, thermal_source, SettleCriterion()).wait()
+    # result: {'settle_s': 41.0, 'settled': True, 'reason': 'stable', 'criterion': {...}, ...}
+
+Assumptions:
+  (1) power_source(window_s) returns (time_ns, mW) arrays of the power samples
+      received within the last window_s seconds
+  (2) thermal_source() returns the current temperatures (milli degree C) of
+      the thermal zones, the hottest zone is tracked
+
+Limitations:
+  (1) Without power samples (e.g. SmartPower3 not logging) the board is never
+      considered stable and the wait ends at max_s
+
+Warnings:
+  N/A
+
+TODO:
+  N/A
+"""
+
+import time
+import numpy as np
+
+STABLE  = 'stable'
+TIMEOUT = 'timeout'
+
+
+class SettleCriterion:
+    '''Thresholds and bounds of the steady state detection'''
+    def __init__(self,
+                 window_s:float = 20.0,                 # Rolling window of the line fit
+                 hold_s:float = 10.0,                   # Criterion to hold continuously for
+                 min_s:float = 20.0,                    # Lower bound of the wait
+                 max_s:float = 2*60.0,                  # Upper bound of the wait, i.e. the earlier fixed wait
+                 max_power_slope_mW_s:float = 10.0,
+                 max_power_std_mW:float = 100.0,
+                 max_temp_slope_mC_s:float = 50.0,      # 0.05 degree C per second
+                 max_temp_std_mC:float = 500.0,
+                 poll_interval_s:float = 1.0):
+        assert 0 <= min_s <= max_s, 'Settle bounds inconsistent: min '+str(min_s)+' > max '+str(max_s)
+        self.window_s = window_s
+        self.hold_s = hold_s
+        self.min_s = min_s
+        self.max_s = max_s
+        self.max_power_slope_mW_s = max_power_slope_mW_s
+        self.max_power_std_mW = max_power_std_mW
+        self.max_temp_slope_mC_s = max_temp_slope_mC_s
+        self.max_temp_std_mC = max_temp_std_mC
+        self.poll_interval_s = poll_interval_s
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def window_fit(time_ns:np.ndarray, values:np.ndarray, window_s:float, now_ns:int):
+    '''(slope per second, standard deviation) of the samples within the window before now_ns
+
+    None if the samples do not cover at least 80% of the window.
+    '''
+    time_ns = np.asarray(time_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = (time_ns > now_ns - int(window_s*1e9)) & np.isfinite(values)
+    t = (time_ns[keep] - now_ns) / 1e9
+    v = values[keep]
+    if len(t) < 3 or t[-1] - t[0] < 0.8*window_s:
+        return None
+    slope = np.polyfit(t, v, 1)[0]
+    return float(slope), float(np.std(v))
+
+
+class SettleController:
+    def __init__(self, power_source, thermal_source, criterion:SettleCriterion = None,
+                 clock = time.monotonic_ns, sleep = time.sleep):
+        self.power_source = power_source
+        self.thermal_source = thermal_source
+        self.criterion = criterion if criterion is not None else SettleCriterion()
+        self.__clock__ = clock
+        self.__sleep__ = sleep
+        self.__temp_ns__ = []
+        self.__temp__ = []
+
+    def metrics(self, now_ns:int) -> dict:
+        '''Current slopes and deviations of the power and temperature windows (None if not covered)'''
+        c = self.criterion
+        power_ns, power_mW = self.power_source(c.window_s)
+        power = window_fit(power_ns, power_mW, c.window_s, now_ns) if len(power_ns) else None
+        temp = window_fit(self.__temp_ns__, self.__temp__, c.window_s, now_ns)
+        return {'power_slope_mW_s': None if power is None else power[0],
+                'power_std_mW': None if power is None else power[1],
+                'temp_slope_mC_s': None if temp is None else temp[0],
+                'temp_std_mC': None if temp is None else temp[1]}
+
+    def stable(self, metrics:dict) -> bool:
+        c = self.criterion
+        if any(value is None for value in metrics.values()):
+            return False
+        return abs(metrics['power_slope_mW_s']) <= c.max_power_slope_mW_s and \
+               metrics['power_std_mW'] <= c.max_power_std_mW and \
+               abs(metrics['temp_slope_mC_s']) <= c.max_temp_slope_mC_s and \
+               metrics['temp_std_mC'] <= c.max_temp_std_mC
+
+    def wait(self) -> dict:
+        '''Blocks until settled or max_s elapsed, returns the settle record for the run metadata'''
+        c = self.criterion
+        start_ns = self.__clock__()
+        stable_since = None
+        self.__temp_ns__, self.__temp__ = [], []
+        while True:
+            now_ns = self.__clock__()
+            elapsed = (now_ns - start_ns) / 1e9
+            temps = self.thermal_source()
+            if temps:
+                self.__temp_ns__.append(now_ns)
+                self.__temp__.append(max(temps))
+            metrics = self.metrics(now_ns)
+            if self.stable(metrics):
+                stable_since = now_ns if stable_since is None else stable_since
+            else:
+                stable_since = None
+            reason = None
+            if stable_since is not None and elapsed >= c.min_s and (now_ns - stable_since)/1e9 >= c.hold_s:
+                reason = STABLE
+            elif elapsed >= c.max_s:
+                reason = TIMEOUT
+            if reason is not None:
+                result = {'settle_s': round(elapsed, 3), 'settled': reason == STABLE, 'reason': reason,
+                          'criterion': c.as_dict()}
+                result.update(metrics)
+                return result
+            self.__sleep__(c.poll_interval_s)
+
+
+#### ==========================================================================
+#### Test Code
+if __name__ == '__main__':
+    ## Simulated clock: power decays to 2.5W (tau 15s), temperature to 45C (tau 25s)
+    class SimClock:
+        def __init__(self):
+            self.now_ns = 0
+        def __call__(self):
+            return self.now_ns
+        def sleep(self, secs):
+            self.now_ns += int(secs*1e9)
+
+    def run(tau_p, tau_t, criterion):
+        clock = SimClock()
+        power_ns = np.arange(0, 400*10**9, 50*10**6)        # SmartPower3 @20Hz
+        power_mW = 2500 + 1500*np.exp(-power_ns/1e9/tau_p)
+        def power_source(window_s):
+            sel = (power_ns <= clock.now_ns) & (power_ns > clock.now_ns - window_s*1e9)
+            return power_ns[sel], power_mW[sel]
+        def thermal_source():
+            t = clock.now_ns/1e9
+            return [int(45000 + 15000*np.exp(-t/tau_t)), 40000]
+        return SettleController(power_source, thermal_source, criterion, clock, clock.sleep).wait()
+
+    result = run(15, 25, SettleCriterion())
+    print ('Settle: '+str({k: v for k, v in result.items() if k != 'criterion'}))
+    assert result['settled'] and result['reason'] == STABLE, 'Not settled'
+    assert 60 <= result['settle_s'] < 120, 'Unexpected settle time '+str(result['settle_s'])
+    assert abs(result['temp_slope_mC_s']) <= 50, 'Temperature not settled'
+
+    ## Signal not settling within max_s
+    result = run(200, 200, SettleCriterion(max_s=60))
+    assert not result['settled'] and result['reason'] == TIMEOUT and result['settle_s'] == 60, 'Timeout not hit'
+
+    ## Settled signal still waits for min_s
+    result = run(0.01, 0.01, SettleCriterion(min_s=45))
+    assert result['settled'] and result['settle_s'] == 45, 'min_s not respected: '+str(result['settle_s'])
+    print ('Settle controller test completed...')
+
+#### ==========================================================================
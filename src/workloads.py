@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import fabric
-import time
 import os
 import datetime
 
@@ -12,12 +11,22 @@ path_root = Path(__file__).parents[0]
 sys.path.append(str(path_root))
 
 from ODroidXU4.mgmt.BoardConfigControl import BroadConfig as hwctrl
+from src.ODroidXU4.mgmt.BoardSession import BoardSession
+from ODroidXU4.mgmt.BenchDataSync import BenchDataSync
+from ODroidXU4.perf_groups import plan_events, MODE_ROTATE, MODE_PARALLEL
 from ODroidXU4.mgmt.performance.FanControl import FanControl as hwfan
 from ODroidXU4.mgmt.performance.CPUFreq import CPUFreqControl as cpufreqctrl
 from ODroidXU4.mgmt.performance.MemoryController import MemCtrlrFreqControl as memfreqctrl
 from ODroidXU4.polling_sampler import DataSampler as  polling
+from ODroidXU4.telemetry_sampler import TelemetrySampler as telemetry
+from src.ODroidXU4.monitor.thermal import ThermalSampler as thermal
 from SmartPower3.SmartPower3 import NCSampler as sm3
 from utils.ProgressBar import sleep_progress 
+from utils.SettleControl import SettleController, SettleCriterion
+from processing.dataset import RUNMETA_SUFFIX
+from processing.archive import ArchiveWriter, ARCHIVE_SUFFIX
+from utils.RunJournal import JobJournal
+import json
 
 class WorkloadRecord:
     """Class to hold record of workload information
@@ -65,7 +74,7 @@ class PerfStat_WorkloadCompiler:
     __task_cmd_option_bigcores=' -c 4,5,6,7 '
     __task_cmd_option_littlecores=' -c 1,2,3 ' 
 
-    ## Perf events to be monitored.
+    ## Perf events to be monitored, scheduled in groups fitting the PMU counters (see ODroidXU4/perf_groups.py)
     __perf_event_listing=\
             'branch-instructions,branch-misses,branch-load-misses,branch-loads,'\
             'bus-cycles,cpu-cycles,instructions,'\
@@ -77,12 +86,19 @@ class PerfStat_WorkloadCompiler:
 
     def __init__(self, workloads:[WorkloadRecord],
                  set_bigcore:bool,
-                 results_prefix_dir:str='results'
+                 results_prefix_dir:str='results',
+                 event_mode:str=MODE_PARALLEL
                  ) -> None:
-        """Constructor, initialized with list of workloads"""
+        """Constructor, initialized with list of workloads
+
+        event_mode selects how the event groups are run: 'parallel' (all
+        groups, multiplexed as whole groups), 'rotate' (one group per
+        iteration, unscaled counts) or 'flat' (single event list)
+        """
         self.__workload_count = len(workloads)
         self.__workloads = []
         self.__resultsfile = []
+        self.plan = plan_events(self.__perf_event_listing.split(','), mode=event_mode)
         if (set_bigcore == True):
             taskset_cmd = self.__task_cmd_prefix + self.__task_cmd_option_bigcores 
         else:
@@ -90,14 +106,17 @@ class PerfStat_WorkloadCompiler:
 
         for item in workloads:
             results_file = results_prefix_dir+'/'+item.name()
-            workload_cmd_temp = self.__perf_stat_cmd_prefix +' '\
+            ## One command per iteration of the event schedule
+            workload_cmds = []
+            for itr in range(1, len(self.plan)+1):
+                workload_cmds.append(self.__perf_stat_cmd_prefix +' '\
                             + self.__perf_stat_cmd_result_options + results_file +' '\
                             + self.__perf_stat_cmd_sampling_options +' '\
                             + self.__perf_stat_cmd_cpu_options +' '\
-                            + '-e ' + self.__perf_event_listing +' '\
+                            + self.plan.event_options(itr) +' '\
                             + taskset_cmd + ' '\
-                            + item.cmd()
-            self.__workloads.append(workload_cmd_temp)
+                            + item.cmd())
+            self.__workloads.append(workload_cmds)
             self.__resultsfile.append(results_file)
 
 
@@ -117,16 +136,21 @@ class PerfStat_WorkloadCompiler:
         """Iterate through the workload list elements
         """
         if self.__itr_ctr < self.__len__():
-            x = str(self.__workloads[self.__itr_ctr])
+            x = self.__workloads[self.__itr_ctr]
             name = self.__resultsfile[self.__itr_ctr]
             self.__itr_ctr += 1
             return (name, x)
         else:
             raise StopIteration
 
+    def iteration(self, cmds:[str], itr:int) -> (str, dict):
+        '''Command of a workload for an iteration (counted from 1) & its event groups for the run metadata'''
+        return cmds[(itr - 1) % len(cmds)], self.plan.as_dict(itr)
+
     def dump (self):
         for item in self.__workloads:
-            print (item)
+            for cmd in item:
+                print (cmd)
     
     def results_files(self) -> [str]:
         return self.__resultsfile
@@ -139,80 +163,130 @@ class WorkloadBase:
     def __init__(self, 
                  conn: fabric.Connection,
                  run_on_bigcore: bool = True,
+                 power_capture: str = 'csv',     # SmartPower3 capture mode: 'csv' (.powdata) or 'ring' (.powbin)
+                 power_port: int = 6000,         # UDP port the board's SmartPower3 unit logs to
+                 poll_sampler: str = 'agent',    # Poll data source: 'agent' (on-device telemetry agent) or 'ssh' (DataSampler)
+                 poll_rate_hz: float = 20.0,     # Sampling rate of the telemetry agent
+                 settle_criterion: SettleCriterion = None,  # Steady state to reach prior to each run
+                 journal: JobJournal = None,     # Journal of the job, to resume it after an interruption
+                 stream_archive: bool = False,   # Archive the files of every iteration into <results>.pack once complete
                  ):
         self.__conn__    = conn
         self.__run_on_bigcore__ = run_on_bigcore
         
+        # Persistent channels on the connection's transport, shared by controllers & samplers
+        self.__session__ = BoardSession(self.__conn__)
+
         # Initialize hardware controller modules
-        self.__bdctrl__  = hwctrl(self.__conn__)
-        self.__fanctrl__ = hwfan(self.__conn__)
-        self.__perfcpuctrl__ = cpufreqctrl(self.__conn__)
-        self.__perfmemctrl__ = memfreqctrl(self.__conn__)
+        self.__bdctrl__  = hwctrl(self.__conn__, self.__session__)
+        self.__fanctrl__ = hwfan(self.__conn__, self.__session__)
+        self.__perfcpuctrl__ = cpufreqctrl(self.__conn__, self.__session__)
+        self.__perfmemctrl__ = memfreqctrl(self.__conn__, self.__session__)
 
         # Initialize data samplers
-        self.__polling__ = polling(self.__conn__)
-        self.__sm3__     = sm3()
+        if (poll_sampler == 'agent'):
+            self.__polling__ = telemetry(self.__conn__, rate_hz=poll_rate_hz)
+        elif (poll_sampler == 'ssh'):
+            self.__polling__ = polling(self.__conn__, self.__session__)
+        else:
+            raise Exception('Unknown poll sampler: '+str(poll_sampler))
+        self.__poll_sampler__ = poll_sampler
+        self.__sm3__     = sm3(capture=power_capture, port=power_port)
+        self.__thermal__ = thermal(self.__conn__, self.__session__)
+        self.__settle_criterion__ = settle_criterion if settle_criterion is not None else SettleCriterion()
+        self.__journal__ = journal
+        self.__boot__ = None
+        self.__stream_archive__ = stream_archive
+        self.__archive__ = None
+        self.archive_path = None
 
     def __setup_persistant__(self,
                     resultsdir_prefix:str,
                     testname_suffix:str):
-        # Set CPU isolation prior to reboot so that CPUs are reserved for 
-        # workload execution
+        # Set CPU isolation so that CPUs are reserved for workload execution,
+        # the device is rebooted only if the isolated CPUs change
         if (self.__run_on_bigcore__):
             print ('Setting Big cluster isolation')
-            self.__bdctrl__.set_cpuisol_bigcluster()
         else:
             print ('Setting Little cluster isolation')
-            self.__bdctrl__.set_cpuisol_littlecluster()
+        rebooted = self.__bdctrl__.set_cpuisol(self.__run_on_bigcore__)
+        self.__boot__ = {'rebooted': rebooted, 'boot_latency_s': self.__bdctrl__.boot_latency_s if rebooted else None}
 
+        # Push the telemetry agent, it is started by the poll sampler at every run
+        if (self.__poll_sampler__ == 'agent'):
+            self.__polling__.deploy()
         
         # Setup for results storage
-        ## Time stamp to segregate test runs
-        test_run_name= datetime.datetime.now().strftime('%m-%d-%Y_%H-%M-%S_'+testname_suffix)
-        print (test_run_name)
-
-        ## Create top level results directory
-        if (os.path.exists(resultsdir_prefix) == False):
-            os.mkdir(resultsdir_prefix)
-
-        ## Create timestamped directory under results directory holding specific test run
-        self.__results_path__ = os.path.join(resultsdir_prefix,test_run_name)
-        if (os.path.exists(self.__results_path__) == False):
-            os.mkdir(self.__results_path__)
-
-        # Initiate reboot
-        time.sleep(2)
-        self.__bdctrl__.reboot_device()
+        if (self.__journal__ is not None and self.__journal__.results_path is not None):
+            ## Resume in the results directory of the interrupted run
+            self.__results_path__ = self.__journal__.results_path
+            print ('Resuming '+self.__journal__.job+' in '+self.__results_path__)
+        else:
+            ## Time stamp to segregate test runs
+            test_run_name= datetime.datetime.now().strftime('%m-%d-%Y_%H-%M-%S_'+testname_suffix)
+            print (test_run_name)
+
+            ## Create top level results directory
+            if (os.path.exists(resultsdir_prefix) == False):
+                os.mkdir(resultsdir_prefix)
+
+            ## Create timestamped directory under results directory holding specific test run
+            self.__results_path__ = os.path.join(resultsdir_prefix,test_run_name)
+            if (os.path.exists(self.__results_path__) == False):
+                os.mkdir(self.__results_path__)
+            if (self.__journal__ is not None):
+                self.__journal__.start(self.__results_path__)
+
+        ## Archive of the results, appended to when resuming
+        if (self.__stream_archive__):
+            self.archive_path = self.__results_path__+ARCHIVE_SUFFIX
+            self.__archive__ = ArchiveWriter(self.archive_path)
 
     def __pre_run__(self,tc_opres_file:str,
                     cpu_freq:int = 2000000,
-                    max_fan:bool = True
+                    max_fan:bool = True,
+                    perf_groups:dict = None     # Event groups of the perf-stat run, recorded in the run metadata
                     ):
         ## HW Setup & necessary preconditions to be added here, which are to be done
-        ## prior to starting test run
+        ## prior to starting test run. Settings are queued & committed in one round trip,
+        ## each being read back for verification
+        batch = self.__session__.batch()
         if(max_fan == True):
-            self.__fanctrl__.switch_on()
+            self.__fanctrl__.switch_on(batch)
         else:
-            self.__fanctrl__.switch_off()
+            self.__fanctrl__.switch_off(batch)
 
         # Setup up cluster frequency for either big or little cores
         if (self.__run_on_bigcore__):
             print ('Setting Big cluster\'s frequency configurations')
-            self.__perfcpuctrl__.set_cluster_gov_perf(True)
-            self.__perfcpuctrl__.set_cluster_frequency(True,cpu_freq)
+            self.__perfcpuctrl__.set_cluster_gov_perf(True, batch)
+            self.__perfcpuctrl__.set_cluster_frequency(True,cpu_freq, batch)
         else:
             print ('Setting Little cluster\'s frequency configurations')
-            self.__perfcpuctrl__.set_cluster_gov_perf(False)
-            self.__perfcpuctrl__.set_cluster_frequency(False,cpu_freq)
+            self.__perfcpuctrl__.set_cluster_gov_perf(False, batch)
+            self.__perfcpuctrl__.set_cluster_frequency(False,cpu_freq, batch)
         
         # Setup up memory controller performance
-        self.__perfmemctrl__.set_governor_perf()
-        self.__perfmemctrl__.set_boost_max_freq()
-
-        print('Waiting for 2 mins...')
-        time.sleep(2*60)
+        self.__perfmemctrl__.set_governor_perf(batch)
+        self.__perfmemctrl__.set_boost_max_freq(batch=batch)
+        batch.commit()
+
+        # Wait for power & temperature to settle, instead of a fixed 2 mins
+        print('Waiting for steady state (at most '+str(self.__settle_criterion__.max_s)+'s)...')
+        self.__sm3__.StartMonitoring()
+        try:
+            settle = SettleController(self.__sm3__.recent_power, self.__thermal__.sample_data,
+                                      self.__settle_criterion__).wait()
+        finally:
+            self.__sm3__.StopMonitoring()
+        print ('Settled in '+str(settle['settle_s'])+'s ('+settle['reason']+')')
         print ('__pre_run__: '+ tc_opres_file + ' @'+str(cpu_freq))
 
+        ## Run metadata, picked up by the ingestion (src/processing/ingest.py) into the dataset
+        with open(self.__results_path__+'/'+os.path.basename(tc_opres_file)+RUNMETA_SUFFIX, 'w') as f:
+            json.dump({'settle': settle, 'cpu_freq_khz': cpu_freq, 'max_fan': max_fan, 'boot': self.__boot__,
+                       'perf_groups': perf_groups}, f, indent=1)
+
         ## Start the data samplers
         self.__sm3__.StartSampling(self.__results_path__+'/'+os.path.basename(tc_opres_file) +'.powdata')
         self.__polling__.StartSampling(self.__results_path__+'/'+os.path.basename(tc_opres_file)+'.polldata')
@@ -226,6 +300,53 @@ class WorkloadBase:
         # Cleanup code of files and HW after test execution
         pass
 
+    ## Journaling of iterations, no-ops without a journal
+    def __iteration_artifacts__(self, result_name:str) -> [str]:
+        '''Files of an iteration in the results directory (.prof, .powdata, .polldata, ...)'''
+        prefix = os.path.basename(result_name)+'.'
+        return sorted(os.path.join(self.__results_path__, f) for f in os.listdir(self.__results_path__) if f.startswith(prefix))
+
+    def __skip_iteration__(self, workload:str, itr:int) -> bool:
+        if (self.__journal__ is not None and self.__journal__.iteration_completed(workload, itr)):
+            print ('Skipping iteration '+str(itr)+' of '+workload+', completed earlier')
+            return True
+        return False
+
+    def __begin_iteration__(self, workload:str, itr:int, result_name:str, cpu_freq:int):
+        if (self.__journal__ is not None):
+            self.__journal__.begin_iteration('big' if self.__run_on_bigcore__ else 'little', cpu_freq, workload, itr,
+                                             stale=self.__iteration_artifacts__(result_name))
+
+    def __complete_iteration__(self, workload:str, itr:int, result_name:str, cpu_freq:int):
+        artifacts = self.__iteration_artifacts__(result_name)
+        if (self.__archive__ is not None):
+            self.__archive__.add_files(artifacts, os.path.dirname(self.__results_path__))
+        if (self.__journal__ is not None):
+            self.__journal__.complete_iteration('big' if self.__run_on_bigcore__ else 'little', cpu_freq, workload, itr,
+                                                artifacts)
+
+    def __check_event_schedule__(self, plan, iteration_count:int):
+        '''Rejects a rotation of the perf event groups that would leave groups uncounted'''
+        # Iterations 1 .. iteration_count-1 are counted, one group each when rotating
+        counted = max(iteration_count - 1, 0)
+        if (plan.mode == MODE_ROTATE and counted < len(plan)):
+            raise Exception('Rotating perf event groups over '+str(counted)+' counted iterations counts '+
+                            str(counted)+' of the '+str(len(plan))+' groups: iteration_count must be at least '+
+                            str(len(plan) + 1))
+
+    def __finish_archive__(self):
+        '''Adds the files not archived with an iteration & closes the archive'''
+        if (self.__archive__ is None):
+            return
+        archived = set(self.__archive__.names())
+        base = os.path.dirname(self.__results_path__)
+        rest = sorted(os.path.join(root, f) for root, _, files in os.walk(self.__results_path__) for f in files
+                      if os.path.relpath(os.path.join(root, f), base).replace(os.sep, '/') not in archived)
+        if rest:
+            self.__archive__.add_files(rest, base)
+        self.__archive__.close()
+        self.__archive__ = None
+
         
 
 #################################################
@@ -238,11 +359,23 @@ class CPUIntensiveWorkloads(WorkloadBase):
                  run_on_bigcore: bool = True,
                  enable_stress_workloads:bool = True, 
                  enable_compress_workloads:bool = False, 
-                 enable_encode_workloads:bool = False
+                 enable_encode_workloads:bool = False,
+                 power_capture: str = 'csv',
+                 power_port: int = 6000,
+                 poll_sampler: str = 'agent',
+                 poll_rate_hz: float = 20.0,
+                 settle_criterion: SettleCriterion = None,
+                 journal: JobJournal = None,
+                 stream_archive: bool = False,
+                 perf_event_mode: str = MODE_PARALLEL
                  ):
-        WorkloadBase.__init__(self,conn,run_on_bigcore=run_on_bigcore)
+        WorkloadBase.__init__(self,conn,run_on_bigcore=run_on_bigcore,power_capture=power_capture,
+                              power_port=power_port,poll_sampler=poll_sampler,poll_rate_hz=poll_rate_hz,
+                              settle_criterion=settle_criterion,journal=journal,
+                              stream_archive=stream_archive)
         self.workload_listing = []
         self.run_on_bigcore = run_on_bigcore
+        self.perf_event_mode = perf_event_mode
 
         self.iteration_count = iteration_count
         self.enable_stress_workloads = enable_stress_workloads 
@@ -291,29 +424,16 @@ class CPUIntensiveWorkloads(WorkloadBase):
         
         ## Compile the workload list & initialize the job
         self.workloads_obj = PerfStat_WorkloadCompiler(self.workload_listing, 
-                                    set_bigcore=self.run_on_bigcore)
+                                    set_bigcore=self.run_on_bigcore,
+                                    event_mode=self.perf_event_mode)
+        self.__check_event_schedule__(self.workloads_obj.plan, self.iteration_count)
     
     def setup_persistant(self,workload_data:str, 
                             resultsdir_prefix:str,
                             testname_suffix:str):
-        print ('Pushing dependencies to device... Please wait')
-        self.__conn__.run ('mkdir -p bench-data')
-        # Clean the old files - if any
-        with self.__conn__.cd('bench-data/'):
-            self.__conn__.run ('rm -rf *')
-
-        self.__conn__.put(workload_data+'/Silent Love-360p.mp4','bench-data/')
-        self.__conn__.put(workload_data+'/Silent Love-720p.mp4','bench-data/')
-        self.__conn__.put(workload_data+'/cantrbry.zip','bench-data/')
-        self.__conn__.put(workload_data+'/enwik8.zip','bench-data/')
-        self.__conn__.put(workload_data+'/webster.bz2','bench-data/')
-
-        print ('Extracting files... Please wait')
-        with self.__conn__.cd('bench-data/'):
-            self.__conn__.run ('bzip2 -d webster.bz2')
-            self.__conn__.run ('unzip enwik8.zip')
-            self.__conn__.run ('unzip cantrbry.zip')
-            self.__conn__.run ('rm -f cantrbry.zip enwik8.zip')
+        print ('Syncing dependencies to device... Please wait')
+        # Only missing or changed inputs are pushed & extracted, leftovers of earlier runs are cleaned
+        BenchDataSync(self.__conn__).sync(workload_data)
         
         # Calling base class for generic actions & reboot
         WorkloadBase.__setup_persistant__(self, resultsdir_prefix, testname_suffix)
@@ -321,10 +441,11 @@ class CPUIntensiveWorkloads(WorkloadBase):
     def __pre_run__(self,
                     tc_name:str,
                     cpu_freq:int = 2000000,
+                    perf_groups:dict = None
                     ):
         ''' Method to be exceuted prior to running CPU workloads
         '''
-        WorkloadBase.__pre_run__(self, tc_name, cpu_freq) # Calling base class for generic actions
+        WorkloadBase.__pre_run__(self, tc_name, cpu_freq, perf_groups=perf_groups) # Calling base class for generic actions
         
 
     def __post_run__(self):
@@ -346,18 +467,24 @@ class CPUIntensiveWorkloads(WorkloadBase):
             for workload_item in self.workloads_obj:
                 workload_ctr += 1
                 result = workload_item[0]
-                cmd = workload_item[1]
+                cmds = workload_item[1]
                 print ('======= Workload ('+str(workload_ctr)+'/'+str(total_workload)+'): '+result +'=======')
                 for itr in range(1, self.iteration_count):
                     result_name = result+'-'+str(itr)
-                    self.__pre_run__(result_name, cpu_freq)
+                    if (self.__skip_iteration__(result, itr)):
+                        continue
+                    cmd, perf_groups = self.workloads_obj.iteration(cmds, itr)
+                    self.__begin_iteration__(result, itr, result_name, cpu_freq)
+                    self.__pre_run__(result_name, cpu_freq, perf_groups)
                     print('Iteration: '+str(itr) +', results file==> '+result_name)
                     ## Execute the workload on device
                     self.__conn__.run(cmd)
                     self.__post_run__()
                     ## Fetch results from remote
                     self.__conn__.get('bench-data/'+result, self.__results_path__+'/'+ os.path.basename(result_name)+'.prof')
+                    self.__complete_iteration__(result, itr, result_name, cpu_freq)
 
+        self.__finish_archive__()
         return self.__results_path__
 
         
@@ -371,9 +498,21 @@ class IdleWorkloads (WorkloadBase):
                  run_on_bigcore: bool = True,
                  run_perf_sleep: bool = False,
                  iteration_count:int = 10,
+                 power_capture: str = 'csv',
+                 power_port: int = 6000,
+                 poll_sampler: str = 'agent',
+                 poll_rate_hz: float = 20.0,
+                 settle_criterion: SettleCriterion = None,
+                 journal: JobJournal = None,
+                 stream_archive: bool = False,
+                 perf_event_mode: str = MODE_PARALLEL
                  ):
-        WorkloadBase.__init__(self,conn,run_on_bigcore=run_on_bigcore)
+        WorkloadBase.__init__(self,conn,run_on_bigcore=run_on_bigcore,power_capture=power_capture,
+                              power_port=power_port,poll_sampler=poll_sampler,poll_rate_hz=poll_rate_hz,
+                              settle_criterion=settle_criterion,journal=journal,
+                              stream_archive=stream_archive)
         self.run_on_bigcore = run_on_bigcore
+        self.perf_event_mode = perf_event_mode
         self.idle_duration = idle_duration
         self.run_perf_sleep = run_perf_sleep
         self.iteration_count = iteration_count
@@ -384,7 +523,9 @@ class IdleWorkloads (WorkloadBase):
         if (self.run_perf_sleep == True):
             self.workload_listing.append(WorkloadRecord('IdleSleep-perf', 'sleep',str(self.idle_duration)))
             self.workloads_obj = PerfStat_WorkloadCompiler(self.workload_listing,
-                                    set_bigcore=self.run_on_bigcore)
+                                    set_bigcore=self.run_on_bigcore,
+                                    event_mode=self.perf_event_mode)
+            self.__check_event_schedule__(self.workloads_obj.plan, self.iteration_count)
     
     def setup_persistant(self,resultsdir_prefix:str,
                             testname_suffix:str):
@@ -394,13 +535,14 @@ class IdleWorkloads (WorkloadBase):
     def __pre_run__(self,
                     tc_name:str,
                     cpu_freq:int = 2000000,
-                    max_fan:bool = True
+                    max_fan:bool = True,
+                    perf_groups:dict = None
                     ):
         ''' Method to be exceuted prior to running CPU workloads
         '''
         if (self.run_perf_sleep):
             pass
-        WorkloadBase.__pre_run__(self, tc_name, cpu_freq, max_fan) # Calling base class for generic actions
+        WorkloadBase.__pre_run__(self, tc_name, cpu_freq, max_fan, perf_groups) # Calling base class for generic actions
 
     def __post_run__(self):
         ''' Method to be exceuted after running CPU workloads
@@ -422,26 +564,33 @@ class IdleWorkloads (WorkloadBase):
                 for workload_item in self.workloads_obj:
                     workload_ctr += 1
                     result = workload_item[0]
-                    cmd = workload_item[1]
+                    cmds = workload_item[1]
 
                     
                     print ('======= Idle Workload ('+str(workload_ctr)+'/'+str(total_workload)+'): '+result +'=======')
                     for itr in range(1, self.iteration_count):
                         result_name = result+'-'+str(itr)
+                        if (self.__skip_iteration__(result, itr)):
+                            continue
                         print('results file==> '+result_name)
-                        self.__pre_run__(result_name, cpu_freq,max_fan)
+                        cmd, perf_groups = self.workloads_obj.iteration(cmds, itr)
+                        self.__begin_iteration__(result, itr, result_name, cpu_freq)
+                        self.__pre_run__(result_name, cpu_freq,max_fan,perf_groups)
                         ## Execute the workload on device
                         self.__conn__.run(cmd)
                         self.__post_run__()
 
                         ## Fetch results from remote
                         self.__conn__.get('bench-data/'+result, self.__results_path__+'/'+os.path.basename(result_name)+'.prof')
-        else:
+                        self.__complete_iteration__(result, itr, result_name, cpu_freq)
+        elif (not self.__skip_iteration__('Idling', 1)):
+            self.__begin_iteration__('Idling', 1, 'Idling', cpu_freq)
             self.__pre_run__('Idling', cpu_freq,max_fan)
             sleep_progress(self.idle_duration)
             self.__post_run__()
+            self.__complete_iteration__('Idling', 1, 'Idling', cpu_freq)
         
-        
+        self.__finish_archive__()
         return self.__results_path__
 
 